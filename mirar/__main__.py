@@ -69,6 +69,12 @@ parser.add_argument(
     default=48.0,
     help="Time, in hours, to wait before ceasing monitoring for new images",
 )
+parser.add_argument(
+    "--metricsport",
+    default=None,
+    type=int,
+    help="Port to serve processing metrics in Prometheus format (monitor only)",
+)
 parser.add_argument(
     "--rawdir",
     default=RAW_IMG_SUB_DIR,
@@ -120,6 +126,7 @@ with tempfile.TemporaryDirectory(dir=TEMP_DIR) as temp_dir_path:
             email_sender=args.emailsender,
             email_recipients=EMAIL_RECIPIENTS,
             raw_dir=args.rawdir,
+            metrics_port=args.metricsport,
         )
         monitor.process_realtime()
 
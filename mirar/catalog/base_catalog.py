@@ -2,12 +2,18 @@
 Module for Catalog base class
 """
 
+import copy
 import logging
 from abc import ABC
 from pathlib import Path
 
 import astropy.table
 
+from mirar.catalog.tile_cache import (
+    CATALOG_TILE_CACHE_DIR,
+    DEFAULT_TILE_DEPTH,
+    CatalogTileCache,
+)
 from mirar.data import Image
 from mirar.data.utils import get_image_center_wcs_coords
 from mirar.errors import ProcessorError
@@ -56,6 +62,10 @@ class BaseCatalog(ABCatalog, ABC):
         max_mag: Maximum magnitude for stars in catalog
         filter_name: Filter name for catalog
         cache_catalog_locally: Whether to cache catalog locally?
+        tile_cache_dir: Directory for a local HEALPix tile cache of the catalog.
+        Defaults to the CATALOG_TILE_CACHE_DIR environment variable, and no
+        tile cache is used if neither is set.
+        tile_depth: HEALPix depth of tiles in the tile cache
         catalog_cachepath_key: Header key that stores the full path to the cached
         catalog. Recommended to use the inbuilt REF_CAT_PATH_KEY.
         Users need to add this to the image header themselves. e.g. For winter,
@@ -71,6 +81,8 @@ class BaseCatalog(ABCatalog, ABC):
         filter_name: str,
         cache_catalog_locally: bool = False,
         catalog_cachepath_key: str = REF_CAT_PATH_KEY,
+        tile_cache_dir: str | Path | None = CATALOG_TILE_CACHE_DIR,
+        tile_depth: int = DEFAULT_TILE_DEPTH,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
@@ -79,6 +91,8 @@ class BaseCatalog(ABCatalog, ABC):
         self.filter_name = filter_name
         self.cache_catalog_locally = cache_catalog_locally
         self.catalog_cachepath_key = catalog_cachepath_key
+        self.tile_cache_dir = tile_cache_dir
+        self.tile_depth = tile_depth
 
     def get_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
         """
@@ -90,6 +104,63 @@ class BaseCatalog(ABCatalog, ABC):
         """
         raise NotImplementedError()
 
+    def get_tile_cache_key(self) -> str | None:
+        """
+        Get a key identifying this catalog configuration in the tile cache.
+        Catalogs returning None are never cached as tiles.
+
+        :return: key, or None
+        """
+        return f"{self.abbreviation}_{self.filter_name}"
+
+    def get_tile_cache(self) -> CatalogTileCache | None:
+        """
+        Get the tile cache for this catalog, if enabled
+
+        :return: tile cache, or None
+        """
+        if self.tile_cache_dir is None:
+            return None
+
+        catalog_key = self.get_tile_cache_key()
+        if catalog_key is None:
+            return None
+
+        return CatalogTileCache(
+            cache_dir=self.tile_cache_dir,
+            catalog_key=catalog_key,
+            min_mag=self.min_mag,
+            max_mag=self.max_mag,
+            depth=self.tile_depth,
+        )
+
+    def get_cached_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
+        """
+        Returns a catalog centered on ra/dec, using the tile cache if enabled
+
+        :param ra_deg: RA
+        :param dec_deg: Dec
+        :return: Catalog
+        """
+        tile_cache = self.get_tile_cache()
+
+        if tile_cache is None:
+            return self.get_catalog(ra_deg=ra_deg, dec_deg=dec_deg)
+
+        def fetch(
+            query_ra_deg: float, query_dec_deg: float, radius_deg: float
+        ) -> astropy.table.Table:
+            query_catalog = copy.copy(self)
+            query_catalog.search_radius_arcmin = radius_deg * 60.0
+            return query_catalog.get_catalog(ra_deg=query_ra_deg, dec_deg=query_dec_deg)
+
+        return tile_cache.get_cone(
+            ra_deg=ra_deg,
+            dec_deg=dec_deg,
+            radius_deg=self.search_radius_arcmin / 60.0,
+            fetch=fetch,
+        )
+
     def write_catalog(self, image: Image, output_dir: str | Path) -> Path:
         """
         Generates a custom catalog for an image
@@ -104,7 +175,7 @@ class BaseCatalog(ABCatalog, ABC):
 
         base_name = Path(image[BASE_NAME_KEY]).with_suffix(".ldac").name
 
-        cat = self.get_catalog(ra_deg=ra_deg, dec_deg=dec_deg)
+        cat = self.get_cached_catalog(ra_deg=ra_deg, dec_deg=dec_deg)
 
         output_path = self.get_output_path(output_dir, base_name)
         output_path.unlink(missing_ok=True)
@@ -224,3 +295,6 @@ class CatalogFromFile(BaseCatalog):
     def get_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
         catalog = get_table_from_ldac(self.catalog_path)
         return catalog
+
+    def get_tile_cache_key(self) -> None:
+        return None
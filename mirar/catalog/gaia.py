@@ -77,6 +77,19 @@ class Gaia2Mass(BaseCatalog):
             if val is None:
                 self.acceptable_ph_quals[filt] = ["A", "B", "C"]
 
+    def get_tile_cache_key(self) -> str | None:
+        if self.trim:
+            # Trimmed catalogs depend on the image catalog, so cannot be reused
+            return None
+        ph_quals = "_".join(
+            f"{filt}{''.join(self.acceptable_ph_quals[filt])}"
+            for filt in sorted(self.acceptable_ph_quals)
+        )
+        return (
+            f"{self.abbreviation}_{self.filter_name}_"
+            f"snr{self.snr_threshold:g}_{ph_quals}"
+        )
+
     def get_catalog(
         self,
         ra_deg: float,
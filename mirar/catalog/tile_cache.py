@@ -0,0 +1,337 @@
+"""
+Module for a persistent, tile-based local cache of reference catalogs.
+
+The sky is partitioned into HEALPix cells (nested scheme, at a fixed depth).
+Each cached tile holds every catalog source in one cell, and is stored on disk
+as a FITS binary table. Tiles are kept separately for each magnitude range,
+as catalogs apply their magnitude cuts in different ways (e.g. on a different
+column to the returned magnitude, or not at all for the minimum magnitude),
+so a tile fetched with one range cannot be reliably cut down to another.
+
+A cone is served by assembling the tiles which overlap it. Only missing tiles
+are fetched, using a single query for a slightly larger cone which is guaranteed
+to contain all of them. Repeated pointings of the same field therefore need no
+network round trips, and the cache can be pre-warmed for a night's schedule
+with :func:`prewarm_catalog_tiles`.
+
+The cache is enabled by setting the environment variable CATALOG_TILE_CACHE_DIR,
+or by passing a tile cache directory to a catalog.
+"""
+
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+import astropy.units as u
+import numpy as np
+from astropy.table import Table, vstack
+from cdshealpix import nested
+
+from mirar.errors import ProcessorError
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TILE_CACHE_DIR = os.getenv("CATALOG_TILE_CACHE_DIR")
+
+# HEALPix depth of tiles. Cells at depth 7 are ~27 arcmin across.
+DEFAULT_TILE_DEPTH = 7
+
+MIN_MAG_KEY = "MINMAG"
+MAX_MAG_KEY = "MAXMAG"
+NSOURCES_KEY = "NSOURCES"
+
+
+class CatalogTileError(ProcessorError):
+    """
+    Error relating to the catalog tile cache
+    """
+
+
+def get_tile_radius_deg(ipix: np.ndarray, depth: int) -> float:
+    """
+    Get the maximum distance from the centre of any of a set of HEALPix cells
+    to its boundary
+
+    :param ipix: HEALPix cell indices
+    :param depth: HEALPix depth
+    :return: radius in degrees
+    """
+    ipix = np.asarray(ipix, dtype=np.uint64)
+    centre_lon, centre_lat = nested.healpix_to_lonlat(ipix, depth)
+    # Sample each edge, as HEALPix cell edges are not great circles
+    edge_lon, edge_lat = nested.vertices(ipix, depth, step=8)
+    separations = angular_separation_deg(
+        centre_lon.deg[:, None],
+        centre_lat.deg[:, None],
+        edge_lon.deg,
+        edge_lat.deg,
+    )
+    return float(np.max(separations))
+
+
+def angular_separation_deg(
+    ra_1: np.ndarray, dec_1: np.ndarray, ra_2: np.ndarray, dec_2: np.ndarray
+) -> np.ndarray:
+    """
+    Angular separation between positions, using the Vincenty formula
+
+    :param ra_1: first right ascension in degrees
+    :param dec_1: first declination in degrees
+    :param ra_2: second right ascension in degrees
+    :param dec_2: second declination in degrees
+    :return: separation in degrees
+    """
+    ra_1, dec_1, ra_2, dec_2 = (np.radians(x) for x in [ra_1, dec_1, ra_2, dec_2])
+    delta_ra = ra_2 - ra_1
+    numerator = np.hypot(
+        np.cos(dec_2) * np.sin(delta_ra),
+        np.cos(dec_1) * np.sin(dec_2)
+        - np.sin(dec_1) * np.cos(dec_2) * np.cos(delta_ra),
+    )
+    denominator = np.sin(dec_1) * np.sin(dec_2) + np.cos(dec_1) * np.cos(
+        dec_2
+    ) * np.cos(delta_ra)
+    return np.degrees(np.arctan2(numerator, denominator))
+
+
+class CatalogTileCache:
+    """
+    Tile-based local cache for a single catalog configuration
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        catalog_key: str,
+        min_mag: float,
+        max_mag: float,
+        depth: int = DEFAULT_TILE_DEPTH,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.catalog_key = catalog_key
+        self.min_mag = min_mag
+        self.max_mag = max_mag
+        self.depth = depth
+
+    def get_tile_dir(self) -> Path:
+        """
+        Get the directory containing tiles for this catalog configuration
+
+        :return: tile directory
+        """
+        return self.cache_dir.joinpath(
+            self.catalog_key,
+            f"mag{self.min_mag:g}_{self.max_mag:g}",
+            f"depth{self.depth}",
+        )
+
+    def get_tile_path(self, ipix: int) -> Path:
+        """
+        Get the path of a tile
+
+        :param ipix: HEALPix cell index
+        :return: path of tile
+        """
+        return self.get_tile_dir().joinpath(f"{int(ipix)}.fits")
+
+    def get_covering_tiles(
+        self, ra_deg: float, dec_deg: float, radius_deg: float
+    ) -> np.ndarray:
+        """
+        Get the HEALPix cells overlapping a cone
+
+        :param ra_deg: right ascension of cone centre in degrees
+        :param dec_deg: declination of cone centre in degrees
+        :param radius_deg: radius of cone in degrees
+        :return: array of HEALPix cell indices
+        """
+        ipix, _, _ = nested.cone_search(
+            lon=ra_deg * u.deg,
+            lat=dec_deg * u.deg,
+            radius=radius_deg * u.deg,
+            depth=self.depth,
+            flat=True,
+        )
+        return np.unique(ipix)
+
+    def read_tile(self, ipix: int) -> Table | None:
+        """
+        Read a tile from the cache, if it exists
+
+        :param ipix: HEALPix cell index
+        :return: tile, or None if it is missing
+        """
+        path = self.get_tile_path(ipix)
+        if not path.exists():
+            return None
+
+        tile = Table.read(path, format="fits")
+        if (tile.meta[MIN_MAG_KEY] != self.min_mag) or (
+            tile.meta[MAX_MAG_KEY] != self.max_mag
+        ):
+            logger.debug(
+                f"Cached tile {path} has magnitude range "
+                f"{tile.meta[MIN_MAG_KEY]}-{tile.meta[MAX_MAG_KEY]}, "
+                f"but {self.min_mag}-{self.max_mag} is required."
+            )
+            return None
+
+        return tile
+
+    def write_tile(self, ipix: int, tile: Table):
+        """
+        Write a tile to the cache, atomically
+
+        :param ipix: HEALPix cell index
+        :param tile: table of sources in the tile
+        :return: None
+        """
+        tile = tile.copy(copy_data=False)
+        tile.meta = {
+            MIN_MAG_KEY: float(self.min_mag),
+            MAX_MAG_KEY: float(self.max_mag),
+            NSOURCES_KEY: len(tile),
+        }
+
+        path = self.get_tile_path(ipix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, suffix=".fits", delete=False
+        ) as temp_file:
+            temp_path = Path(temp_file.name)
+        try:
+            tile.write(temp_path, format="fits", overwrite=True)
+            os.replace(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def get_cone(
+        self,
+        ra_deg: float,
+        dec_deg: float,
+        radius_deg: float,
+        fetch: Callable[[float, float, float], Table],
+    ) -> Table:
+        """
+        Get all sources in a cone, fetching any missing tiles
+
+        :param ra_deg: right ascension of cone centre in degrees
+        :param dec_deg: declination of cone centre in degrees
+        :param radius_deg: radius of cone in degrees
+        :param fetch: function to fetch a catalog for a cone,
+            given (ra_deg, dec_deg, radius_deg)
+        :return: table of sources in the cone
+        """
+        ipixs = self.get_covering_tiles(ra_deg, dec_deg, radius_deg)
+
+        tiles = {}
+        for ipix in ipixs:
+            tile = self.read_tile(ipix)
+            if tile is not None:
+                tiles[ipix] = tile
+
+        missing = [x for x in ipixs if x not in tiles]
+
+        if len(missing) > 0:
+            logger.debug(
+                f"Fetching {len(missing)} of {len(ipixs)} tiles for "
+                f"{self.catalog_key} around RA {ra_deg:.4f}, Dec {dec_deg:.4f}"
+            )
+            tiles.update(self.fetch_tiles(missing, fetch))
+        else:
+            logger.debug(
+                f"All {len(ipixs)} tiles for {self.catalog_key} found in cache "
+                f"around RA {ra_deg:.4f}, Dec {dec_deg:.4f}"
+            )
+
+        non_empty = [tiles[x] for x in ipixs if len(tiles[x]) > 0]
+        if len(non_empty) == 0:
+            return Table()
+
+        table = vstack(non_empty, metadata_conflicts="silent")
+        table.meta = {}
+        separations = angular_separation_deg(
+            ra_deg, dec_deg, np.asarray(table["ra"]), np.asarray(table["dec"])
+        )
+        return table[separations <= radius_deg]
+
+    def fetch_tiles(
+        self,
+        ipixs: list[int],
+        fetch: Callable[[float, float, float], Table],
+    ) -> dict[int, Table]:
+        """
+        Fetch a set of tiles with a single query, and save them to the cache.
+        The query cone is centred on the tiles, and large enough
+        to fully contain every one of them.
+
+        :param ipixs: HEALPix cell indices
+        :param fetch: function to fetch a catalog for a cone
+        :return: dictionary of tiles
+        """
+        ipixs = np.asarray(ipixs, dtype=np.uint64)
+        centre_lon, centre_lat = nested.healpix_to_lonlat(ipixs, self.depth)
+        centre_vectors = np.column_stack(
+            [
+                np.cos(centre_lat.rad) * np.cos(centre_lon.rad),
+                np.cos(centre_lat.rad) * np.sin(centre_lon.rad),
+                np.sin(centre_lat.rad),
+            ]
+        )
+        mean_vector = np.mean(centre_vectors, axis=0)
+        query_ra = float(np.degrees(np.arctan2(mean_vector[1], mean_vector[0])) % 360)
+        query_dec = float(
+            np.degrees(np.arctan2(mean_vector[2], np.hypot(*mean_vector[:2])))
+        )
+        query_radius = float(
+            np.max(
+                angular_separation_deg(
+                    query_ra, query_dec, centre_lon.deg, centre_lat.deg
+                )
+            )
+            + get_tile_radius_deg(ipixs, self.depth) * 1.01
+        )
+
+        table = fetch(query_ra, query_dec, query_radius)
+
+        if len(table) == 0:
+            # An empty result may be a failed query, or a field outside the
+            # coverage of the catalog, so it is not cached
+            logger.debug(f"No sources found for {self.catalog_key}, not caching")
+            return {ipix: table for ipix in ipixs}
+
+        table_ipix = nested.lonlat_to_healpix(
+            np.asarray(table["ra"], dtype=float) * u.deg,
+            np.asarray(table["dec"], dtype=float) * u.deg,
+            self.depth,
+        )
+
+        tiles = {}
+        for ipix in ipixs:
+            tile = table[table_ipix == ipix]
+            self.write_tile(ipix, tile)
+            tiles[ipix] = tile
+        return tiles
+
+
+def prewarm_catalog_tiles(catalog, positions: list[tuple[float, float]]):
+    """
+    Fill the tile cache of a catalog for a list of pointings, e.g. the fields
+    scheduled for a night
+
+    :param catalog: catalog with tile caching enabled
+    :param positions: list of (ra_deg, dec_deg) pointings
+    :return: None
+    """
+    if catalog.get_tile_cache() is None:
+        err = (
+            f"Cannot prewarm {catalog.abbreviation} catalog, as tile caching is "
+            f"not enabled. Set CATALOG_TILE_CACHE_DIR, or pass a tile_cache_dir."
+        )
+        logger.error(err)
+        raise CatalogTileError(err)
+
+    for ra_deg, dec_deg in positions:
+        catalog.get_cached_catalog(ra_deg=ra_deg, dec_deg=dec_deg)
@@ -69,6 +69,16 @@ class VizierCatalog(BaseCatalog, ABC):
         """
         return f"e_{self.get_mag_key()}"
 
+    def get_tile_cache_key(self) -> str:
+        return f"{self.abbreviation}_{self.get_mag_key()}_snr{self.snr_threshold:g}"
+
+    def get_cached_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
+        table = super().get_cached_catalog(ra_deg=ra_deg, dec_deg=dec_deg)
+        if len(table) == 0:
+            # Tile queries are not centred on the field, so check it here
+            self.check_coverage(ra_deg, dec_deg)
+        return table
+
     def filter_catalog(self, table: astropy.table.Table) -> astropy.table.Table:
         """
         Filters catalog to include a subset of sources, if required
@@ -1,9 +1,33 @@
 """
 Central module for handling the cache, currently used only for storing image data.
+
+Image data is stored as .npy files. These are written atomically
+(to a temporary file, which then replaces the original), and read back as
+copy-on-write memory maps. Reading an image therefore costs only a few page faults
+for the pixels which are actually used, rather than a full read of the file.
+Changes to a memory-mapped array stay private to that array,
+and only reach the cache when they are explicitly saved again.
+
+The cache can optionally keep recently-used arrays in RAM, in front of the .npy
+files. This in-memory tier has a fixed byte budget, set with the
+`WINTER_CACHE_MEMORY_MB` environment variable or
+:func:`~mirar.data.cache.Cache.set_memory_budget`. When the budget is exceeded,
+the least-recently used arrays are evicted, and written to their .npy file
+if they have changed. Hit, miss and eviction counters are available via
+:func:`~mirar.data.cache.Cache.get_stats`.
+
+The lock of the cache only guards this bookkeeping: arrays are written and read
+outside of it, so threads do not wait on each other's file I/O.
+Before forking worker processes, changed arrays should be written to disk with
+:func:`~mirar.data.cache.Cache.flush`, and each worker should discard the
+inherited in-memory tier with :func:`~mirar.data.cache.Cache.reset_after_fork`.
 """
 
 import logging
 import os
+import threading
+import uuid
+from collections import OrderedDict
 from pathlib import Path
 
 import numpy as np
@@ -12,6 +36,9 @@ logger = logging.getLogger(__name__)
 
 USE_CACHE: bool = os.getenv("USE_WINTER_CACHE", "true") in ["true", "True", True]
 
+# Size of the in-memory tier of the cache, in bytes (default 0, i.e disk only)
+CACHE_MEMORY_BUDGET: int = int(float(os.getenv("WINTER_CACHE_MEMORY_MB", "0")) * 1e6)
+
 
 class CacheError(Exception):
     """Error Relating to cache"""
@@ -24,6 +51,20 @@ class Cache:
 
     cache_dir: Path | None = None
 
+    def __init__(self, memory_budget: int = CACHE_MEMORY_BUDGET):
+        # Parsed .npy headers, keyed by path and invalidated by file stats
+        self._layouts: dict[Path, tuple] = {}
+
+        # In-memory tier, ordered from least to most recently used
+        self.memory_budget = memory_budget
+        self._memory_pool: OrderedDict[Path, np.ndarray] = OrderedDict()
+        self._dirty: set[Path] = set()
+        self._pool_bytes = 0
+        # Arrays being written to disk (outside the lock), so still readable
+        self._writing: dict[Path, np.ndarray] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "spills": 0}
+        self._lock = threading.RLock()
+
     def get_cache_dir(self) -> Path:
         """
         Returns the current cache dir
@@ -58,6 +99,329 @@ class Cache:
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
 
+    def get_stats(self) -> dict:
+        """
+        Returns the hit/miss/eviction counters of the in-memory tier
+
+        :return: Dictionary of counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["n_in_memory"] = len(self._memory_pool)
+            stats["bytes_in_memory"] = self._pool_bytes
+            stats["memory_budget"] = self.memory_budget
+        return stats
+
+    def _add_to_pool(
+        self, path: Path, data: np.ndarray, dirty: bool
+    ) -> list[tuple[Path, np.ndarray]]:
+        """
+        Add an array to the in-memory tier, evicting other arrays if needed.
+        Must be called while holding the lock.
+
+        :param path: Path of .npy file
+        :param data: Array to store (owned by the cache)
+        :param dirty: Whether the array still needs to be written to disk
+        :return: Evicted arrays to write to disk, once the lock is released
+        """
+        self._drop_from_pool(path)
+        self._memory_pool[path] = data
+        self._pool_bytes += data.nbytes
+        if dirty:
+            self._dirty.add(path)
+        return self._evict()
+
+    def _drop_from_pool(self, path: Path) -> np.ndarray | None:
+        """
+        Remove an array from the in-memory tier, without writing it to disk
+
+        :param path: Path of .npy file
+        :return: Array which was removed (or None)
+        """
+        data = self._memory_pool.pop(path, None)
+        if data is not None:
+            self._pool_bytes -= data.nbytes
+        self._dirty.discard(path)
+        return data
+
+    def _evict(self) -> list[tuple[Path, np.ndarray]]:
+        """
+        Evict least-recently used arrays, until the in-memory tier is within budget.
+        Must be called while holding the lock.
+
+        :return: Evicted arrays to write to disk, once the lock is released
+        """
+        to_write = []
+        while (self._pool_bytes > self.memory_budget) and (len(self._memory_pool) > 0):
+            path = next(iter(self._memory_pool))
+            dirty = path in self._dirty
+            data = self._drop_from_pool(path)
+            if dirty:
+                to_write.append(self._start_write(path, data))
+            self._stats["evictions"] += 1
+        return to_write
+
+    def _start_write(self, path: Path, data: np.ndarray) -> tuple[Path, np.ndarray]:
+        """
+        Register an array as being written to disk, so that it can still be read
+        until the write completes. Must be called while holding the lock.
+
+        :param path: Path of .npy file
+        :param data: Array to write
+        :return: Path and array
+        """
+        self._writing[path] = data
+        return path, data
+
+    def _write_all(self, to_write: list[tuple[Path, np.ndarray]]):
+        """
+        Write arrays to disk. Must be called without holding the lock.
+
+        :param to_write: Paths and arrays to write
+        :return: None
+        """
+        for path, data in to_write:
+            self._write_to_disk(path, data)
+
+    def set_memory_budget(self, n_bytes: int):
+        """
+        Function to set the size of the in-memory tier of the cache.
+        If the budget is exceeded, the least-recently used arrays are
+        spilled to disk. A budget of 0 disables the in-memory tier.
+
+        :param n_bytes: Memory budget in bytes
+        :return: None
+        """
+        with self._lock:
+            self.memory_budget = int(n_bytes)
+            to_write = self._evict()
+        self._write_all(to_write)
+
+    def spill(self, path: Path):
+        """
+        Move an array from the in-memory tier to disk.
+
+        :param path: Path of .npy file
+        :return: None
+        """
+        to_write = []
+        with self._lock:
+            dirty = path in self._dirty
+            data = self._drop_from_pool(path)
+            if (data is not None) and dirty:
+                to_write.append(self._start_write(path, data))
+                self._stats["spills"] += 1
+        self._write_all(to_write)
+
+    def flush(self):
+        """
+        Write all changed arrays in the in-memory tier to disk, keeping them
+        in memory. Used e.g. before forking worker processes,
+        which read image data from disk.
+
+        :return: None
+        """
+        with self._lock:
+            to_write = [
+                self._start_write(path, self._memory_pool[path]) for path in self._dirty
+            ]
+            self._dirty.clear()
+            self._stats["spills"] += len(to_write)
+        self._write_all(to_write)
+
+    def reset_after_fork(self):
+        """
+        Discard the in-memory tier inherited from a parent process, without
+        writing it to disk. The parent process remains responsible for writing
+        its arrays, so it should call flush() before forking.
+
+        :return: None
+        """
+        self._lock = threading.RLock()
+        self._memory_pool = OrderedDict()
+        self._dirty = set()
+        self._writing = {}
+        self._pool_bytes = 0
+
+    def _write_to_disk(self, path: Path, data: np.ndarray):
+        """
+        Write an array to disk. The array is first written to a temporary file,
+        which then replaces the original. Any existing memory maps of the
+        old file therefore remain valid.
+
+        The file is written without holding the lock. If the array is replaced
+        or removed from the cache in the meantime, the temporary file is discarded.
+
+        :param path: Path of .npy file
+        :param data: Array to save
+        :return: None
+        """
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, "wb") as temp_file:
+                np.save(temp_file, data, allow_pickle=False)
+        except Exception:
+            with self._lock:
+                if self._writing.get(path) is data:
+                    del self._writing[path]
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            is_current = self._writing.get(path) is data
+            if is_current:
+                os.replace(temp_path, path)
+                del self._writing[path]
+                self._layouts.pop(path, None)
+
+        if not is_current:
+            temp_path.unlink(missing_ok=True)
+
+    def save_array(self, path: Path, data: np.ndarray):
+        """
+        Save an array to the cache. If it fits within the memory budget,
+        a copy is kept in memory and only written to disk when evicted.
+        Otherwise, it is written to disk directly.
+
+        :param path: Path of .npy file
+        :param data: Array to save
+        :return: None
+        """
+        data = np.asarray(data)
+
+        with self._lock:
+            # Any pending write of older data for this path is superseded
+            self._writing.pop(path, None)
+            if data.nbytes <= self.memory_budget:
+                to_write = self._add_to_pool(path, data.copy(), dirty=True)
+            else:
+                self._drop_from_pool(path)
+                to_write = [self._start_write(path, data)]
+        self._write_all(to_write)
+
+    def get_layout(self, path: Path) -> tuple:
+        """
+        Get the layout (shape, dtype, order and data offset) of a .npy file.
+        The header is only parsed again if the file has changed on disk
+        (e.g. it was written by another process).
+
+        :param path: Path of .npy file
+        :return: tuple of file stats, shape, dtype, fortran order and offset
+        """
+        stats = os.stat(path)
+        file_id = (stats.st_mtime_ns, stats.st_size, stats.st_ino)
+
+        layout = self._layouts.get(path)
+
+        if (layout is None) or (layout[0] != file_id):
+            with open(path, "rb") as npy_file:
+                version = np.lib.format.read_magic(npy_file)
+                if version == (1, 0):
+                    header = np.lib.format.read_array_header_1_0(npy_file)
+                elif version == (2, 0):
+                    header = np.lib.format.read_array_header_2_0(npy_file)
+                else:
+                    header = None
+                offset = npy_file.tell()
+
+            if header is None:
+                # Other versions have no public header reader, so parse via numpy
+                data = np.load(path.as_posix(), mmap_mode="r", allow_pickle=False)
+                header = (data.shape, data.flags.f_contiguous, data.dtype)
+                offset = data.offset if isinstance(data, np.memmap) else 0
+                del data
+
+            shape, fortran_order, dtype = header
+            layout = (file_id, shape, dtype, fortran_order, offset)
+            self._layouts[path] = layout
+
+        return layout
+
+    def _read_from_disk(self, path: Path, writeable: bool) -> np.ndarray:
+        """
+        Load an array from disk, as a memory map.
+
+        If writeable, the map is copy-on-write: the returned array can be
+        modified freely, without changing the cached file.
+        Otherwise, the map is read-only.
+
+        :param path: Path of .npy file
+        :param writeable: Whether the returned array should be writeable
+        :return: Array
+        """
+        _, shape, dtype, fortran_order, offset = self.get_layout(path)
+
+        if (int(np.prod(shape)) == 0) or dtype.hasobject:
+            return np.load(path.as_posix(), allow_pickle=False)
+
+        data = np.memmap(
+            path,
+            mode="c" if writeable else "r",
+            dtype=dtype,
+            shape=shape,
+            order="F" if fortran_order else "C",
+            offset=offset,
+        )
+        return data.view(np.ndarray)
+
+    def load_array(self, path: Path, writeable: bool = True) -> np.ndarray:
+        """
+        Load an array from the cache.
+
+        Arrays held in memory are returned as a copy if writeable, or as a
+        read-only view otherwise. Other arrays are memory-mapped from disk and,
+        if they fit within the memory budget, promoted to the in-memory tier.
+
+        :param path: Path of .npy file
+        :param writeable: Whether the returned array should be writeable
+        :return: Array
+        """
+        with self._lock:
+            data = self._memory_pool.get(path)
+            if data is not None:
+                self._memory_pool.move_to_end(path)
+            else:
+                data = self._writing.get(path)
+            self._stats["hits" if data is not None else "misses"] += 1
+
+        if data is None:
+            file_id, shape, dtype, _, _ = self.get_layout(path)
+            if int(np.prod(shape)) * dtype.itemsize > self.memory_budget:
+                return self._read_from_disk(path, writeable=writeable)
+
+            disk_data = np.array(self._read_from_disk(path, writeable=False))
+
+            to_write = []
+            with self._lock:
+                data = self._memory_pool.get(path, self._writing.get(path))
+                if data is None:
+                    data = disk_data
+                    # Only keep the array if the file was not replaced meanwhile
+                    stats = os.stat(path)
+                    if file_id == (stats.st_mtime_ns, stats.st_size, stats.st_ino):
+                        to_write = self._add_to_pool(path, data, dirty=False)
+            self._write_all(to_write)
+
+        if writeable:
+            return data.copy()
+
+        view = data.view()
+        view.flags.writeable = False
+        return view
+
+    def remove_array(self, path: Path):
+        """
+        Remove an array from the cache
+
+        :param path: Path of .npy file
+        :return: None
+        """
+        with self._lock:
+            self._drop_from_pool(path)
+            self._writing.pop(path, None)
+            path.unlink(missing_ok=True)
+            self._layouts.pop(path, None)
+
     def __str__(self):
         return f"A cache, with path {self.cache_dir}"
 
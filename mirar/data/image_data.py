@@ -53,11 +53,32 @@ You can change this via an environment variable.
 
 See :doc:`usage` for more information about selecting cache mode,
 and setting the output data directory.
+
+Image data follows a pipeline-wide floating point **dtype policy**.
+Raw images are converted to this dtype when loaded. Floating point data
+set on an Image is stored (in RAM or in the cache) and saved with at most this
+precision: wider data is downcast, while narrower data (e.g. float32 under
+the default policy) is kept as it is, rather than widened.
+The default is float64. For detectors whose dynamic range fits in float32,
+setting the environment variable below halves the memory, cache and I/O used
+for image data. Processors needing extra precision upcast locally.
+
+.. code-block:: bash
+
+    export IMAGE_DTYPE = float32
+
+Images also keep track of the files they have been saved to. Each call to
+`set_data()` increments a data version, and a saved copy of an image is
+only reused (e.g. linked for an external tool, rather than rewritten) if the
+data version and header match those at the time of saving, and the file itself
+has not since been changed. Data should therefore always be updated with
+`set_data()`, rather than by modifying arrays in place.
 """
 
 import copy
 import hashlib
 import logging
+import os
 import threading
 from pathlib import Path
 from typing import Optional
@@ -68,9 +89,81 @@ from astropy.time import Time
 
 from mirar.data.base_data import DataBatch, DataBlock
 from mirar.data.cache import USE_CACHE, cache
+from mirar.paths import LATEST_SAVE_KEY
 
 logger = logging.getLogger(__name__)
 
+IMAGE_DTYPES = ["float32", "float64"]
+
+
+class ImageDtypeError(ValueError):
+    """Error relating to the image dtype policy"""
+
+
+def validate_image_dtype(dtype: str | np.dtype | type) -> np.dtype:
+    """
+    Check that a dtype is a valid image dtype
+
+    :param dtype: dtype
+    :return: numpy dtype
+    """
+    dtype = np.dtype(dtype)
+    if dtype.name not in IMAGE_DTYPES:
+        err = f"Image dtype '{dtype.name}' not recognised. Valid dtypes: {IMAGE_DTYPES}"
+        logger.error(err)
+        raise ImageDtypeError(err)
+    return dtype
+
+
+_image_dtype = validate_image_dtype(os.getenv("IMAGE_DTYPE", "float64"))
+
+
+def get_image_dtype() -> np.dtype:
+    """
+    Get the dtype used for image data
+
+    :return: numpy dtype
+    """
+    return _image_dtype
+
+
+def set_image_dtype(dtype: str | np.dtype | type):
+    """
+    Set the dtype used for image data
+
+    :param dtype: dtype, either float32 or float64
+    :return: None
+    """
+    global _image_dtype  # pylint: disable=global-statement
+    _image_dtype = validate_image_dtype(dtype)
+
+
+def to_image_dtype(data: np.ndarray) -> np.ndarray:
+    """
+    Convert image data to the image dtype.
+    Data already with the image dtype is returned without a copy.
+
+    :param data: image data
+    :return: image data with the image dtype
+    """
+    return np.asarray(data, dtype=_image_dtype)
+
+
+def downcast_to_image_dtype(data: np.ndarray) -> np.ndarray:
+    """
+    Convert floating point image data wider than the image dtype to the image dtype.
+    Narrower data, and non-floating point data, is returned unchanged.
+
+    :param data: image data
+    :return: image data, with at most the precision of the image dtype
+    """
+    data = np.asarray(data)
+    if np.issubdtype(data.dtype, np.floating) and (
+        data.dtype.itemsize > _image_dtype.itemsize
+    ):
+        return data.astype(_image_dtype)
+    return data
+
 
 class Image(DataBlock):
     """
@@ -84,13 +177,22 @@ class Image(DataBlock):
 
     cache_files = []
 
+    # Whether images unpickled in this process take ownership of their cache file.
+    # Worker processes switch this off, so that they never delete files
+    # belonging to the parent process.
+    adopt_cache_on_unpickle: bool = True
+
     def __init__(self, data: np.ndarray, header: Header):
         self._data = None
+        self._owns_cache = False
+        self._data_version = 0
+        self._saved_paths = {}
         self.header = header
         super().__init__()
         if USE_CACHE:
             self.cache_path = self.get_cache_path()
             self.cache_files.append(self.cache_path)
+            self._owns_cache = True
         else:
             self.cache_path = None
         self.set_data(data=data)
@@ -112,11 +214,16 @@ class Image(DataBlock):
 
     def set_data(self, data: np.ndarray):
         """
-        Set the data with cache
+        Set the data with cache. Floating point data wider than
+        the image dtype is downcast to the image dtype.
 
         :param data: Updated image data
         :return: None
         """
+        data = downcast_to_image_dtype(data)
+
+        self._data_version += 1
+
         if USE_CACHE:
             self.set_cache_data(data)
         else:
@@ -129,7 +236,7 @@ class Image(DataBlock):
         :param data: Updated image data
         :return: None
         """
-        np.save(self.cache_path.as_posix(), data, allow_pickle=False)
+        cache.save_array(self.cache_path, data)
 
     def set_ram_data(self, data: np.ndarray):
         """
@@ -151,14 +258,29 @@ class Image(DataBlock):
 
         return self.get_ram_data()
 
+    def get_readonly_data(self) -> np.ndarray:
+        """
+        Get a read-only view of the image data, without copying it.
+        With the cache enabled, this may be a memory map of the cached array,
+        so data can be read piecewise without loading the full image.
+
+        :return: read-only image data (numpy array)
+        """
+        if USE_CACHE:
+            return cache.load_array(self.cache_path, writeable=False)
+
+        data = self.get_ram_data().view()
+        data.flags.writeable = False
+        return data
+
     def get_mask(self) -> np.ndarray:
         """
         Get the mask data for an image. 0 is masked, 1 is unmasked.
 
         :return: mask data (numpy array)
         """
-        img_data = self.get_data()
-        return ~np.isnan(img_data)
+        # A read-only map, so no private copy of the data is made
+        return ~np.isnan(self.get_readonly_data())
 
     def get_cache_data(self) -> np.ndarray:
         """
@@ -166,7 +288,7 @@ class Image(DataBlock):
 
         :return: image data (numpy array)
         """
-        return np.load(self.cache_path.as_posix(), allow_pickle=True)
+        return cache.load_array(self.cache_path)
 
     def get_ram_data(self) -> np.ndarray:
         """
@@ -193,6 +315,73 @@ class Image(DataBlock):
         """
         self.header = header
 
+    def get_data_version(self) -> int:
+        """
+        Get the version of the image data, which is incremented
+        each time the data is set
+
+        :return: data version
+        """
+        return self._data_version
+
+    def get_content_version(self, include_header: bool = True) -> str:
+        """
+        Get a version string for the content of the image, changing whenever
+        the data (or optionally the header) changes. The path of the latest save
+        is excluded from the header, as it does not change the content.
+
+        :param include_header: whether the version includes the header
+        :return: content version
+        """
+        version = str(self._data_version)
+        if include_header:
+            header_hash = hashlib.sha1()
+            for card in self.header.cards:
+                if card.keyword != LATEST_SAVE_KEY:
+                    header_hash.update(card.image.encode())
+            version += f":{header_hash.hexdigest()}"
+        return version
+
+    def set_saved_path(self, path: str | Path, version: str, kind: str = "image"):
+        """
+        Record that a file derived from the image has been saved to path
+
+        :param path: path of saved file
+        :param version: content version of the image used to make the file
+        :param kind: kind of file, e.g. 'image' or 'mask'
+        :return: None
+        """
+        path = Path(path)
+        stat = path.stat()
+        self._saved_paths[kind] = (path, version, stat.st_mtime_ns, stat.st_size)
+
+    def get_saved_path(self, version: str, kind: str = "image") -> Optional[Path]:
+        """
+        Get the path of a saved file derived from the image, if the file still
+        exists unchanged, and was made from the same content version of the image
+
+        :param version: current content version of the image
+        :param kind: kind of file, e.g. 'image' or 'mask'
+        :return: path of saved file, or None
+        """
+        if kind not in self._saved_paths:
+            return None
+
+        path, saved_version, mtime_ns, size = self._saved_paths[kind]
+
+        if saved_version != version:
+            return None
+
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+
+        if (stat.st_mtime_ns, stat.st_size) != (mtime_ns, size):
+            return None
+
+        return path
+
     def __getitem__(self, item):
         return self.header.__getitem__(item)
 
@@ -207,10 +396,34 @@ class Image(DataBlock):
         """
         return self.header.keys()
 
+    def release_cache(self):
+        """
+        Give up ownership of the cache file, so that it is not deleted when
+        this object is. Used when handing an image over to another process.
+
+        :return: None
+        """
+        if self._owns_cache:
+            self._owns_cache = False
+            self.cache_files.remove(self.cache_path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_owns_cache"] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.cache_path is not None and self.adopt_cache_on_unpickle:
+            self.cache_files.append(self.cache_path)
+            self._owns_cache = True
+
     def __del__(self):
-        if self.cache_path is not None:
-            self.cache_path.unlink(missing_ok=True)
+        if self.cache_path is not None and getattr(self, "_owns_cache", False):
             self.cache_files.remove(self.cache_path)
+            # Several images (e.g. one returned by a worker process) can share a file
+            if self.cache_path not in self.cache_files:
+                cache.remove_array(self.cache_path)
 
     def __deepcopy__(self, memo):
         new = type(self)(
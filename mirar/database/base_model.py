@@ -4,6 +4,7 @@ Module to define PSQL database tables using sqlalchemy
 
 import logging
 from datetime import date
+from functools import lru_cache
 from typing import Any, ClassVar, Type
 
 import pandas as pd
@@ -13,6 +14,7 @@ from pydantic import (
     ConfigDict,
     Field,
     FieldValidationInfo,
+    TypeAdapter,
     field_validator,
     model_validator,
 )
@@ -22,7 +24,7 @@ from sqlalchemy.exc import IntegrityError
 from mirar.database.constants import POSTGRES_DUPLICATE_PROTOCOLS
 from mirar.database.constraints import DBQueryConstraints
 from mirar.database.transactions import select_from_table
-from mirar.database.transactions.insert import _insert_in_table
+from mirar.database.transactions.insert import _insert_in_table, _insert_many_in_table
 from mirar.database.transactions.update import _update_database_entry
 from mirar.errors import ProcessorError
 
@@ -211,6 +213,110 @@ class BaseDB(PydanticBase):
         logger.debug(f"Return result {result}")
         return result
 
+    @classmethod
+    def validate_entries(cls, records: list[dict]) -> list["BaseDB"]:
+        """
+        Validate many entries at once
+
+        :param records: list of dictionaries, one per entry
+        :return: list of validated models
+        """
+        return _get_list_adapter(cls).validate_python(records)
+
+    @classmethod
+    def prepare_bulk_insert(cls, entries: list["BaseDB"]):
+        """
+        Prepare validated entries for a bulk insert. Models which override
+        insert_entry to modify entries before insertion should override this
+        function to do the same for many entries, to allow bulk inserts.
+
+        :param entries: validated entries
+        :return: None
+        """
+
+    @classmethod
+    def supports_bulk_insert(cls) -> bool:
+        """
+        Check whether entries can be bulk inserted. This is true unless
+        insert_entry is overridden without overriding prepare_bulk_insert.
+
+        :return: boolean
+        """
+        overrides_insert = cls.insert_entry is not BaseDB.insert_entry
+        overrides_prepare = (
+            cls.prepare_bulk_insert.__func__ is not BaseDB.prepare_bulk_insert.__func__
+        )
+        return (not overrides_insert) or overrides_prepare
+
+    @classmethod
+    def insert_entries(
+        cls,
+        records: list[dict],
+        duplicate_protocol: str,
+        returning_key_names: str | list[str] | None = None,
+    ) -> pd.DataFrame:
+        """
+        Validate many entries in one pass, and insert them into the corresponding
+        sql database in a single transaction.
+
+        If any entry is a duplicate, the transaction is rolled back. For the 'fail'
+        protocol an error is then raised, while for 'ignore' and 'replace'
+        each entry is inserted individually with insert_entry to
+        resolve the duplicates.
+
+        :param records: list of dictionaries, one per entry
+        :param duplicate_protocol: protocol to follow if duplicate entry is found
+        :param returning_key_names: names of the keys to return
+        :return: dataframe of the returned keys, with one row per entry
+        """
+        assert duplicate_protocol in POSTGRES_DUPLICATE_PROTOCOLS
+
+        entries = cls.validate_entries(records)
+
+        if len(entries) == 0:
+            return pd.DataFrame()
+
+        if returning_key_names is None:
+            returning_key_names = entries[0].get_primary_key()
+
+        if not isinstance(returning_key_names, list):
+            returning_key_names = [returning_key_names]
+
+        if cls.supports_bulk_insert():
+            cls.prepare_bulk_insert(entries)
+
+            try:
+                return _insert_many_in_table(
+                    new_entries=[x.model_dump() for x in entries],
+                    sql_table=cls.sql_model,
+                    returning_keys=returning_key_names,
+                )
+            except IntegrityError as exc:
+                if not isinstance(exc.orig, errors.UniqueViolation):
+                    raise exc
+
+                if duplicate_protocol == "fail":
+                    err = (
+                        f"Duplicate error, at least one of {len(entries)} entries "
+                        f"already exists in {cls.sql_model.__tablename__}."
+                    )
+                    logger.error(err)
+                    raise errors.UniqueViolation from exc
+
+                logger.debug(
+                    f"Found duplicate entries in {cls.sql_model.__tablename__}, "
+                    f"inserting {len(entries)} entries individually."
+                )
+
+        results = [
+            x.insert_entry(
+                duplicate_protocol=duplicate_protocol,
+                returning_key_names=returning_key_names,
+            )
+            for x in entries
+        ]
+        return pd.concat(results, ignore_index=True)
+
     def _update_entry(self, update_key_names: list[str] | str | None = None):
         """
         Update database entry
@@ -290,6 +396,17 @@ class BaseDB(PydanticBase):
         return len(match) > 0
 
 
+@lru_cache
+def _get_list_adapter(model: Type[BaseDB]) -> TypeAdapter:
+    """
+    Get a (cached) adapter to validate a list of entries for a model
+
+    :param model: database model
+    :return: TypeAdapter
+    """
+    return TypeAdapter(list[model])
+
+
 ra_field: float = Field(title="RA (degrees)", ge=0.0, le=360.0)
 dec_field: float = Field(title="Dec (degrees)", ge=-90.0, le=90.0)
 alt_field: float = Field(title="Alt (degrees)", ge=0.0, le=90.0)
@@ -1,8 +1,27 @@
 """
 Util functions for database interactions
+
+Engines are cached for each process, keyed on the database and credentials,
+so connections are reused between queries rather than opened for every
+select or insert. Each engine has a bounded connection pool, sized to the
+number of worker threads (MAX_N_CPU). Connections are checked with a 'pre-ping'
+before use, and recycled periodically, so stale connections are replaced.
+
+After a fork, the child process discards the engines inherited from its parent
+(without closing the parent's connections), and creates its own as needed.
+
+Pool statistics (connections checked out, overflow, and time spent waiting for
+a connection) are available via :func:`get_pool_stats`,
+or in Prometheus format via :func:`get_pool_metrics_text`, which the monitor
+serves alongside its processing metrics.
 """
 
-from sqlalchemy import URL, Engine, NullPool, create_engine
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import URL, Engine, QueuePool, create_engine
 
 from mirar.database.credentials import (
     DB_HOSTNAME,
@@ -11,6 +30,88 @@ from mirar.database.credentials import (
     DB_SCHEMA,
     DB_USER,
 )
+from mirar.paths import PACKAGE_NAME, max_n_cpu
+
+logger = logging.getLogger(__name__)
+
+# Number of connections kept open in each pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(max_n_cpu)))
+# Number of extra connections which can be opened temporarily beyond the pool size
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", str(max_n_cpu)))
+# Maximum time to wait for a connection, in seconds
+DB_POOL_TIMEOUT = 30.0
+# Maximum age of a connection before it is replaced, in seconds
+DB_POOL_RECYCLE = 1800
+
+_engines: dict[tuple, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool which records the time spent waiting for connections
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.n_checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            with self._wait_lock:
+                self.n_checkouts += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    def recreate(self):
+        # Pools are recreated (e.g. on dispose), so carry over the statistics
+        new = super().recreate()
+        new.n_checkouts = self.n_checkouts
+        new.total_wait = self.total_wait
+        new.max_wait = self.max_wait
+        return new
+
+    def get_stats(self) -> dict:
+        """
+        Get statistics for the pool
+
+        :return: dictionary of statistics
+        """
+        with self._wait_lock:
+            return {
+                "size": self.size(),
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": max(self.overflow(), 0),
+                "n_checkouts": self.n_checkouts,
+                "total_wait": self.total_wait,
+                "max_wait": self.max_wait,
+            }
+
+
+def _reset_engines_after_fork():
+    """
+    Discard engines inherited from a parent process, without closing
+    the parent's connections
+
+    :return: None
+    """
+    global _engines_lock  # pylint: disable=global-statement
+    _engines_lock = threading.Lock()
+    for engine in _engines.values():
+        engine.dispose(close=False)
+    _engines.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
 
 
 def get_engine(
@@ -22,7 +123,7 @@ def get_engine(
     db_schema: str = DB_SCHEMA,
 ) -> Engine:
     """
-    Function to create a postgres engine
+    Function to get a (cached) postgres engine
 
     :param db_user: User for db
     :param db_password: password for db
@@ -32,19 +133,90 @@ def get_engine(
     :param db_schema: schema of db
     :return: sqlalchemy engine
     """
+    key = (os.getpid(), db_name, db_user, db_password, db_hostname, db_port, db_schema)
+
+    with _engines_lock:
+        engine = _engines.get(key)
+
+        if engine is None:
+            url_object = URL.create(
+                "postgresql+psycopg",
+                username=db_user,
+                password=db_password,
+                host=db_hostname,
+                port=db_port,
+                database=db_name,
+            )
+
+            engine = create_engine(
+                url_object,
+                future=True,
+                poolclass=TimedQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_POOL_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=True,
+                connect_args={"options": f"-csearch_path={db_schema}"},
+            )
+            _engines[key] = engine
+
+    return engine
+
+
+def dispose_engines():
+    """
+    Close all pooled connections, and discard all cached engines
+
+    :return: None
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def get_pool_stats() -> dict[str, dict]:
+    """
+    Get connection pool statistics for each cached engine of this process
+
+    :return: dictionary of statistics, keyed by 'user@host:port/db_name'
+    """
+    with _engines_lock:
+        engines = list(_engines.items())
+
+    stats = {}
+    for key, engine in engines:
+        if key[0] != os.getpid():
+            continue
+        _, db_name, db_user, _, db_hostname, db_port, _ = key
+        stats[f"{db_user}@{db_hostname}:{db_port}/{db_name}"] = engine.pool.get_stats()
+    return stats
+
+
+def get_pool_metrics_text() -> str:
+    """
+    Get connection pool statistics in the Prometheus text exposition format
+
+    :return: string
+    """
+    metrics = [
+        ("checked_out", "checked_out_connections", "gauge", "Connections in use"),
+        ("overflow", "overflow_connections", "gauge", "Connections beyond pool size"),
+        ("n_checkouts", "checkouts_total", "counter", "Connection checkouts"),
+        ("total_wait", "wait_seconds_total", "counter", "Time waiting for connections"),
+        ("max_wait", "max_wait_seconds", "gauge", "Longest wait for a connection"),
+    ]
+
+    stats = get_pool_stats()
 
-    url_object = URL.create(
-        "postgresql+psycopg",
-        username=db_user,
-        password=db_password,
-        host=db_hostname,
-        port=db_port,
-        database=db_name,
-    )
-
-    return create_engine(
-        url_object,
-        future=True,
-        poolclass=NullPool,
-        connect_args={"options": f"-csearch_path={db_schema}"},
-    )
+    lines = []
+    for column, name, metric_type, description in metrics:
+        lines.append(f"# HELP {PACKAGE_NAME}_db_pool_{name} {description}")
+        lines.append(f"# TYPE {PACKAGE_NAME}_db_pool_{name} {metric_type}")
+        for database, pool_stats in stats.items():
+            lines.append(
+                f'{PACKAGE_NAME}_db_pool_{name}{{database="{database}"}} '
+                f"{float(pool_stats[column])}"
+            )
+    return "\n".join(lines) + "\n"
@@ -2,10 +2,11 @@
 Central module for all DB transaction types.
 """
 
-from mirar.database.transactions.insert import _insert_in_table
+from mirar.database.transactions.insert import _insert_in_table, _insert_many_in_table
 from mirar.database.transactions.select import (
     check_table_exists,
     is_populated,
     select_from_table,
+    select_q3c_crossmatch,
 )
 from mirar.database.transactions.update import _update_database_entry
@@ -50,3 +50,43 @@ def _insert_in_table(
         conn.commit()
 
     return pd.DataFrame(res.fetchall())
+
+
+def _insert_many_in_table(
+    new_entries: list[dict],
+    sql_table: Type[BaseTable],
+    returning_keys: list[str] | str,
+) -> pd.DataFrame:
+    """
+    Export many entries to a database table, in a single transaction.
+    Entries are sent as multi-row INSERT statements, and the returned
+    keys are in the same order as the entries. If any entry fails,
+    no entries are inserted.
+
+    :param new_entries: list of dictionaries to export, all with the same keys
+    :param sql_table: table of DB to export to
+    :param returning_keys: keys to return
+    :return: dataframe of returned keys, with one row per entry
+    """
+    if not isinstance(returning_keys, list):
+        returning_keys = [returning_keys]
+
+    if len(new_entries) == 0:
+        return pd.DataFrame(columns=returning_keys)
+
+    db_name = sql_table.db_name
+
+    table_columns = sql_table.__table__.columns
+    stmt = Insert(sql_table).returning(
+        *[table_columns[x] for x in returning_keys], sort_by_parameter_order=True
+    )
+
+    engine = get_engine(db_name=db_name)
+
+    with engine.begin() as conn:
+        res = conn.execute(stmt, new_entries)
+        rows = res.fetchall()
+
+    logger.debug(f"Inserted {len(rows)} entries into {sql_table.__tablename__}")
+
+    return pd.DataFrame(rows, columns=returning_keys)
@@ -2,6 +2,9 @@
 Module to select database entries
 """
 
+import logging
+
+import numpy as np
 import pandas as pd
 from sqlalchemy import Select, text
 
@@ -9,6 +12,13 @@ from mirar.database.base_table import BaseTable
 from mirar.database.constraints import DBQueryConstraints
 from mirar.database.engine import get_engine
 
+logger = logging.getLogger(__name__)
+
+# Column of crossmatch results giving the row index of each query position
+XMATCH_INDEX_COLUMN = "_xm_index"
+# Prefix for uploaded query values, to avoid clashes with table columns
+XMATCH_QUERY_PREFIX = "_xm_"
+
 
 def run_select(
     query: Select,
@@ -114,3 +124,112 @@ def is_populated(
         )
 
     return res.fetchone()[0]
+
+
+def select_q3c_crossmatch(
+    sql_table: BaseTable,
+    query_values: pd.DataFrame,
+    crossmatch_radius_arcsec: float,
+    output_columns: list[str],
+    ra_field_name: str = "ra",
+    dec_field_name: str = "dec",
+    join_constraints: list[str] | None = None,
+    db_constraints: DBQueryConstraints | None = None,
+    max_num_results: int | None = None,
+    order_field_name: str | None = None,
+    order_ascending: bool = False,
+) -> pd.DataFrame:
+    """
+    Crossmatch many positions to a table in a single query. The positions are
+    uploaded as arrays, and joined to the table with q3c_join.
+
+    Uploaded values are available to join constraints as q._xm_<column>,
+    and table columns as t.<column>. Matches for each position are ranked by
+    order_field_name (if given), and then by distance.
+
+    :param sql_table: database SQL table
+    :param query_values: dataframe of query values, with (at least) 'ra' and 'dec'
+        columns in degrees. Any other columns must be numeric.
+    :param crossmatch_radius_arcsec: crossmatch radius in arcsec
+    :param output_columns: table columns to output
+    :param ra_field_name: ra field name in the table
+    :param dec_field_name: dec field name in the table
+    :param join_constraints: additional sql constraints relating
+        query values and table columns
+    :param db_constraints: additional database query constraints on the table
+    :param max_num_results: maximum number of matches per position (default: all)
+    :param order_field_name: table column to rank matches by
+    :param order_ascending: whether to rank matches in ascending order
+    :return: dataframe of matches, with the row index of the matched query position
+        in column XMATCH_INDEX_COLUMN, sorted by index and then rank
+    """
+    output_columns = list(output_columns)
+    result_columns = [XMATCH_INDEX_COLUMN] + output_columns
+
+    if len(query_values) == 0:
+        return pd.DataFrame(columns=result_columns)
+
+    query_columns = list(query_values.columns)
+    params = {"q_index": list(range(len(query_values)))}
+    for i, column in enumerate(query_columns):
+        params[f"q_{i}"] = np.asarray(query_values[column], dtype=float).tolist()
+
+    arrays = ["CAST(:q_index AS bigint[])"] + [
+        f"CAST(:q_{i} AS double precision[])" for i in range(len(query_columns))
+    ]
+    aliases = [XMATCH_INDEX_COLUMN] + [
+        f"{XMATCH_QUERY_PREFIX}{x}" for x in query_columns
+    ]
+
+    q_ra = f"q.{XMATCH_QUERY_PREFIX}ra"
+    q_dec = f"q.{XMATCH_QUERY_PREFIX}dec"
+    t_ra = f"t.{ra_field_name}"
+    t_dec = f"t.{dec_field_name}"
+
+    where = []
+    if join_constraints is not None:
+        where += join_constraints
+    if (db_constraints is not None) and (len(db_constraints) > 0):
+        where.append(f"({db_constraints.parse_constraints()})")
+    where_clause = f"WHERE {' AND '.join(where)}" if len(where) > 0 else ""
+
+    order = []
+    if order_field_name is not None:
+        order.append(f"t.{order_field_name} {'ASC' if order_ascending else 'DESC'}")
+    order.append(f"q3c_dist({q_ra}, {q_dec}, {t_ra}, {t_dec})")
+
+    rank_clause = ""
+    if max_num_results is not None:
+        rank_clause = f"WHERE _xm_rank <= {int(max_num_results)}"
+
+    selected = ", ".join([f"t.{x}" for x in output_columns])
+
+    query = text(
+        f"""
+        SELECT {", ".join(result_columns)} FROM (
+            SELECT q.{XMATCH_INDEX_COLUMN}, {selected},
+                ROW_NUMBER() OVER (
+                    PARTITION BY q.{XMATCH_INDEX_COLUMN} ORDER BY {", ".join(order)}
+                ) AS _xm_rank
+            FROM unnest({", ".join(arrays)}) AS q({", ".join(aliases)})
+            JOIN {sql_table.__tablename__} AS t
+                ON q3c_join({q_ra}, {q_dec}, {t_ra}, {t_dec},
+                    {crossmatch_radius_arcsec / 3600.0})
+            {where_clause}
+        ) AS matches
+        {rank_clause}
+        ORDER BY {XMATCH_INDEX_COLUMN}, _xm_rank
+        """
+    )
+
+    engine = get_engine(db_name=sql_table.db_name)
+
+    with engine.connect() as conn:
+        res = pd.read_sql(query, conn, params=params)
+
+    logger.debug(
+        f"Crossmatched {len(query_values)} positions to "
+        f"{sql_table.__tablename__}, with {len(res)} matches"
+    )
+
+    return res[result_columns]
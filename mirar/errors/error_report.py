@@ -29,6 +29,23 @@ class ErrorReport:
         self.t_error = datetime.now()
         self.known_error_bool = isinstance(self.error, BaseProcessorError)
         self.non_critical_bool = isinstance(self.error, NoncriticalProcessingError)
+        self.traceback_lines = None
+
+    def get_traceback_lines(self) -> list[str]:
+        """
+        Returns the formatted traceback of the error. Tracebacks cannot be pickled,
+        so reports sent from a worker process carry a pre-formatted copy.
+
+        :return: list of traceback lines
+        """
+        if self.traceback_lines is not None:
+            return self.traceback_lines
+        return traceback.format_tb(self.error.__traceback__)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["traceback_lines"] = self.get_traceback_lines()
+        return state
 
     def message_known_error(self) -> str:
         """
@@ -63,7 +80,7 @@ class ErrorReport:
         msg = (
             f"Error for processor {self.processor_name} at {self.t_error} "
             f"(local time): \n "
-            f"{''.join(traceback.format_tb(self.error.__traceback__))}"
+            f"{''.join(self.get_traceback_lines())}"
             f"{self.get_error_name()}: {self.error} \n  "
             f"This error affected the following files: {self.contents} \n"
             f"{self.message_known_error()} \n \n"
@@ -84,7 +101,7 @@ class ErrorReport:
 
         :return: String for single line
         """
-        return traceback.format_tb(self.error.__traceback__)[-1]
+        return self.get_traceback_lines()[-1]
 
     def get_error_line(self) -> str:
         """
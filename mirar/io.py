@@ -6,6 +6,7 @@ All opening/writing of fits files should run via this script.
 
 import copy
 import logging
+import os
 import warnings
 from pathlib import Path
 from typing import Callable
@@ -15,7 +16,9 @@ from astropy.io import fits
 from astropy.utils.exceptions import AstropyUserWarning, AstropyWarning
 
 from mirar.data import Image
+from mirar.data.image_data import downcast_to_image_dtype, to_image_dtype
 from mirar.errors.exceptions import ProcessorError
+from mirar.metrics import record_bytes_read, record_bytes_written
 from mirar.paths import BASE_NAME_KEY, LATEST_SAVE_KEY, RAW_IMG_KEY, core_fields
 
 logger = logging.getLogger(__name__)
@@ -54,6 +57,7 @@ def save_hdu_as_fits(hdu: fits.PrimaryHDU, path: str | Path, overwrite: bool = T
     """
     hdu.verify("silentfix+exception")
     hdu.writeto(path, overwrite=overwrite)
+    record_bytes_written(os.path.getsize(path))
 
 
 def save_to_path(
@@ -89,6 +93,7 @@ def save_mef_to_path(data_list, header_list, primary_header, path):
     hdulist = fits.HDUList(hdu_list)
 
     hdulist.writeto(path, overwrite=True)
+    record_bytes_written(os.path.getsize(path))
 
 
 def open_fits(path: str | Path) -> tuple[np.ndarray, fits.Header]:
@@ -100,6 +105,7 @@ def open_fits(path: str | Path) -> tuple[np.ndarray, fits.Header]:
     """
     if isinstance(path, str):
         path = Path(path)
+    record_bytes_read(os.path.getsize(path))
     with fits.open(path, memmap=False, ignore_missing_simple=True) as img:
         hdu = img.pop(0)
         hdu.verify("silentfix+ignore")
@@ -129,12 +135,67 @@ def save_fits(
     if isinstance(path, str):
         path = Path(path)
     check_image_has_core_fields(image)
-    data = image.get_data()
+    data = downcast_to_image_dtype(image.get_data())
     header = image.get_header()
     if header is not None:
         header[LATEST_SAVE_KEY] = path.as_posix()
     logger.debug(f"Saving to {path.as_posix()}")
     save_to_path(data, header, path)
+    image.set_saved_path(path, image.get_content_version())
+
+
+def link_file(source: str | Path, destination: str | Path) -> bool:
+    """
+    Link destination to an existing file at source, replacing any file
+    at destination. A hard link is used if possible, and otherwise a symbolic link.
+
+    :param source: path of existing file
+    :param destination: path of link
+    :return: boolean whether the link was made
+    """
+    source, destination = Path(source), Path(destination)
+
+    if destination.exists() and destination.samefile(source):
+        return True
+
+    if destination.exists() or destination.is_symlink():
+        destination.unlink()
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        try:
+            os.symlink(source.resolve(), destination)
+        except OSError as exc:
+            logger.debug(f"Could not link {destination} to {source}: {exc}")
+            return False
+
+    logger.debug(f"Linked {destination} to {source}")
+    return True
+
+
+def link_or_save_fits(
+    image: Image,
+    path: str | Path,
+):
+    """
+    Link path to an existing saved copy of an Image, if the image is unchanged
+    since that copy was saved, and otherwise save the Image to path
+
+    :param image: Image to save
+    :param path: path
+    :return: None
+    """
+    if isinstance(path, str):
+        path = Path(path)
+
+    saved_path = image.get_saved_path(image.get_content_version())
+
+    if (saved_path is None) or (not link_file(saved_path, path)):
+        save_fits(image, path)
+        return
+
+    image[LATEST_SAVE_KEY] = path.as_posix()
 
 
 def open_raw_image(
@@ -153,7 +214,7 @@ def open_raw_image(
 
     data, header = open_f(path)
 
-    new_img = Image(data.astype(np.float64), header)
+    new_img = Image(to_image_dtype(data), header)
 
     check_image_has_core_fields(new_img)
 
@@ -170,12 +231,13 @@ def open_mef_fits(
     :return: tuple containing image data and image header
     """
     split_data, split_headers = [], []
+    record_bytes_read(os.path.getsize(path))
     with fits.open(path, memmap=False) as hdu:
         primary_header = hdu[0].header  # pylint: disable=no-member
         num_ext = len(hdu)
         for ext in range(1, num_ext):
             split_data.append(
-                hdu[ext].data.astype(np.float64)
+                to_image_dtype(hdu[ext].data)
             )  # pylint: disable=no-member
             split_headers.append(hdu[ext].header)  # pylint: disable=no-member
 
@@ -280,7 +342,7 @@ def open_mef_image(
         extension_key=extension_key,
     )
 
-    ext_data_list = [x.astype(np.float64) for x in ext_data_list]
+    ext_data_list = [to_image_dtype(x) for x in ext_data_list]
     split_images_list = []
 
     for i, ext_data in enumerate(ext_data_list):
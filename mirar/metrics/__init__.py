@@ -0,0 +1,20 @@
+"""
+Central module for recording performance metrics during processing.
+
+Each time a :class:`~mirar.processors.base_processor.BaseProcessor` acts on a
+:class:`~mirar.data.base_data.DataBatch`, a
+:class:`~mirar.metrics.processing_record.ProcessingRecord` is created. This
+records the wall time, CPU time, change in memory usage, and the number of bytes read
+and written through :mod:`mirar.io`.
+
+These records are collated in a :class:`~mirar.metrics.metrics_report.MetricsReport`,
+which summarises them for each processor, and can be exported in JSON, CSV or
+Prometheus text format. A :class:`~mirar.metrics.prometheus.PrometheusExporter`
+can serve the latter over http, e.g. for a realtime
+:class:`~mirar.monitor.base_monitor.Monitor`.
+"""
+
+from mirar.metrics.io_counter import record_bytes_read, record_bytes_written
+from mirar.metrics.metrics_report import MetricsReport
+from mirar.metrics.processing_record import ProcessingRecord, ProcessingTracker
+from mirar.metrics.prometheus import PrometheusExporter
@@ -0,0 +1,40 @@
+"""
+Module for counting the bytes read and written through :mod:`mirar.io`.
+
+Counters are kept per thread, so that each worker thread only counts its own I/O.
+They only ever increase, so I/O for a block of code is the difference between
+the counters before and after.
+"""
+
+import threading
+
+_counters = threading.local()
+
+
+def get_io_counters() -> tuple[int, int]:
+    """
+    Get the I/O counters of the current thread
+
+    :return: bytes read, bytes written
+    """
+    return getattr(_counters, "bytes_read", 0), getattr(_counters, "bytes_written", 0)
+
+
+def record_bytes_read(n_bytes: int):
+    """
+    Add to the count of bytes read by the current thread
+
+    :param n_bytes: number of bytes
+    :return: None
+    """
+    _counters.bytes_read = getattr(_counters, "bytes_read", 0) + int(n_bytes)
+
+
+def record_bytes_written(n_bytes: int):
+    """
+    Add to the count of bytes written by the current thread
+
+    :param n_bytes: number of bytes
+    :return: None
+    """
+    _counters.bytes_written = getattr(_counters, "bytes_written", 0) + int(n_bytes)
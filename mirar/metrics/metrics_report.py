@@ -0,0 +1,227 @@
+"""
+Module for MetricsReport objects.
+
+A :class:`~mirar.metrics.metrics_report.MetricsReport` object contains a list of
+:class:`~mirar.metrics.processing_record.ProcessingRecord` objects,
+and summarises them for each processor. The summary is updated as each record
+is added, so long-running reports (e.g. for a realtime monitor) can keep only
+the most recent records, without losing any from the summary.
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from mirar.data import cache
+from mirar.metrics.processing_record import ProcessingRecord, get_peak_rss
+from mirar.paths import PACKAGE_NAME, __version__
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsReport:
+    """
+    Container class to hold multiple
+    :class:`~mirar.metrics.processing_record.ProcessingRecord` objects
+    """
+
+    def __init__(
+        self,
+        records: Optional[list[ProcessingRecord]] = None,
+        max_records: Optional[int] = None,
+    ):
+        # Only the most recent records are kept if max_records is set, but the
+        # per-processor summary is updated with every record
+        self.records = deque(maxlen=max_records)
+        self.n_records = 0
+        self._summary = {}
+        self._lock = threading.Lock()
+
+        if records is not None:
+            for record in records:
+                self.add_record(record)
+
+    def add_record(self, record: ProcessingRecord):
+        """
+        Adds a new ProcessingRecord
+
+        :param record: ProcessingRecord to add
+        :return: None
+        """
+        t_start = record.t_start.timestamp()
+        with self._lock:
+            self.records.append(record)
+            self.n_records += 1
+
+            summary = self._summary.get(record.processor_name)
+            if summary is None:
+                summary = {
+                    "n_batches": 0,
+                    "n_failed": 0,
+                    "wall_time": 0.0,
+                    "max_wall_time": 0.0,
+                    "cpu_time": 0.0,
+                    "max_rss_change": None,
+                    "bytes_read": 0,
+                    "bytes_written": 0,
+                    "t_first": t_start,
+                    "t_last": t_start + record.wall_time,
+                }
+                self._summary[record.processor_name] = summary
+
+            summary["n_batches"] += 1
+            summary["n_failed"] += int(not record.success)
+            summary["wall_time"] += record.wall_time
+            summary["max_wall_time"] = max(summary["max_wall_time"], record.wall_time)
+            summary["cpu_time"] += record.cpu_time
+            if record.rss_change is not None:
+                previous = summary["max_rss_change"]
+                summary["max_rss_change"] = (
+                    record.rss_change
+                    if previous is None
+                    else max(previous, record.rss_change)
+                )
+            summary["bytes_read"] += record.bytes_read
+            summary["bytes_written"] += record.bytes_written
+            summary["t_first"] = min(summary["t_first"], t_start)
+            summary["t_last"] = max(summary["t_last"], t_start + record.wall_time)
+
+    def __add__(self, other):
+        for record in other.records:
+            self.add_record(record)
+        return self
+
+    def get_records_table(self) -> pd.DataFrame:
+        """
+        Returns a table of all records, with one row per batch
+
+        :return: dataframe of records
+        """
+        with self._lock:
+            rows = [x.to_dict() for x in self.records]
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "processor_name",
+                "contents",
+                "t_start",
+                "wall_time",
+                "cpu_time",
+                "rss_change",
+                "bytes_read",
+                "bytes_written",
+                "success",
+            ],
+        )
+
+    def summarise(self) -> pd.DataFrame:
+        """
+        Summarise the records for each processor. The throughput is the number of
+        batches divided by the time between the first batch starting and the
+        last batch finishing, so it accounts for parallel processing.
+
+        :return: dataframe with one row per processor
+        """
+        with self._lock:
+            summaries = {name: dict(x) for name, x in self._summary.items()}
+
+        rows = []
+        for name, summary in summaries.items():
+            span = summary.pop("t_last") - summary.pop("t_first")
+            rows.append(
+                {
+                    "processor_name": name,
+                    **summary,
+                    "batches_per_second": (
+                        summary["n_batches"] / span if span > 0 else None
+                    ),
+                }
+            )
+
+        return pd.DataFrame(rows)
+
+    def write_json(self, output_path: str | Path):
+        """
+        Write a JSON report, with the per-processor summary and all (kept) records
+
+        :param output_path: output path
+        :return: None
+        """
+        summary = self.summarise()
+        report = {
+            "version": f"{PACKAGE_NAME}=={__version__}",
+            "n_records": self.n_records,
+            "peak_rss": get_peak_rss(),
+            "cache": cache.get_stats(),
+            "processors": json.loads(summary.to_json(orient="records")),
+            "records": json.loads(self.get_records_table().to_json(orient="records")),
+        }
+        logger.info(f"Saving processing metrics to {output_path}")
+        with open(output_path, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+    def write_csv(self, output_path: str | Path):
+        """
+        Write a CSV table of all (kept) records, with one row per batch
+
+        :param output_path: output path
+        :return: None
+        """
+        logger.info(f"Saving processing metrics to {output_path}")
+        self.get_records_table().to_csv(output_path, index=False)
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the summary in the Prometheus text exposition format
+
+        :return: string
+        """
+        summary = self.summarise()
+
+        metrics = [
+            ("n_batches", "batches_total", "counter", "Batches processed"),
+            ("n_failed", "failed_batches_total", "counter", "Batches which failed"),
+            ("wall_time", "wall_seconds_total", "counter", "Wall time"),
+            ("cpu_time", "cpu_seconds_total", "counter", "CPU time"),
+            ("bytes_read", "read_bytes_total", "counter", "Bytes read via mirar.io"),
+            (
+                "bytes_written",
+                "written_bytes_total",
+                "counter",
+                "Bytes written via mirar.io",
+            ),
+            (
+                "batches_per_second",
+                "batches_per_second",
+                "gauge",
+                "Batch throughput",
+            ),
+        ]
+
+        lines = []
+        for column, name, metric_type, description in metrics:
+            lines.append(f"# HELP {PACKAGE_NAME}_processor_{name} {description}")
+            lines.append(f"# TYPE {PACKAGE_NAME}_processor_{name} {metric_type}")
+            for _, row in summary.iterrows():
+                value = row[column]
+                if value is None or pd.isnull(value):
+                    continue
+                lines.append(
+                    f'{PACKAGE_NAME}_processor_{name}{{processor="'
+                    f'{row["processor_name"]}"}} {float(value)}'
+                )
+
+        lines.append(f"# HELP {PACKAGE_NAME}_peak_rss_bytes Peak resident set size")
+        lines.append(f"# TYPE {PACKAGE_NAME}_peak_rss_bytes gauge")
+        lines.append(f"{PACKAGE_NAME}_peak_rss_bytes {float(get_peak_rss())}")
+
+        for key, value in cache.get_stats().items():
+            lines.append(f"# TYPE {PACKAGE_NAME}_cache_{key} gauge")
+            lines.append(f"{PACKAGE_NAME}_cache_{key} {float(value)}")
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,141 @@
+"""
+Module for ProcessingRecord objects.
+
+A :class:`~mirar.metrics.processing_record.ProcessingRecord` summarises the cost of
+a single processor acting on a single batch.
+"""
+
+import logging
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+
+from mirar.metrics.io_counter import get_io_counters
+
+logger = logging.getLogger(__name__)
+
+# ru_maxrss is in kilobytes on Linux, but bytes on macOS
+RSS_UNIT_BYTES = 1 if sys.platform == "darwin" else 1024
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the peak resident set size of the current process,
+    over its whole lifetime
+
+    :return: peak RSS in bytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT_BYTES
+
+
+def get_current_rss() -> int | None:
+    """
+    Returns the current resident set size of the current process.
+    This is read from /proc, so is only available on Linux.
+
+    :return: current RSS in bytes, or None if unavailable
+    """
+    try:
+        with open("/proc/self/statm", encoding="utf8") as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class ProcessingRecord:
+    """
+    Class representing the cost of processing a single batch
+    """
+
+    def __init__(
+        self,
+        processor_name: str,
+        contents: list[str],
+        t_start: datetime,
+        wall_time: float,
+        cpu_time: float,
+        rss_change: int | None,
+        bytes_read: int,
+        bytes_written: int,
+        success: bool,
+    ):
+        self.processor_name = processor_name
+        self.contents = contents
+        self.t_start = t_start
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.rss_change = rss_change
+        self.bytes_read = bytes_read
+        self.bytes_written = bytes_written
+        self.success = success
+
+    def to_dict(self) -> dict:
+        """
+        Returns the record as a dictionary
+
+        :return: dictionary
+        """
+        return {
+            "processor_name": self.processor_name,
+            "contents": ",".join(self.contents),
+            "t_start": self.t_start.isoformat(),
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "rss_change": self.rss_change,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "success": self.success,
+        }
+
+
+class ProcessingTracker:
+    """
+    Context manager to create a
+    :class:`~mirar.metrics.processing_record.ProcessingRecord` for a block of code.
+
+    CPU time is measured for the current thread only, so it does not include
+    external software (e.g. the astromatic tools) run in a subprocess.
+    The change in resident set size is measured for the whole process, so it also
+    includes memory used by any batches processed concurrently in other threads.
+    """
+
+    def __init__(self, processor_name: str, contents: list[str]):
+        self.processor_name = processor_name
+        self.contents = [str(x) for x in contents]
+        self.success = True
+        self.record = None
+
+        self._t_start = None
+        self._wall_start = None
+        self._cpu_start = None
+        self._io_start = None
+        self._rss_start = None
+
+    def __enter__(self):
+        self._t_start = datetime.now()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._io_start = get_io_counters()
+        self._rss_start = get_current_rss()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        bytes_read, bytes_written = get_io_counters()
+        rss_end = get_current_rss()
+        rss_change = None
+        if (rss_end is not None) and (self._rss_start is not None):
+            rss_change = rss_end - self._rss_start
+        self.record = ProcessingRecord(
+            processor_name=self.processor_name,
+            contents=self.contents,
+            t_start=self._t_start,
+            wall_time=time.perf_counter() - self._wall_start,
+            cpu_time=time.thread_time() - self._cpu_start,
+            rss_change=rss_change,
+            bytes_read=bytes_read - self._io_start[0],
+            bytes_written=bytes_written - self._io_start[1],
+            success=self.success and (exc_type is None),
+        )
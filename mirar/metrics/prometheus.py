@@ -0,0 +1,67 @@
+"""
+Module for serving metrics in the Prometheus text format over http
+"""
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PrometheusExporter:
+    """
+    Minimal http server, which serves the output of a function at /metrics
+    in the Prometheus text exposition format
+    """
+
+    def __init__(self, get_metrics_text: Callable[[], str], port: int, host: str = ""):
+        self.get_metrics_text = get_metrics_text
+        self.port = port
+        self.host = host
+        self.server = None
+
+    def start(self):
+        """
+        Start serving metrics, in a daemon thread
+
+        :return: None
+        """
+        get_metrics_text = self.get_metrics_text
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            """Handler returning the metrics text"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Respond to a GET request"""
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = get_metrics_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                """Silence the default logging to stderr"""
+
+        self.server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.port = self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Serving metrics at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """
+        Stop serving metrics
+
+        :return: None
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
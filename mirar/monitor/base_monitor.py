@@ -21,8 +21,10 @@ from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
 from mirar.data import Dataset, Image, ImageBatch
+from mirar.database.engine import get_pool_metrics_text
 from mirar.errors import ErrorReport, ErrorStack, ImageNotFoundError, ProcessorError
 from mirar.io import check_file_is_complete
+from mirar.metrics import MetricsReport, PrometheusExporter
 from mirar.paths import (
     DITHER_N_KEY,
     MAX_DITHER_KEY,
@@ -69,6 +71,9 @@ class NewImageHandler(FileSystemEventHandler):
 
 FILE_TRANSFER_TIMEOUT_S = 60.0
 
+# Number of recent processing records kept by the monitor for its metrics report
+MONITOR_MAX_METRICS_RECORDS = 10000
+
 
 class Monitor:
     """Class to 'monitor' a directory, watching for newly created files.
@@ -91,10 +96,24 @@ class Monitor:
         log_level: str = "INFO",
         raw_dir: str = RAW_IMG_SUB_DIR,
         base_raw_img_dir: Path = base_raw_dir,
+        metrics_port: Optional[int] = None,
+        metrics_interval_minutes: float = 30.0,
     ):
         logger.info(f"Software version: {PACKAGE_NAME}=={__version__}")
 
         self.errorstack = ErrorStack()
+
+        # Processing metrics accumulate over the night, and can be served
+        # in Prometheus format, with the database connection pool statistics.
+        # Only recent records are kept, and the report is written periodically.
+        self.metrics = MetricsReport(max_records=MONITOR_MAX_METRICS_RECORDS)
+        self.metrics_interval = float(metrics_interval_minutes) * u.minute
+        self.t_metrics_written = Time.now()
+        self.metrics_exporter = None
+        if metrics_port is not None:
+            self.metrics_exporter = PrometheusExporter(
+                get_metrics_text=self.get_metrics_text, port=metrics_port
+            )
         self.night = night
         self.pipeline_name = pipeline
 
@@ -348,6 +367,9 @@ class Monitor:
 
             workers.append(worker)
 
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.start()
+
         # setup watchdog to monitor directory for trigger files
         logger.info(f"Watching {self.raw_image_directory}")
 
@@ -359,13 +381,38 @@ class Monitor:
         try:
             while (Time.now() - self.t_start) < self.final_postprocess_hours:
                 time.sleep(2)
+                if (Time.now() - self.t_metrics_written) > self.metrics_interval:
+                    self.write_metrics()
         finally:
             logger.info("No longer waiting for new images.")
             observer.stop()
             observer.join()
             self.postprocess()
+            self.write_metrics()
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.stop()
             logger.info(f"Saving log to {self.log_path}")
 
+    def write_metrics(self):
+        """
+        Write the processing metrics accumulated so far, in JSON and CSV format
+
+        :return: None
+        """
+        self.t_metrics_written = Time.now()
+        metrics_output_path = self.pipeline.get_metrics_output_path(self.error_path)
+        self.metrics.write_json(output_path=metrics_output_path)
+        self.metrics.write_csv(output_path=metrics_output_path.with_suffix(".csv"))
+
+    def get_metrics_text(self) -> str:
+        """
+        Get the processing metrics and database connection pool statistics,
+        in the Prometheus text exposition format
+
+        :return: string
+        """
+        return self.metrics.to_prometheus() + get_pool_metrics_text()
+
     def update_error_log(self):
         """Function to overwrite the error file with the latest version.
         The error summary is cumulative, so this just updates the file.
@@ -418,6 +465,8 @@ class Monitor:
                 dataset=Dataset(ImageBatch()),
                 selected_configurations=protected_key,
                 catch_all_errors=True,
+                metrics=self.metrics,
+                write_metrics=False,
             )
             self.errorstack += errorstack
             self.update_error_log()
@@ -575,6 +624,8 @@ class Monitor:
                                     dataset=Dataset(all_img),
                                     selected_configurations=self.realtime_configurations,
                                     catch_all_errors=True,
+                                    metrics=self.metrics,
+                                    write_metrics=False,
                                 )
                                 self.errorstack += errorstack
                                 self.update_error_log()
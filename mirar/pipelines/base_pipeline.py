@@ -20,7 +20,13 @@ import numpy as np
 
 from mirar.data import Dataset, Image, ImageBatch
 from mirar.errors import ErrorStack
+from mirar.metrics import MetricsReport
 from mirar.paths import get_output_path
+from mirar.pipelines.streaming import (
+    DEFAULT_STREAM_QUEUE_SIZE,
+    split_into_segments,
+    stream_dataset,
+)
 from mirar.processors.base_processor import BaseProcessor
 from mirar.processors.utils.error_annotator import ErrorStackAnnotator
 
@@ -213,20 +219,47 @@ class Pipeline:
 
         return error_output_path
 
+    def get_metrics_output_path(self, output_error_path: str | Path) -> Path:
+        """
+        Generates a path for the processing metrics report (in JSON format),
+        next to the error summary
+
+        :param output_error_path: path of error summary
+        :return: path for metrics report
+        """
+        return Path(output_error_path).with_name(
+            f"{self.night}_processing_metrics.json"
+        )
+
     def reduce_images(
         self,
         dataset: Optional[Dataset] = None,
         output_error_path: Optional[str] = None,
         catch_all_errors: bool = True,
         selected_configurations: Optional[str | list[str]] = None,
+        streaming: bool = False,
+        stream_queue_size: int = DEFAULT_STREAM_QUEUE_SIZE,
+        metrics: Optional[MetricsReport] = None,
+        write_metrics: bool = True,
     ) -> tuple[Dataset, ErrorStack]:
         """
         Function to process a given dataset.
 
+        In streaming mode, batches flow through the processors independently,
+        and only synchronization points (e.g. batching steps) wait for the whole
+        dataset. See :mod:`mirar.pipelines.streaming`.
+
         :param dataset: dataset to process (can  be empty)
         :param output_error_path: optional path to write error summary
         :param catch_all_errors: Either catch errors, or just immediately raise them
         :param selected_configurations: Configuration to use
+        :param streaming: Whether to stream batches through the processors
+        :param stream_queue_size: Maximum number of batches waiting between
+            processors, in streaming mode
+        :param metrics: Optional report, to which the processing metrics
+            are added (e.g. to accumulate metrics across several calls)
+        :param write_metrics: Whether to write the metrics report. Callers
+            accumulating metrics across many calls can instead write it themselves.
         :return: Post-processing dataset and summary of errors caught
         """
 
@@ -238,6 +271,9 @@ class Pipeline:
 
         err_stack = ErrorStack()
 
+        if metrics is None:
+            metrics = MetricsReport()
+
         if selected_configurations is None:
             selected_configurations = self.selected_configurations
 
@@ -252,14 +288,33 @@ class Pipeline:
 
             processors = self.set_configuration(configuration)
 
-            for i, processor in enumerate(processors):
-                logger.info(
-                    f"Applying '{processor.__class__} to {len(dataset)} batches "
-                    f"(Step {i + 1}/{len(processors)})"
-                )
-                logger.info(f"[{str(processor)}]")
+            if streaming:
+                steps = split_into_segments(processors)
+            else:
+                steps = [[processor] for processor in processors]
 
-                dataset, new_err_stack = processor.base_apply(dataset)
+            for i, step in enumerate(steps):
+                if len(step) == 1:
+                    logger.info(
+                        f"Applying '{step[0].__class__} to {len(dataset)} batches "
+                        f"(Step {i + 1}/{len(steps)})"
+                    )
+                    logger.info(f"[{str(step[0])}]")
+                else:
+                    logger.info(
+                        f"Streaming {len(dataset)} batches through "
+                        f"{[x.__class__.__name__ for x in step]} "
+                        f"(Step {i + 1}/{len(steps)})"
+                    )
+
+                if streaming and not step[0].is_synchronization_point:
+                    dataset, new_err_stack = stream_dataset(
+                        step, dataset, queue_size=stream_queue_size, metrics=metrics
+                    )
+                else:
+                    dataset, new_err_stack = step[0].base_apply(
+                        dataset, metrics=metrics
+                    )
                 err_stack += new_err_stack
 
                 if np.logical_and(not catch_all_errors, len(err_stack.reports) > 0):
@@ -268,8 +323,8 @@ class Pipeline:
                 if len(dataset) == 0:
                     logger.error(
                         f"No images left in dataset. "
-                        f"Terminating early, after step {i + 1}/{len(processors)} "
-                        f"({processor.__class__.__name__})."
+                        f"Terminating early, after step {i + 1}/{len(steps)} "
+                        f"({step[-1].__class__.__name__})."
                     )
                     break
 
@@ -277,6 +332,12 @@ class Pipeline:
         err_stack.summarise_error_stack_tsv(
             output_path=output_error_path.with_suffix(".tsv")
         )
+
+        if write_metrics:
+            metrics_output_path = self.get_metrics_output_path(output_error_path)
+            metrics.write_json(output_path=metrics_output_path)
+            metrics.write_csv(output_path=metrics_output_path.with_suffix(".csv"))
+
         return dataset, err_stack
 
     def postprocess_configuration(
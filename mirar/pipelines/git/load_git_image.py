@@ -10,6 +10,7 @@ import numpy as np
 from astropy.time import Time
 
 from mirar.data import Image
+from mirar.data.image_data import get_image_dtype
 from mirar.io import open_fits, open_raw_image
 from mirar.paths import (
     COADD_KEY,
@@ -81,7 +82,7 @@ def load_raw_git_fits(path: str | Path) -> tuple[np.array, astropy.io.fits.Heade
 
     header["ZP"] = header["ZP"]
     header[ZP_STD_KEY] = header["ZP_ERR"]
-    data = data.astype(float)
+    data = data.astype(get_image_dtype())
     data[data == 0.0] = np.nan
 
     data[data > 40000] = np.nan
@@ -140,7 +141,7 @@ def load_raw_lt_fits(path: str | Path) -> tuple[np.array, astropy.io.fits.Header
 
     # header["ZP"] = header["ZP"]
     # header[ZP_STD_KEY] = header["ZP_ERR"]
-    data = data.astype(float)
+    data = data.astype(get_image_dtype())
     data[data == 0.0] = np.nan
 
     # data[data > 40000] = np.nan
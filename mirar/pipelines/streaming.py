@@ -0,0 +1,218 @@
+"""
+Module for streaming execution of a :class:`~mirar.pipelines.base_pipeline.Pipeline`.
+
+By default, a pipeline applies each processor to the entire
+:class:`~mirar.data.base_data.Dataset`, before moving on to the next processor.
+Every batch must therefore finish every earlier step before any batch can move on,
+and memory/cache usage scales with the size of the whole dataset.
+
+In streaming mode, batches instead flow through a chain of processors independently.
+Each processor runs as a *stage*, with its own pool of worker threads,
+and stages are connected by bounded queues. A batch can therefore be fully
+processed while other batches are still waiting for earlier steps.
+
+Some processors, such as
+:class:`~mirar.processors.utils.image_selector.ImageBatcher`
+and :class:`~mirar.processors.utils.image_selector.ImageDebatcher`, need to see the
+whole dataset at once. These declare themselves as synchronization points
+(via :attr:`~mirar.processors.base_processor.BaseProcessor.is_synchronization_point`).
+The processor chain is split into segments at these points: the segments between
+them are streamed, and each synchronization point is applied to the full dataset.
+
+Streaming stages always use threads, regardless of the executor chosen for
+each processor.
+"""
+
+import logging
+import threading
+from queue import Queue
+from threading import Thread
+
+from mirar.data import Dataset
+from mirar.errors import ErrorStack
+from mirar.metrics import MetricsReport
+from mirar.processors.base_processor import BaseProcessor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAM_QUEUE_SIZE = 4
+
+_STOP = None
+
+
+def split_into_segments(processors: list[BaseProcessor]) -> list[list[BaseProcessor]]:
+    """
+    Split a list of processors into segments. Each synchronization point is
+    a segment of its own, and all other processors are grouped into segments
+    between synchronization points.
+
+    :param processors: list of processors
+    :return: list of segments
+    """
+    segments = []
+    current = []
+
+    for processor in processors:
+        if processor.is_synchronization_point:
+            if len(current) > 0:
+                segments.append(current)
+                current = []
+            segments.append([processor])
+        else:
+            current.append(processor)
+
+    if len(current) > 0:
+        segments.append(current)
+
+    return segments
+
+
+class ProcessorStage:
+    """
+    A single processor in a streamed segment, with a pool of worker threads
+    reading batches from an input queue and writing to an output queue
+    """
+
+    def __init__(
+        self,
+        processor: BaseProcessor,
+        input_queue: Queue,
+        output_queue: Queue,
+        err_stack: ErrorStack,
+        err_lock: threading.Lock,
+        metrics: MetricsReport,
+    ):
+        self.processor = processor
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.err_stack = err_stack
+        self.err_lock = err_lock
+        self.metrics = metrics
+        self.n_workers = max(1, processor.max_n_cpu)
+        self.n_finished = 0
+        self.finish_lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker threads of the stage
+
+        :return: None
+        """
+        for _ in range(self.n_workers):
+            worker = Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+
+    def process(self, index: tuple, batch) -> list:
+        """
+        Apply the processor to a single batch, and return the resulting batches.
+        Processors can remove batches (e.g.
+        :class:`~mirar.processors.base_processor.CleanupProcessor`)
+        or split them, so zero or more batches can be returned.
+
+        :param index: index of batch
+        :param batch: batch to process
+        :return: list of (index, batch) tuples
+        """
+        new_batch, report, record = self.processor.process_batch(batch)
+        self.metrics.add_record(record)
+
+        if new_batch is not None:
+            try:
+                new_dataset = self.processor.update_dataset(Dataset([new_batch]))
+            except Exception as exc:  # pylint: disable=broad-except
+                new_dataset = Dataset()
+                report = self.processor.generate_error_report(exc, new_batch)
+        else:
+            new_dataset = Dataset()
+
+        if report is not None:
+            logger.error(report.generate_log_message())
+            with self.err_lock:
+                self.err_stack.add_report(report)
+
+        return [(index + (k,), x) for k, x in enumerate(new_dataset)]
+
+    def work(self):
+        """
+        Worker loop, processing batches until the input queue is exhausted.
+        The last worker to finish passes the stop signal on to the next stage.
+
+        :return: None
+        """
+        while True:
+            item = self.input_queue.get()
+
+            if item is _STOP:
+                # Leave the stop signal for any sibling workers
+                self.input_queue.put(_STOP)
+                break
+
+            index, batch = item
+            for output in self.process(index, batch):
+                self.output_queue.put(output)
+
+        with self.finish_lock:
+            self.n_finished += 1
+            if self.n_finished == self.n_workers:
+                self.output_queue.put(_STOP)
+
+
+def stream_dataset(
+    processors: list[BaseProcessor],
+    dataset: Dataset,
+    queue_size: int = DEFAULT_STREAM_QUEUE_SIZE,
+    metrics: MetricsReport | None = None,
+) -> tuple[Dataset, ErrorStack]:
+    """
+    Stream a dataset through a chain of processors, with bounded queues between
+    each processor. None of the processors should be synchronization points.
+
+    :param processors: list of processors
+    :param dataset: input dataset
+    :param queue_size: maximum number of batches waiting between each stage
+    :param metrics: Optional report, to which processing metrics are added
+    :return: Updated dataset, and any caught errors
+    """
+    err_stack = ErrorStack()
+    err_lock = threading.Lock()
+
+    if metrics is None:
+        metrics = MetricsReport()
+
+    queues = [Queue(maxsize=queue_size) for _ in range(len(processors) + 1)]
+
+    for i, processor in enumerate(processors):
+        stage = ProcessorStage(
+            processor=processor,
+            input_queue=queues[i],
+            output_queue=queues[i + 1],
+            err_stack=err_stack,
+            err_lock=err_lock,
+            metrics=metrics,
+        )
+        stage.start()
+
+    def feed():
+        for j, batch in enumerate(dataset):
+            queues[0].put(((j,), batch))
+        queues[0].put(_STOP)
+
+    feeder = Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+
+    results = {}
+
+    while True:
+        item = queues[-1].get()
+        if item is _STOP:
+            break
+        index, batch = item
+        results[index] = batch
+
+    feeder.join()
+
+    new_dataset = Dataset([results[key] for key in sorted(results.keys())])
+
+    return new_dataset, err_stack
@@ -569,6 +569,7 @@ imsub = [
         sextractor=winter_reference_sextractor,
         ref_psfex=winter_reference_psfex,
         phot_sextractor=winter_reference_psf_phot_sextractor,
+        use_reference_cache=True,
     ),
     Sextractor(
         **sextractor_reference_psf_phot_config,
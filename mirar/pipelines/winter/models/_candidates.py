@@ -366,3 +366,26 @@ class Candidate(BaseDB):
             duplicate_protocol=duplicate_protocol,
             returning_key_names=returning_key_names,
         )
+
+    @classmethod
+    def prepare_bulk_insert(cls, entries: list["Candidate"]):
+        """
+        Replace unknown programs with the default program, as in insert_entry,
+        querying each distinct program once
+
+        :param entries: validated entries
+        :return: None
+        """
+        for progname in {x.progname for x in entries}:
+            prog_match = select_from_table(
+                DBQueryConstraints(columns="progname", accepted_values=progname),
+                sql_table=Program.sql_model,
+            )
+            if prog_match.empty:
+                logger.debug(
+                    f"Program {progname} not found in database. "
+                    f"Using default program {default_program.progname}"
+                )
+                for entry in entries:
+                    if entry.progname == progname:
+                        entry.progname = default_program.progname
@@ -10,6 +10,7 @@ import numpy as np
 from astropy.time import Time
 
 from mirar.data import Image
+from mirar.data.image_data import get_image_dtype
 from mirar.io import open_fits, open_raw_image
 from mirar.paths import (
     COADD_KEY,
@@ -96,7 +97,7 @@ def load_raw_wirc_fits(path: str | Path) -> tuple[np.array, astropy.io.fits.Head
         if "ZP_AUTO" in header.keys():
             header[ZP_KEY] = float(header["ZP_AUTO"])
             header[ZP_STD_KEY] = float(header["ZP_AUTO_std"])
-    data = data.astype(float)
+    data = data.astype(get_image_dtype())
     data[data == 0.0] = np.nan
     return data, header
 
@@ -11,12 +11,18 @@ import numpy as np
 from astropy.io import fits
 
 from mirar.data import ImageBatch
+from mirar.errors import ProcessorError
 from mirar.paths import (
     NORM_PSFEX_KEY,
     PSFEX_CAT_KEY,
     SEXTRACTOR_HEADER_KEY,
     get_output_dir,
 )
+from mirar.processors.astromatic.result_cache import (
+    AstromaticResultCache,
+    get_result_cache,
+    run_with_result_cache,
+)
 from mirar.processors.astromatic.sextractor.sextractor import Sextractor
 from mirar.processors.base_processor import BaseImageProcessor, PrerequisiteError
 from mirar.utils import execute
@@ -24,11 +30,77 @@ from mirar.utils import execute
 logger = logging.getLogger(__name__)
 
 
+class PSFexModelError(ProcessorError):
+    """Error relating to a PSFex model"""
+
+
+class PSFexModel:
+    """
+    Spatially-varying PSF model from a PSFex '.psf' file.
+
+    PSFex models the PSF as a polynomial in the (scaled) image coordinates,
+    with one PSF component per monomial, ordered with x varying fastest
+    (1, x, x^2, ..., y, xy, ..., y^2, ...).
+
+    :param psf_path: path of the PSFex '.psf' file
+    """
+
+    def __init__(self, psf_path: str | Path):
+        self.psf_path = Path(psf_path)
+        with fits.open(self.psf_path) as data_file:
+            header = data_file[1].header  # pylint: disable=no-member
+            self.components = np.array(data_file[1].data[0][0], dtype=float)
+
+        n_axes = int(header.get("POLNAXIS", 0))
+        if n_axes not in [0, 2]:
+            err = (
+                f"PSFex model {self.psf_path} varies with {n_axes} parameters, "
+                f"but only models varying with image position are supported"
+            )
+            logger.error(err)
+            raise PSFexModelError(err)
+
+        self.degree = int(header.get("POLDEG1", 0)) if n_axes > 0 else 0
+        self.zero = [float(header.get(f"POLZERO{i}", 0.0)) for i in [1, 2]]
+        self.scale = [float(header.get(f"POLSCAL{i}", 1.0)) for i in [1, 2]]
+
+        n_terms = (self.degree + 1) * (self.degree + 2) // 2
+        if len(self.components) != n_terms:
+            err = (
+                f"PSFex model {self.psf_path} has {len(self.components)} "
+                f"components, but {n_terms} were expected for degree {self.degree}"
+            )
+            logger.error(err)
+            raise PSFexModelError(err)
+
+    def get_psf(self, x_image: float, y_image: float) -> np.ndarray:
+        """
+        Get the normalised PSF at a position, with negative values set to zero
+
+        :param x_image: x position (FITS convention, as for X_IMAGE)
+        :param y_image: y position (FITS convention, as for Y_IMAGE)
+        :return: PSF
+        """
+        x_scaled = (x_image - self.zero[0]) / self.scale[0]
+        y_scaled = (y_image - self.zero[1]) / self.scale[1]
+
+        terms = [
+            x_scaled**i * y_scaled**j
+            for j in range(self.degree + 1)
+            for i in range(self.degree + 1 - j)
+        ]
+
+        psf = np.tensordot(terms, self.components, axes=1)
+        psf[psf < 0] = 0.0
+        return psf / np.sum(psf)
+
+
 def run_psfex(
     sextractor_cat_path: Path,
     config_path: str,
     psf_output_dir: str,
     norm_psf_output_name: Optional[str | Path] = None,
+    result_cache: Optional[AstromaticResultCache] = None,
 ):
     """
     Function to run PSFex
@@ -37,6 +109,7 @@ def run_psfex(
         config_path: path of psfex config file
         psf_output_dir: output directory to store PSF
         norm_psf_output_name: normalized PSF output path
+        result_cache: Optional cache of results, to skip rerunning PSFex
 
     Returns:
 
@@ -46,10 +119,19 @@ def run_psfex(
         f"-PSF_DIR {psf_output_dir} -CHECKIMAGE_TYPE NONE"
     )
 
-    execute(psfex_command)
+    psf_path = Path(psf_output_dir).joinpath(
+        Path(sextractor_cat_path).with_suffix(".psf").name
+    )
+
+    run_with_result_cache(
+        lambda: execute(psfex_command),
+        cmd=psfex_command,
+        input_paths=[x for x in [config_path, sextractor_cat_path] if x is not None],
+        output_paths=[psf_path],
+        result_cache=result_cache,
+    )
 
     if norm_psf_output_name is not None:
-        psf_path = sextractor_cat_path.with_suffix(".psf")
         with fits.open(psf_path) as data_file:
             psf_model_data = data_file[1].data[0][0][0]
         psf_model_data = psf_model_data / np.sum(psf_model_data)
@@ -69,11 +151,13 @@ class PSFex(BaseImageProcessor):
         config_path: Optional[str] = None,
         output_sub_dir: str = "psf",
         norm_fits: bool = True,
+        use_result_cache: bool = False,
     ):
         super().__init__()
         self.config_path = config_path
         self.output_sub_dir = output_sub_dir
         self.norm_fits = norm_fits
+        self.use_result_cache = use_result_cache
 
     def __str__(self) -> str:
         return (
@@ -103,6 +187,7 @@ class PSFex(BaseImageProcessor):
                 config_path=self.config_path,
                 psf_output_dir=os.path.dirname(sextractor_cat_path),
                 norm_psf_output_name=norm_psf_path,
+                result_cache=get_result_cache() if self.use_result_cache else None,
             )
 
             image[PSFEX_CAT_KEY] = str(psf_path)
@@ -0,0 +1,259 @@
+"""
+Module for an opt-in, content-addressed cache of astromatic results
+(SExtractor catalogs, SCAMP headers, SWarp images and PSFEx models).
+
+Each tool invocation is keyed on the hashed contents of its input files
+(including the files listed in '@' list files, and their .head/.ahead header
+files), and on the command line,
+with every input and output path replaced by a placeholder. Rerunning a tool
+on identical inputs with identical options therefore gives the same key, even
+if the inputs are in a different directory or were rewritten since.
+
+On a cache miss, the tool is run, and its outputs are copied into the store.
+On a hit, the outputs are copied back to the requested paths without running
+the tool. Header updates made by the processors depend only on these outputs,
+so they are reproduced automatically.
+
+The store is located at ASTROMATIC_CACHE_DIR (default: a subdirectory of the
+output data directory), and its size is limited by ASTROMATIC_CACHE_SIZE_MB
+(default 10000 MB). When the limit is exceeded, the least-recently used results
+are evicted.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from mirar.paths import PACKAGE_NAME, base_output_dir
+from mirar.processors.manifest_store import MANIFEST_NAME, ManifestStore, hash_file
+
+logger = logging.getLogger(__name__)
+
+ASTROMATIC_CACHE_DIR = Path(
+    os.getenv(
+        "ASTROMATIC_CACHE_DIR",
+        str(base_output_dir.joinpath(f"{PACKAGE_NAME}_astromatic_cache")),
+    )
+)
+ASTROMATIC_CACHE_SIZE = int(
+    float(os.getenv("ASTROMATIC_CACHE_SIZE_MB", "10000")) * 1024**2
+)
+
+# Change to invalidate all existing results
+RESULT_CACHE_VERSION = "1"
+
+# Header files read implicitly by astromatic tools, next to each listed file
+SIDECAR_SUFFIXES = [".head", ".ahead"]
+
+
+def hash_list_file(path: str | Path) -> str:
+    """
+    Get a hash of the contents of every file listed in a list file
+    (one path per line), in order. Any header sidecar files of each listed file
+    (e.g. the .head files from SCAMP read by SWarp) are included.
+
+    :param path: path of list file
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "r", encoding="utf8") as list_file:
+        for line in list_file:
+            listed = line.strip()
+            if len(listed) > 0:
+                digest.update(hash_file(listed).encode())
+                for suffix in SIDECAR_SUFFIXES:
+                    sidecar_path = Path(listed).with_suffix(suffix)
+                    if sidecar_path.exists():
+                        digest.update(f"{suffix}:{hash_file(sidecar_path)}".encode())
+    return digest.hexdigest()
+
+
+class AstromaticResultCache(ManifestStore):
+    """
+    Content-addressed store of astromatic tool outputs, with size-based eviction
+
+    :param cache_dir: directory of the store
+    :param max_size: maximum size of the store, in bytes
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path = ASTROMATIC_CACHE_DIR,
+        max_size: int = ASTROMATIC_CACHE_SIZE,
+    ):
+        super().__init__(cache_dir=cache_dir, max_size=max_size)
+
+    def get_key(
+        self,
+        cmd: str,
+        input_paths: list[str | Path],
+        output_paths: list[str | Path],
+        list_paths: Optional[list[str | Path]] = None,
+    ) -> str:
+        """
+        Get the key for a tool invocation
+
+        :param cmd: command line
+        :param input_paths: input files (images, catalogs, config and parameter files)
+        :param output_paths: output files
+        :param list_paths: list files, each listing further input files
+        :return: key
+        """
+        if list_paths is None:
+            list_paths = []
+
+        replacements = {}
+        for path in input_paths:
+            replacements[str(path)] = f"<input:{hash_file(path)}>"
+        for path in list_paths:
+            replacements[str(path)] = f"<list:{hash_list_file(path)}>"
+        for i, path in enumerate(output_paths):
+            replacements[str(path)] = f"<output:{i}>"
+        for path in output_paths:
+            replacements.setdefault(str(Path(path).parent), "<output_dir>")
+
+        # Replace longer paths first, so directories do not split file paths
+        normalised = cmd
+        for original in sorted(replacements, key=len, reverse=True):
+            normalised = normalised.replace(original, replacements[original])
+
+        return hashlib.sha256(
+            f"{RESULT_CACHE_VERSION}\n{normalised}".encode()
+        ).hexdigest()
+
+    def get_entry_dir(self, key: str) -> Path:
+        """
+        Get the directory of a stored result
+
+        :param key: key
+        :return: directory
+        """
+        return self.cache_dir.joinpath(key[:2], key)
+
+    def restore(self, key: str, output_paths: list[str | Path]) -> bool:
+        """
+        Copy a stored result to the output paths, if it exists
+
+        :param key: key
+        :param output_paths: output files
+        :return: whether the result was restored
+        """
+        entry_dir = self.get_entry_dir(key)
+        manifest_path = entry_dir.joinpath(MANIFEST_NAME)
+
+        try:
+            with open(manifest_path, "r", encoding="utf8") as manifest_file:
+                manifest = json.load(manifest_file)
+            for index, stored_name in manifest["outputs"].items():
+                output_path = Path(output_paths[int(index)])
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(entry_dir.joinpath(stored_name), output_path)
+            self.record_use(entry_dir)
+        except (OSError, ValueError, KeyError, IndexError):
+            self.record_lookup(hit=False)
+            return False
+
+        self.record_lookup(hit=True)
+        logger.debug(f"Restored cached result {key} to {output_paths}")
+        return True
+
+    def store(self, key: str, output_paths: list[str | Path]):
+        """
+        Store the outputs of a tool invocation. Missing outputs are skipped.
+
+        :param key: key
+        :param output_paths: output files
+        :return: None
+        """
+        entry_dir = self.get_entry_dir(key)
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary directory first, so readers never see partial results
+        temp_dir = Path(tempfile.mkdtemp(dir=entry_dir.parent, prefix=".tmp_"))
+        try:
+            outputs = {}
+            for i, path in enumerate(output_paths):
+                if Path(path).exists():
+                    stored_name = f"{i}_{Path(path).name}"
+                    shutil.copyfile(path, temp_dir.joinpath(stored_name))
+                    outputs[str(i)] = stored_name
+
+            with open(
+                temp_dir.joinpath(MANIFEST_NAME), "w", encoding="utf8"
+            ) as manifest_file:
+                json.dump({"outputs": outputs}, manifest_file)
+
+            try:
+                temp_dir.rename(entry_dir)
+            except OSError:
+                # Already stored by another process
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        logger.debug(f"Stored result {key}")
+        self.evict()
+
+
+_result_cache: Optional[AstromaticResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> AstromaticResultCache:
+    """
+    Get the shared astromatic result cache, creating it if needed
+
+    :return: result cache
+    """
+    global _result_cache  # pylint: disable=global-statement
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = AstromaticResultCache()
+        return _result_cache
+
+
+def run_with_result_cache(
+    run: Callable[[], None],
+    cmd: str,
+    input_paths: list[str | Path],
+    output_paths: list[str | Path],
+    list_paths: Optional[list[str | Path]] = None,
+    result_cache: Optional[AstromaticResultCache] = None,
+):
+    """
+    Run a tool, unless its outputs can be restored from the result cache
+
+    :param run: function to run the tool
+    :param cmd: command line
+    :param input_paths: input files
+    :param output_paths: output files
+    :param list_paths: list files, each listing further input files
+    :param result_cache: result cache (if None, the tool is always run)
+    :return: None
+    """
+    if result_cache is None:
+        run()
+        return
+
+    start = time.perf_counter()
+    key = result_cache.get_key(
+        cmd, input_paths=input_paths, output_paths=output_paths, list_paths=list_paths
+    )
+
+    if result_cache.restore(key, output_paths):
+        logger.debug(
+            f"Skipped running '{cmd}', restored outputs in "
+            f"{time.perf_counter() - start:.3f} s"
+        )
+        return
+
+    run()
+    result_cache.store(key, output_paths)
@@ -7,6 +7,7 @@ import os
 import shutil
 from collections.abc import Callable
 from pathlib import Path
+from typing import Optional
 
 import numpy as np
 from astropy.io import fits
@@ -20,6 +21,11 @@ from mirar.paths import (
     get_output_dir,
     get_untemp_path,
 )
+from mirar.processors.astromatic.result_cache import (
+    AstromaticResultCache,
+    get_result_cache,
+    run_with_result_cache,
+)
 from mirar.processors.astromatic.sextractor.sextractor import (
     SEXTRACTOR_HEADER_KEY,
     check_sextractor_prerequisite,
@@ -38,6 +44,7 @@ def run_scamp(
     ast_ref_cat_path: str | Path,
     output_dir: str | Path,
     timeout_seconds: float = 60.0,
+    result_cache: Optional[AstromaticResultCache] = None,
 ):
     """
     Function to run scamp.
@@ -51,6 +58,7 @@ def run_scamp(
         ast_ref_cat_path:
         output_dir:
         timeout_seconds:
+        result_cache: Optional cache of results, to skip rerunning scamp
 
     Returns:
 
@@ -62,7 +70,24 @@ def run_scamp(
         f"-VERBOSE_TYPE QUIET -SOLVE_PHOTOM N"
     )
 
-    execute(scamp_cmd, output_dir=output_dir, timeout=np.max([60.0, timeout_seconds]))
+    # Scamp writes a .head file next to each catalog
+    with open(scamp_list_path, "r", encoding="utf8") as scamp_list:
+        output_paths = [
+            Path(x.strip()).with_suffix(".head")
+            for x in scamp_list.readlines()
+            if len(x.strip()) > 0
+        ]
+
+    run_with_result_cache(
+        lambda: execute(
+            scamp_cmd, output_dir=output_dir, timeout=np.max([60.0, timeout_seconds])
+        ),
+        cmd=scamp_cmd,
+        input_paths=[scamp_config_path, ast_ref_cat_path],
+        output_paths=output_paths,
+        list_paths=[scamp_list_path],
+        result_cache=result_cache,
+    )
 
 
 def write_scamp_header_to_image(image: Image):
@@ -107,6 +132,7 @@ class Scamp(BaseImageProcessor):
         temp_output_sub_dir: str = "scamp",
         cache: bool = False,
         copy_scamp_header_to_image: bool = False,
+        use_result_cache: bool = False,
     ):
         super().__init__()
         self.scamp_config = scamp_config_path
@@ -114,6 +140,7 @@ class Scamp(BaseImageProcessor):
         self.temp_output_sub_dir = temp_output_sub_dir
         self.cache = cache
         self.copy_scamp_header_to_image = copy_scamp_header_to_image
+        self.use_result_cache = use_result_cache
 
     def __str__(self) -> str:
         """
@@ -175,6 +202,7 @@ class Scamp(BaseImageProcessor):
             ast_ref_cat_path=ref_cat_path,
             output_dir=scamp_output_dir,
             timeout_seconds=30.0 * num_files,
+            result_cache=get_result_cache() if self.use_result_cache else None,
         )
 
         if not self.cache:
@@ -16,6 +16,7 @@ from astropy.table import Table
 
 from mirar.data import Image, ImageBatch
 from mirar.data.utils.coords import write_regions_file
+from mirar.io import link_file
 from mirar.paths import (
     BASE_NAME_KEY,
     LATEST_WEIGHT_SAVE_KEY,
@@ -23,6 +24,7 @@ from mirar.paths import (
     get_output_dir,
     get_temp_path,
 )
+from mirar.processors.astromatic.result_cache import get_result_cache
 from mirar.processors.astromatic.sextractor.sourceextractor import (
     parse_checkimage,
     run_sextractor_single,
@@ -87,6 +89,7 @@ class Sextractor(BaseImageProcessor):
         use_psfex: bool = False,
         psf_path: Optional[str] = None,
         catalog_purifier: Callable[[Table, Image], Table] = None,
+        use_result_cache: bool = False,
     ):
         """
         :param output_sub_dir: subdirectory to output sextractor files
@@ -109,6 +112,8 @@ class Sextractor(BaseImageProcessor):
         for key in header
         :param catalog_purifier: If not None, will apply this function to the
         Sextractor catalog before saving
+        :param use_result_cache: whether to reuse results of identical sextractor
+        runs from the astromatic result cache
         """
         # pylint: disable=too-many-arguments
         super().__init__()
@@ -129,6 +134,7 @@ class Sextractor(BaseImageProcessor):
         self.use_psfex = use_psfex
         self.psf_path = psf_path
         self.catalog_purifier = catalog_purifier
+        self.use_result_cache = use_result_cache
 
         if isinstance(self.checkimage_name, str):
             self.checkimage_name = [self.checkimage_name]
@@ -212,7 +218,7 @@ class Sextractor(BaseImageProcessor):
             temp_path = get_temp_path(sextractor_out_dir, image[BASE_NAME_KEY])
 
             if not os.path.exists(temp_path):
-                self.save_fits(image, temp_path)
+                self.link_or_save_fits(image, temp_path)
 
             temp_files = [temp_path]
 
@@ -226,7 +232,8 @@ class Sextractor(BaseImageProcessor):
                     sextractor_out_dir, image[LATEST_WEIGHT_SAVE_KEY]
                 )
                 if os.path.exists(image_weight_path):
-                    shutil.copyfile(image_weight_path, temp_weight_path)
+                    if not link_file(image_weight_path, temp_weight_path):
+                        shutil.copyfile(image_weight_path, temp_weight_path)
                     weight_path = temp_weight_path
                     temp_files.append(Path(weight_path))
 
@@ -274,6 +281,7 @@ class Sextractor(BaseImageProcessor):
                 gain=self.gain,
                 psf_name=self.psf_path,
                 catalog_name=output_cat,
+                result_cache=get_result_cache() if self.use_result_cache else None,
             )
 
             logger.debug(f"Cache save is {self.cache}")
@@ -9,6 +9,10 @@ from typing import Optional
 
 from mirar.data.utils import write_regions_file
 from mirar.processors.astromatic.config import astromatic_config_dir
+from mirar.processors.astromatic.result_cache import (
+    AstromaticResultCache,
+    run_with_result_cache,
+)
 from mirar.utils import ExecutionError, execute
 from mirar.utils.ldac_tools import get_table_from_ldac
 
@@ -147,6 +151,7 @@ def run_sextractor_single(  # pylint: disable=too-many-arguments
     mag_zp: Optional[float] = None,
     write_regions: bool = False,
     psf_name: Optional[Path] = None,
+    result_cache: Optional[AstromaticResultCache] = None,
 ):  # pylint: disable=too-many-locals
     """
     Function to run sextractor in single mode
@@ -169,6 +174,7 @@ def run_sextractor_single(  # pylint: disable=too-many-arguments
         mag_zp: The magnitude zero point to use for the catalog
         write_regions: Whether to write ds9 regions for the objects in the catalog
         psf_name: PSFex model path, used to calculate PSF magnitudes
+        result_cache: Optional cache of results, to skip rerunning sextractor
     Returns:
 
     """
@@ -216,8 +222,29 @@ def run_sextractor_single(  # pylint: disable=too-many-arguments
 
     if psf_name is not None:
         cmd += f" -PSF_NAME {psf_name}"
+
+    input_paths = [
+        x
+        for x in [
+            img,
+            config,
+            parameters_name,
+            filter_name,
+            starnnw_name,
+            weight_image,
+            psf_name,
+        ]
+        if x is not None
+    ]
+
     try:
-        execute(cmd, output_dir)
+        run_with_result_cache(
+            lambda: execute(cmd, output_dir),
+            cmd=cmd,
+            input_paths=input_paths,
+            output_paths=[catalog_name] + list(checkimage_name),
+            result_cache=result_cache,
+        )
     except ExecutionError as exc:
         raise SextractorError(exc) from exc
 
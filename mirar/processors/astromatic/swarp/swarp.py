@@ -29,6 +29,7 @@ from mirar.paths import (
     get_output_dir,
     get_temp_path,
 )
+from mirar.processors.astromatic.result_cache import get_result_cache
 from mirar.processors.astromatic.scamp.scamp import SCAMP_HEADER_KEY
 from mirar.processors.astromatic.swarp.swarp_wrapper import run_swarp
 from mirar.processors.base_processor import BaseImageProcessor
@@ -71,6 +72,7 @@ class Swarp(BaseImageProcessor):
         calculate_dims_in_swarp: bool = False,
         header_keys_to_combine: Optional[str | list[str]] = None,
         coordinate_tolerance_deg: float = 10,
+        use_result_cache: bool = False,
     ):
         """
 
@@ -133,6 +135,8 @@ class Swarp(BaseImageProcessor):
             corresponding header keys to a comma-separated value in the stacked images
             coordinate_tolerance_deg: float Will raise an error if the input images are
             not within this tolerance of each other in terms of their coordinates.
+            use_result_cache: bool Whether to reuse results of identical swarp runs
+            from the astromatic result cache
         """
         super().__init__()
         self.swarp_config = swarp_config_path
@@ -157,6 +161,7 @@ class Swarp(BaseImageProcessor):
         if isinstance(self.header_keys_to_combine, str):
             self.header_keys_to_combine = [self.header_keys_to_combine]
         self.coordinate_tolerance_deg = coordinate_tolerance_deg
+        self.use_result_cache = use_result_cache
 
     def __str__(self) -> str:
         return "Processor to apply swarp to images, stacking them together."
@@ -299,7 +304,7 @@ class Swarp(BaseImageProcessor):
 
                 temp_img_path = get_temp_path(swarp_output_dir, image[BASE_NAME_KEY])
 
-                self.save_fits(image, temp_img_path)
+                self.link_or_save_fits(image, temp_img_path)
 
                 logger.debug(f"Saving mask image for {temp_img_path}")
                 temp_mask_path = self.save_mask_image(image, temp_img_path)
@@ -365,6 +370,7 @@ class Swarp(BaseImageProcessor):
             subtract_bkg=self.subtract_bkg,
             flux_scaling_keyword=SWARP_FLUX_SCALING_KEY,
             cache=self.cache,
+            result_cache=get_result_cache() if self.use_result_cache else None,
         )
 
         # Check if output image exists if combine is no.
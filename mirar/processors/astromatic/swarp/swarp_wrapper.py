@@ -8,6 +8,10 @@ from typing import Optional
 
 import numpy as np
 
+from mirar.processors.astromatic.result_cache import (
+    AstromaticResultCache,
+    run_with_result_cache,
+)
 from mirar.utils import execute
 
 
@@ -29,6 +33,7 @@ def run_swarp(
     flux_scaling_keyword: str = None,
     cache: bool = False,
     center_type: str = None,
+    result_cache: Optional[AstromaticResultCache] = None,
 ):
     """
     Wrapper to resample and stack images with swarp
@@ -70,6 +75,9 @@ def run_swarp(
     flux_scaling_keyword: str
         What flux scaling keyword do you want to use? If None, the default value in
         the config will be used
+    result_cache: AstromaticResultCache
+        Optional cache of results, to skip rerunning swarp. Only used if
+        combine is True, as otherwise the outputs are intermediate resampled images
     """
 
     swarp_command = (
@@ -127,4 +135,14 @@ def run_swarp(
     else:
         swarp_command += " -DELETE_TMPFILES N"
 
-    execute(swarp_command)
+    list_paths = [x for x in [stack_list_path, weight_list_path] if x is not None]
+    output_paths = [x for x in [out_path, weight_out_path] if x is not None]
+
+    run_with_result_cache(
+        lambda: execute(swarp_command),
+        cmd=swarp_command,
+        input_paths=[swarp_config_path],
+        output_paths=output_paths,
+        list_paths=list_paths,
+        result_cache=result_cache if combine else None,
+    )
@@ -13,9 +13,12 @@ from mirar.processors.astrometry.autoastrometry.sources import (
     BaseSource,
     SextractorSource,
     distance,
-    pixel_distance,
-    position_angle,
-    quickdistance,
+    distances,
+    get_source_array,
+    pixel_distances,
+    position_angles,
+    quickdistance_matrix,
+    wrap_position_angles,
 )
 from mirar.processors.astrometry.autoastrometry.utils import median, mode, stdev, unique
 
@@ -25,6 +28,92 @@ FAST_MATCH = False
 SHOW_MATCH = False
 
 
+# Number of rows of the pairwise distance matrix calculated at once
+PAIR_DISTANCE_BLOCK_SIZE = 256
+
+
+def get_pair_distances(
+    src_array: np.ndarray, ra_scale: float, min_rad: float, max_rad: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Get the distances between all pairs of sources with min_rad < distance < max_rad
+
+    :param src_array: structured array of sources
+    :param ra_scale: cos(declination), for approximate distances
+    :param min_rad: min radius
+    :param max_rad: max radius
+    :return: index of first source, index of second source, distance,
+        sorted by first and then second source
+    """
+    pair_i, pair_j, pair_dist = [], [], []
+
+    for start in range(0, len(src_array), PAIR_DISTANCE_BLOCK_SIZE):
+        rows = src_array[start : start + PAIR_DISTANCE_BLOCK_SIZE]
+
+        ddec = np.abs(
+            rows["dec_deg"][:, np.newaxis] - src_array["dec_deg"][np.newaxis, :]
+        )
+        dra = np.abs(rows["ra_deg"][:, np.newaxis] - src_array["ra_deg"][np.newaxis, :])
+
+        dist = quickdistance_matrix(rows, ra_scale, src_array)
+
+        valid = (
+            (ddec <= max_rad)
+            & (ra_scale * dra <= max_rad)
+            & (min_rad < dist)
+            & (dist < max_rad)
+        )
+        # Exclude each source from its own pairs
+        valid[np.arange(len(rows)), np.arange(start, start + len(rows))] = False
+
+        block_i, block_j = np.nonzero(valid)
+        pair_i.append(block_i + start)
+        pair_j.append(block_j)
+        pair_dist.append(dist[block_i, block_j])
+
+    if len(pair_i) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+
+    return np.concatenate(pair_i), np.concatenate(pair_j), np.concatenate(pair_dist)
+
+
+def match_distances(
+    dists: np.ndarray,
+    sorted_ref_dists: np.ndarray,
+    ref_order: np.ndarray,
+    ref_dists: np.ndarray,
+    tolerance: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find all pairs of distances and reference distances which agree within a
+    fractional tolerance, i.e abs(dist / ref_dist - 1) < tolerance
+
+    :param dists: distances
+    :param sorted_ref_dists: reference distances, sorted
+    :param ref_order: index of each sorted reference distance in ref_dists
+    :param ref_dists: reference distances
+    :param tolerance: fractional tolerance
+    :return: index of each matching distance, and of the matching reference distance
+    """
+    low = dists / (1.0 + tolerance)
+    if tolerance < 1.0:
+        high = dists / (1.0 - tolerance)
+    else:
+        high = np.full(len(dists), np.inf)
+
+    # Search a slightly wider range, and then apply the exact criterion
+    start = np.searchsorted(sorted_ref_dists, low * (1.0 - 1.0e-9), side="left")
+    stop = np.searchsorted(sorted_ref_dists, high * (1.0 + 1.0e-9), side="right")
+    counts = stop - start
+
+    rows = np.repeat(np.arange(len(dists)), counts)
+    offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    ref_index = ref_order[np.repeat(start, counts) + offsets]
+
+    matched = np.abs((dists[rows] / ref_dists[ref_index]) - 1.0) < tolerance
+    return rows[matched], ref_index[matched]
+
+
 def distance_match(
     img_src_list: list[SextractorSource],
     ref_src_list: list[BaseSource],
@@ -72,61 +161,30 @@ def distance_match(
     if unc_pa is None:
         unc_pa = 720.0
 
-    dec_list = []
-    for src in img_src_list:
-        dec_list.append(src.dec_rad)
-    median_dec_rad = median(dec_list)  # faster distance computation
-    ra_scale = np.cos(median_dec_rad)  # will mess up meridian crossings, however
-
-    # Calculate all the distances
-
-    # In image catalog:
-    img_src_dists = []
-    img_src_match_ids = []
-    for i, src in enumerate(img_src_list):
-        distances = []
-        distances_j_index = []
-        for j, src2 in enumerate(img_src_list):
-            if i == j:
-                continue
+    img_array = get_source_array(img_src_list)
+    ref_array = get_source_array(ref_src_list)
 
-            if abs(src.dec_deg - src2.dec_deg) > max_rad:
-                continue
-            if ra_scale * abs(src.ra_deg - src2.ra_deg) > max_rad:
-                continue
+    median_dec_rad = median(img_array["dec_rad"])  # faster distance computation
+    ra_scale = np.cos(median_dec_rad)  # will mess up meridian crossings, however
 
-            dist = quickdistance(src, src2, ra_scale)
+    # Calculate all the distances, in image catalog and reference catalog
 
-            if min_rad < dist < max_rad:
-                distances.append(dist)
-                distances_j_index.append(j)
+    img_pair_i, img_pair_j, img_pair_dist = get_pair_distances(
+        img_array, ra_scale=ra_scale, min_rad=min_rad, max_rad=max_rad
+    )
+    ref_pair_i, ref_pair_j, ref_pair_dist = get_pair_distances(
+        ref_array, ra_scale=ra_scale, min_rad=min_rad, max_rad=max_rad
+    )
 
-        img_src_dists.append(distances)
-        img_src_match_ids.append(distances_j_index)
+    img_pair_pa = position_angles(img_array[img_pair_i], img_array[img_pair_j])
+    ref_pair_pa = position_angles(ref_array[ref_pair_i], ref_array[ref_pair_j])
 
-    # In reference catalog:
-    ref_src_dists = []
-    ref_src_match_ids = []
-    for i, src in enumerate(ref_src_list):
-        distances = []
-        distances_j_index = []
-        for j, src2 in enumerate(ref_src_list):
-            if i == j:
-                continue
+    img_pair_bounds = np.searchsorted(img_pair_i, np.arange(len(img_array) + 1))
+    ref_has_pairs = np.bincount(ref_pair_i, minlength=len(ref_array)) >= 2
 
-            if abs(src.dec_deg - src2.dec_deg) > max_rad:
-                continue
-            if ra_scale * abs(src.ra_deg - src2.ra_deg) > max_rad:
-                continue
-
-            dist = quickdistance(src, src2, ra_scale)
-
-            if min_rad < dist < max_rad:
-                distances.append(dist)
-                distances_j_index.append(j)
-
-        ref_src_dists.append(distances)
-        ref_src_match_ids.append(distances_j_index)
+    # Sort the reference distances, to look up matching distances by bisection
+    ref_order = np.argsort(ref_pair_dist, kind="stable")
+    ref_sorted_dist = ref_pair_dist[ref_order]
 
     # Now look for matches in the reference catalog to distances in the image catalog.
 
@@ -140,91 +198,90 @@ def distance_match(
     primary_match_img = []
     primary_match_ref = []
 
-    for img_i, img_dist_array in enumerate(img_src_dists):
-        if len(img_dist_array) < 2:
+    for img_i in range(len(img_array)):
+        img_js = img_pair_j[img_pair_bounds[img_i] : img_pair_bounds[img_i + 1]]
+        img_dists = img_pair_dist[img_pair_bounds[img_i] : img_pair_bounds[img_i + 1]]
+
+        if len(img_js) < 2:
             continue
 
-        for ref_i, ref_dist_array in enumerate(ref_src_dists):
-            if len(ref_dist_array) < 2:
-                continue
+        # Every (image distance, reference pair) with a matching distance
+        rows, ref_pairs = match_distances(
+            img_dists, ref_sorted_dist, ref_order, ref_pair_dist, tolerance
+        )
+        keep = ref_has_pairs[ref_pair_i[ref_pairs]]
+        rows, ref_pairs = rows[keep], ref_pairs[keep]
 
-            match = 0
-            img_match_in = []
-            ref_match_in = []
+        if len(rows) == 0:
+            continue
 
-            for img_j, img_src_dist in enumerate(img_dist_array):
-                new_match = 1
+        # Group by reference source, ordered as image pair, then reference pair
+        order = np.lexsort((ref_pairs, rows, ref_pair_i[ref_pairs]))
+        rows, ref_pairs = rows[order], ref_pairs[order]
+        ref_is, group_starts = np.unique(ref_pair_i[ref_pairs], return_index=True)
+        group_bounds = np.append(group_starts, len(rows))
+
+        # Further matches for the same image pair indicate degeneracies,
+        # so only count the first
+        new_match = np.ones(len(rows), dtype=bool)
+        new_match[1:] = rows[1:] != rows[:-1]
+        new_match[group_starts] = True
+        n_match = np.add.reduceat(new_match.astype(int), group_starts)
+
+        # Here, dpa[n] is the mean rotation of the PA from
+        # the primary star of this match to the stars in its match
+        # RELATIVE TO those same angles for those same stars
+        # in the catalog.  Therefore it is a robust measurement of the rotation.
+        all_dpa = wrap_position_angles(
+            img_pair_pa[img_pair_bounds[img_i] + rows] - ref_pair_pa[ref_pairs]
+        )
 
-                for ref_j, ref_src_dist in enumerate(ref_dist_array):
-                    if abs((img_src_dist / ref_src_dist) - 1.0) < tolerance:
-                        match += new_match
+        for k in np.nonzero(n_match >= req_match)[0]:
+            ref_i = ref_is[k]
+            group = slice(group_bounds[k], group_bounds[k + 1])
+
+            img_match_in = img_js[rows[group]]
+            ref_match_in = ref_pair_j[ref_pairs[group]]
+            dpa = all_dpa[group]
+
+            # If user was confident the initial PA was right, remove bad PA'src
+            # right away
+            keep = np.abs(dpa) <= unc_pa
+            img_match_in, ref_match_in, dpa = (
+                img_match_in[keep],
+                ref_match_in[keep],
+                dpa[keep],
+            )
 
-                        # further matches before the next
-                        # img_j loop indicate degeneracies
-                        new_match = 0
+            if len(img_match_in) < 2:
+                continue
 
-                        img_match_in.append(img_src_match_ids[img_i][img_j])
-                        ref_match_in.append(ref_src_match_ids[ref_i][ref_j])
+            mode_dpa = mode(list(dpa))
 
-            if match >= req_match:
-                dpa = []
-                # Here, dpa[n] is the mean rotation of the PA from
-                # the primary star of this match to the stars in its match
-                # RELATIVE TO those same angles for those same stars
-                # in the catalog.  Therefore it is a robust measurement of the rotation.
+            # Remove deviant matches by PA
+            keep = np.abs(dpa - mode_dpa) <= pa_tolerance
+            img_match_in, ref_match_in = img_match_in[keep], ref_match_in[keep]
 
-                for i, match_index in enumerate(img_match_in):
-                    ddpa = position_angle(
-                        img_src_list[img_i], img_src_list[match_index]
-                    ) - position_angle(
-                        ref_src_list[ref_i], ref_src_list[ref_match_in[i]]
-                    )
-                    while ddpa > 200.0:
-                        ddpa -= 360.0
-                    while ddpa < -160.0:
-                        ddpa += 360.0
-                    dpa.append(ddpa)
-
-                # If user was confident the initial PA was right, remove bad PA'src
-                # right away
-                for i in range(len(img_match_in) - 1, -1, -1):
-                    if abs(dpa[i]) > unc_pa:
-                        del img_match_in[i]
-                        del ref_match_in[i]
-                        del dpa[i]
-
-                if len(img_match_in) < 2:
-                    continue
-
-                mode_dpa = mode(dpa)
-
-                # Remove deviant matches by PA
-                for i in range(len(img_match_in) - 1, -1, -1):
-                    if abs(dpa[i] - mode_dpa) > pa_tolerance:
-                        del img_match_in[i]
-                        del ref_match_in[i]
-                        del dpa[i]
-
-                if len(img_match_in) < 2:
-                    continue
-
-                n_degeneracies = (
-                    len(img_match_in)
-                    - len(unique(img_match_in))
-                    + len(ref_match_in)
-                    - len(unique(ref_match_in))
-                )
-                # this isn't quite accurate (overestimates if degeneracies are mixed up)
+            if len(img_match_in) < 2:
+                continue
 
-                mpa.append(mode_dpa)
-                primary_match_img.append(img_i)
-                primary_match_ref.append(ref_i)
-                img_match.append(img_match_in)
-                ref_match.append(ref_match_in)
-                match_ns.append(len(img_match_in) - n_degeneracies)
+            n_degeneracies = (
+                len(img_match_in)
+                - len(np.unique(img_match_in))
+                + len(ref_match_in)
+                - len(np.unique(ref_match_in))
+            )
+            # this isn't quite accurate (overestimates if degeneracies are mixed up)
+
+            mpa.append(mode_dpa)
+            primary_match_img.append(img_i)
+            primary_match_ref.append(int(ref_i))
+            img_match.append(img_match_in.tolist())
+            ref_match.append(ref_match_in.tolist())
+            match_ns.append(len(img_match_in) - n_degeneracies)
 
-                if len(img_match_in) - n_degeneracies > 6:
-                    n_great_matches += 1
+            if len(img_match_in) - n_degeneracies > 6:
+                n_great_matches += 1
 
         if n_great_matches > 16 and FAST_MATCH is True:
             break  # save processing time
@@ -316,31 +373,28 @@ def distance_match(
 
     # New verification step: calculate distances and PAs between central stars
     # of matches
-    n_dist_flags = [0] * len(primary_match_img)
+    # (flags are not realigned after deleting clusters, as in the original algorithm)
+    n_dist_flags = np.zeros(len(primary_match_img), dtype=int)
     for _ in range(2):  # two iterations
         # find bad pairs
         if len(primary_match_img) == 0:
             break
 
-        for i, img_i in enumerate(primary_match_img):
-            for j, img_j in enumerate(primary_match_img):
-                if i == j:
-                    continue
+        primary_img = img_array[primary_match_img]
+        primary_ref = ref_array[primary_match_ref]
 
-                ref_i = primary_match_ref[i]
-                ref_j = primary_match_ref[j]
+        img_dist = distances(primary_img[:, np.newaxis], primary_img[np.newaxis, :])
+        ref_dist = distances(primary_ref[:, np.newaxis], primary_ref[np.newaxis, :])
 
-                img_dist_ij = distance(img_src_list[img_i], img_src_list[img_j])
-                ref_dist_ij = distance(ref_src_list[ref_i], ref_src_list[ref_j])
+        # (occasionally will get divide by zero)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bad_pairs = np.abs((img_dist / ref_dist) - 1.0) > tolerance
+        np.fill_diagonal(bad_pairs, False)
 
-                try:
-                    if abs((img_dist_ij / ref_dist_ij) - 1.0) > tolerance:
-                        n_dist_flags[i] += 1
-                except ZeroDivisionError:  # (occasionally will get divide by zero)
-                    pass
+        n_test_matches = len(primary_match_img)
+        n_dist_flags[:n_test_matches] += np.sum(bad_pairs, axis=1)
 
         # delete bad clusters
-        n_test_matches = len(primary_match_img)
         for i in range(n_test_matches - 1, -1, -1):
             if (
                 n_dist_flags[i] == n_test_matches - 1
@@ -361,19 +415,14 @@ def distance_match(
         return [], [], []
 
     # check the pixel scale while we're at it
-    pix_scale_list = []
     if len(primary_match_img) >= 2:
-        for i in range(len(primary_match_img) - 1):
-            for j in range(i + 1, len(primary_match_img)):
-                img_i = primary_match_img[i]
-                ref_i = primary_match_ref[i]
-                img_j = primary_match_img[j]
-                ref_j = primary_match_ref[j]
-
-                pix_scale_list.append(
-                    distance(ref_src_list[ref_i], ref_src_list[ref_j])
-                    / pixel_distance(img_src_list[img_i], img_src_list[img_j])
-                )
+        index_i, index_j = np.triu_indices(len(primary_match_img), k=1)
+        primary_img = img_array[primary_match_img]
+        primary_ref = ref_array[primary_match_ref]
+
+        pix_scale_list = distances(
+            primary_ref[index_i], primary_ref[index_j]
+        ) / pixel_distances(primary_img[index_i], primary_img[index_j])
 
         pix_scale = median(pix_scale_list)
         pix_scale_std = stdev(pix_scale_list)
@@ -426,7 +475,7 @@ def distance_match(
             )
             out.write("image\n")
             for i, img_i in enumerate(primary_match_img):
-                for j, img_j in enumerate(img_match[i]):
+                for img_j in img_match[i]:
                     out.write(
                         f"line({img_src_list[img_i].x:.3f},"
                         f"{img_src_list[img_i].y:.3f},"
@@ -447,7 +496,7 @@ def distance_match(
             )
             out.write("fk5\n")
             for i, ref_i in enumerate(primary_match_ref):
-                for j, ref_j in enumerate(ref_match[i]):
+                for ref_j in ref_match[i]:
                     out.write(
                         f"line({ref_src_list[ref_i].ra_deg:.5f},"
                         f"{ref_src_list[ref_i].dec_deg:.5f},"
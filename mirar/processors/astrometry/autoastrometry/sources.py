@@ -1,13 +1,30 @@
 """
-Module containing base Source classes used by autoastrometry
+Module containing base Source classes used by autoastrometry.
+
+Sources are read and written as objects, but are converted to structured arrays
+(see :func:`get_source_array`) for crossmatching, so distances and position angles
+can be calculated for many pairs of sources at once.
 """
 
 import logging
+from typing import Optional
 
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+SOURCE_DTYPE = np.dtype(
+    [
+        ("ra_deg", float),
+        ("dec_deg", float),
+        ("ra_rad", float),
+        ("dec_rad", float),
+        ("mag", float),
+        ("x", float),
+        ("y", float),
+    ]
+)
+
 
 class BaseSource:
     """
@@ -161,3 +178,104 @@ def compare_mag(source: SextractorSource) -> float:
     :return: magnitude of source
     """
     return source.mag
+
+
+def get_source_array(src_list: list[BaseSource]) -> np.ndarray:
+    """
+    Convert a list of sources to a structured array, with the fields of
+    SOURCE_DTYPE. Pixel positions are NaN for sources without them.
+
+    :param src_list: list of sources
+    :return: structured array
+    """
+    src_array = np.zeros(len(src_list), dtype=SOURCE_DTYPE)
+    for field in ["ra_deg", "dec_deg", "ra_rad", "dec_rad", "mag"]:
+        src_array[field] = [getattr(src, field) for src in src_list]
+    for field in ["x", "y"]:
+        src_array[field] = [getattr(src, field, np.nan) for src in src_list]
+    return src_array
+
+
+def wrap_position_angles(pa_deg: np.ndarray) -> np.ndarray:
+    """
+    Wrap position angles to the range -160 to 200 degrees
+
+    :param pa_deg: position angles (degrees)
+    :return: wrapped position angles
+    """
+    pa_deg = np.asarray(pa_deg, dtype=float)
+    pa_deg = np.where(
+        pa_deg > 200.0, pa_deg - 360.0 * np.ceil((pa_deg - 200.0) / 360.0), pa_deg
+    )
+    return np.where(
+        pa_deg < -160.0, pa_deg + 360.0 * np.ceil((-160.0 - pa_deg) / 360.0), pa_deg
+    )
+
+
+def pixel_distances(src_1: np.ndarray, src_2: np.ndarray) -> np.ndarray:
+    """
+    Vectorised :func:`pixel_distance`, for structured arrays of sources
+
+    :param src_1: sources 1
+    :param src_2: sources 2
+    :return: pixel distances
+    """
+    return np.sqrt((src_1["x"] - src_2["x"]) ** 2 + (src_1["y"] - src_2["y"]) ** 2)
+
+
+def distances(src_1: np.ndarray, src_2: np.ndarray) -> np.ndarray:
+    """
+    Vectorised :func:`distance`, for structured arrays of sources
+
+    :param src_1: sources 1
+    :param src_2: sources 2
+    :return: great circle distances (arcsec)
+    """
+    ddec = src_2["dec_rad"] - src_1["dec_rad"]
+    dra = src_2["ra_rad"] - src_1["ra_rad"]
+    dist_rad = 2 * np.arcsin(
+        np.sqrt(
+            (np.sin(ddec / 2.0)) ** 2
+            + np.cos(src_1["dec_rad"])
+            * np.cos(src_2["dec_rad"])
+            * (np.sin(dra / 2.0)) ** 2
+        )
+    )
+    return dist_rad * 180.0 / np.pi * 3600.0
+
+
+def quickdistance_matrix(
+    src_1: np.ndarray, cosdec: float, src_2: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Vectorised :func:`quickdistance`, between every pair of sources
+
+    :param src_1: structured array of sources
+    :param cosdec: cos(declination)
+    :param src_2: optional second structured array of sources (default: src_1)
+    :return: matrix of approximate distances, from each source in src_1 (rows)
+        to each source in src_2 (columns)
+    """
+    if src_2 is None:
+        src_2 = src_1
+    ddec = src_2["dec_deg"][np.newaxis, :] - src_1["dec_deg"][:, np.newaxis]
+    dra = src_2["ra_deg"][np.newaxis, :] - src_1["ra_deg"][:, np.newaxis]
+    dra = np.where(dra > 180, 360 - dra, dra)
+    return 3600 * np.sqrt(ddec**2 + (cosdec * dra) ** 2)
+
+
+def position_angles(src_1: np.ndarray, src_2: np.ndarray) -> np.ndarray:
+    """
+    Vectorised :func:`position_angle`, for structured arrays of sources
+
+    :param src_1: sources 1
+    :param src_2: sources 2
+    :return: position angles (degrees)
+    """
+    dra = src_2["ra_rad"] - src_1["ra_rad"]
+    pa_rad = np.arctan2(
+        np.cos(src_1["dec_rad"]) * np.tan(src_2["dec_rad"])
+        - np.sin(src_1["dec_rad"]) * np.cos(dra),
+        np.sin(dra),
+    )
+    return wrap_position_angles(90.0 - pa_rad * 180.0 / np.pi)
@@ -21,6 +21,7 @@ from mirar.processors.astromatic import Sextractor
 from mirar.processors.astromatic.sextractor.sextractor import SEXTRACTOR_HEADER_KEY
 from mirar.processors.base_processor import PrerequisiteError, logger
 from mirar.utils.ldac_tools import get_table_from_ldac
+from mirar.utils.spatial_index import get_sky_index
 
 
 def default_image_sextractor_catalog_purifier(
@@ -56,28 +57,39 @@ def xmatch_catalogs(
     """
     Cross-match the reference catalog to the image catalog
     """
-    ref_coords = SkyCoord(ra=ref_cat["ra"], dec=ref_cat["dec"], unit=(u.deg, u.deg))
-
-    img_coords = SkyCoord(
-        ra=image_cat["ALPHAWIN_J2000"],
-        dec=image_cat["DELTAWIN_J2000"],
-        unit=(u.deg, u.deg),
-    )
-
     logger.debug(
-        f"Cross-matching {len(ref_cat)} sources in catalog to {len(img_coords)} "
+        f"Cross-matching {len(ref_cat)} sources in catalog to {len(image_cat)} "
         f"image with radius {crossmatch_radius_arcsec} arcsec."
     )
 
-    idx, d2d, _ = ref_coords.match_to_catalog_sky(img_coords)
-    match_mask = d2d < crossmatch_radius_arcsec * u.arcsec
-    matched_ref_cat = ref_cat[match_mask]
-    matched_img_cat = image_cat[idx[match_mask]]
+    # The reference catalog index is cached, so it is reused for every image
+    ref_index = get_sky_index(
+        np.asarray(ref_cat["ra"], dtype=float), np.asarray(ref_cat["dec"], dtype=float)
+    )
+    img_inds, ref_inds, separations = ref_index.query_radius(
+        np.asarray(image_cat["ALPHAWIN_J2000"], dtype=float),
+        np.asarray(image_cat["DELTAWIN_J2000"], dtype=float),
+        radius_arcsec=crossmatch_radius_arcsec,
+    )
+    match_mask = separations < crossmatch_radius_arcsec
+    img_inds, ref_inds = img_inds[match_mask], ref_inds[match_mask]
+    separations = separations[match_mask]
+
+    # Keep the nearest image source for each reference source
+    order = np.lexsort((separations, ref_inds))
+    img_inds, ref_inds = img_inds[order], ref_inds[order]
+    separations = separations[order]
+    nearest = np.ones(len(ref_inds), dtype=bool)
+    nearest[1:] = ref_inds[1:] != ref_inds[:-1]
+
+    matched_ref_cat = ref_cat[ref_inds[nearest]]
+    matched_img_cat = image_cat[img_inds[nearest]]
+    d2d = Angle(separations[nearest] / 3600.0, unit=u.deg)
     logger.debug(
         f"Cross-matched {len(matched_img_cat)} sources from catalog to the image."
     )
 
-    return matched_img_cat, matched_ref_cat, d2d[match_mask]
+    return matched_img_cat, matched_ref_cat, d2d
 
 
 class BaseProcessorWithCrossMatch(BaseImageProcessor):
@@ -8,7 +8,9 @@ import hashlib
 import logging
 import socket
 import threading
+import uuid
 from abc import ABC
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from queue import Queue
 from threading import Thread
@@ -18,17 +20,21 @@ import numpy as np
 import pandas as pd
 from tqdm.auto import tqdm
 
-from mirar.data import DataBatch, Dataset, Image, ImageBatch, SourceBatch
+from mirar.data import DataBatch, Dataset, Image, ImageBatch, SourceBatch, cache
+from mirar.data.cache import USE_CACHE
+from mirar.data.image_data import get_image_dtype
 from mirar.errors import (
     ErrorReport,
     ErrorStack,
     NoncriticalProcessingError,
     ProcessorError,
 )
-from mirar.io import open_fits, save_fits
+from mirar.io import link_file, link_or_save_fits, open_fits, save_fits
+from mirar.metrics import MetricsReport, ProcessingRecord, ProcessingTracker
 from mirar.paths import (
     BASE_NAME_KEY,
     CAL_OUTPUT_SUB_DIR,
+    LATEST_SAVE_KEY,
     LATEST_WEIGHT_SAVE_KEY,
     PACKAGE_NAME,
     PROC_HISTORY_KEY,
@@ -37,6 +43,23 @@ from mirar.paths import (
     get_output_path,
     max_n_cpu,
 )
+from mirar.processors.executors import (
+    INLINE_EXECUTOR,
+    PROCESS_EXECUTOR,
+    THREAD_EXECUTOR,
+    apply_in_process,
+    can_use_processes,
+    get_process_context,
+    init_process_worker,
+    validate_executor,
+)
+from mirar.processors.master_registry import master_registry
+from mirar.processors.stacking import (
+    MEDIAN_COMBINE,
+    StackFrame,
+    combine_frames,
+    validate_combine_method,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +100,12 @@ class BaseProcessor:
 
     max_n_cpu: int = max_n_cpu
 
+    executor: str = THREAD_EXECUTOR
+
+    # Processors which must see the whole dataset at once (e.g. to regroup batches)
+    # are synchronization points, when streaming through a pipeline
+    is_synchronization_point: bool = False
+
     subclasses = {}
 
     def __init__(self):
@@ -87,6 +116,7 @@ class BaseProcessor:
         # For caching/multithreading
         self.passed_batches = {}
         self.err_stack = {}
+        self.metrics = {}
         self.progress = {}
 
     @classmethod
@@ -103,6 +133,17 @@ class BaseProcessor:
         """
         self.preceding_steps = previous_steps
 
+    def set_executor(self, executor: str):
+        """
+        Sets the executor used to process batches, one of
+        'thread', 'process' or 'inline'.
+        See :mod:`mirar.processors.executors` for details.
+
+        :param executor: name of executor
+        :return: None
+        """
+        self.executor = validate_executor(executor)
+
     def set_night(self, night_sub_dir: str | int = ""):
         """
         Sets the night subdirectory for the processor to read/write data
@@ -153,48 +194,48 @@ class BaseProcessor:
         """
         del self.passed_batches[cache_id]
         del self.err_stack[cache_id]
+        del self.metrics[cache_id]
 
-    def base_apply(self, dataset: Dataset) -> tuple[Dataset, ErrorStack]:
+    def base_apply(
+        self, dataset: Dataset, metrics: MetricsReport | None = None
+    ) -> tuple[Dataset, ErrorStack]:
         """
         Core function to act on a dataset, and return an updated dataset
 
         :param dataset: Input dataset
+        :param metrics: Optional report, to which processing metrics are added
         :return: Updated dataset, and any caught errors
         """
         cache_id = threading.get_ident()
 
         self.passed_batches[cache_id] = {}
         self.err_stack[cache_id] = ErrorStack()
+        self.metrics[cache_id] = metrics if metrics is not None else MetricsReport()
 
         if len(dataset) > 0:
             n_cpu = min([self.max_n_cpu, len(dataset)])
 
-            logger.info(f"Running {self.__class__.__name__} on {n_cpu} threads")
-
-            watchdog_queue = Queue()
-
-            workers = []
+            executor = validate_executor(self.executor)
 
-            for _ in range(n_cpu):
-                # Set up a worker thread to process database load
-                worker = Thread(
-                    target=self.apply_to_batch, args=(watchdog_queue, cache_id)
-                )
-                worker.daemon = True
-                worker.start()
-
-                workers.append(worker)
+            if executor == PROCESS_EXECUTOR:
+                if not can_use_processes(self):
+                    executor = THREAD_EXECUTOR
 
             with tqdm(total=len(dataset), position=0, leave=False) as progress:
                 # Set up progress bar
                 self.progress[cache_id] = progress
 
-                # Loop over batches to add to queue
-                for j, batch in enumerate(dataset):
-                    watchdog_queue.put(item=(j, batch))
-
-                # Wait for the queue to empty
-                watchdog_queue.join()
+                if executor == INLINE_EXECUTOR:
+                    logger.info(f"Running {self.__class__.__name__} inline")
+                    self.apply_inline(dataset, cache_id)
+                elif executor == PROCESS_EXECUTOR:
+                    logger.info(
+                        f"Running {self.__class__.__name__} on {n_cpu} processes"
+                    )
+                    self.apply_in_processes(dataset, cache_id, n_cpu)
+                else:
+                    logger.info(f"Running {self.__class__.__name__} on {n_cpu} threads")
+                    self.apply_in_threads(dataset, cache_id, n_cpu)
 
                 self.progress[cache_id].refresh()
                 self.progress[cache_id].close()
@@ -211,6 +252,139 @@ class BaseProcessor:
 
         return dataset, err_stack
 
+    def apply_in_threads(self, dataset: Dataset, cache_id: int, n_cpu: int):
+        """
+        Process all batches in a dataset using a pool of threads
+
+        :param dataset: Input dataset
+        :param cache_id: key for cache
+        :param n_cpu: number of threads
+        :return: None
+        """
+        watchdog_queue = Queue()
+
+        for _ in range(n_cpu):
+            # Set up a worker thread to process database load
+            worker = Thread(target=self.apply_to_batch, args=(watchdog_queue, cache_id))
+            worker.daemon = True
+            worker.start()
+
+        # Loop over batches to add to queue
+        for j, batch in enumerate(dataset):
+            watchdog_queue.put(item=(j, batch))
+
+        # Wait for the queue to empty
+        watchdog_queue.join()
+
+    def apply_inline(self, dataset: Dataset, cache_id: int):
+        """
+        Process all batches in a dataset sequentially, in the current thread
+
+        :param dataset: Input dataset
+        :param cache_id: key for cache
+        :return: None
+        """
+        for j, batch in enumerate(dataset):
+            new_batch, report, record = self.process_batch(batch)
+            self.update_cache(cache_id, j, new_batch, report, record)
+
+    def apply_in_processes(self, dataset: Dataset, cache_id: int, n_cpu: int):
+        """
+        Process all batches in a dataset using a pool of worker processes.
+
+        Image data is shared through the on-disk cache rather than pickled.
+        Results and error reports are returned in the original batch order.
+
+        :param dataset: Input dataset
+        :param cache_id: key for cache
+        :param n_cpu: number of processes
+        :return: None
+        """
+        cache_dir = cache.cache_dir if USE_CACHE else None
+
+        # Workers read image data from disk, and are forked with a copy of the
+        # in-memory tier of the cache, so any changes must be written first
+        if USE_CACHE:
+            cache.flush()
+
+        with ProcessPoolExecutor(
+            max_workers=n_cpu,
+            mp_context=get_process_context(),
+            initializer=init_process_worker,
+            initargs=(cache_dir, get_image_dtype().name),
+        ) as pool:
+            futures = {}
+            for j, batch in enumerate(dataset):
+                futures[pool.submit(apply_in_process, self, batch)] = (j, batch)
+
+            for future in as_completed(futures):
+                j, batch = futures[future]
+                try:
+                    new_batch, report, record = future.result()
+                except Exception as exc:  # pylint: disable=broad-except
+                    new_batch, record = None, None
+                    report = self.generate_error_report(exc, batch)
+                self.update_cache(cache_id, j, new_batch, report, record)
+
+    def process_batch(
+        self, batch: DataBatch
+    ) -> tuple[DataBatch | None, ErrorReport | None, ProcessingRecord]:
+        """
+        Function to run self.apply on a batch, catch any errors, and record
+        the processing time/memory/I/O.
+
+        Batches raising a non-critical error are kept, while batches
+        raising any other error are dropped.
+
+        :param batch: batch to process
+        :return: processed batch (or None), error report (or None), and a
+            record of the processing metrics
+        """
+        with ProcessingTracker(
+            processor_name=self.__class__.__name__,
+            contents=batch.get_raw_image_names(),
+        ) as tracker:
+            try:
+                new_batch, report = self.apply(batch), None
+            except NoncriticalProcessingError as exc:
+                new_batch, report = batch, self.generate_error_report(exc, batch)
+            except Exception as exc:  # pylint: disable=broad-except
+                new_batch, report = None, self.generate_error_report(exc, batch)
+                tracker.success = False
+
+        return new_batch, report, tracker.record
+
+    def update_cache(
+        self,
+        cache_id: int,
+        j: int,
+        batch: DataBatch | None,
+        report: ErrorReport | None,
+        record: ProcessingRecord | None = None,
+    ):
+        """
+        Update the internal cache with the result of processing a single batch
+
+        :param cache_id: key for cache
+        :param j: index of batch in dataset
+        :param batch: processed batch (or None if it failed)
+        :param report: error report (or None if there was no error)
+        :param record: record of processing metrics (or None)
+        :return: None
+        """
+        if report is not None:
+            logger.error(report.generate_log_message())
+            self.err_stack[cache_id].add_report(report)
+
+        if record is not None:
+            self.metrics[cache_id].add_record(record)
+
+        if batch is not None:
+            self.passed_batches[cache_id][j] = batch
+
+        self.progress[cache_id].update(1)
+        self.progress[cache_id].refresh()
+
     def apply_to_batch(self, queue, cache_id: int):
         """
         Function to run self.apply on a batch in the queue, catch any errors, and then
@@ -222,24 +396,20 @@ class BaseProcessor:
         """
         while True:
             j, batch = queue.get()
-            try:
-                batch = self.apply(batch)
-                self.passed_batches[cache_id][j] = batch
-            except NoncriticalProcessingError as exc:
-                err = self.generate_error_report(exc, batch)
-                logger.error(err.generate_log_message())
-                self.err_stack[cache_id].add_report(err)
-                self.passed_batches[cache_id][j] = batch
-            except Exception as exc:  # pylint: disable=broad-except
-                err = self.generate_error_report(exc, batch)
-                logger.error(err.generate_log_message())
-                self.err_stack[cache_id].add_report(err)
-
-            self.progress[cache_id].update(1)
-            self.progress[cache_id].refresh()
-
+            new_batch, report, record = self.process_batch(batch)
+            self.update_cache(cache_id, j, new_batch, report, record)
             queue.task_done()
 
+    def __getstate__(self):
+        # The internal caches of base_apply (e.g. progress bars) are not
+        # needed in worker processes, and cannot be pickled
+        state = self.__dict__.copy()
+        state["passed_batches"] = {}
+        state["err_stack"] = {}
+        state["metrics"] = {}
+        state["progress"] = {}
+        return state
+
     def apply(self, batch: DataBatch):
         """
         Function applying the processor to a
@@ -344,6 +514,23 @@ class ImageHandler:
         """
         save_fits(image, path)
 
+    @staticmethod
+    def link_or_save_fits(
+        image: Image,
+        path: str | Path,
+    ):
+        """
+        Link path to an existing saved copy of an Image, if the image is
+        unchanged since, and otherwise save the Image to path.
+        Links should only be used for files that are not modified,
+        e.g. the input of external tools.
+
+        :param image: Image to save
+        :param path: path
+        :return: None
+        """
+        link_or_save_fits(image, path)
+
     def save_mask_image(self, image: Image, img_path: Path) -> Path:
         """
         Saves a mask image, following the astromatic software convention of
@@ -356,6 +543,13 @@ class ImageHandler:
         mask_path = get_mask_path(img_path)
         header = image.get_header()
 
+        version = self.get_mask_version(image)
+        saved_path = image.get_saved_path(version, kind="mask")
+        if (saved_path is not None) and link_file(saved_path, mask_path):
+            # The header is shared with the mask, as it would be if saved
+            header[LATEST_SAVE_KEY] = mask_path.as_posix()
+            return mask_path
+
         mask = image.get_mask()
         if LATEST_WEIGHT_SAVE_KEY in image.header:
             weight_data = self.open_fits(
@@ -363,9 +557,29 @@ class ImageHandler:
             ).get_data()
             mask = mask * weight_data
         self.save_fits(Image(mask.astype(float), header), mask_path)
+        image.set_saved_path(mask_path, version, kind="mask")
 
         return mask_path
 
+    @staticmethod
+    def get_mask_version(image: Image) -> str:
+        """
+        Get a version string for the mask image of an image, which changes if
+        the image data changes, or if the weight file used for the mask changes
+
+        :param image: Science image
+        :return: mask version
+        """
+        version = image.get_content_version(include_header=False)
+        if LATEST_WEIGHT_SAVE_KEY in image.header:
+            weight_path = Path(image.header[LATEST_WEIGHT_SAVE_KEY])
+            try:
+                stat = weight_path.stat()
+                version += f":{weight_path}:{stat.st_mtime_ns}:{stat.st_size}"
+            except OSError:
+                version += f":{weight_path}"
+        return version
+
     @staticmethod
     def get_hash(image_batch: ImageBatch):
         """
@@ -407,6 +621,8 @@ class ProcessorWithCache(BaseImageProcessor, ABC):
         overwrite: bool = True,
         cache_sub_dir: str = CAL_OUTPUT_SUB_DIR,
         cache_image_name_header_keys: str | list[str] | None = None,
+        combine_method: str = MEDIAN_COMBINE,
+        combine_kwargs: dict | None = None,
     ):
         super().__init__()
         self.try_load_cache = try_load_cache
@@ -414,6 +630,10 @@ class ProcessorWithCache(BaseImageProcessor, ABC):
         self.overwrite = overwrite
         self.cache_sub_dir = cache_sub_dir
         self.cache_image_name_header_keys = cache_image_name_header_keys
+        self.combine_method = validate_combine_method(combine_method)
+        self.combine_kwargs = combine_kwargs if combine_kwargs is not None else {}
+        # Identifies this processor's entries in the master registry
+        self.registry_token = uuid.uuid4().hex
 
     def select_cache_images(self, images: ImageBatch) -> ImageBatch:
         """
@@ -466,14 +686,51 @@ class ProcessorWithCache(BaseImageProcessor, ABC):
 
     def get_cache_file(self, images: ImageBatch) -> Image:
         """
-        Return the appropriate cached image for the batch
+        Return the appropriate cached image for the batch.
+        Images are kept in memory after being loaded or made once, so batches
+        sharing a cached image (in any thread) do not reload or remake it.
 
         :param images: images to process
         :return: cached image to use
         """
+        path = self.get_cache_path(images)
+
+        return master_registry.get_or_create(
+            (self.registry_token, str(path)),
+            lambda: self.load_or_make_cache_file(images, path),
+        )
+
+    def get_cache_product(
+        self,
+        images: ImageBatch,
+        product_name: str,
+        make_product: Callable[[Image], object],
+    ):
+        """
+        Return a product derived from the cached image for the batch
+        (e.g. master flat data with bad pixels masked), which is kept in memory
+        alongside the cached image
 
+        :param images: images to process
+        :param product_name: name of product
+        :param make_product: function to make the product from the cached image
+        :return: product
+        """
         path = self.get_cache_path(images)
 
+        return master_registry.get_or_create(
+            (self.registry_token, str(path), product_name),
+            lambda: make_product(self.get_cache_file(images)),
+        )
+
+    def load_or_make_cache_file(self, images: ImageBatch, path: Path) -> Image:
+        """
+        Load the cached image from disk, or make it (and save it) if necessary
+
+        :param images: images to process
+        :param path: path of cached image
+        :return: cached image
+        """
         exists = path.exists()
 
         if np.logical_and(self.try_load_cache, exists):
@@ -488,6 +745,21 @@ class ProcessorWithCache(BaseImageProcessor, ABC):
 
         return image
 
+    def combine_cache_frames(self, frames: list[StackFrame]) -> np.ndarray:
+        """
+        Combine frames into a cached image, tile by tile with bounded memory
+
+        :param frames: frames to combine
+        :return: combined image data
+        """
+        logger.debug(f"Combining {len(frames)} frames with '{self.combine_method}'")
+        return combine_frames(
+            frames,
+            method=self.combine_method,
+            n_workers=self.max_n_cpu,
+            **self.combine_kwargs,
+        )
+
     def make_image(self, images: ImageBatch) -> Image:
         """
         Make a cached image (e.g master flat)
@@ -591,3 +863,24 @@ class BaseSourceProcessor(BaseProcessor, ABC):
         )
         super_dict.update({key.upper(): val for key, val in super_dict.items()})
         return super_dict
+
+    @staticmethod
+    def generate_super_dicts(metadata: dict, source_table: pd.DataFrame) -> list[dict]:
+        """
+        Generate a dictionary of metadata and candidate row for every row of a
+        source table, equivalent to generate_super_dict but without
+        iterating over rows as pandas Series
+
+        :param metadata: Metadata for the source table
+        :param source_table: Source table
+        :return: List of combined dictionaries
+        """
+        metadata_dict = {key.lower(): val for key, val in metadata.items()}
+
+        super_dicts = []
+        for row in source_table.to_dict(orient="records"):
+            super_dict = dict(metadata_dict)
+            super_dict.update({key.lower(): val for key, val in row.items()})
+            super_dict.update({key.upper(): val for key, val in super_dict.items()})
+            super_dicts.append(super_dict)
+        return super_dicts
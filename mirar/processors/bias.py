@@ -11,6 +11,7 @@ from mirar.data import Image, ImageBatch
 from mirar.errors import ImageNotFoundError
 from mirar.paths import BIAS_FRAME_KEY, LATEST_SAVE_KEY, SATURATE_KEY
 from mirar.processors.base_processor import ProcessorPremadeCache, ProcessorWithCache
+from mirar.processors.stacking import StackFrame
 from mirar.processors.utils.image_selector import select_from_images
 
 logger = logging.getLogger(__name__)
@@ -75,15 +76,12 @@ class BiasCalibrator(ProcessorWithCache):
             logger.error(err)
             raise ImageNotFoundError(err)
 
-        nx, ny = images[0].get_data().shape
+        biases = [StackFrame(img.get_readonly_data()) for img in images]
 
-        biases = np.zeros((nx, ny, n_frames))
-
-        for i, img in enumerate(images):
-            biases[:, :, i] = img.get_data()
-
-        logger.debug(f"Median combining {n_frames} biases")
-        master_bias = Image(np.nanmedian(biases, axis=2), header=images[0].get_header())
+        logger.debug(f"Combining {n_frames} biases")
+        master_bias = Image(
+            self.combine_cache_frames(biases), header=images[0].get_header()
+        )
 
         return master_bias
 
@@ -21,6 +21,7 @@ from mirar.paths import (
     STACKED_COMPONENT_IMAGES_KEY,
 )
 from mirar.processors.base_processor import ProcessorPremadeCache, ProcessorWithCache
+from mirar.processors.stacking import StackFrame
 from mirar.processors.utils.image_selector import select_from_images
 
 logger = logging.getLogger(__name__)
@@ -101,24 +102,22 @@ class DarkCalibrator(ProcessorWithCache):
             logger.error(err)
             raise MissingDarkError(err)
 
-        nx, ny = dark_images[0].get_data().shape
-
-        darks = np.zeros((nx, ny, n_frames))
+        darks = []
 
         individual_dark_exptimes, imagenames_key = [], []
-        for i, img in enumerate(dark_images):
+        for img in dark_images:
             dark_exptime = img[EXPTIME_KEY]
-            darks[:, :, i] = img.get_data() / dark_exptime
+            darks.append(StackFrame(img.get_readonly_data(), scale=dark_exptime))
             individual_dark_exptimes.append(str(dark_exptime))
             imagenames_key.append(img[BASE_NAME_KEY])
 
-        logger.debug(f"Median combining {n_frames} darks")
+        logger.debug(f"Combining {n_frames} darks")
         master_dark_header = copy(dark_images[0].get_header())
         master_dark_header[EXPTIME_KEY] = 1.0
         master_dark_header[COADD_KEY] = n_frames
         master_dark_header["INDIVEXP"] = ",".join(individual_dark_exptimes)
         master_dark_header[STACKED_COMPONENT_IMAGES_KEY] = ",".join(imagenames_key)
-        master_dark = Image(np.nanmedian(darks, axis=2), header=master_dark_header)
+        master_dark = Image(self.combine_cache_frames(darks), header=master_dark_header)
 
         return master_dark
 
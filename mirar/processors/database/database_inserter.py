@@ -59,16 +59,17 @@ class DatabaseImageInserter(BaseDatabaseInserter, BaseImageProcessor):
     """
 
     def _apply_to_images(self, batch: ImageBatch) -> ImageBatch:
-        for image in batch:
-            val_dict = self.generate_value_dict(image)
+        records = [self.generate_value_dict(image) for image in batch]
 
-            new = self.db_table(**val_dict)
-            res = new.insert_entry(duplicate_protocol=self.duplicate_protocol)
+        res = self.db_table.insert_entries(
+            records, duplicate_protocol=self.duplicate_protocol
+        )
 
-            assert len(res) == 1
+        assert len(res) == len(batch)
 
+        for i, image in enumerate(batch):
             for key in res.columns:
-                image[key] = res[key].iloc[0]
+                image[key] = res[key].iloc[i]
         return batch
 
     @staticmethod
@@ -92,20 +93,16 @@ class DatabaseSourceInserter(BaseDatabaseInserter, BaseSourceProcessor):
             source_table = source_list.get_data()
             metadata = source_list.get_metadata()
 
-            primary_key_df_list = []
-            for _, source_row in source_table.iterrows():
-                super_dict = self.generate_super_dict(metadata, source_row)
-
-                new = self.db_table(**super_dict)
-                res = new.insert_entry(duplicate_protocol=self.duplicate_protocol)
+            super_dicts = self.generate_super_dicts(metadata, source_table)
 
-                assert len(res) == 1
+            primary_key_df = self.db_table.insert_entries(
+                super_dicts, duplicate_protocol=self.duplicate_protocol
+            )
 
-                primary_key_df_list.append(res.loc[0])
+            assert len(primary_key_df) == len(source_table)
 
-            primary_key_df = pd.DataFrame(primary_key_df_list).reset_index(drop=True)
             for key in primary_key_df:
-                source_table[key] = primary_key_df[key]
+                source_table[key] = primary_key_df[key].to_numpy()
 
             source_list.set_data(source_table)
 
@@ -11,7 +11,8 @@ import pandas as pd
 
 from mirar.data import DataBlock, Image, ImageBatch, SourceBatch
 from mirar.database.constraints import DBQueryConstraints
-from mirar.database.transactions import select_from_table
+from mirar.database.transactions import select_from_table, select_q3c_crossmatch
+from mirar.database.transactions.select import XMATCH_INDEX_COLUMN, XMATCH_QUERY_PREFIX
 from mirar.paths import SOURCE_HISTORY_KEY
 from mirar.processors.base_processor import BaseImageProcessor, BaseSourceProcessor
 from mirar.processors.database.base_database_processor import BaseDatabaseProcessor
@@ -270,7 +271,17 @@ class DatabaseMultimatchSelector(BaseDatabaseSourceSelector, ABC):
 
 class BaseSpatialCrossmatchSource(BaseDatabaseSourceSelector, ABC):
     """
-    Processor to crossmatch to sources in a database using spatial search
+    Processor to crossmatch to sources in a database using spatial search.
+
+    All sources in a table are crossmatched with a single query, using q3c_join.
+    If max_num_results is set, the matches for each source are ranked by
+    order_field_name (if given), and then by distance.
+
+    Unlike other source selectors, get_constraints is not used to build the query.
+    Subclasses add constraints by overriding get_query_columns (the source values
+    to upload) and get_join_constraints (sql relating those values to the table).
+    Subclasses which still override get_constraints are deprecated, and fall back
+    to querying the database once per source.
     """
 
     def __init__(
@@ -291,6 +302,18 @@ class BaseSpatialCrossmatchSource(BaseDatabaseSourceSelector, ABC):
         self.order_ascending = order_ascending
         self.query_dist = query_dist
 
+        self.use_source_constraints = (
+            type(self).get_constraints
+            is not BaseSpatialCrossmatchSource.get_constraints
+        )
+        if self.use_source_constraints:
+            logger.warning(
+                f"{type(self).__name__} overrides get_constraints, which is "
+                f"deprecated for spatial crossmatches, so the database will be "
+                f"queried once per source. Override get_query_columns and "
+                f"get_join_constraints instead."
+            )
+
     def get_source_crossmatch_constraints(self, data: dict) -> DBQueryConstraints:
         """
         Apply constraints to a single source, using q3c
@@ -312,6 +335,82 @@ class BaseSpatialCrossmatchSource(BaseDatabaseSourceSelector, ABC):
     def get_constraints(self, data: dict) -> DBQueryConstraints:
         return self.get_source_crossmatch_constraints(data)
 
+    def get_query_columns(self) -> list[str]:
+        """
+        Get the source columns uploaded for the crossmatch query
+
+        :return: list of columns
+        """
+        return ["ra", "dec"]
+
+    def get_join_constraints(self) -> list[str]:
+        """
+        Get sql constraints relating uploaded source values (q._xm_<column>)
+        to table columns (t.<column>), applied in the crossmatch query
+
+        :return: list of sql constraints
+        """
+        return []
+
+    def get_query_values(
+        self, metadata: dict, candidate_table: pd.DataFrame
+    ) -> pd.DataFrame:
+        """
+        Get the values of each source to upload for the crossmatch query.
+        As for per-source queries, source columns take precedence over metadata.
+
+        :param metadata: source table metadata
+        :param candidate_table: source table
+        :return: dataframe of query values
+        """
+        super_dicts = self.generate_super_dicts(metadata, candidate_table)
+        columns = self.get_query_columns()
+        return pd.DataFrame(
+            [[super_dict[x] for x in columns] for super_dict in super_dicts],
+            columns=columns,
+        )
+
+    def _apply_to_sources(
+        self,
+        batch: SourceBatch,
+    ) -> SourceBatch:
+        if self.use_source_constraints:
+            return BaseDatabaseSourceSelector._apply_to_sources(self, batch)
+
+        output_columns = self.db_output_columns
+        if isinstance(output_columns, str):
+            output_columns = [output_columns]
+
+        for source_table in batch:
+            candidate_table = source_table.get_data()
+            query_values = self.get_query_values(
+                source_table.get_metadata(), candidate_table
+            )
+
+            res = select_q3c_crossmatch(
+                sql_table=self.db_table.sql_model,
+                query_values=query_values,
+                crossmatch_radius_arcsec=self.xmatch_radius_arcsec,
+                output_columns=output_columns,
+                ra_field_name=self.ra_field_name,
+                dec_field_name=self.dec_field_name,
+                join_constraints=self.get_join_constraints(),
+                db_constraints=self.additional_query_constraints,
+                max_num_results=self.max_num_results,
+                order_field_name=self.order_field_name,
+                order_ascending=self.order_ascending,
+            )
+
+            results = [
+                pd.DataFrame(columns=output_columns) for _ in range(len(query_values))
+            ]
+            for index, matches in res.groupby(XMATCH_INDEX_COLUMN):
+                results[int(index)] = matches[output_columns].reset_index(drop=True)
+
+            new_table = self.update_dataframe(candidate_table, results)
+            source_table.set_data(new_table)
+        return batch
+
 
 class SingleSpatialCrossmatchSource(
     BaseSpatialCrossmatchSource, DatabaseSingleMatchSelector
@@ -352,16 +451,13 @@ class DatabaseHistorySelector(SpatialCrossmatchSourceWithDatabase):
         self.output_df_colname = SOURCE_HISTORY_KEY
         logger.info(f"Update db is {self.update_dataframe}")
 
-    def get_constraints(self, data: dict) -> DBQueryConstraints:
-        query_constraints = self.get_source_crossmatch_constraints(data)
-        query_constraints.add_constraint(
-            column=self.time_field_name,
-            comparison_type="<",
-            accepted_values=data[self.time_field_name],
-        )
-        query_constraints.add_constraint(
-            column=self.time_field_name,
-            comparison_type=">=",
-            accepted_values=data[self.time_field_name] - self.history_duration_days,
-        )
-        return query_constraints
+    def get_query_columns(self) -> list[str]:
+        return super().get_query_columns() + [self.time_field_name]
+
+    def get_join_constraints(self) -> list[str]:
+        query_time = f"q.{XMATCH_QUERY_PREFIX}{self.time_field_name}"
+        table_time = f"t.{self.time_field_name}"
+        return super().get_join_constraints() + [
+            f"{table_time} < {query_time}",
+            f"{table_time} >= {query_time} - {self.history_duration_days}",
+        ]
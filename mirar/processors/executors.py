@@ -0,0 +1,184 @@
+"""
+Module containing the execution backends used by
+:func:`~mirar.processors.base_processor.BaseProcessor.base_apply`.
+
+By default, batches are processed by a pool of python threads. This works well for
+processors which spend most of their time waiting on external software
+(e.g. the astromatic tools), but pure python/numpy processors are held back by the
+GIL. Each processor can therefore select one of three executors:
+
+* **thread** (default): batches are processed by a pool of threads
+* **process**: batches are shipped to a pool of worker processes
+* **inline**: batches are processed one after another, in the calling thread
+
+In process mode, :class:`~mirar.data.image_data.Image` objects are sent to the
+workers without their pixel data. The data is instead shared via the on-disk
+cache, so only the headers and the cache paths are pickled. Images created
+by the worker are handed back to the parent process, which then takes ownership
+of their cache files. Process mode therefore requires cache mode,
+and a processor which can be pickled. If either condition is not met,
+the processor falls back to the thread executor.
+"""
+
+import logging
+import multiprocessing
+import pickle
+from multiprocessing.util import Finalize
+from pathlib import Path
+
+from mirar.data import DataBatch, Image, cache
+from mirar.data.cache import USE_CACHE
+from mirar.data.image_data import set_image_dtype
+from mirar.errors import ErrorReport, ProcessorError
+from mirar.metrics import ProcessingRecord
+from mirar.utils.docker_pool import close_docker_pool
+
+logger = logging.getLogger(__name__)
+
+THREAD_EXECUTOR = "thread"
+PROCESS_EXECUTOR = "process"
+INLINE_EXECUTOR = "inline"
+
+EXECUTORS = [THREAD_EXECUTOR, PROCESS_EXECUTOR, INLINE_EXECUTOR]
+
+# Worker processes are forked, because 'spawn' would re-run the main module
+# (e.g. the command line interface in mirar.__main__) in every worker
+PROCESS_START_METHOD = "fork"
+
+
+class ExecutorError(ProcessorError):
+    """
+    Error relating to the choice of executor
+    """
+
+
+class WorkerTransferError(ProcessorError):
+    """
+    Error raised in a worker process, which could not itself be sent back
+    to the parent process
+    """
+
+
+def validate_executor(executor: str) -> str:
+    """
+    Check that an executor name is valid
+
+    :param executor: name of executor
+    :return: name of executor
+    """
+    if executor not in EXECUTORS:
+        err = f"Executor '{executor}' not recognised. Valid executors are {EXECUTORS}."
+        logger.error(err)
+        raise ExecutorError(err)
+    return executor
+
+
+def can_use_processes(processor) -> bool:
+    """
+    Check whether a processor can be run with the process executor
+
+    :param processor: processor to check
+    :return: boolean
+    """
+    if not USE_CACHE:
+        logger.warning(
+            f"Cannot run {processor.__class__.__name__} in worker processes "
+            f"without cache mode. Falling back to threads."
+        )
+        return False
+
+    try:
+        pickle.dumps(processor)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning(
+            f"Cannot pickle {processor.__class__.__name__} ({exc}), so it cannot "
+            f"be run in worker processes. Falling back to threads."
+        )
+        return False
+
+    return True
+
+
+def get_process_context():
+    """
+    Get the multiprocessing context for worker processes
+
+    :return: multiprocessing context
+    """
+    return multiprocessing.get_context(PROCESS_START_METHOD)
+
+
+def init_process_worker(cache_dir: Path | None, image_dtype: str = "float64"):
+    """
+    Initialise a worker process, so that it shares the cache
+    and image dtype of the parent process
+
+    :param cache_dir: cache directory of parent process
+    :param image_dtype: image dtype of parent process
+    :return: None
+    """
+    set_image_dtype(image_dtype)
+    if cache_dir is not None:
+        cache.set_cache_dir(cache_dir)
+    # Workers read and write image data directly through the on-disk cache.
+    # Arrays held in memory by the parent were flushed to disk before the fork,
+    # so the inherited copies are discarded rather than written again.
+    cache.reset_after_fork()
+    cache.set_memory_budget(0)
+    Image.adopt_cache_on_unpickle = False
+    # Workers exit without running atexit handlers, so any docker containers
+    # (and work directory) created by the worker are cleaned up by a finalizer
+    Finalize(None, close_docker_pool, exitpriority=0)
+
+
+def release_batch(batch: DataBatch):
+    """
+    Hand over the cache files of all images in a batch, so that they are not deleted
+    when the batch is garbage-collected in a worker process
+
+    :param batch: batch to release
+    :return: None
+    """
+    for data_block in batch:
+        if isinstance(data_block, Image):
+            data_block.release_cache()
+
+
+def make_report_transferable(report: ErrorReport) -> ErrorReport:
+    """
+    Ensure that an error report can be sent back to the parent process.
+    Not all exceptions survive a round trip through pickle,
+    so these are replaced with a generic error carrying the same message.
+
+    :param report: error report
+    :return: error report which can be pickled
+    """
+    try:
+        pickle.loads(pickle.dumps(report.error))
+    except Exception:  # pylint: disable=broad-except
+        traceback_lines = report.get_traceback_lines()
+        report.error = WorkerTransferError(f"{report.get_error_name()}: {report.error}")
+        report.traceback_lines = traceback_lines
+    return report
+
+
+def apply_in_process(
+    processor, batch: DataBatch
+) -> tuple[DataBatch | None, ErrorReport | None, ProcessingRecord]:
+    """
+    Apply a processor to a batch inside a worker process
+
+    :param processor: processor to apply
+    :param batch: batch to process
+    :return: processed batch (or None), error report (or None), and
+        processing record
+    """
+    new_batch, report, record = processor.process_batch(batch)
+
+    if new_batch is not None:
+        release_batch(new_batch)
+
+    if report is not None:
+        report = make_report_transferable(report)
+
+    return new_batch, report, record
@@ -21,6 +21,7 @@ from mirar.paths import (
     OBSCLASS_KEY,
 )
 from mirar.processors.base_processor import ProcessorPremadeCache, ProcessorWithCache
+from mirar.processors.stacking import StackFrame
 from mirar.processors.utils.image_selector import select_from_images
 
 logger = logging.getLogger(__name__)
@@ -80,12 +81,7 @@ class FlatCalibrator(ProcessorWithCache):
         batch: ImageBatch,
     ) -> ImageBatch:
         master_flat = self.get_cache_file(batch)
-        master_flat_data = master_flat.get_data()
-
-        mask = master_flat_data <= self.flat_nan_threshold
-
-        if np.sum(mask) > 0:
-            master_flat_data[mask] = np.nan
+        master_flat_data = self.get_master_flat_data(batch)
 
         for image in batch:
             data = image.get_data()
@@ -95,6 +91,34 @@ class FlatCalibrator(ProcessorWithCache):
 
         return batch
 
+    def get_master_flat_data(self, batch: ImageBatch) -> np.ndarray:
+        """
+        Get the master flat data for a batch, with pixels below the
+        NaN threshold set to NaN. This is prepared once per master flat,
+        and shared (read-only) between batches.
+
+        :param batch: images to process
+        :return: read-only master flat data
+        """
+        return self.get_cache_product(batch, "masked_data", self.mask_master_flat)
+
+    def mask_master_flat(self, master_flat: Image) -> np.ndarray:
+        """
+        Set pixels of a master flat below the NaN threshold to NaN
+
+        :param master_flat: master flat image
+        :return: read-only master flat data
+        """
+        master_flat_data = np.array(master_flat.get_data())
+
+        mask = master_flat_data <= self.flat_nan_threshold
+
+        if np.sum(mask) > 0:
+            master_flat_data[mask] = np.nan
+
+        master_flat_data.flags.writeable = False
+        return master_flat_data
+
     def make_image(
         self,
         images: ImageBatch,
@@ -109,13 +133,12 @@ class FlatCalibrator(ProcessorWithCache):
             logger.error(err)
             raise MissingFlatError(err)
 
-        nx, ny = images[0].get_data().shape
-
-        flats = np.zeros((nx, ny, n_frames))
+        flats = []
 
         flat_exptimes = []
-        for i, img in enumerate(images):
-            data = img.get_data()
+        for img in images:
+            data = img.get_readonly_data()
+            pixels_to_keep = None
 
             if self.flat_mask_key is not None:
                 if self.flat_mask_key not in img.header.keys():
@@ -134,23 +157,28 @@ class FlatCalibrator(ProcessorWithCache):
                     raise FileNotFoundError(err)
 
                 mask_img = self.open_fits(mask_file)
-                pixels_to_keep = mask_img.get_data().astype(bool)
-                mask = ~pixels_to_keep
+                pixels_to_keep = mask_img.get_readonly_data().astype(bool)
                 logger.debug(
-                    f"Masking {np.sum(mask)} pixels in flat {img[BASE_NAME_KEY]}"
+                    f"Masking {np.sum(~pixels_to_keep)} pixels "
+                    f"in flat {img[BASE_NAME_KEY]}"
                 )
-                data[mask] = np.nan
 
             flat_exptimes.append(img[EXPTIME_KEY])
 
-            median = np.nanmedian(
-                data[self.x_min : self.x_max, self.y_min : self.y_max]
+            region = (
+                slice(self.x_min, self.x_max),
+                slice(self.y_min, self.y_max),
             )
-            flats[:, :, i] = data / median
+            region_data = data[region]
+            if pixels_to_keep is not None:
+                region_data = np.where(pixels_to_keep[region], region_data, np.nan)
+            median = np.nanmedian(region_data)
+
+            flats.append(StackFrame(data, scale=median, keep_mask=pixels_to_keep))
 
-        logger.debug(f"Median combining {n_frames} flats")
+        logger.debug(f"Combining {n_frames} flats")
 
-        master_flat = np.nanmedian(flats, axis=2)
+        master_flat = self.combine_cache_frames(flats)
 
         master_flat_image = Image(master_flat, header=copy(images[0].get_header()))
         master_flat_image[COADD_KEY] = n_frames
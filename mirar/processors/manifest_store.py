@@ -0,0 +1,116 @@
+"""
+Module for a base class of on-disk stores of files, with size-based eviction.
+
+Each stored entry is a directory two levels below the store directory, holding
+the stored files and a JSON manifest describing them. Entries are written to a
+temporary directory first, and then renamed, so readers never see partial
+entries. The modification time of the manifest records the last use of an entry,
+and the least-recently used entries are evicted when the total size of the store
+exceeds its limit.
+
+See :class:`~mirar.processors.astromatic.result_cache.AstromaticResultCache` and
+:class:`~mirar.processors.reference_cache.ReferenceProductCache`.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def hash_file(path: str | Path) -> str:
+    """
+    Get the sha256 hash of the contents of a file
+
+    :param path: path of file
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024**2), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ManifestStore:
+    """
+    Base class for a store of entries with manifests, with size-based eviction
+
+    :param cache_dir: directory of the store
+    :param max_size: maximum size of the store, in bytes
+    """
+
+    def __init__(self, cache_dir: str | Path, max_size: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def record_lookup(self, hit: bool):
+        """
+        Record a hit or a miss in the statistics
+
+        :param hit: whether the lookup was a hit
+        :return: None
+        """
+        with self._lock:
+            self._stats["hits" if hit else "misses"] += 1
+
+    @staticmethod
+    def record_use(entry_dir: Path):
+        """
+        Record the use of an entry, for eviction
+
+        :param entry_dir: directory of the entry
+        :return: None
+        """
+        os.utime(entry_dir.joinpath(MANIFEST_NAME))
+
+    def get_entries(self) -> list[tuple[float, int, Path]]:
+        """
+        Get all stored entries
+
+        :return: list of (last use time, size in bytes, directory)
+        """
+        entries = []
+        for manifest_path in self.cache_dir.glob(f"*/*/{MANIFEST_NAME}"):
+            entry_dir = manifest_path.parent
+            try:
+                size = sum(x.stat().st_size for x in entry_dir.iterdir())
+                entries.append((manifest_path.stat().st_mtime, size, entry_dir))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Remove the least-recently used entries, until the store is within
+        its size limit
+
+        :return: None
+        """
+        with self._lock:
+            entries = sorted(self.get_entries(), key=lambda x: x[0])
+            total_size = sum(x[1] for x in entries)
+            for _, size, entry_dir in entries:
+                if total_size <= self.max_size:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total_size -= size
+                self._stats["evictions"] += 1
+                logger.debug(f"Evicted {entry_dir}")
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get cache statistics
+
+        :return: dictionary of hits, misses and evictions
+        """
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,113 @@
+"""
+Module for an in-memory registry of master calibration images
+(e.g. master darks and flats) shared between batches.
+
+Many batches of science images often share the same master calibration images.
+Rather than re-reading or rebuilding a master for every batch,
+:class:`~mirar.processors.base_processor.ProcessorWithCache` keeps masters in
+a size-bounded registry, keyed on the processor and the hashed cache path.
+
+The registry is thread-safe. If several threads request a missing entry at the
+same time, only the first builds it, while the others wait for the result.
+If building fails, every waiting thread receives the same error, and the
+entry is not stored.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+# Number of master images (and derived products) kept in memory
+MASTER_REGISTRY_SIZE = 8
+
+
+class MasterRegistry:
+    """
+    Thread-safe, size-bounded registry which builds each entry at most once
+    """
+
+    def __init__(self, max_size: int = MASTER_REGISTRY_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._pending: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Get an entry from the registry, building it if it is missing.
+        Concurrent requests for a missing entry are coalesced,
+        so the factory is only called once.
+
+        :param key: key for entry
+        :param factory: function to build the entry
+        :return: entry
+        """
+        with self._lock:
+            if key in self._entries:
+                self._stats["hits"] += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            future = self._pending.get(key)
+            is_builder = future is None
+            if is_builder:
+                self._stats["misses"] += 1
+                future = Future()
+                self._pending[key] = future
+            else:
+                self._stats["coalesced"] += 1
+
+        if not is_builder:
+            logger.debug(f"Waiting for {key} to be built by another thread")
+            return future.result()
+
+        try:
+            value = factory()
+        except BaseException as exc:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(exc)
+            raise
+
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            del self._pending[key]
+
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        """
+        Remove all built entries from the registry
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Get registry statistics
+
+        :return: dictionary of hits, misses and coalesced requests
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+master_registry = MasterRegistry()
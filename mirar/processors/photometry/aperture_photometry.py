@@ -10,10 +10,12 @@ from mirar.paths import (
     APFLUXUNC_PREFIX_KEY,
     APMAG_PREFIX_KEY,
     APMAGUNC_PREFIX_KEY,
-    get_output_dir,
 )
 from mirar.processors.photometry.base_photometry import BasePhotometryProcessor
-from mirar.processors.photometry.utils import aper_photometry, get_mags_from_fluxes
+from mirar.processors.photometry.utils import (
+    aper_photometry_batch,
+    get_mags_from_fluxes,
+)
 
 
 class AperturePhotometry(BasePhotometryProcessor):
@@ -52,18 +54,41 @@ class AperturePhotometry(BasePhotometryProcessor):
     def perform_photometry(
         self, image_cutout: np.array, unc_image_cutout: np.array
     ) -> tuple[list[float], list[float]]:
+        """
+        Function to perform aperture photometry on a cutout, for each aperture
+
+        :param image_cutout: cutout of image
+        :param unc_image_cutout: cutout of uncertainty image
+        :return: list of fluxes, list of flux uncertainties
+        """
+        fluxes, fluxuncs = self.perform_batch_photometry(
+            image_cutout[None, :, :], unc_image_cutout[None, :, :]
+        )
+        return list(fluxes[:, 0]), list(fluxuncs[:, 0])
+
+    def perform_batch_photometry(
+        self, image_cutouts: np.ndarray, unc_image_cutouts: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Function to perform aperture photometry on a stack of cutouts,
+        for each aperture
+
+        :param image_cutouts: cutouts of image, with shape (N, k, k)
+        :param unc_image_cutouts: cutouts of uncertainty image, with shape (N, k, k)
+        :return: fluxes and flux uncertainties, each with shape (n_apertures, N)
+        """
         fluxes, fluxuncs = [], []
         for ind, aper_diam in enumerate(self.aper_diameters):
-            flux, fluxunc = aper_photometry(
-                image_cutout,
-                unc_image_cutout,
+            flux, fluxunc = aper_photometry_batch(
+                image_cutouts,
+                unc_image_cutouts,
                 aper_diam,
                 self.bkg_in_diameters[ind],
                 self.bkg_out_diameters[ind],
             )
             fluxes.append(flux)
             fluxuncs.append(fluxunc)
-        return fluxes, fluxuncs
+        return np.array(fluxes), np.array(fluxuncs)
 
     def _apply_to_sources(
         self,
@@ -74,36 +99,24 @@ class AperturePhotometry(BasePhotometryProcessor):
 
             metadata = source_table.get_metadata()
 
-            all_fluxes, all_fluxuncs = [], []
-            temp_imagename, temp_unc_imagename = self.save_temp_image_uncimage(metadata)
+            photometry_image = self.load_photometry_image(metadata)
 
-            for cand_ind in range(len(candidate_table)):
-                row = candidate_table.iloc[cand_ind]
+            image_cutouts, unc_image_cutouts = self.generate_cutout_stacks(
+                image_data=photometry_image.get_data(),
+                unc_image_data=photometry_image.get_uncertainty(),
+                source_table=candidate_table,
+            )
 
-                image_cutout, unc_image_cutout = self.generate_cutouts(
-                    imagename=temp_imagename,
-                    unc_imagename=temp_unc_imagename,
-                    data_item=row,
+            if self.save_cutouts:
+                self.save_cutout_stacks(
+                    image_cutouts,
+                    unc_image_cutouts,
+                    index=range(len(candidate_table)),
                 )
 
-                fluxes, fluxuncs = self.perform_photometry(
-                    image_cutout=image_cutout, unc_image_cutout=unc_image_cutout
-                )
-                all_fluxes.append(fluxes)
-                all_fluxuncs.append(fluxuncs)
-
-                if self.save_cutouts:
-                    image_cutout_path = get_output_dir(
-                        self.temp_output_sub_dir, self.night_sub_dir
-                    ).joinpath(f"image_cutout_{cand_ind}.dat")
-                    np.savetxt(X=image_cutout, fname=image_cutout_path)
-                    unc_image_cutout_path = get_output_dir(
-                        self.temp_output_sub_dir, self.night_sub_dir
-                    ).joinpath(f"unc_image_cutout_{cand_ind}.dat")
-                    np.savetxt(X=unc_image_cutout, fname=unc_image_cutout_path)
-
-            all_fluxes = np.array(all_fluxes).T
-            all_fluxuncs = np.array(all_fluxuncs).T
+            all_fluxes, all_fluxuncs = self.perform_batch_photometry(
+                image_cutouts=image_cutouts, unc_image_cutouts=unc_image_cutouts
+            )
 
             for ind, suffix in enumerate(self.col_suffix_list):
                 flux, fluxunc = all_fluxes[ind], all_fluxuncs[ind]
@@ -119,8 +132,6 @@ class AperturePhotometry(BasePhotometryProcessor):
                 candidate_table[f"{APMAG_PREFIX_KEY}{suffix}"] = magnitudes
                 candidate_table[f"{APMAGUNC_PREFIX_KEY}{suffix}"] = magnitudes_unc
 
-            temp_imagename.unlink()
-            temp_unc_imagename.unlink()
             source_table.set_data(candidate_table)
 
         return batch
@@ -3,16 +3,17 @@ Module with classes to perform photometry on sources
 """
 
 import logging
+import threading
 from abc import ABC
+from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 from astropy.io import fits
 
-from mirar.data import Image
 from mirar.paths import (
-    BASE_NAME_KEY,
+    GAIN_KEY,
     LATEST_SAVE_KEY,
     NORM_PSFEX_KEY,
     UNC_IMG_KEY,
@@ -23,10 +24,76 @@ from mirar.paths import (
     get_output_dir,
 )
 from mirar.processors.base_processor import BaseSourceProcessor, ImageHandler
-from mirar.processors.photometry.utils import get_rms_image, make_cutouts
+from mirar.processors.photometry.utils import get_cutout_stack, get_rms_data
 
 logger = logging.getLogger(__name__)
 
+# Number of images (and their uncertainty images) kept in memory for photometry
+PHOTOMETRY_IMAGE_CACHE_SIZE = 2
+
+
+class PhotometryImage:
+    """
+    Image data used for photometry, held in memory (or memory-mapped from the
+    original file). The uncertainty image is only computed when first requested.
+    """
+
+    def __init__(self, data: np.ndarray, header: fits.Header):
+        self.data = data
+        self.header = header
+        self._unc_data = None
+        self._lock = threading.Lock()
+
+    def get_data(self) -> np.ndarray:
+        """
+        Get the image data
+
+        :return: image data
+        """
+        return self.data
+
+    def get_uncertainty(self) -> np.ndarray:
+        """
+        Get the uncertainty image, computing it on the first call
+
+        :return: uncertainty data
+        """
+        with self._lock:
+            if self._unc_data is None:
+                self._unc_data = get_rms_data(self.data, gain=self.header[GAIN_KEY])
+                self._unc_data.setflags(write=False)
+                logger.debug("Computed uncertainty image for photometry")
+        return self._unc_data
+
+
+@lru_cache(maxsize=PHOTOMETRY_IMAGE_CACHE_SIZE)
+def _load_photometry_image(
+    path: str, mtime_ns: int  # pylint: disable=unused-argument
+) -> PhotometryImage:
+    """
+    Cached loading of a photometry image. The modification time is part of the
+    cache key, so an image which is overwritten is reloaded.
+
+    :param path: path of image
+    :param mtime_ns: modification time of image
+    :return: PhotometryImage
+    """
+    with fits.open(path, memmap=True) as hdul:
+        data = hdul[0].data  # pylint: disable=no-member
+        header = hdul[0].header.copy()  # pylint: disable=no-member
+    return PhotometryImage(data=data, header=header)
+
+
+def load_photometry_image(path: str | Path) -> PhotometryImage:
+    """
+    Load an image for photometry
+
+    :param path: path of image
+    :return: PhotometryImage
+    """
+    path = Path(path).resolve()
+    return _load_photometry_image(path.as_posix(), path.stat().st_mtime_ns)
+
 
 class BasePhotometryProcessor(BaseSourceProcessor, ABC, ImageHandler):
     """
@@ -58,80 +125,68 @@ class BasePhotometryProcessor(BaseSourceProcessor, ABC, ImageHandler):
         self.ypos_key = y_colname
         self.save_cutouts = save_cutouts
 
-    def save_temp_image(self, image) -> Path:
+    def load_photometry_image(self, metadata: dict) -> PhotometryImage:
         """
-        Save a temporary image and return its path
+        Function to load the image for photometry, with a lazily-computed
+        uncertainty image. Images are cached, so processors running on the same
+        image share both the data and the uncertainty.
 
-        :param image: Image object
-        :return: Path to the temporary image
+        :param metadata: Metadata dictionary
+        :return: PhotometryImage
         """
-        photometry_out_temp_dir = get_output_dir(
-            self.temp_output_sub_dir, self.night_sub_dir
-        )
-        image_basename = image.header[BASE_NAME_KEY]
-        temp_imagepath = photometry_out_temp_dir.joinpath(image_basename)
-        temp_imagepath.parent.mkdir(parents=True, exist_ok=True)
-        self.save_fits(image, temp_imagepath)
-        return temp_imagepath
+        return load_photometry_image(metadata[self.image_key])
 
-    def save_uncertainty_image(self, image: Image) -> Path:
+    def generate_cutout_stacks(
+        self,
+        image_data: np.ndarray,
+        unc_image_data: np.ndarray,
+        source_table: pd.DataFrame,
+    ) -> tuple[np.ndarray, np.ndarray]:
         """
-        Create an uncertainty image from the image and return the filenames of the
-        image and uncertainty image
+        Generate image and uncertainty image cutouts for all sources in a table,
+        each image having been loaded once.
 
-        :param image: Image object
-        :return: Path to the uncertainty image
-        """
-        photometry_out_temp_dir = get_output_dir(
-            self.temp_output_sub_dir, self.night_sub_dir
-        )
-        unc_filename = Path(image[BASE_NAME_KEY].replace(".fits", ".unc.fits"))
-        rms_image = get_rms_image(image)
-        unc_filename = photometry_out_temp_dir.joinpath(unc_filename)
-        unc_filename.parent.mkdir(parents=True, exist_ok=True)
-        self.save_fits(rms_image, path=unc_filename)
-        logger.debug(f"Saved unc file to {unc_filename}")
+        :param image_data: 2D numpy array of the image
+        :param unc_image_data: 2D numpy array of the uncertainty image
+        :param source_table: pandas DataFrame of sources
 
-        return unc_filename
-
-    def generate_cutouts(
-        self, imagename: Path, unc_imagename: Path, data_item: Image | pd.Series
-    ) -> tuple[np.ndarray, np.ndarray]:
-        """
-        Generate image and uncertainty image cutouts. This function first saves the
-        image and uncertainty image to temporary files, then generates the cutouts,
-        then deletes the temporary files.
-        :param imagename: Path to the image
-        :param unc_imagename: Path to the uncertainty image
-        :param data_item: pandas DataFrame Series or astropy fits Header
-
-        :returns tuple: 2D numpy arrays of the image cutout and uncertainty image cutout
+        :returns tuple: 3D numpy arrays of the image cutouts and uncertainty image
+            cutouts, each with shape (N, 2*half_size+1, 2*half_size+1)
         """
-
-        x, y = self.get_physical_coordinates(data_item)
-        image_cutout, unc_image_cutout = make_cutouts(
-            image_paths=[imagename, unc_imagename],
-            position=(x, y),
+        x_positions, y_positions = self.get_physical_positions(source_table)
+        image_cutouts = get_cutout_stack(
+            image_data, x_positions, y_positions, half_size=self.phot_cutout_half_size
+        )
+        unc_image_cutouts = get_cutout_stack(
+            unc_image_data,
+            x_positions,
+            y_positions,
             half_size=self.phot_cutout_half_size,
         )
+        return image_cutouts, unc_image_cutouts
 
-        return image_cutout, unc_image_cutout
-
-    def save_temp_image_uncimage(self, metadata: dict) -> tuple[Path, Path]:
+    def save_cutout_stacks(
+        self, image_cutouts: np.ndarray, unc_image_cutouts: np.ndarray, index
+    ):
         """
-        Function to save the image and uncertainty image to temporary files
+        Write image and uncertainty image cutouts to text files, one pair per source
 
-        :param metadata: Metadata dictionary
-        :return: Tuple of image and uncertainty image filenames
+        :param image_cutouts: 3D numpy array of image cutouts
+        :param unc_image_cutouts: 3D numpy array of uncertainty image cutouts
+        :param index: index of each source, used to name the files
+        :return: None
         """
-        imagename = metadata[self.image_key]
-
-        image = Image(header=fits.getheader(imagename), data=fits.getdata(imagename))
-
-        image_filename = self.save_temp_image(image)
-        unc_filename = self.save_uncertainty_image(image)
-
-        return image_filename, unc_filename
+        output_dir = get_output_dir(self.temp_output_sub_dir, self.night_sub_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for ind, image_cutout, unc_image_cutout in zip(
+            index, image_cutouts, unc_image_cutouts
+        ):
+            image_cutout_path = output_dir.joinpath(f"image_cutout_{ind}.dat")
+            logger.debug(f"Writing cutout to {image_cutout_path}")
+            np.savetxt(X=image_cutout, fname=image_cutout_path)
+            unc_image_cutout_path = output_dir.joinpath(f"unc_image_cutout_{ind}.dat")
+            logger.debug(f"Writing cutout to {unc_image_cutout_path}")
+            np.savetxt(X=unc_image_cutout, fname=unc_image_cutout_path)
 
     def get_physical_coordinates(self, data_item: pd.Series) -> tuple[int, int]:
         """
@@ -143,3 +198,16 @@ class BasePhotometryProcessor(BaseSourceProcessor, ABC, ImageHandler):
         row = data_item
         x, y = row[self.xpos_key], row[self.ypos_key]
         return int(x), int(y)
+
+    def get_physical_positions(
+        self, source_table: pd.DataFrame
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the physical coordinates of all sources in a table
+
+        :param source_table: pandas DataFrame of sources
+        :return: Integer arrays of X and Y coordinates of the sources
+        """
+        x_positions = np.asarray(source_table[self.xpos_key], dtype=float)
+        y_positions = np.asarray(source_table[self.ypos_key], dtype=float)
+        return x_positions.astype(int), y_positions.astype(int)
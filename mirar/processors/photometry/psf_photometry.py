@@ -8,19 +8,13 @@ from pathlib import Path
 import numpy as np
 
 from mirar.data import SourceBatch
-from mirar.paths import (
-    MAG_PSF_KEY,
-    MAGERR_PSF_KEY,
-    PSF_FLUX_KEY,
-    PSF_FLUXUNC_KEY,
-    get_output_dir,
-)
+from mirar.paths import MAG_PSF_KEY, MAGERR_PSF_KEY, PSF_FLUX_KEY, PSF_FLUXUNC_KEY
 from mirar.processors.base_processor import PrerequisiteError
 from mirar.processors.photometry.base_photometry import BasePhotometryProcessor
 from mirar.processors.photometry.utils import (
     get_mags_from_fluxes,
-    make_psf_shifted_array,
-    psf_photometry,
+    get_psf_shifted_array,
+    psf_photometry_batch,
 )
 
 logger = logging.getLogger(__name__)
@@ -46,19 +40,35 @@ class PSFPhotometry(BasePhotometryProcessor):
         :param psf_filename: filename of psf file
         :return: flux, fluxunc, minchi2, xshift, yshift
         """
-        if not isinstance(psf_filename, Path):
-            psf_filename = Path(psf_filename)
-        psfmodels = make_psf_shifted_array(
-            psf_filename=psf_filename.as_posix(),
-            cutout_size_psf_phot=int(image_cutout.shape[0] / 2),
+        fluxes, fluxuncs, minchi2s, xshifts, yshifts = self.perform_batch_photometry(
+            image_cutout[None, :, :], unc_image_cutout[None, :, :], psf_filename
+        )
+        return fluxes[0], fluxuncs[0], minchi2s[0], xshifts[0], yshifts[0]
+
+    @staticmethod
+    def perform_batch_photometry(
+        image_cutouts: np.ndarray,
+        unc_image_cutouts: np.ndarray,
+        psf_filename: str | Path,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Function to perform PSF photometry on a stack of cutouts
+        :param image_cutouts: cutouts of image, with shape (N, k, k)
+        :param unc_image_cutouts: cutouts of uncertainty image, with shape (N, k, k)
+        :param psf_filename: filename of psf file
+        :return: fluxes, fluxuncs, minchi2s, xshifts, yshifts
+        """
+        psfmodels = get_psf_shifted_array(
+            psf_filename=psf_filename,
+            cutout_size_psf_phot=int(image_cutouts.shape[1] / 2),
         )
 
-        flux, fluxunc, minchi2, xshift, yshift, _ = psf_photometry(
-            image_cutout=image_cutout,
-            image_unc_cutout=unc_image_cutout,
+        fluxes, fluxuncs, minchi2s, xshifts, yshifts, _ = psf_photometry_batch(
+            image_cutouts=image_cutouts,
+            image_unc_cutouts=unc_image_cutouts,
             psfmodels=psfmodels,
         )
-        return flux, fluxunc, minchi2, xshift, yshift
+        return fluxes, fluxuncs, minchi2s, xshifts, yshifts
 
     def get_psf_filename(self, row):
         """
@@ -81,8 +91,6 @@ class PSFPhotometry(BasePhotometryProcessor):
 
             metadata = source_table.get_metadata()
 
-            fluxes, fluxuncs, minchi2s, xshifts, yshifts = [], [], [], [], []
-
             if self.psf_file_key not in metadata:
                 raise PrerequisiteError(
                     f"PSF file key {self.psf_file_key} not in source table."
@@ -90,41 +98,28 @@ class PSFPhotometry(BasePhotometryProcessor):
                     f" the psf file name?"
                 )
             psf_filename = source_table[self.psf_file_key]
-            temp_imagename, temp_unc_imagename = self.save_temp_image_uncimage(metadata)
+            photometry_image = self.load_photometry_image(metadata)
 
-            for ind, row in candidate_table.iterrows():
-                image_cutout, unc_image_cutout = self.generate_cutouts(
-                    imagename=temp_imagename,
-                    unc_imagename=temp_unc_imagename,
-                    data_item=row,
-                )
-                (
-                    flux,
-                    fluxunc,
-                    minchi2,
-                    xshift,
-                    yshift,
-                ) = self.perform_photometry(
-                    image_cutout, unc_image_cutout, psf_filename=psf_filename
+            image_cutouts, unc_image_cutouts = self.generate_cutout_stacks(
+                image_data=photometry_image.get_data(),
+                unc_image_data=photometry_image.get_uncertainty(),
+                source_table=candidate_table,
+            )
+
+            if self.save_cutouts:
+                self.save_cutout_stacks(
+                    image_cutouts, unc_image_cutouts, index=candidate_table.index
                 )
 
-                if self.save_cutouts:
-                    image_cutout_path = get_output_dir(
-                        self.temp_output_sub_dir, self.night_sub_dir
-                    ).joinpath(f"image_cutout_{ind}.dat")
-                    logger.debug(f"Writing cutout to {image_cutout_path}")
-                    np.savetxt(X=image_cutout, fname=image_cutout_path)
-                    unc_image_cutout_path = get_output_dir(
-                        self.temp_output_sub_dir, self.night_sub_dir
-                    ).joinpath(f"unc_image_cutout_{ind}.dat")
-                    logger.debug(f"Writing cutout to {unc_image_cutout_path}")
-                    np.savetxt(X=unc_image_cutout, fname=unc_image_cutout_path)
-
-                fluxes.append(flux)
-                fluxuncs.append(fluxunc)
-                minchi2s.append(minchi2)
-                xshifts.append(xshift)
-                yshifts.append(yshift)
+            (
+                fluxes,
+                fluxuncs,
+                minchi2s,
+                xshifts,
+                yshifts,
+            ) = self.perform_batch_photometry(
+                image_cutouts, unc_image_cutouts, psf_filename=psf_filename
+            )
 
             candidate_table[PSF_FLUX_KEY] = fluxes
             candidate_table[PSF_FLUXUNC_KEY] = fluxuncs
@@ -142,9 +137,6 @@ class PSFPhotometry(BasePhotometryProcessor):
             candidate_table[MAG_PSF_KEY] = magnitudes
             candidate_table[MAGERR_PSF_KEY] = magnitudes_unc
 
-            temp_imagename.unlink()
-            temp_unc_imagename.unlink()
-
             source_table.set_data(candidate_table)
 
         return batch
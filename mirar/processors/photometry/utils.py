@@ -3,6 +3,7 @@ Module with utis for photometry
 """
 
 import logging
+from functools import lru_cache
 from pathlib import Path
 
 import matplotlib.pyplot as plt
@@ -10,7 +11,7 @@ import numpy as np
 from astropy.io import fits
 from astropy.stats import sigma_clipped_stats
 from matplotlib.patches import Circle
-from photutils.aperture import CircularAnnulus, CircularAperture, aperture_photometry
+from photutils.aperture import CircularAnnulus, CircularAperture
 
 from mirar.data import Image
 from mirar.errors import ProcessorError
@@ -18,6 +19,9 @@ from mirar.paths import GAIN_KEY
 
 logger = logging.getLogger(__name__)
 
+# Number of PSF files whose shifted models are kept in memory
+PSF_CACHE_SIZE = 32
+
 
 class CutoutError(ProcessorError):
     """
@@ -25,6 +29,51 @@ class CutoutError(ProcessorError):
     """
 
 
+def get_cutout_stack(
+    data: np.ndarray, x_positions: np.ndarray, y_positions: np.ndarray, half_size: int
+) -> np.ndarray:
+    """
+    Function to extract square cutouts around many positions of a single image,
+    in one vectorised gather. Cutouts extending beyond the image edge are
+    padded with zeros.
+
+    :param data: 2D numpy array of the image
+    :param x_positions: integer x coordinates of the cutout centres
+    :param y_positions: integer y coordinates of the cutout centres
+    :param half_size: half_size of the square cutouts
+    :return: 3D numpy array of cutouts, with shape (N, 2*half_size+1, 2*half_size+1)
+    """
+    x_positions = np.atleast_1d(np.asarray(x_positions, dtype=int))
+    y_positions = np.atleast_1d(np.asarray(y_positions, dtype=int))
+    y_image_size, x_image_size = np.shape(data)
+
+    outside = (
+        (x_positions < 0)
+        | (x_positions > x_image_size)
+        | (y_positions < 0)
+        | (y_positions > y_image_size)
+    )
+    if np.any(outside):
+        bad = [f"{x},{y}" for x, y in zip(x_positions[outside], y_positions[outside])]
+        raise CutoutError(f"Cutout positions {bad} are outside the image")
+
+    # Gather with clipped indices, then zero any pixels beyond the image edge.
+    # This only touches the pixels of each cutout, rather than copying the
+    # full image, so memory-mapped data is read lazily.
+    offsets = np.arange(-half_size, half_size + 1)
+    rows = y_positions[:, None] + offsets[None, :]
+    cols = x_positions[:, None] + offsets[None, :]
+    valid = ((rows >= 0) & (rows < y_image_size))[:, :, None] & (
+        (cols >= 0) & (cols < x_image_size)
+    )[:, None, :]
+    rows = np.clip(rows, 0, y_image_size - 1)
+    cols = np.clip(cols, 0, x_image_size - 1)
+    # Cutouts are upcast, as image data may be stored as float32
+    cutouts = np.asarray(data[rows[:, :, None], cols[:, None, :]], dtype=float)
+    cutouts[~valid] = 0.0
+    return cutouts
+
+
 def make_cutouts(
     image_paths: Path | list[Path], position: tuple, half_size: int
 ) -> list[np.array]:
@@ -44,47 +93,115 @@ def make_cutouts(
     cutout_list = []
     for image_path in image_paths:
         data = fits.getdata(image_path)
-        y_image_size, x_image_size = np.shape(data)
         x, y = position
 
-        if x < 0 or x > x_image_size or y < 0 or y > y_image_size:
+        try:
+            cutout = get_cutout_stack(data, [x], [y], half_size=half_size)[0]
+        except CutoutError as exc:
             raise CutoutError(
                 f"Cutout position {x},{y} is outside the image {image_path}"
-            )
+            ) from exc
 
-        if x < half_size:
-            xmin, xmax = 0, x + half_size + 1
-            x_pad_width = (half_size - x, 0)
-
-        elif x + half_size + 1 > x_image_size:
-            xmin, xmax = x - half_size, x_image_size
-            x_pad_width = (0, (half_size + x + 1) - x_image_size)
-        else:
-            xmin, xmax = x - half_size, x + half_size + 1
-            x_pad_width = (0, 0)
-
-        if y < half_size:
-            ymin, ymax = 0, y + half_size + 1
-            y_pad_width = (half_size - y, 0)
-
-        elif y + half_size + 1 > y_image_size:
-            ymin, ymax = y - half_size, y_image_size
-            y_pad_width = (0, (half_size + y + 1) - y_image_size)
-        else:
-            ymin, ymax = y - half_size, y + half_size + 1
-            y_pad_width = (0, 0)
-
-        cutout = data[ymin:ymax, xmin:xmax]
-        cutout = np.pad(cutout, (y_pad_width, x_pad_width), "constant")
         cutout_list.append(cutout)
-
-        assert cutout.shape == (2 * half_size + 1, 2 * half_size + 1), (
-            f"Cutout shape is not correct for x={x} and y={y} and "
-            f"half_size={half_size}. Shape is {cutout.shape} Data shape is {data.shape}"
-        )
     return cutout_list
 
 
+def _zero_nan(array: np.ndarray) -> np.ndarray:
+    """
+    Replace NaN values in an array with zero
+
+    :param array: numpy array
+    :return: numpy array without NaN values
+    """
+    return np.where(np.isnan(array), 0.0, array)
+
+
+def psf_photometry_batch(
+    image_cutouts: np.ndarray,
+    image_unc_cutouts: np.ndarray,
+    psfmodels: np.ndarray,
+    max_chunk_elements: int = 2**24,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Function to perform PSF photometry on a stack of cutouts, fitting every
+    shifted PSF model to every cutout at once
+
+    :param image_cutouts: 3D numpy array of image cutouts, shape (N, k, k)
+    :param image_unc_cutouts: 3D numpy array of uncertainty cutouts, shape (N, k, k)
+    :param psfmodels: 3D numpy array of the PSF models, shape (k, k, M)
+    :param max_chunk_elements: Maximum number of elements in the (sources, models,
+        pixels) residual array evaluated at once, to bound memory usage
+    :return: best-fit fluxes, flux uncertainties, chi2 values, xshifts, yshifts,
+        and the index of the best-fit PSF model for each source
+    """
+    n_sources = image_cutouts.shape[0]
+    n_models = psfmodels.shape[2]
+    n_pixels = psfmodels.shape[0] * psfmodels.shape[1]
+
+    # (M, P) model matrix, in the same pixel order as the flattened cutouts
+    models = np.moveaxis(psfmodels, 2, 0).reshape(n_models, n_pixels)
+    images = image_cutouts.reshape(n_sources, n_pixels)
+    uncs = image_unc_cutouts.reshape(n_sources, n_pixels)
+
+    model_sq = np.square(models)
+    norm = np.nansum(model_sq, axis=1)
+
+    # nansum is equivalent to a sum with NaN replaced by zero
+    fluxes = _zero_nan(images) @ _zero_nan(models).T
+    fluxes /= norm[None, :]
+    flux_uncs = np.sqrt(_zero_nan(np.square(uncs)) @ _zero_nan(model_sq).T)
+    flux_uncs /= norm[None, :]
+
+    # For well-behaved pixels, the chi2 sum is expanded into matrix products:
+    # sum w (I - fP)^2 = sum w I^2 - 2f sum w I P + f^2 sum w P^2, with w = 1/U^2
+    valid = np.isfinite(images) & np.isfinite(uncs) & (uncs != 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(valid, 1.0 / np.square(uncs), 0.0)
+    weighted_images = np.where(valid, images, 0.0) * weights
+    chi2s = (
+        np.sum(weighted_images * np.where(valid, images, 0.0), axis=1)[:, None]
+        - 2.0 * fluxes * (weighted_images @ models.T)
+        + np.square(fluxes) * (weights @ model_sq.T)
+    )
+
+    # Pixels with zero or infinite values (e.g. zero-padding beyond the image edge)
+    # are evaluated directly, to preserve the infinities of the full calculation
+    unusual = ~valid & ~np.isnan(images) & ~np.isnan(uncs)
+    direct_inds = np.nonzero(np.any(unusual, axis=1))[0]
+    chunk_size = max(1, max_chunk_elements // max(1, n_models * n_pixels))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, len(direct_inds), chunk_size):
+            inds = direct_inds[start : start + chunk_size]
+            residuals = (
+                images[inds, None, :] - models[None, :, :] * fluxes[inds, :, None]
+            )
+            chi2s[inds] = np.nansum(
+                np.square(residuals) / np.square(uncs[inds, None, :]), axis=2
+            )
+
+    deg_freedom = n_pixels - 1
+    chi2s /= deg_freedom
+
+    best_inds = np.argmin(chi2s, axis=1)
+    rows = np.arange(n_sources)
+
+    # Shift of each model, relative to the unshifted PSF
+    peak_inds = np.unravel_index(np.argmax(models, axis=1), psfmodels.shape[:2])
+    peak_ys, peak_xs = peak_inds[0], peak_inds[1]
+    unshifted_ind = n_models // 2 + 1
+    xshifts = peak_xs[best_inds] - peak_xs[unshifted_ind]
+    yshifts = peak_ys[best_inds] - peak_ys[unshifted_ind]
+
+    return (
+        fluxes[rows, best_inds],
+        flux_uncs[rows, best_inds],
+        chi2s[rows, best_inds],
+        xshifts,
+        yshifts,
+        best_inds,
+    )
+
+
 def psf_photometry(
     image_cutout: np.ndarray,
     image_unc_cutout: np.ndarray,
@@ -104,49 +221,19 @@ def psf_photometry(
         :return xshifts: xshift required to match PSF to the source
         :return yshifts: yshift required to match PSF to the source
     """
-    numpsfmodels = psfmodels.shape[2]
-
-    chi2s, psf_fluxes, psf_flux_uncs = [], [], []
-    for ind in range(numpsfmodels):
-        psfmodel = psfmodels[:, :, ind]
-        psf_flux = np.nansum(psfmodel * image_cutout) / np.nansum(np.square(psfmodel))
-        psf_flux_unc = np.sqrt(
-            np.nansum(np.square(psfmodel) * np.square(image_unc_cutout))
-        ) / np.nansum(np.square(psfmodel))
-        deg_freedom = np.size(image_cutout) - 1
-        chi2 = (
-            np.nansum(
-                np.square(image_cutout - psfmodel * psf_flux)
-                / np.square(image_unc_cutout)
-            )
-            / deg_freedom
-        )
-
-        psf_fluxes.append(psf_flux)
-        psf_flux_uncs.append(psf_flux_unc)
-        chi2s.append(chi2)
-
-    minchi2_ind = np.argmin(chi2s)
-    minchi2 = np.min(chi2s)
-    best_fit_psf_flux = psf_fluxes[minchi2_ind]
-    best_fit_psf_fluxunc = psf_flux_uncs[minchi2_ind]
-
-    best_fit_psfmodel = psfmodels[:, :, minchi2_ind]
-    ys_cen, xs_cen = np.where(best_fit_psfmodel == np.max(best_fit_psfmodel))
-
-    unshifted_psf = psfmodels[:, :, numpsfmodels // 2 + 1]
-
-    y_cen, x_cen = np.where(unshifted_psf == np.max(unshifted_psf))
-    yshift = ys_cen[0] - y_cen
-    xshift = xs_cen[0] - x_cen
+    fluxes, flux_uncs, chi2s, xshifts, yshifts, best_inds = psf_photometry_batch(
+        image_cutouts=image_cutout[None, :, :],
+        image_unc_cutouts=image_unc_cutout[None, :, :],
+        psfmodels=psfmodels,
+    )
 
     return (
-        best_fit_psf_flux,
-        best_fit_psf_fluxunc,
-        minchi2,
-        xshift,
-        yshift,
-        best_fit_psfmodel,
+        fluxes[0],
+        flux_uncs[0],
+        chi2s[0],
+        xshifts[0],
+        yshifts[0],
+        psfmodels[:, :, best_inds[0]],
     )
 
 
@@ -185,8 +272,8 @@ def make_psf_shifted_array(
     unshifted_ind = int(ngrid / 2) + 1
     normpsfmax = np.max(normpsf)
     xcen_1, xcen_2 = np.where(padpsfs[:, :, unshifted_ind] == normpsfmax)
-    xcen_1 = int(xcen_1)
-    xcen_2 = int(xcen_2)
+    xcen_1 = int(xcen_1[0])
+    xcen_2 = int(xcen_2[0])
 
     psfmodels = padpsfs[
         xcen_1 - cutout_size_psf_phot : xcen_1 + cutout_size_psf_phot + 1,
@@ -195,6 +282,53 @@ def make_psf_shifted_array(
     return psfmodels
 
 
+@lru_cache(maxsize=PSF_CACHE_SIZE)
+def _get_cached_psf_shifted_array(
+    psf_filename: str,
+    mtime_ns: int,  # pylint: disable=unused-argument
+    cutout_size_psf_phot: int,
+    pad_psf_size: int,
+) -> np.ndarray:
+    """
+    Cached version of :func:`make_psf_shifted_array`. The modification time
+    is part of the cache key, so a PSF file which is overwritten is re-read.
+
+    :param psf_filename: PSF file name
+    :param mtime_ns: modification time of the PSF file
+    :param cutout_size_psf_phot: half size of the PSF cutouts
+    :param pad_psf_size: size of the padded PSF array
+    :return: read-only array of shifted PSF models
+    """
+    psfmodels = make_psf_shifted_array(
+        psf_filename=psf_filename,
+        cutout_size_psf_phot=cutout_size_psf_phot,
+        pad_psf_size=pad_psf_size,
+    )
+    psfmodels.setflags(write=False)
+    return psfmodels
+
+
+def get_psf_shifted_array(
+    psf_filename: str | Path, cutout_size_psf_phot: int = 20, pad_psf_size: int = 60
+) -> np.ndarray:
+    """
+    Function to get the array of shifted PSF models for a PSF file. The models are
+    only built once per PSF file, and then reused for all subsequent calls.
+
+    :param psf_filename: PSF file name
+    :param cutout_size_psf_phot: half size of the PSF cutouts
+    :param pad_psf_size: size of the padded PSF array
+    :return: read-only array of shifted PSF models
+    """
+    psf_filename = Path(psf_filename).resolve()
+    return _get_cached_psf_shifted_array(
+        psf_filename.as_posix(),
+        psf_filename.stat().st_mtime_ns,
+        int(cutout_size_psf_phot),
+        int(pad_psf_size),
+    )
+
+
 def aper_photometry(
     image_cutout: np.ndarray,
     image_unc_cutout: np.ndarray,
@@ -219,7 +353,6 @@ def aper_photometry(
         :return: aperture flux, aperture flux uncertainty
     """
     x_crd, y_crd = int(image_cutout.shape[0] / 2), int(image_cutout.shape[1] / 2)
-    image_cutout_mask = np.isnan(image_cutout)
     if plot:
         if plotfilename is None:
             raise ValueError("Please provide a filename to save the plot to.")
@@ -252,27 +385,95 @@ def aper_photometry(
         plt.savefig(plotfilename)
         plt.close(fig)
 
-    aperture = CircularAperture((x_crd, y_crd), r=aper_diameter / 2)
+    counts, counts_err = aper_photometry_batch(
+        image_cutouts=image_cutout[None, :, :],
+        image_unc_cutouts=image_unc_cutout[None, :, :],
+        aper_diameter=aper_diameter,
+        bkg_in_diameter=bkg_in_diameter,
+        bkg_out_diameter=bkg_out_diameter,
+    )
+    return counts[0], counts_err[0]
+
+
+def get_annulus_pixels(
+    cutout_shape: tuple[int, int], bkg_in_diameter: float, bkg_out_diameter: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Function to get the pixels of a background annulus centred on a cutout.
+    Pixels of the annulus lying beyond the cutout edge are flagged, as these
+    are treated as zeros.
+
+    :param cutout_shape: shape of the cutouts
+    :param bkg_in_diameter: inner background annulus diameter in pixels
+    :param bkg_out_diameter: outer background annulus diameter in pixels
+    :return: y indices, x indices, and boolean array of whether each pixel
+        lies within the cutout
+    """
+    x_crd, y_crd = int(cutout_shape[0] / 2), int(cutout_shape[1] / 2)
     annulus_aperture = CircularAnnulus(
         (x_crd, y_crd), r_in=bkg_in_diameter / 2, r_out=bkg_out_diameter / 2
     )
+    annulus_mask = annulus_aperture.to_mask(method="center")
+    bbox = annulus_mask.bbox
+    mask_ys, mask_xs = np.nonzero(annulus_mask.data > 0)
+    ys = mask_ys + bbox.iymin
+    xs = mask_xs + bbox.ixmin
+    inside = (ys >= 0) & (ys < cutout_shape[0]) & (xs >= 0) & (xs < cutout_shape[1])
+    return ys, xs, inside
+
+
+def aper_photometry_batch(
+    image_cutouts: np.ndarray,
+    image_unc_cutouts: np.ndarray,
+    aper_diameter: float,
+    bkg_in_diameter: float,
+    bkg_out_diameter: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Perform aperture photometry on a stack of cutouts, each centred on a source.
+    The aperture and annulus masks are computed once, and applied to all cutouts.
+
+    :param image_cutouts: 3D numpy array of image cutouts, shape (N, k, k)
+    :param image_unc_cutouts: 3D numpy array of uncertainty cutouts, shape (N, k, k)
+    :param aper_diameter: aperture diameter in pixels
+    :param bkg_in_diameter: inner background annulus diameter in pixels
+    :param bkg_out_diameter: outer background annulus diameter in pixels
+    :return: aperture fluxes, aperture flux uncertainties
+    """
+    n_sources = image_cutouts.shape[0]
+    cutout_shape = image_cutouts.shape[1:]
+    x_crd, y_crd = int(cutout_shape[0] / 2), int(cutout_shape[1] / 2)
 
-    annulus_masks = annulus_aperture.to_mask(method="center")
-    annulus_data = annulus_masks.multiply(image_cutout)
-    mask = annulus_masks.data
-    annulus_data_1d = annulus_data[mask > 0]
-    _, bkg_median, _ = sigma_clipped_stats(annulus_data_1d, sigma=2, mask_value=np.nan)
-    bkg = np.zeros(image_cutout.shape) + bkg_median
+    # Background: sigma-clipped median of each annulus
+    ys, xs, inside = get_annulus_pixels(
+        cutout_shape, bkg_in_diameter=bkg_in_diameter, bkg_out_diameter=bkg_out_diameter
+    )
+    annulus_data = np.zeros((n_sources, len(ys)))
+    annulus_data[:, inside] = image_cutouts[:, ys[inside], xs[inside]]
+    _, bkg_medians, _ = sigma_clipped_stats(
+        annulus_data, sigma=2, mask_value=np.nan, axis=1
+    )
+    bkg_medians = np.asarray(bkg_medians, dtype=float)
+
+    # Flux: exact overlap of the aperture with each pixel, with NaN pixels masked
+    aperture = CircularAperture((x_crd, y_crd), r=aper_diameter / 2)
+    flux_weights = aperture.to_mask(method="exact").to_image(cutout_shape)
+    unc_weights = aperture.to_mask(method="center").to_image(cutout_shape)
+    if flux_weights is None:
+        flux_weights = np.zeros(cutout_shape)
+        unc_weights = np.zeros(cutout_shape)
 
-    aperture_mask = aperture.to_mask(method="center")
-    aperture_unc_data = aperture_mask.multiply(image_unc_cutout)
+    image_pixels = image_cutouts.reshape(n_sources, -1)
+    unc_pixels = image_unc_cutouts.reshape(n_sources, -1)
+    nan_mask = np.isnan(image_pixels)
+
+    flux_weights = flux_weights.ravel()
+    counts = np.where(nan_mask, 0.0, image_pixels) @ flux_weights
+    counts -= bkg_medians * (np.where(nan_mask, 0.0, 1.0) @ flux_weights)
+
+    unc_sq = np.square(unc_pixels)
+    counts_err = np.sqrt(np.where(np.isnan(unc_sq), 0.0, unc_sq) @ unc_weights.ravel())
 
-    error = np.sqrt(np.nansum(aperture_unc_data**2))
-    phot_table = aperture_photometry(
-        data=image_cutout - bkg, apertures=aperture, mask=image_cutout_mask
-    )
-    counts = phot_table["aperture_sum"][0]
-    counts_err = error
     return counts, counts_err
 
 
@@ -283,17 +484,28 @@ def get_rms_image(image: Image) -> Image:
     :param rms: rms of the image
     :return: An RMS :class:`~mirar.data.image_data.Image`
     """
-    image_data = image.get_data()
-    image_data = image_data[np.invert(np.isnan(image_data))]
+    rms_image = Image(
+        data=get_rms_data(image.get_data(), gain=image[GAIN_KEY]),
+        header=image.get_header(),
+    )
+    return rms_image
+
+
+def get_rms_data(data: np.ndarray, gain: float) -> np.ndarray:
+    """Get an RMS array from the data of an image
+
+    :param data: image data
+    :param gain: gain of the image
+    :return: RMS array
+    """
+    image_data = data[np.invert(np.isnan(data))]
     rms = 0.5 * (
         np.percentile(image_data[image_data != 0.0], 84.13)
         - np.percentile(image_data[image_data != 0.0], 15.86)
     )
-    gain = image[GAIN_KEY]
-    poisson_noise = np.copy(image.get_data()) / gain
+    poisson_noise = np.array(data) / gain
     poisson_noise[poisson_noise < 0] = 0
-    rms_image = Image(data=np.sqrt(poisson_noise + rms**2), header=image.get_header())
-    return rms_image
+    return np.sqrt(poisson_noise + rms**2)
 
 
 def get_mags_from_fluxes(
@@ -13,19 +13,35 @@ import numpy as np
 from astropy.wcs import WCS
 
 from mirar.data import Image, ImageBatch
-from mirar.paths import LATEST_SAVE_KEY, REF_IMG_KEY, get_output_dir
+from mirar.paths import (
+    BASE_NAME_KEY,
+    LATEST_SAVE_KEY,
+    RAW_IMG_KEY,
+    REF_IMG_KEY,
+    get_output_dir,
+)
 from mirar.processors.astromatic.psfex.psfex import PSFex
 from mirar.processors.astromatic.sextractor.sextractor import Sextractor
 from mirar.processors.astromatic.swarp.swarp import Swarp, SwarpWarning
 from mirar.processors.base_processor import BaseImageProcessor
+from mirar.processors.reference_cache import get_reference_cache
 from mirar.references.base_reference_generator import BaseReferenceGenerator
 
 logger = logging.getLogger(__name__)
 
+PROPAGATE_HEADERLIST = ["TMC_ZP", "TMC_ZPSD"]
+
 
 class ProcessReference(BaseImageProcessor):
     """
     Processor to process reference images.
+
+    The reference image is resampled onto the grid of each science image,
+    and then processed with SExtractor and PSFEx. If use_reference_cache is True,
+    these reference products are stored (see
+    :mod:`~mirar.processors.reference_cache`), and reused for later science
+    images with the same reference, on a grid whose centre is within
+    reference_cache_tolerance pixels.
     """
 
     base_key = "REFPREP"
@@ -42,6 +58,8 @@ class ProcessReference(BaseImageProcessor):
         ref_psfex: Callable[..., PSFex],
         phot_sextractor: Callable[..., Sextractor] = None,
         temp_output_subtract_dir: str = "subtract",
+        use_reference_cache: bool = False,
+        reference_cache_tolerance: float = 1.0,
     ):
         super().__init__()
         self.ref_image_generator = ref_image_generator
@@ -52,6 +70,8 @@ class ProcessReference(BaseImageProcessor):
         self.temp_output_subtract_dir = temp_output_subtract_dir
         if self.phot_sextractor is None:
             self.phot_sextractor = self.sextractor
+        self.reference_cache = get_reference_cache() if use_reference_cache else None
+        self.reference_cache_tolerance = reference_cache_tolerance
 
     def get_sub_output_dir(self) -> Path:
         """
@@ -89,6 +109,139 @@ class ProcessReference(BaseImageProcessor):
             gain,
         )
 
+    def make_reference_products(
+        self,
+        ref_image: Image,
+        sci_ra_cent: float,
+        sci_dec_cent: float,
+        sci_pixscale: float,
+        sci_x_imgsize: int,
+        sci_y_imgsize: int,
+    ) -> Image:
+        """
+        Resample a reference image onto the grid of a science image, and process
+        it with SExtractor and PSFEx
+
+        :param ref_image: reference image
+        :param sci_ra_cent: RA of the centre of the science image
+        :param sci_dec_cent: Dec of the centre of the science image
+        :param sci_pixscale: pixel scale of the science image, in arcsec
+        :param sci_x_imgsize: size of the science image along x
+        :param sci_y_imgsize: size of the science image along y
+        :return: final (saved) reference image
+        """
+        output_dir = self.get_sub_output_dir()
+
+        # Resample ref image onto science image
+        ref_resampler = self.swarp_resampler(
+            pixscale=sci_pixscale,
+            x_imgpixsize=sci_x_imgsize,
+            y_imgpixsize=sci_y_imgsize,
+            center_ra=sci_ra_cent,
+            center_dec=sci_dec_cent,
+            propogate_headerlist=PROPAGATE_HEADERLIST,
+            temp_output_sub_dir=self.temp_output_subtract_dir,
+            include_scamp=False,
+            combine=False,
+            gain=ref_image["GAIN"],
+        )
+
+        ref_resampler.set_night(night_sub_dir=self.night_sub_dir)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", SwarpWarning)
+            resampled_ref_img = ref_resampler.apply(ImageBatch(ref_image))[0]
+
+        resampled_ref_path = output_dir.joinpath(resampled_ref_img.get_name())
+        self.save_fits(resampled_ref_img, resampled_ref_path)
+
+        # Detect source in reference image, and save as catalog
+
+        ref_sextractor = self.sextractor(output_sub_dir=self.temp_output_subtract_dir)
+        ref_sextractor.set_night(night_sub_dir=self.night_sub_dir)
+
+        resampled_ref_sextractor_img = ref_sextractor.apply(
+            ImageBatch(resampled_ref_img)
+        )[0]
+
+        rrsi_path = os.path.join(
+            self.get_sub_output_dir(), resampled_ref_sextractor_img.get_name()
+        )
+
+        self.save_fits(image=resampled_ref_sextractor_img, path=rrsi_path)
+        logger.debug(f"Saved reference image to {rrsi_path}")
+
+        ref_psfex = self.psfex(
+            output_sub_dir=self.temp_output_subtract_dir, norm_fits=True
+        )
+
+        resampled_ref_sextractor_psfex_img = ref_psfex.apply(
+            ImageBatch(resampled_ref_sextractor_img)
+        )[0]
+
+        logger.debug(
+            f"Running photometry on " f"{resampled_ref_sextractor_psfex_img.get_name()}"
+        )
+
+        # Run Sextractor again using PSFex model
+        ref_psf_phot_sextractor = self.phot_sextractor(
+            output_sub_dir=self.temp_output_subtract_dir,
+        )
+        ref_psf_phot_sextractor.set_night(night_sub_dir=self.night_sub_dir)
+
+        final_ref_image = ref_psf_phot_sextractor.apply(
+            ImageBatch(resampled_ref_sextractor_psfex_img)
+        )[0]
+
+        # Save the final resampled, sextracted and psfexed reference image
+        self.save_fits(final_ref_image, resampled_ref_path)
+
+        return final_ref_image
+
+    def restore_reference_products(
+        self,
+        key: str,
+        ra_deg: float,
+        dec_deg: float,
+        pixscale: float,
+        ref_image: Image,
+    ) -> Image | None:
+        """
+        Restore stored reference products to the output directory,
+        updating the paths in the header of the reference image
+
+        :param key: key of the reference products
+        :param ra_deg: RA of the centre of the science image
+        :param dec_deg: Dec of the centre of the science image
+        :param pixscale: pixel scale of the science image, in arcsec
+        :param ref_image: reference image
+        :return: final (saved) reference image, or None if there are no products
+        """
+        ref_raw_name = ref_image[RAW_IMG_KEY]
+        restored = self.reference_cache.restore(
+            key,
+            ra_deg=ra_deg,
+            dec_deg=dec_deg,
+            pixscale=pixscale,
+            output_dir=self.get_sub_output_dir(),
+            stem=Path(ref_image[BASE_NAME_KEY]).stem,
+            tolerance=self.reference_cache_tolerance,
+        )
+
+        if restored is None:
+            return None
+
+        ref_path, path_map = restored
+        final_ref_image = self.open_fits(ref_path)
+        for key_name, value in final_ref_image.get_header().items():
+            if isinstance(value, str) and (value in path_map):
+                final_ref_image[key_name] = path_map[value]
+        final_ref_image[BASE_NAME_KEY] = ref_path.name
+        final_ref_image[RAW_IMG_KEY] = ref_raw_name
+        self.save_fits(final_ref_image, ref_path)
+
+        logger.debug(f"Reused stored reference products for {ref_path.name}")
+        return final_ref_image
+
     def _apply_to_images(
         self,
         batch: ImageBatch,
@@ -103,8 +256,6 @@ class ProcessReference(BaseImageProcessor):
 
             ref_image = ref_writer.get_reference_image(image)
 
-            ref_gain = ref_image["GAIN"]
-
             sci_x_cent, sci_y_cent = image["NAXIS1"] / 2, image["NAXIS2"] / 2
 
             header = image.get_header()
@@ -118,29 +269,38 @@ class ProcessReference(BaseImageProcessor):
 
             sci_gain = image["GAIN"]
 
-            propogate_headerlist = ["TMC_ZP", "TMC_ZPSD"]
-
-            # Resample ref image onto science image
-            ref_resampler = self.swarp_resampler(
-                pixscale=sci_pixscale,
-                x_imgpixsize=sci_x_imgsize,
-                y_imgpixsize=sci_y_imgsize,
-                center_ra=sci_ra_cent,
-                center_dec=sci_dec_cent,
-                propogate_headerlist=propogate_headerlist,
-                temp_output_sub_dir=self.temp_output_subtract_dir,
-                include_scamp=False,
-                combine=False,
-                gain=ref_gain,
-            )
-
-            ref_resampler.set_night(night_sub_dir=self.night_sub_dir)
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", SwarpWarning)
-                resampled_ref_img = ref_resampler.apply(ImageBatch(ref_image))[0]
-
-            resampled_ref_path = output_dir.joinpath(resampled_ref_img.get_name())
-            self.save_fits(resampled_ref_img, resampled_ref_path)
+            final_ref_image = None
+
+            if self.reference_cache is not None:
+                ref_key = self.reference_cache.get_key(
+                    ref_image, sci_x_imgsize, sci_y_imgsize, sci_pixscale
+                )
+                ref_stem = Path(ref_image[BASE_NAME_KEY]).stem
+                final_ref_image = self.restore_reference_products(
+                    ref_key,
+                    sci_ra_cent,
+                    sci_dec_cent,
+                    sci_pixscale,
+                    ref_image=ref_image,
+                )
+
+            if final_ref_image is None:
+                final_ref_image = self.make_reference_products(
+                    ref_image,
+                    sci_ra_cent=sci_ra_cent,
+                    sci_dec_cent=sci_dec_cent,
+                    sci_pixscale=sci_pixscale,
+                    sci_x_imgsize=sci_x_imgsize,
+                    sci_y_imgsize=sci_y_imgsize,
+                )
+                if self.reference_cache is not None:
+                    self.reference_cache.store(
+                        ref_key,
+                        ra_deg=sci_ra_cent,
+                        dec_deg=sci_dec_cent,
+                        image=final_ref_image,
+                        stem=ref_stem,
+                    )
 
             (
                 _,
@@ -151,7 +311,7 @@ class ProcessReference(BaseImageProcessor):
                 ref_resamp_x_imgsize,
                 ref_resamp_y_imgsize,
                 _,
-            ) = self.get_image_header_params(resampled_ref_img)
+            ) = self.get_image_header_params(final_ref_image)
 
             # This is a fall back if the ref image resampling by Swarp fails
             # Resample the science image onto resampled reference image
@@ -161,7 +321,7 @@ class ProcessReference(BaseImageProcessor):
                 y_imgpixsize=ref_resamp_y_imgsize,
                 center_ra=ref_resamp_ra_cent,
                 center_dec=ref_resamp_dec_cent,
-                propogate_headerlist=propogate_headerlist,
+                propogate_headerlist=PROPAGATE_HEADERLIST,
                 temp_output_sub_dir=self.temp_output_subtract_dir,
                 include_scamp=False,
                 combine=False,
@@ -177,57 +337,11 @@ class ProcessReference(BaseImageProcessor):
                 resampled_sci_image, output_dir.joinpath(resampled_sci_image.get_name())
             )
 
-            # Detect source in reference image, and save as catalog
-
-            ref_sextractor = self.sextractor(
-                output_sub_dir=self.temp_output_subtract_dir
-            )
-            ref_sextractor.set_night(night_sub_dir=self.night_sub_dir)
-
-            resampled_ref_sextractor_img = ref_sextractor.apply(
-                ImageBatch(resampled_ref_img)
-            )[0]
-
-            rrsi_path = os.path.join(
-                self.get_sub_output_dir(), resampled_ref_sextractor_img.get_name()
-            )
-
-            self.save_fits(image=resampled_ref_sextractor_img, path=rrsi_path)
-            logger.debug(f"Saved reference image to {rrsi_path}")
-
-            ref_psfex = self.psfex(
-                output_sub_dir=self.temp_output_subtract_dir, norm_fits=True
-            )
-
-            resampled_ref_sextractor_psfex_img = ref_psfex.apply(
-                ImageBatch(resampled_ref_sextractor_img)
-            )[0]
-
-            logger.debug(
-                f"Running photometry on "
-                f"{resampled_ref_sextractor_psfex_img.get_name()}"
-            )
-
-            # Run Sextractor again using PSFex model
-            ref_psf_phot_sextractor = self.phot_sextractor(
-                output_sub_dir=self.temp_output_subtract_dir,
-            )
-            ref_psf_phot_sextractor.set_night(night_sub_dir=self.night_sub_dir)
-
-            final_ref_image = ref_psf_phot_sextractor.apply(
-                ImageBatch(resampled_ref_sextractor_psfex_img)
-            )[0]
-
-            # Save the final resampled, sextracted and psfexed reference image
-            self.save_fits(final_ref_image, resampled_ref_path)
-
             # Copy over header keys from ref to sci
             # resampled_sci_image[REF_PSF_KEY] = resampled_ref_sextractor_img[
             #     NORM_PSFEX_KEY
             # ]
-            resampled_sci_image[REF_IMG_KEY] = resampled_ref_sextractor_psfex_img[
-                LATEST_SAVE_KEY
-            ]
+            resampled_sci_image[REF_IMG_KEY] = final_ref_image[LATEST_SAVE_KEY]
 
             new_batch.append(resampled_sci_image)
 
@@ -0,0 +1,306 @@
+"""
+Module for a store of processed reference products, which can be reused
+between science images.
+
+For every science image, :class:`~mirar.processors.reference.ProcessReference`
+resamples the reference image onto the grid of the science image, and runs
+SExtractor, PSFEx and a second (PSF photometry) SExtractor pass on the resampled
+reference. Repeat visits to the same field, sub-detector and filter use the same
+reference, on (nearly) the same grid, so these products can be reused.
+
+Products are keyed on the reference identity (the hashed reference data, weight
+and header, excluding any keys which depend on the science image), and on the
+size and pixel scale of the target grid. Within a key, a stored product is
+reused if its grid centre is within a tolerance (in pixels) of the new grid
+centre. The science image is always resampled onto the grid of the reference
+product, so reusing products for slightly offset grids is consistent.
+
+The store is located at REFERENCE_CACHE_DIR (default: a subdirectory of the
+output data directory), and its size is limited by REFERENCE_CACHE_SIZE_MB
+(default 20000 MB). When the limit is exceeded, the least-recently used products
+are evicted. The key does not include the configuration of the astromatic
+tools, so the store should be cleared if that configuration changes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+
+from mirar.data import Image
+from mirar.paths import (
+    BASE_NAME_KEY,
+    LATEST_SAVE_KEY,
+    LATEST_WEIGHT_SAVE_KEY,
+    PACKAGE_NAME,
+    RAW_IMG_KEY,
+    base_output_dir,
+)
+from mirar.processors.manifest_store import MANIFEST_NAME, ManifestStore, hash_file
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_CACHE_DIR = Path(
+    os.getenv(
+        "REFERENCE_CACHE_DIR",
+        str(base_output_dir.joinpath(f"{PACKAGE_NAME}_reference_cache")),
+    )
+)
+REFERENCE_CACHE_SIZE = int(
+    float(os.getenv("REFERENCE_CACHE_SIZE_MB", "20000")) * 1024**2
+)
+
+# Change to invalidate all existing products
+REFERENCE_CACHE_VERSION = "1"
+
+# Header keys of the reference image which depend on the science image
+SCIENCE_DEPENDENT_KEYS = [
+    BASE_NAME_KEY,
+    RAW_IMG_KEY,
+    LATEST_SAVE_KEY,
+    LATEST_WEIGHT_SAVE_KEY,
+]
+
+
+def get_reference_id(ref_image: Image) -> str:
+    """
+    Get a hash identifying a reference image, based on its data, weight image
+    and header (excluding keys which depend on the science image)
+
+    :param ref_image: reference image
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+
+    header = ref_image.get_header()
+    for key, value in header.items():
+        if key not in SCIENCE_DEPENDENT_KEYS:
+            digest.update(f"{key}={value}\n".encode())
+
+    data = np.ascontiguousarray(ref_image.get_data())
+    digest.update(str(data.dtype).encode())
+    digest.update(str(data.shape).encode())
+    digest.update(data.tobytes())
+
+    if LATEST_WEIGHT_SAVE_KEY in header:
+        weight_path = Path(header[LATEST_WEIGHT_SAVE_KEY])
+        if weight_path.is_file():
+            digest.update(hash_file(weight_path).encode())
+
+    return digest.hexdigest()
+
+
+class ReferenceProductCache(ManifestStore):
+    """
+    Store of processed reference products, with size-based eviction
+
+    :param cache_dir: directory of the store
+    :param max_size: maximum size of the store, in bytes
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path = REFERENCE_CACHE_DIR,
+        max_size: int = REFERENCE_CACHE_SIZE,
+    ):
+        super().__init__(cache_dir=cache_dir, max_size=max_size)
+
+    @staticmethod
+    def get_key(ref_image: Image, n_x: int, n_y: int, pixscale: float) -> str:
+        """
+        Get the key for the products of a reference image on a grid
+
+        :param ref_image: reference image
+        :param n_x: number of pixels of the grid along x
+        :param n_y: number of pixels of the grid along y
+        :param pixscale: pixel scale of the grid, in arcsec
+        :return: key
+        """
+        grid = f"{int(n_x)}x{int(n_y)}@{float(pixscale):.6f}"
+        return hashlib.sha256(
+            f"{REFERENCE_CACHE_VERSION}\n{get_reference_id(ref_image)}\n{grid}".encode()
+        ).hexdigest()
+
+    def find(
+        self,
+        key: str,
+        ra_deg: float,
+        dec_deg: float,
+        pixscale: float,
+        tolerance: float = 1.0,
+    ) -> Optional[Path]:
+        """
+        Find the stored products with the nearest grid centre,
+        if it is within the tolerance
+
+        :param key: key
+        :param ra_deg: RA of the grid centre
+        :param dec_deg: Dec of the grid centre
+        :param pixscale: pixel scale of the grid, in arcsec
+        :param tolerance: maximum offset of grid centres, in pixels
+        :return: directory of the products, or None
+        """
+        centre = SkyCoord(ra=ra_deg * u.deg, dec=dec_deg * u.deg)
+
+        best_dir, best_offset = None, None
+        for manifest_path in self.cache_dir.joinpath(key).glob(f"*/{MANIFEST_NAME}"):
+            try:
+                with open(manifest_path, "r", encoding="utf8") as manifest_file:
+                    manifest = json.load(manifest_file)
+                stored = SkyCoord(
+                    ra=manifest["ra"] * u.deg, dec=manifest["dec"] * u.deg
+                )
+            except (OSError, ValueError, KeyError):
+                continue
+
+            offset = centre.separation(stored).to(u.arcsec).value / pixscale
+            if (offset <= tolerance) & (
+                (best_offset is None) or (offset < best_offset)
+            ):
+                best_dir, best_offset = manifest_path.parent, offset
+
+        if best_dir is not None:
+            logger.debug(f"Found reference products {best_dir} ({best_offset:.2f} pix)")
+        return best_dir
+
+    def restore(
+        self,
+        key: str,
+        ra_deg: float,
+        dec_deg: float,
+        pixscale: float,
+        output_dir: Path,
+        stem: str,
+        tolerance: float = 1.0,
+    ) -> Optional[tuple[Path, dict[str, str]]]:
+        """
+        Copy stored products to an output directory, if they exist.
+        Files are renamed by replacing the stem of the stored reference name
+        with a new stem.
+
+        :param key: key
+        :param ra_deg: RA of the grid centre
+        :param dec_deg: Dec of the grid centre
+        :param pixscale: pixel scale of the grid, in arcsec
+        :param output_dir: output directory
+        :param stem: stem of the new reference name
+        :param tolerance: maximum offset of grid centres, in pixels
+        :return: path of the reference image, and a mapping of stored paths
+            to new paths (or None if no products could be restored)
+        """
+        entry_dir = self.find(key, ra_deg, dec_deg, pixscale, tolerance=tolerance)
+
+        restored = None
+        if entry_dir is not None:
+            manifest_path = entry_dir.joinpath(MANIFEST_NAME)
+            try:
+                with open(manifest_path, "r", encoding="utf8") as manifest_file:
+                    manifest = json.load(manifest_file)
+
+                output_dir.mkdir(parents=True, exist_ok=True)
+                path_map = {}
+                for original_path, stored_name in manifest["files"].items():
+                    new_name = stored_name.replace(manifest["stem"], stem, 1)
+                    new_path = output_dir.joinpath(new_name)
+                    shutil.copyfile(entry_dir.joinpath(stored_name), new_path)
+                    path_map[original_path] = new_path.as_posix()
+
+                restored = (Path(path_map[manifest["image"]]), path_map)
+                self.record_use(entry_dir)
+            except (OSError, ValueError, KeyError):
+                restored = None
+
+        self.record_lookup(hit=restored is not None)
+
+        return restored
+
+    def store(
+        self,
+        key: str,
+        ra_deg: float,
+        dec_deg: float,
+        image: Image,
+        stem: str,
+    ):
+        """
+        Store the products of a reference image. The products are the saved
+        image itself, and every file in the same directory which is referenced
+        in its header.
+
+        :param key: key
+        :param ra_deg: RA of the grid centre
+        :param dec_deg: Dec of the grid centre
+        :param image: final (saved) reference image
+        :param stem: stem of the reference name
+        :return: None
+        """
+        image_path = Path(image[LATEST_SAVE_KEY])
+
+        paths = [image_path]
+        for value in image.get_header().values():
+            if isinstance(value, str) and (len(value) > 0):
+                path = Path(value)
+                if (
+                    (path.parent == image_path.parent)
+                    and path.is_file()
+                    and (path not in paths)
+                ):
+                    paths.append(path)
+
+        key_dir = self.cache_dir.joinpath(key)
+        key_dir.mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary directory first, so readers never see partial products
+        temp_dir = Path(tempfile.mkdtemp(dir=key_dir, prefix=".tmp_"))
+        try:
+            files = {}
+            for path in paths:
+                shutil.copyfile(path, temp_dir.joinpath(path.name))
+                files[path.as_posix()] = path.name
+
+            manifest = {
+                "ra": float(ra_deg),
+                "dec": float(dec_deg),
+                "stem": stem,
+                "image": image_path.as_posix(),
+                "files": files,
+            }
+            with open(
+                temp_dir.joinpath(MANIFEST_NAME), "w", encoding="utf8"
+            ) as manifest_file:
+                json.dump(manifest, manifest_file)
+
+            temp_dir.rename(key_dir.joinpath(uuid4().hex))
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        logger.debug(f"Stored reference products for {image_path.name}")
+        self.evict()
+
+
+_reference_cache: Optional[ReferenceProductCache] = None
+_reference_cache_lock = threading.Lock()
+
+
+def get_reference_cache() -> ReferenceProductCache:
+    """
+    Get the shared reference product cache, creating it if needed
+
+    :return: reference product cache
+    """
+    global _reference_cache  # pylint: disable=global-statement
+    with _reference_cache_lock:
+        if _reference_cache is None:
+            _reference_cache = ReferenceProductCache()
+        return _reference_cache
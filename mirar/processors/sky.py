@@ -25,21 +25,14 @@ class NightSkyMedianCalibrator(SkyFlatCalibrator):
         self,
         batch: ImageBatch,
     ) -> ImageBatch:
-        master_sky = self.get_cache_file(batch)
-
-        mask = master_sky.get_data() <= self.flat_nan_threshold
-
-        if np.sum(mask) > 0:
-            data = master_sky.get_data()
-            data[mask] = np.nan
-            master_sky.set_data(data)
+        master_sky_data = self.get_master_flat_data(batch)
 
         for image in batch:
             data = image.get_data()
             header = image.get_header()
 
             subtract_median = np.nanmedian(data)
-            data = data - subtract_median * master_sky.get_data()
+            data = data - subtract_median * master_sky_data
 
             header.append(
                 ("SKMEDSUB", subtract_median, "Median sky level subtracted"), end=True
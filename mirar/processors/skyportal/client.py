@@ -1,21 +1,94 @@
 """
 Client for interacting with Skyportal API
+
+The client can be shared between threads, e.g. to upload many candidates
+concurrently. Each thread has its own session, so connections are kept alive
+and reused between requests from that thread. The total number of requests
+can be limited to a maximum rate (with a token bucket), and the number of
+requests in flight at once can be capped.
+
+The latency of requests is recorded for each endpoint, with object
+names and ids in the endpoint replaced by a placeholder. These statistics are
+available as a dataframe, or in the Prometheus text format.
 """
 
 import logging
 import os
+import threading
+import time
 from typing import Mapping, Optional
 from urllib.parse import urljoin
 
+import pandas as pd
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
+from mirar.paths import PACKAGE_NAME
+
 DEFAULT_TIMEOUT = 5  # seconds
 
 logger = logging.getLogger(__name__)
 
 
+def get_endpoint_name(method: str, endpoint: str) -> str:
+    """
+    Get a name for an endpoint, for grouping latency statistics.
+    Path segments after the first which are not plain words (e.g. object
+    names or ids) are replaced by a placeholder.
+
+    :param method: HTTP method
+    :param endpoint: API endpoint e.g. sources/WNTR23aaaaa/annotations
+    :return: name e.g. POST sources/{id}/annotations
+    """
+    segments = endpoint.strip("/").split("/")
+    segments = segments[:1] + [
+        x if (x.isalpha() and x.islower()) else "{id}" for x in segments[1:]
+    ]
+    return f"{method.upper()} {'/'.join(segments)}"
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket, limiting the rate of requests
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        :param rate: maximum average number of requests per second
+        :param burst: maximum number of requests sent at once, defaults to
+            the rate (or 1)
+        """
+        if rate <= 0:
+            err = f"Rate limit must be positive, but got {rate}"
+            logger.error(err)
+            raise ValueError(err)
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until a request can be sent
+
+        :return: None
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
 class TimeoutHTTPAdapter(HTTPAdapter):
     """
     HTTP adapter that sets a default timeout for all requests.
@@ -54,19 +127,66 @@ class SkyportalClient:
     def __init__(
         self,
         base_url: str = "https://fritz.science/api/",
+        max_requests_per_second: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
     ):
+        """
+        :param base_url: base url of the Skyportal API
+        :param max_requests_per_second: maximum rate of requests, for all threads
+            combined, defaults to no limit
+        :param max_in_flight: maximum number of requests in flight at once,
+            defaults to no limit
+        """
         self.base_url = base_url
-        self._session = None
+        self.max_requests_per_second = max_requests_per_second
+        self.max_in_flight = max_in_flight
         self.session_headers = None
+        self._set_up_concurrency()
+
+    def _set_up_concurrency(self):
+        """
+        Set up the thread-local sessions, limits and latency statistics
+
+        :return: None
+        """
+        self._local = threading.local()
+        self._rate_limiter = (
+            RateLimiter(self.max_requests_per_second)
+            if self.max_requests_per_second is not None
+            else None
+        )
+        self._in_flight = (
+            threading.BoundedSemaphore(self.max_in_flight)
+            if self.max_in_flight is not None
+            else None
+        )
+        self._latency_lock = threading.Lock()
+        self._latencies = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in [
+            "_local",
+            "_rate_limiter",
+            "_in_flight",
+            "_latency_lock",
+            "_latencies",
+        ]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._set_up_concurrency()
 
     def set_up_session(self):
         """
-        Set up a session for sending requests to Skyportal.
+        Set up a session for sending requests to Skyportal, for the current thread.
 
         :return: None
         """
         # session to talk to SkyPortal
-        self._session = requests.Session()
+        session = requests.Session()
         self.session_headers = {
             "Authorization": f"token {self._get_fritz_token()}",
             "User-Agent": "mirar",
@@ -79,20 +199,99 @@ class SkyportalClient:
             allowed_methods=["HEAD", "GET", "PUT", "POST", "PATCH"],
         )
         adapter = TimeoutHTTPAdapter(timeout=5, max_retries=retries)
-        self._session.mount("https://", adapter)
-        self._session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._local.session = session
 
     def get_session(self) -> requests.Session:
         """
-        Wrapper for getting the session.
+        Wrapper for getting the session of the current thread.
         If the session is not set up, it will be set up.
 
         :return: Session
         """
-        if self._session is None:
+        if getattr(self._local, "session", None) is None:
             self.set_up_session()
 
-        return self._session
+        return self._local.session
+
+    def record_latency(self, endpoint_name: str, latency: float, success: bool):
+        """
+        Record the latency of a request
+
+        :param endpoint_name: name of endpoint
+        :param latency: latency in seconds
+        :param success: whether the request succeeded
+        :return: None
+        """
+        with self._latency_lock:
+            stats = self._latencies.setdefault(
+                endpoint_name,
+                {"n_requests": 0, "n_failed": 0, "total_seconds": 0.0, "max": 0.0},
+            )
+            stats["n_requests"] += 1
+            stats["n_failed"] += int(not success)
+            stats["total_seconds"] += latency
+            stats["max"] = max(stats["max"], latency)
+
+    def get_latency_stats(self) -> pd.DataFrame:
+        """
+        Get the latency statistics of requests, for each endpoint. Failed requests
+        are those raising an error, or returning a server error.
+
+        :return: dataframe with one row per endpoint
+        """
+        with self._latency_lock:
+            rows = [
+                {
+                    "endpoint": name,
+                    "n_requests": stats["n_requests"],
+                    "n_failed": stats["n_failed"],
+                    "total_seconds": stats["total_seconds"],
+                    "mean_seconds": stats["total_seconds"] / stats["n_requests"],
+                    "max_seconds": stats["max"],
+                }
+                for name, stats in self._latencies.items()
+            ]
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "endpoint",
+                "n_requests",
+                "n_failed",
+                "total_seconds",
+                "mean_seconds",
+                "max_seconds",
+            ],
+        )
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the latency statistics in the Prometheus text exposition format,
+        e.g. for serving with :class:`~mirar.metrics.prometheus.PrometheusExporter`
+
+        :return: string
+        """
+        stats = self.get_latency_stats()
+
+        metrics = [
+            ("n_requests", "requests_total", "counter", "Requests sent"),
+            ("n_failed", "failed_requests_total", "counter", "Requests which failed"),
+            ("total_seconds", "request_seconds_total", "counter", "Request latency"),
+            ("max_seconds", "max_request_seconds", "gauge", "Maximum latency"),
+        ]
+
+        lines = []
+        for column, name, metric_type, description in metrics:
+            lines.append(f"# HELP {PACKAGE_NAME}_skyportal_{name} {description}")
+            lines.append(f"# TYPE {PACKAGE_NAME}_skyportal_{name} {metric_type}")
+            for _, row in stats.iterrows():
+                lines.append(
+                    f'{PACKAGE_NAME}_skyportal_{name}{{endpoint="'
+                    f'{row["endpoint"]}"}} {float(row[column])}'
+                )
+
+        return "\n".join(lines) + "\n"
 
     @staticmethod
     def _get_fritz_token():
@@ -147,17 +346,35 @@ class SkyportalClient:
 
         url = urljoin(self.base_url, endpoint)
 
-        if method == "get":
-            response = methods[method](
-                url,
-                params=data,
-                headers=self.session_headers,
-            )
-        else:
-            response = methods[method](
-                url,
-                json=data,
-                headers=self.session_headers,
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+
+        if self._in_flight is not None:
+            self._in_flight.acquire()
+
+        t_start = time.perf_counter()
+        success = False
+        try:
+            if method == "get":
+                response = methods[method](
+                    url,
+                    params=data,
+                    headers=self.session_headers,
+                )
+            else:
+                response = methods[method](
+                    url,
+                    json=data,
+                    headers=self.session_headers,
+                )
+            success = response.status_code < 500
+        finally:
+            if self._in_flight is not None:
+                self._in_flight.release()
+            self.record_latency(
+                get_endpoint_name(method, endpoint),
+                time.perf_counter() - t_start,
+                success,
             )
 
         return response
@@ -171,12 +171,14 @@ class SkyportalCandidateUploader(SkyportalSourceUploader):
                 )
                 logger.error(response.json())
 
-    def export_to_skyportal(self, alert):
+    def export_to_skyportal(self, alert, put_photometry: bool = True):
         """
         Posts a candidate to SkyPortal.
 
         :param alert: _description_
         :type alert: _type_
+        :param put_photometry: whether to send the photometry, or leave it to be
+            sent in a batch
         """
         # check if candidate exists in SkyPortal
         logger.debug(f"Checking if {alert[SOURCE_NAME_KEY]} is candidate in SkyPortal")
@@ -213,8 +215,9 @@ class SkyportalCandidateUploader(SkyportalSourceUploader):
             self.skyportal_post_annotation(alert)
 
             # post full light curve
-            logger.debug(f"Using stream_id={self.stream_id}")
-            self.skyportal_put_photometry(alert)
+            if put_photometry:
+                logger.debug(f"Using stream_id={self.stream_id}")
+                self.skyportal_put_photometry(alert)
 
             # post thumbnails
             self.skyportal_post_thumbnails(alert)
@@ -251,8 +254,9 @@ class SkyportalCandidateUploader(SkyportalSourceUploader):
                     )
 
             # post alert photometry in single call to /api/photometry
-            logger.debug(f"Using stream_id={self.stream_id}")
-            self.skyportal_put_photometry(alert)
+            if put_photometry:
+                logger.debug(f"Using stream_id={self.stream_id}")
+                self.skyportal_put_photometry(alert)
 
             if self.update_thumbnails:
                 self.skyportal_post_thumbnails(alert)
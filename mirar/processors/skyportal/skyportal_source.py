@@ -1,8 +1,16 @@
 """
 Module for sending sources to Fritz.
+
+Sources can be uploaded concurrently by a pool of threads, with all alerts of
+a given object uploaded in order by a single thread. The photometry of several
+objects can also be sent in a single request, as SkyPortal accepts lists of
+object ids for photometry. Limits on the rate of requests, and the number of
+requests in flight, are set on the
+:class:`~mirar.processors.skyportal.client.SkyportalClient`.
 """
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from typing import Mapping, Optional
 
@@ -40,6 +48,8 @@ class SkyportalSourceUploader(BaseSourceProcessor):
         instrument_id: int,
         update_thumbnails: bool = False,
         skyportal_client: Optional[SkyportalClient] = SkyportalClient(),
+        n_upload_workers: int = 1,
+        photometry_batch_size: int = 1,
     ):
         super().__init__()
         self.group_ids = group_ids
@@ -47,6 +57,8 @@ class SkyportalSourceUploader(BaseSourceProcessor):
         self.origin = origin  # used for sending updates to Fritz
         self.update_thumbnails = update_thumbnails
         self.skyportal_client = skyportal_client
+        self.n_upload_workers = n_upload_workers
+        self.photometry_batch_size = photometry_batch_size
 
     def _apply_to_sources(
         self,
@@ -58,6 +70,7 @@ class SkyportalSourceUploader(BaseSourceProcessor):
         :param batch: SourceBatch to process
         :return: SourceBatch after processing
         """
+        alerts = []
         for source_table in batch:
             candidate_df = source_table.get_data()
 
@@ -66,7 +79,33 @@ class SkyportalSourceUploader(BaseSourceProcessor):
             candidate_df["mjd"] = Time(metadata[TIME_KEY]).mjd
             for _, src in candidate_df.iterrows():
                 super_dict = self.generate_super_dict(metadata, src.fillna(""))
-                self.export_to_skyportal(deepcopy(super_dict))
+                alerts.append(deepcopy(super_dict))
+
+        # Alerts of the same object are uploaded in order, by the same thread
+        alerts_by_name = {}
+        for alert in alerts:
+            alerts_by_name.setdefault(alert[SOURCE_NAME_KEY], []).append(alert)
+
+        batch_photometry = self.photometry_batch_size > 1
+
+        def export_alerts(object_alerts: list[dict]):
+            for object_alert in object_alerts:
+                self.export_to_skyportal(
+                    object_alert, put_photometry=not batch_photometry
+                )
+
+        object_alert_lists = list(alerts_by_name.values())
+
+        if (self.n_upload_workers <= 1) or (len(object_alert_lists) <= 1):
+            for object_alerts in object_alert_lists:
+                export_alerts(object_alerts)
+        else:
+            with ThreadPoolExecutor(max_workers=self.n_upload_workers) as executor:
+                # Consume the results, to raise any errors
+                list(executor.map(export_alerts, object_alert_lists))
+
+        if batch_photometry:
+            self.skyportal_put_photometry_batches(alerts)
 
         return batch
 
@@ -245,33 +284,108 @@ class SkyportalSourceUploader(BaseSourceProcessor):
 
         return df_photometry
 
-    def skyportal_put_photometry(self, alert):
-        """Send photometry to Fritz."""
+    def make_photometry_payload(self, alert: dict) -> Optional[dict]:
+        """
+        Make the payload for sending the photometry of an alert to SkyPortal
+
+        :param alert: dict of source/candidate information
+        :return: payload, or None if there is no photometry
+        """
         logger.debug(f"Making alert photometry of {alert[SOURCE_NAME_KEY]}")
         df_photometry = self.make_photometry(alert)
 
-        if len(df_photometry) > 0:
-            photometry = df_photometry.to_dict("list")
-            photometry["obj_id"] = alert[SOURCE_NAME_KEY]
-            photometry["instrument_id"] = self.instrument_id
-            if hasattr(self, "stream_id"):
-                photometry["stream_ids"] = [int(self.stream_id)]
-            logger.debug(f"Posting photometry of {alert[SOURCE_NAME_KEY]} to SkyPortal")
-            response = self.api("PUT", "photometry", photometry)
-            if response.json()["status"] == "success":
-                logger.debug(f"Posted {alert[SOURCE_NAME_KEY]} photometry to SkyPortal")
-            else:
-                logger.error(
-                    f"Failed to post {alert[SOURCE_NAME_KEY]} photometry to SkyPortal"
-                )
-                logger.error(response.json())
+        if len(df_photometry) == 0:
+            return None
+
+        photometry = df_photometry.to_dict("list")
+        photometry["obj_id"] = alert[SOURCE_NAME_KEY]
+        photometry["instrument_id"] = self.instrument_id
+        if hasattr(self, "stream_id"):
+            photometry["stream_ids"] = [int(self.stream_id)]
+        return photometry
+
+    def send_photometry(self, photometry: dict, name: str) -> bool:
+        """
+        Send a photometry payload to SkyPortal
+
+        :param photometry: photometry payload
+        :param name: name of the object(s), for logging
+        :return: boolean whether the photometry was posted successfully
+        """
+        logger.debug(f"Posting photometry of {name} to SkyPortal")
+        response = self.api("PUT", "photometry", photometry)
+        if response.json()["status"] == "success":
+            logger.debug(f"Posted {name} photometry to SkyPortal")
+            return True
+
+        logger.error(f"Failed to post {name} photometry to SkyPortal")
+        logger.error(response.json())
+        return False
+
+    def skyportal_put_photometry(self, alert):
+        """Send photometry to Fritz."""
+        photometry = self.make_photometry_payload(alert)
+        if photometry is not None:
+            self.send_photometry(photometry, alert[SOURCE_NAME_KEY])
+
+    def skyportal_put_photometry_batches(self, alerts: list[dict]):
+        """
+        Send the photometry of many alerts to Fritz, in batches of
+        photometry_batch_size alerts. Each batch is a single request, with
+        the object id of each photometry point. If a batch fails, the
+        photometry of each alert in the batch is sent separately.
+
+        :param alerts: list of dicts of source/candidate information
+        :return: None
+        """
+        payloads = []
+        for alert in alerts:
+            photometry = self.make_photometry_payload(alert)
+            if photometry is not None:
+                payloads.append((alert[SOURCE_NAME_KEY], photometry))
+
+        batches = [
+            payloads[i : i + self.photometry_batch_size]
+            for i in range(0, len(payloads), self.photometry_batch_size)
+        ]
+
+        def send_batch(batch: list[tuple[str, dict]]):
+            if len(batch) == 1:
+                self.send_photometry(batch[0][1], batch[0][0])
+                return
+
+            combined = {}
+            for _, photometry in batch:
+                n_points = len(photometry["mjd"])
+                for key, value in photometry.items():
+                    if key == "stream_ids":
+                        combined[key] = value
+                    elif isinstance(value, list):
+                        combined.setdefault(key, []).extend(value)
+                    else:
+                        combined.setdefault(key, []).extend([value] * n_points)
+
+            names = [name for name, _ in batch]
+            if not self.send_photometry(combined, f"{len(names)} objects"):
+                logger.warning(f"Sending photometry separately for {names}")
+                for name, photometry in batch:
+                    self.send_photometry(photometry, name)
+
+        if (self.n_upload_workers <= 1) or (len(batches) <= 1):
+            for batch in batches:
+                send_batch(batch)
+        else:
+            with ThreadPoolExecutor(max_workers=self.n_upload_workers) as executor:
+                list(executor.map(send_batch, batches))
 
-    def export_to_skyportal(self, alert):
+    def export_to_skyportal(self, alert, put_photometry: bool = True):
         """
         Posts a source to SkyPortal.
 
         :param alert: _description_
         :type alert: _type_
+        :param put_photometry: whether to send the photometry, or leave it to be
+            sent in a batch
         """
         # check if source exists in SkyPortal # pylint: disable=duplicate-code
         logger.debug(f"Checking if {alert[SOURCE_NAME_KEY]} is source in SkyPortal")
@@ -292,7 +406,8 @@ class SkyportalSourceUploader(BaseSourceProcessor):
             self.skyportal_post_thumbnails(alert)
 
         # post full light curve
-        self.skyportal_put_photometry(alert)
+        if put_photometry:
+            self.skyportal_put_photometry(alert)
 
         if self.update_thumbnails:
             self.skyportal_post_thumbnails(alert)
@@ -3,13 +3,15 @@ Module containing a processor for assigning names to sources
 """
 
 import logging
+import re
 
+import numpy as np
 import pandas as pd
 from astropy.time import Time
-from sqlalchemy import select
+from sqlalchemy import func, select, text
 
 from mirar.data import SourceBatch
-from mirar.database.transactions.select import run_select
+from mirar.database.engine import get_engine
 from mirar.paths import SOURCE_NAME_KEY, TIME_KEY
 from mirar.processors.database.database_selector import BaseDatabaseSourceSelector
 
@@ -21,9 +23,6 @@ class CandidateNamer(BaseDatabaseSourceSelector):
 
     base_key = "namer"
 
-    # Go one at a time to avoid... race conditions
-    max_n_cpu = 1
-
     def __init__(
         self,
         base_name: str,
@@ -35,7 +34,6 @@ class CandidateNamer(BaseDatabaseSourceSelector):
         self.db_name_field = db_name_field
         self.base_name = base_name
         self.name_start = name_start
-        self.lastname = None
 
     def __str__(self) -> str:
         return (
@@ -80,61 +78,118 @@ class CandidateNamer(BaseDatabaseSourceSelector):
 
         return new_string
 
-    def extract_last_year(self, last_name: str) -> int:
+    def letters_to_index(self, letters: str) -> int:
         """
-        Extract the year from the last name
+        Convert name letters to their position in the naming sequence, so that
+        the position of increment_string(letters) is one more than that of letters.
+        Index 0 is the shortest name, consisting of only 'a'.
 
-        :param last_name: last name
-        :return: year
+        :param letters: name letters
+        :return: index
+        """
+        min_length = len(self.name_start)
+        index = sum(26**length for length in range(min_length, len(letters)))
+        value = 0
+        for character in letters:
+            value = 26 * value + (ord(character) - ord("a"))
+        return index + value
+
+    def index_to_letters(self, index: int) -> str:
         """
-        last_year = int(last_name[len(self.base_name) : len(self.base_name) + 2])
-        return last_year
+        Convert a position in the naming sequence to name letters
 
-    def get_next_name(self, detection_time: Time, last_name: str = None) -> str:
+        :param index: index
+        :return: name letters
+        """
+        length = len(self.name_start)
+        while index >= 26**length:
+            index -= 26**length
+            length += 1
+
+        letters = ""
+        for _ in range(length):
+            index, value = divmod(index, 26)
+            letters = chr(ord("a") + value) + letters
+        return letters
+
+    def get_sequence_name(self, cand_year: int) -> str:
         """
-        Function to get a new candidate name
+        Get the name of the database sequence used to reserve names for a year
 
-        :param detection_time: detection time (Astropy Time object)
-        :param last_name: last name
-        :return: new name
+        :param cand_year: (two-digit) year
+        :return: sequence name
         """
-        cand_year = detection_time.datetime.year % 1000
+        base = (
+            f"{self.db_table.sql_model.__tablename__}_{self.db_name_field}_"
+            f"{self.base_name}{cand_year}_seq"
+        )
+        return re.sub(r"[^a-z0-9_]", "_", base.lower())
 
-        if last_name is not None:
-            last_year = self.extract_last_year(last_name)
-            if last_year != cand_year:
-                last_name = None
+    def allocate_names(self, detection_time: Time, n_names: int) -> list[str]:
+        """
+        Reserve a contiguous block of new names.
 
-        if last_name is None:
+        Names are reserved with a database sequence, while holding a
+        transaction-level advisory lock, so concurrent batches (in any thread
+        or process) never receive the same names. The sequence is kept ahead of
+        the most recent name of the same year already in the database table.
 
-            col = self.db_table.sql_model.__table__.c[self.db_name_field]
+        :param detection_time: detection time (Astropy Time object)
+        :param n_names: number of names to reserve
+        :return: list of new names
+        """
+        if n_names == 0:
+            return []
 
-            # Select most recent name of same year
-            sel = (
-                select(col).where(col.contains(cand_year)).order_by(col.desc()).limit(1)
-            )
+        cand_year = detection_time.datetime.year % 1000
+        prefix = self.base_name + str(cand_year)
+        seq_name = self.get_sequence_name(cand_year)
 
-            res = run_select(query=sel, sql_table=self.db_table.sql_model)
+        col = self.db_table.sql_model.__table__.c[self.db_name_field]
 
-            # If no names of the same year, start from the beginning
-            if len(res) == 0:
-                name = self.base_name + str(cand_year) + self.name_start
-                return name
+        # Select most recent name of same year
+        sel = (
+            select(col)
+            .where(col.startswith(prefix))
+            .order_by(func.length(col).desc(), col.desc())
+            .limit(1)
+        )
 
-            last_name = res[self.db_name_field].iloc[0]
-            logger.debug(res)
+        engine = get_engine(db_name=self.db_table.sql_model.db_name)
 
-        last_year = self.extract_last_year(last_name)
+        with engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:seq_name))"),
+                {"seq_name": seq_name},
+            )
+            conn.execute(
+                text(f"CREATE SEQUENCE IF NOT EXISTS {seq_name} MINVALUE 0 START 0")
+            )
+            last_name = conn.execute(sel).scalar()
+            last_value, is_called = conn.execute(
+                text(f"SELECT last_value, is_called FROM {seq_name}")
+            ).one()
 
-        assert (
-            last_year == cand_year
-        ), f"Last year {last_year} does not match candidate year {cand_year}"
+            # If no names of the same year, start from the beginning
+            first_index = self.letters_to_index(self.name_start)
+            if is_called:
+                first_index = max(first_index, last_value + 1)
+            if last_name is not None:
+                first_index = max(
+                    first_index, self.letters_to_index(last_name[len(prefix) :]) + 1
+                )
+
+            conn.execute(
+                text("SELECT setval(:seq_name, :value)"),
+                {"seq_name": seq_name, "value": first_index + n_names - 1},
+            )
 
-        last_name_letters = last_name[len(self.base_name) + 2 :]
-        new_name_letters = self.increment_string(last_name_letters)
-        name = self.base_name + str(cand_year) + new_name_letters
-        logger.debug(f"Assigning name: {name}")
-        return name
+        names = [
+            prefix + self.index_to_letters(index)
+            for index in range(first_index, first_index + n_names)
+        ]
+        logger.debug(f"Reserved names {names[0]} to {names[-1]}")
+        return names
 
     def _apply_to_sources(
         self,
@@ -143,27 +198,21 @@ class CandidateNamer(BaseDatabaseSourceSelector):
         for source_table in batch:
             sources = source_table.get_data()
 
-            names = []
-
-            detection_time = Time(source_table[TIME_KEY])
-            for ind, source in sources.iterrows():
-
-                source_name = None
+            if SOURCE_NAME_KEY in sources.columns:
+                names = sources[SOURCE_NAME_KEY].to_numpy(dtype=object, copy=True)
+            else:
+                names = np.full(len(sources), None, dtype=object)
 
-                if SOURCE_NAME_KEY in source:
-                    source_name = source[SOURCE_NAME_KEY]
+            new = pd.isnull(names)
+            logger.debug(
+                f"Assigning names to {np.sum(new)} sources, "
+                f"{np.sum(~new)} sources already have a name."
+            )
 
-                if pd.isnull(source_name):
-                    source_name = self.get_next_name(
-                        detection_time, last_name=self.lastname
-                    )
-                    self.lastname = source_name
-                    logger.debug(f"Assigning name: {source_name} to source # {ind}.")
-                else:
-                    logger.debug(f"Source # {ind} already has a name: {source_name}.")
-                names.append(source_name)
+            detection_time = Time(source_table[TIME_KEY])
+            names[new] = self.allocate_names(detection_time, int(np.sum(new)))
 
-            sources[self.db_name_field] = names
+            sources[self.db_name_field] = list(names)
             source_table.set_data(sources)
 
         return batch
@@ -0,0 +1,242 @@
+"""
+Module for combining many frames into a single image with bounded memory,
+e.g. to make a master bias, dark or flat.
+
+Rather than building a full (n_frames, nx, ny) cube, frames are combined in tiles
+of rows. Each tile reads only the relevant rows of every frame, so frames held
+in the image cache are memory-mapped and streamed from disk. Tiles are combined in
+parallel by a pool of threads, and the total size of the tiles in memory at any
+one time is limited by STACK_MEMORY_MB (default 512 MB).
+
+Three combination methods are supported:
+
+* **median**: the NaN-aware median of all frames
+* **sigma_clipped_mean**: the mean after iterative sigma-clipping of outliers
+* **minmax**: the mean after rejecting the lowest and highest values
+"""
+
+import logging
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.stats import sigma_clip
+from astropy.utils.exceptions import AstropyUserWarning
+
+from mirar.errors import ProcessorError
+from mirar.paths import max_n_cpu
+
+logger = logging.getLogger(__name__)
+
+MEDIAN_COMBINE = "median"
+SIGMA_CLIPPED_MEAN_COMBINE = "sigma_clipped_mean"
+MINMAX_COMBINE = "minmax"
+
+COMBINE_METHODS = [MEDIAN_COMBINE, SIGMA_CLIPPED_MEAN_COMBINE, MINMAX_COMBINE]
+
+STACK_MEMORY_BUDGET = int(float(os.getenv("STACK_MEMORY_MB", "512")) * 1024**2)
+
+# Tiles need temporary arrays of the same size during combination
+TILE_OVERHEAD_FACTOR = 3
+
+
+class StackingError(ProcessorError):
+    """
+    Error relating to combining frames
+    """
+
+
+class StackFrame:
+    """
+    A frame to be combined, which is read in tiles of rows
+
+    :param data: image data. Can be any array supporting row slices,
+        e.g. a read-only memory map
+    :param scale: value each pixel is divided by
+    :param keep_mask: optional array of pixels to use. Pixels where this
+        is zero/False are replaced by NaN
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        scale: float = 1.0,
+        keep_mask: np.ndarray | None = None,
+    ):
+        self.data = data
+        self.scale = scale
+        self.keep_mask = keep_mask
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """
+        Shape of the frame
+
+        :return: shape
+        """
+        return self.data.shape
+
+    def get_rows(self, start: int, stop: int) -> np.ndarray:
+        """
+        Get a tile of rows of the frame
+
+        :param start: first row
+        :param stop: last row (exclusive)
+        :return: tile of rows, as float64
+        """
+        rows = np.array(self.data[start:stop], dtype=float)
+        if self.keep_mask is not None:
+            rows[~np.asarray(self.keep_mask[start:stop]).astype(bool)] = np.nan
+        if self.scale != 1.0:
+            rows /= self.scale
+        return rows
+
+
+def validate_combine_method(method: str) -> str:
+    """
+    Check that a combination method is valid
+
+    :param method: combination method
+    :return: combination method
+    """
+    if method not in COMBINE_METHODS:
+        err = (
+            f"Combination method '{method}' not recognised. "
+            f"Valid methods are {COMBINE_METHODS}."
+        )
+        logger.error(err)
+        raise StackingError(err)
+    return method
+
+
+def combine_cube(
+    cube: np.ndarray,
+    method: str = MEDIAN_COMBINE,
+    sigma: float = 3.0,
+    maxiters: int = 5,
+    n_reject_low: int = 1,
+    n_reject_high: int = 1,
+) -> np.ndarray:
+    """
+    Combine a cube of frames along the first axis
+
+    :param cube: array with shape (n_frames, ...)
+    :param method: combination method
+    :param sigma: clipping threshold for sigma_clipped_mean
+    :param maxiters: maximum clipping iterations for sigma_clipped_mean
+    :param n_reject_low: number of lowest values rejected for minmax
+    :param n_reject_high: number of highest values rejected for minmax
+    :return: combined array
+    """
+    validate_combine_method(method)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == MEDIAN_COMBINE:
+            return np.nanmedian(cube, axis=0)
+
+        if method == SIGMA_CLIPPED_MEAN_COMBINE:
+            clipped = sigma_clip(
+                cube,
+                sigma=sigma,
+                maxiters=maxiters,
+                axis=0,
+                masked=False,
+                copy=False,
+            )
+            return np.nanmean(clipped, axis=0)
+
+        # For minmax, NaNs are sorted to the end, so only valid values are rejected
+        ordered = np.sort(cube, axis=0)
+        n_valid = np.sum(~np.isnan(cube), axis=0)
+        rank = np.arange(cube.shape[0]).reshape((-1,) + (1,) * (cube.ndim - 1))
+        keep = (rank >= n_reject_low) & (rank < n_valid - n_reject_high)
+        total = np.sum(np.where(keep, ordered, 0.0), axis=0)
+        return total / np.sum(keep, axis=0)
+
+
+def get_rows_per_tile(
+    n_frames: int, n_columns: int, n_workers: int, memory_budget: int
+) -> int:
+    """
+    Get the number of rows in each tile, so that all tiles being combined
+    at once fit within the memory budget
+
+    :param n_frames: number of frames
+    :param n_columns: number of columns per frame
+    :param n_workers: number of tiles combined at once
+    :param memory_budget: memory budget in bytes
+    :return: number of rows per tile
+    """
+    bytes_per_row = n_frames * n_columns * np.dtype(float).itemsize
+    tile_budget = memory_budget / (max(1, n_workers) * TILE_OVERHEAD_FACTOR)
+    return max(1, int(tile_budget // bytes_per_row))
+
+
+def combine_frames(
+    frames: list[StackFrame],
+    method: str = MEDIAN_COMBINE,
+    n_workers: int = max_n_cpu,
+    memory_budget: int = STACK_MEMORY_BUDGET,
+    **combine_kwargs,
+) -> np.ndarray:
+    """
+    Combine frames into a single image, tile by tile
+
+    :param frames: frames to combine
+    :param method: combination method
+    :param n_workers: number of threads combining tiles
+    :param memory_budget: maximum memory in bytes used by tiles at any one time
+    :param combine_kwargs: additional arguments for :func:`combine_cube`
+    :return: combined image
+    """
+    validate_combine_method(method)
+
+    if len(frames) == 0:
+        err = "No frames to combine"
+        logger.error(err)
+        raise StackingError(err)
+
+    shape = frames[0].shape
+    for frame in frames:
+        if frame.shape != shape:
+            err = f"Cannot combine frames of shape {frame.shape} and {shape}"
+            logger.error(err)
+            raise StackingError(err)
+
+    n_rows, n_columns = shape
+    n_workers = max(1, n_workers)
+    rows_per_tile = get_rows_per_tile(
+        n_frames=len(frames),
+        n_columns=n_columns,
+        n_workers=n_workers,
+        memory_budget=memory_budget,
+    )
+
+    starts = list(range(0, n_rows, rows_per_tile))
+    logger.debug(
+        f"Combining {len(frames)} frames of shape {shape} with method '{method}', "
+        f"in {len(starts)} tiles of {rows_per_tile} rows"
+    )
+
+    combined = np.zeros(shape)
+
+    def combine_tile(start: int):
+        stop = min(start + rows_per_tile, n_rows)
+        cube = np.stack([frame.get_rows(start, stop) for frame in frames], axis=0)
+        combined[start:stop] = combine_cube(cube, method=method, **combine_kwargs)
+
+    with warnings.catch_warnings():
+        # Pixels which are NaN in every frame are left as NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        warnings.simplefilter("ignore", AstropyUserWarning)
+
+        if (n_workers == 1) or (len(starts) == 1):
+            for start in starts:
+                combine_tile(start)
+        else:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                # Consume the results, to raise any errors
+                list(executor.map(combine_tile, starts))
+
+    return combined
@@ -144,6 +144,8 @@ class ImageBatcher(BaseImageProcessor):
 
     base_key = "batch"
 
+    is_synchronization_point = True
+
     def __init__(self, split_key: str | list[str]):
         super().__init__()
         self.split_key = split_key
@@ -185,6 +187,8 @@ class ImageDebatcher(BaseImageProcessor):
 
     base_key = "debatch"
 
+    is_synchronization_point = True
+
     def _apply_to_images(
         self,
         batch: ImageBatch,
@@ -6,6 +6,7 @@ import logging
 
 import astropy.units as u
 import numpy as np
+import pandas as pd
 from astropy.coordinates import SkyCoord
 
 from mirar.catalog.base_catalog import BaseXMatchCatalog
@@ -35,6 +36,29 @@ class XMatch(BaseSourceProcessor):
             f"'{self.catalog.catalog_name}' catalog."
         )
 
+    @staticmethod
+    def flatten_query_results(
+        query_results: dict, query_names: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, list[dict]]:
+        """
+        Flatten the results of a catalog query into a single list of matches,
+        with index arrays giving the query and the rank of each match
+
+        :param query_results: dictionary of results for each query
+        :param query_names: names of queries, in the order of the candidate table
+        :return: index of query for each match, rank of each match within its query,
+            and list of matches
+        """
+        n_results = [len(query_results[query_name]) for query_name in query_names]
+        query_inds = np.repeat(np.arange(len(query_names)), n_results)
+        result_inds = np.concatenate(
+            [np.arange(n, dtype=int) for n in n_results] + [np.array([], dtype=int)]
+        )
+        results = [
+            result for query_name in query_names for result in query_results[query_name]
+        ]
+        return query_inds, result_inds, results
+
     def _apply_to_sources(
         self,
         batch: SourceBatch,
@@ -42,8 +66,8 @@ class XMatch(BaseSourceProcessor):
         for source_list in batch:
             candidate_table = source_list.get_data()
 
-            ras = candidate_table["ra"]
-            decs = candidate_table["dec"]
+            ras = candidate_table["ra"].to_numpy()
+            decs = candidate_table["dec"].to_numpy()
             crds = SkyCoord(ras, decs, unit=u.deg)
             query_names = np.array([f"q{x}" for x in np.arange(len(ras))])
 
@@ -68,18 +92,24 @@ class XMatch(BaseSourceProcessor):
                         dtype=catalog.column_dtypes[colname],
                     )
 
+            query_inds, result_inds, results = self.flatten_query_results(
+                query_results, query_names
+            )
+
             # Add column for number of matches
             nmatch_colname = f"nmtch{self.catalog.abbreviation}"
-            candidate_table[nmatch_colname] = 0
-
-            for query_ind, query_name in enumerate(query_names):
-                results = query_results[query_name]
-                for result_ind, result in enumerate(results):
-                    for key in result.keys():
-                        colname = catalog.column_names[key] + f"{result_ind + 1}"
-                        candidate_table.at[query_ind, colname] = result[key]
-
-                candidate_table.at[query_ind, nmatch_colname] = len(results)
+            n_matches = np.bincount(query_inds, minlength=len(candidate_table))
+            candidate_table[nmatch_colname] = n_matches
+
+            # Write each catalog column for all candidates at once
+            result_table = pd.DataFrame.from_records(results)
+            for key in result_table.columns:
+                for num in range(int(np.max(result_inds, initial=-1)) + 1):
+                    mask = (result_inds == num) & result_table[key].notna().to_numpy()
+                    colname = catalog.column_names[key] + f"{num + 1}"
+                    candidate_table.loc[
+                        candidate_table.index[query_inds[mask]], colname
+                    ] = result_table[key].to_numpy()[mask]
 
             # Calculate distances between query and result and add to table
             for num in range(self.catalog.num_sources):
@@ -1,205 +1,516 @@
-"""
-Core ZOGY algorithm implementation in Python.
-############################################################
-# Python implementation of ZOGY image subtraction algorithm
-# See Zackay, Ofek, and Gal-Yam 2016 for details
-# http://arxiv.org/abs/1601.02655
-# SBC - 6 July 2016
-# FJM - 20 October 2016
-# SBC - 28 July 2017
-# RDS - 30 October 2022
-############################################################
-"""
-
-import logging
-
-import numpy as np
-import pyfftw
-import pyfftw.interfaces.numpy_fft as fft
-from astropy.stats import sigma_clipped_stats
-
-logger = logging.getLogger(__name__)
-
-pyfftw.interfaces.cache.enable()
-pyfftw.interfaces.cache.set_keepalive_time(1.0)
-
-
-def pyzogy(
-    new_data: np.ndarray,
-    ref_data: np.ndarray,
-    new_psf: np.ndarray,
-    ref_psf: np.ndarray,
-    new_sigma: np.ndarray,
-    ref_sigma: np.ndarray,
-    new_avg_unc: float,
-    ref_avg_unc: float,
-    dx: float = 0.25,
-    dy: float = 0.25,
-) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-    """
-    Python implementation of ZOGY image subtraction algorithm.
-    As per Frank's instructions, will assume images have been aligned,
-    background subtracted, and gain-matched.
-
-    Arguments:
-    :param new_data: New image
-    :param ref_data: Reference image
-    :param new_psf: PSF of New image
-    :param ref_psf: PSF or Reference image
-    :param new_sigma: 2D Uncertainty (sigma) of New image
-    :param ref_sigma: 2D Uncertainty (sigma) of Reference image
-    :param new_avg_unc: Average uncertainty (sigma) of New image
-    :param ref_avg_unc: Average uncertainty (sigma) of Reference image
-    :param dx: Astrometric uncertainty (sigma) in x coordinate
-    :param dy: Astrometric uncertainty (sigma) in y coordinate
-
-    Returns:
-    diff: Subtracted image
-    diff_psf: PSF of subtracted image
-    s_corr: Corrected subtracted image
-    """
-
-    # Make sure the new and ref images have even dimensions, otherwise a shift is
-    # introduced between the subtraction and scorr images
-    assert new_data.shape[0] % 2 == 0, "New image has odd number of rows"
-    assert new_data.shape[1] % 2 == 0, "New image has odd number of columns"
-    assert ref_data.shape[0] % 2 == 0, "Ref image has odd number of rows"
-    assert ref_data.shape[1] % 2 == 0, "Ref image has odd number of columns"
-
-    # Set nans to zero in new and ref images
-    new_nanmask = np.isnan(new_data)
-    ref_nanmask = np.isnan(ref_data)
-
-    new_data[new_nanmask] = np.nanmedian(new_data)
-    ref_data[ref_nanmask] = np.nanmedian(ref_data)
-
-    logger.debug(f"Number of nans is  {np.sum(new_nanmask)}")
-
-    logger.debug(
-        f"Max of small PSF is "
-        f"{np.unravel_index(np.argmax(new_psf, axis=None), new_psf.shape)}"
-    )
-
-    # Match the backgrounds of the new and reference images
-    _, sci_median, _ = sigma_clipped_stats(new_data, sigma=3.0, maxiters=5)
-    _, ref_median, _ = sigma_clipped_stats(ref_data, sigma=3.0, maxiters=5)
-
-    new_data = new_data - sci_median + ref_median
-
-    # Place PSF at center of image with same size as new / reference
-    new_psf_big = np.zeros(new_data.shape)
-    ref_psf_big = np.zeros(ref_data.shape)
-
-    y_min = new_data.shape[0] // 2 - new_psf.shape[0] // 2
-    y_max = new_data.shape[0] // 2 + new_psf.shape[0] // 2 + 1
-    x_min = new_data.shape[1] // 2 - new_psf.shape[1] // 2
-    x_max = new_data.shape[1] // 2 + new_psf.shape[1] // 2 + 1
-
-    new_psf_big[y_min:y_max, x_min:x_max] = new_psf
-    ref_psf_big[y_min:y_max, x_min:x_max] = ref_psf
-
-    logger.debug(
-        f"Max of big PSF is "
-        f"{np.unravel_index(np.argmax(new_psf_big, axis=None), new_psf_big.shape)}"
-    )
-
-    # Shift the PSF to the origin, so that it will not introduce a shift
-    new_psf_big = fft.fftshift(new_psf_big)
-    ref_psf_big = fft.fftshift(ref_psf_big)
-
-    logger.debug(
-        f"Max of big PSF shift is "
-        f"{np.unravel_index(np.argmax(new_psf_big, axis=None), new_psf_big.shape)}"
-        f"PSF shape {new_data.shape} and ref data shape {ref_data.shape}"
-    )
-
-    # Take all the Fourier Transforms
-    new_hat = fft.fft2(new_data)
-    ref_hat = fft.fft2(ref_data)
-
-    new_psf_hat = fft.fft2(new_psf_big)
-    ref_psf_hat = fft.fft2(ref_psf_big)
-
-    # Fourier Transform of Difference Image (Equation 13)
-    diff_hat_numerator = ref_psf_hat * new_hat - new_psf_hat * ref_hat
-    diff_hat_denominator = np.sqrt(
-        new_avg_unc**2 * np.abs(ref_psf_hat**2)
-        + ref_avg_unc**2 * np.abs(new_psf_hat**2)
-    )
-    diff_hat = diff_hat_numerator / diff_hat_denominator
-    # Flux-based zero point (Equation 15)
-    flux_zero_point = 1.0 / np.sqrt(new_avg_unc**2 + ref_avg_unc**2)
-    logger.debug(f"Calculated flux_zero_point {flux_zero_point} ")
-
-    # Difference Image
-    diff = np.real(fft.ifft2(diff_hat)) / flux_zero_point
-    # Fourier Transform of PSF of Subtraction Image (Equation 14)
-    diff_hat_psf = ref_psf_hat * new_psf_hat / flux_zero_point / diff_hat_denominator
-
-    # PSF of Subtraction Image
-    diff_psf = np.real(fft.ifft2(diff_hat_psf))
-    diff_psf = fft.ifftshift(diff_psf)
-    diff_psf = diff_psf[y_min:y_max, x_min:x_max]
-    logger.debug(
-        f"Max of diff PSF is "
-        f"{np.unravel_index(np.argmax(diff_psf, axis=None), diff_psf.shape)}"
-        f"PSF data shape is {new_data.shape}"
-        f"and ref data shape {ref_data.shape}"
-    )
-
-    # Fourier Transform of Score Image (Equation 17)
-    score_hat = flux_zero_point * diff_hat * np.conj(diff_hat_psf)
-
-    # Score Image
-    score = np.real(fft.ifft2(score_hat))
-
-    # Now start calculating Scorr matrix (including all noise terms)
-
-    # Start out with source noise
-    new_sigma[new_nanmask] = 0.0
-    ref_sigma[ref_nanmask] = 0.0
-    # Sigma to variance
-    new_variance = new_sigma**2
-    ref_variance = ref_sigma**2
-
-    # Fourier Transform of variance images
-    new_variance_hat = fft.fft2(new_variance)
-    ref_variance_hat = fft.fft2(ref_variance)
-
-    # Equation 28
-    k_r_hat = np.conj(ref_psf_hat) * np.abs(new_psf_hat**2) / (diff_hat_denominator**2)
-    k_r = np.real(fft.ifft2(k_r_hat))
-
-    # Equation 29
-    k_n_hat = np.conj(new_psf_hat) * np.abs(ref_psf_hat**2) / (diff_hat_denominator**2)
-    k_n = np.real(fft.ifft2(k_n_hat))
-
-    # Noise in New Image: Equation 26
-    new_noise = np.real(fft.ifft2(new_variance_hat * fft.fft2(k_n**2)))
-    # Noise in Reference Image: Equation 27
-    ref_noise = np.real(fft.ifft2(ref_variance_hat * fft.fft2(k_r**2)))
-    # Astrometric Noise
-    # Equation 31
-    new_sigma = np.real(fft.ifft2(k_n_hat * new_hat))
-    dsn_dx = new_sigma - np.roll(new_sigma, 1, axis=1)
-    dsn_dy = new_sigma - np.roll(new_sigma, 1, axis=0)
-
-    # Equation 30
-    v_ast_s_n = dx**2 * dsn_dx**2 + dy**2 * dsn_dy**2
-
-    # Equation 33
-    ref_sigma = np.real(fft.ifft2(k_r_hat * ref_hat))
-    dsr_dx = ref_sigma - np.roll(ref_sigma, 1, axis=1)
-    dsr_dy = ref_sigma - np.roll(ref_sigma, 1, axis=0)
-
-    # Equation 32
-    v_ast_s_r = dx**2 * dsr_dx**2 + dy**2 * dsr_dy**2
-
-    # Calculate Scorr
-    s_corr = score / np.sqrt(new_noise + ref_noise + v_ast_s_n + v_ast_s_r)
-
-    # Set back nans before returning
-    diff[new_nanmask | ref_nanmask] = np.nan
-    s_corr[new_nanmask | ref_nanmask] = np.nan
-
-    return diff, diff_psf, s_corr
+"""
+Core ZOGY algorithm implementation in Python.
+############################################################
+# Python implementation of ZOGY image subtraction algorithm
+# See Zackay, Ofek, and Gal-Yam 2016 for details
+# http://arxiv.org/abs/1601.02655
+# SBC - 6 July 2016
+# FJM - 20 October 2016
+# SBC - 28 July 2017
+# RDS - 30 October 2022
+############################################################
+
+All images are real, so every Fourier transform is Hermitian, and only half of
+each transform is computed (with real-input FFTs). Transforms can be computed in
+float32 or float64. Float32 halves the memory, but the difference image loses
+precision at frequencies where the PSF transforms are small, so float64 is the
+default.
+
+FFTW plans are built once per thread for each shape and dtype, and reused for
+every subsequent subtraction. FFTW wisdom is shared between threads, and can be
+saved between runs by setting FFTW_WISDOM_PATH. The planner effort can be set
+with ZOGY_FFTW_PLANNER_EFFORT (default FFTW_ESTIMATE, for which wisdom is not
+needed).
+
+When one reference is subtracted from many science images, the transform of the
+reference PSF is kept in a small registry, keyed on the content of the PSF, and
+reused. The reference image itself is masked and rescaled for each science
+image, so its transforms are recomputed every time.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pyfftw
+from astropy.stats import sigma_clipped_stats
+
+from mirar.processors.master_registry import MasterRegistry
+
+logger = logging.getLogger(__name__)
+
+FFTW_WISDOM_PATH = os.getenv("FFTW_WISDOM_PATH")
+ZOGY_FFTW_PLANNER_EFFORT = os.getenv("ZOGY_FFTW_PLANNER_EFFORT", "FFTW_ESTIMATE")
+
+# Number of reference PSFs whose transforms are kept in memory
+ZOGY_REFERENCE_CACHE_SIZE = 2
+
+
+class ZogyFFT:
+    """
+    Real-input 2D FFTs with reusable FFTW plans.
+    Plans are not thread-safe, so each thread builds its own plans.
+
+    :param planner_effort: FFTW planner effort
+    :param threads: number of threads used by FFTW for each transform
+    """
+
+    def __init__(
+        self,
+        planner_effort: str = ZOGY_FFTW_PLANNER_EFFORT,
+        threads: int = 1,
+    ):
+        self.planner_effort = planner_effort
+        self.threads = threads
+        self._local = threading.local()
+
+    def get_plan(self, inverse: bool, shape: tuple[int, int], dtype: np.dtype):
+        """
+        Get the plan for a transform of an image, building it if needed
+
+        :param inverse: whether the transform is inverse (complex to real)
+        :param shape: shape of the (real) image
+        :param dtype: real dtype
+        :return: FFTW plan
+        """
+        dtype = np.dtype(dtype)
+        plans = getattr(self._local, "plans", None)
+        if plans is None:
+            plans = self._local.plans = {}
+
+        key = (inverse, tuple(shape), dtype.name)
+        if key not in plans:
+            logger.debug(f"Building FFTW plan for {key}")
+            if inverse:
+                half_shape = (shape[0], shape[1] // 2 + 1)
+                plans[key] = pyfftw.builders.irfft2(
+                    pyfftw.empty_aligned(half_shape, dtype=complex_dtype(dtype)),
+                    s=shape,
+                    planner_effort=self.planner_effort,
+                    threads=self.threads,
+                )
+            else:
+                plans[key] = pyfftw.builders.rfft2(
+                    pyfftw.empty_aligned(shape, dtype=dtype),
+                    planner_effort=self.planner_effort,
+                    threads=self.threads,
+                )
+            record_new_wisdom()
+        return plans[key]
+
+    def rfft2(self, data: np.ndarray) -> np.ndarray:
+        """
+        Real-input 2D FFT
+
+        :param data: real image
+        :return: half of the Fourier transform
+        """
+        plan = self.get_plan(False, data.shape, data.dtype)
+        plan.input_array[...] = data
+        return plan().copy()
+
+    def irfft2(
+        self, data_hat: np.ndarray, shape: tuple[int, int], dtype: np.dtype
+    ) -> np.ndarray:
+        """
+        Inverse of :meth:`rfft2`
+
+        :param data_hat: half of a Hermitian Fourier transform
+        :param shape: shape of the real image
+        :param dtype: real dtype
+        :return: real image
+        """
+        plan = self.get_plan(True, shape, dtype)
+        # The input of a complex-to-real transform is overwritten,
+        # so always copy it to the plan
+        plan.input_array[...] = data_hat
+        return plan().copy()
+
+
+def complex_dtype(dtype: np.dtype) -> np.dtype:
+    """
+    Get the complex dtype corresponding to a real dtype
+
+    :param dtype: real dtype
+    :return: complex dtype
+    """
+    return np.result_type(dtype, np.complex64)
+
+
+_wisdom_lock = threading.Lock()
+_wisdom_loaded: bool = False
+_wisdom_changed: bool = False
+
+
+def load_fftw_wisdom(path: str | Path):
+    """
+    Load FFTW wisdom from a file, if it exists
+
+    :param path: path of wisdom file
+    :return: None
+    """
+    path = Path(path)
+    if path.exists():
+        with open(path, "r", encoding="utf8") as wisdom_file:
+            wisdom = json.load(wisdom_file)
+        pyfftw.import_wisdom(tuple(x.encode() for x in wisdom))
+        logger.debug(f"Loaded FFTW wisdom from {path}")
+
+
+def save_fftw_wisdom(path: str | Path):
+    """
+    Save FFTW wisdom to a file
+
+    :param path: path of wisdom file
+    :return: None
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp_path, "w", encoding="utf8") as wisdom_file:
+        json.dump([x.decode() for x in pyfftw.export_wisdom()], wisdom_file)
+    temp_path.replace(path)
+    logger.debug(f"Saved FFTW wisdom to {path}")
+
+
+def record_new_wisdom():
+    """
+    Note that new plans (and possibly wisdom) were created,
+    so wisdom is saved on exit
+
+    :return: None
+    """
+    global _wisdom_changed  # pylint: disable=global-statement
+    _wisdom_changed = True
+
+
+def _save_wisdom_on_exit():
+    """
+    Save FFTW wisdom to FFTW_WISDOM_PATH if new plans were created
+
+    :return: None
+    """
+    if (FFTW_WISDOM_PATH is not None) & _wisdom_changed:
+        try:
+            save_fftw_wisdom(FFTW_WISDOM_PATH)
+        except OSError as err:
+            logger.warning(f"Unable to save FFTW wisdom: {err}")
+
+
+_fft: Optional[ZogyFFT] = None
+
+
+def get_zogy_fft() -> ZogyFFT:
+    """
+    Get the shared FFT engine, loading FFTW wisdom on first use
+
+    :return: FFT engine
+    """
+    global _fft, _wisdom_loaded  # pylint: disable=global-statement
+    with _wisdom_lock:
+        if not _wisdom_loaded:
+            _wisdom_loaded = True
+            if FFTW_WISDOM_PATH is not None:
+                try:
+                    load_fftw_wisdom(FFTW_WISDOM_PATH)
+                except (OSError, ValueError) as err:
+                    logger.warning(f"Unable to load FFTW wisdom: {err}")
+        if _fft is None:
+            _fft = ZogyFFT()
+        return _fft
+
+
+atexit.register(_save_wisdom_on_exit)
+
+reference_psf_registry = MasterRegistry(max_size=ZOGY_REFERENCE_CACHE_SIZE)
+
+
+def hash_arrays(*arrays: np.ndarray) -> str:
+    """
+    Get a hash of the contents, shapes and dtypes of arrays
+
+    :param arrays: arrays
+    :return: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
+
+
+def get_psf_slices(shape: tuple[int, int], psf_shape: tuple[int, int]):
+    """
+    Get the slices of an image with the PSF placed at its centre
+
+    :param shape: shape of the image
+    :param psf_shape: shape of the PSF
+    :return: y slice, x slice
+    """
+    y_min = shape[0] // 2 - psf_shape[0] // 2
+    y_max = shape[0] // 2 + psf_shape[0] // 2 + 1
+    x_min = shape[1] // 2 - psf_shape[1] // 2
+    x_max = shape[1] // 2 + psf_shape[1] // 2 + 1
+    return slice(y_min, y_max), slice(x_min, x_max)
+
+
+def get_psf_hat(
+    psf: np.ndarray, shape: tuple[int, int], dtype: np.dtype, fft: ZogyFFT
+) -> np.ndarray:
+    """
+    Get the Fourier transform of a PSF, placed in an image of a given shape
+    and shifted to the origin (so that it will not introduce a shift)
+
+    :param psf: PSF
+    :param shape: shape of the image
+    :param dtype: real dtype
+    :param fft: FFT engine
+    :return: half of the Fourier transform
+    """
+    psf_big = np.zeros(shape, dtype=dtype)
+    psf_big[get_psf_slices(shape, psf.shape)] = psf
+
+    logger.debug(
+        f"Max of big PSF is "
+        f"{np.unravel_index(np.argmax(psf_big, axis=None), psf_big.shape)}"
+    )
+
+    return fft.rfft2(np.fft.fftshift(psf_big))
+
+
+def get_reference_products(
+    ref_data: np.ndarray,
+    ref_psf: np.ndarray,
+    ref_sigma: np.ndarray,
+    dtype: np.dtype,
+    fft: ZogyFFT,
+    cache_psf: bool = True,
+) -> dict:
+    """
+    Get the reference-side products of ZOGY, which do not depend on the
+    new image. The PSF transform is reused if the reference PSF is unchanged.
+
+    :param ref_data: Reference image (with nans)
+    :param ref_psf: PSF of Reference image
+    :param ref_sigma: 2D Uncertainty (sigma) of Reference image
+    :param dtype: real dtype of the transforms
+    :param fft: FFT engine
+    :param cache_psf: whether to keep the PSF transform in the registry
+    :return: dictionary of products
+    """
+    shape = ref_data.shape
+
+    def get_psf_hat_product():
+        return get_psf_hat(ref_psf, shape, dtype, fft)
+
+    if cache_psf:
+        psf_key = (hash_arrays(ref_psf), shape, np.dtype(dtype).name)
+        ref_psf_hat = reference_psf_registry.get_or_create(psf_key, get_psf_hat_product)
+    else:
+        ref_psf_hat = get_psf_hat_product()
+
+    ref_nanmask = np.isnan(ref_data)
+    ref_fill = np.nanmedian(ref_data)
+
+    ref_filled = np.where(ref_nanmask, ref_fill, ref_data).astype(dtype)
+    _, ref_median, _ = sigma_clipped_stats(ref_filled, sigma=3.0, maxiters=5)
+
+    ref_variance = np.where(ref_nanmask, 0.0, ref_sigma).astype(dtype) ** 2
+
+    return {
+        "ref_psf_hat": ref_psf_hat,
+        "ref_nanmask": ref_nanmask,
+        "ref_fill": ref_fill,
+        "ref_median": ref_median,
+        "ref_hat": fft.rfft2(ref_filled),
+        "ref_variance_hat": fft.rfft2(ref_variance),
+    }
+
+
+def pyzogy(
+    new_data: np.ndarray,
+    ref_data: np.ndarray,
+    new_psf: np.ndarray,
+    ref_psf: np.ndarray,
+    new_sigma: np.ndarray,
+    ref_sigma: np.ndarray,
+    new_avg_unc: float,
+    ref_avg_unc: float,
+    dx: float = 0.25,
+    dy: float = 0.25,
+    dtype: Optional[str | np.dtype] = None,
+    cache_reference_psf: bool = True,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Python implementation of ZOGY image subtraction algorithm.
+    As per Frank's instructions, will assume images have been aligned,
+    background subtracted, and gain-matched.
+
+    Arguments:
+    :param new_data: New image
+    :param ref_data: Reference image
+    :param new_psf: PSF of New image
+    :param ref_psf: PSF or Reference image
+    :param new_sigma: 2D Uncertainty (sigma) of New image
+    :param ref_sigma: 2D Uncertainty (sigma) of Reference image
+    :param new_avg_unc: Average uncertainty (sigma) of New image
+    :param ref_avg_unc: Average uncertainty (sigma) of Reference image
+    :param dx: Astrometric uncertainty (sigma) in x coordinate
+    :param dy: Astrometric uncertainty (sigma) in y coordinate
+    :param dtype: Real dtype of the Fourier transforms (float32 or float64,
+        default float64)
+    :param cache_reference_psf: Whether to reuse the transform of the reference
+        PSF between calls
+
+    Returns:
+    diff: Subtracted image
+    diff_psf: PSF of subtracted image
+    s_corr: Corrected subtracted image
+    """
+
+    # Make sure the new and ref images have even dimensions, otherwise a shift is
+    # introduced between the subtraction and scorr images
+    assert new_data.shape[0] % 2 == 0, "New image has odd number of rows"
+    assert new_data.shape[1] % 2 == 0, "New image has odd number of columns"
+    assert ref_data.shape[0] % 2 == 0, "Ref image has odd number of rows"
+    assert ref_data.shape[1] % 2 == 0, "Ref image has odd number of columns"
+
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    shape = new_data.shape
+    fft = get_zogy_fft()
+
+    # Reference-side products, computed from the original reference arrays
+    ref = get_reference_products(
+        ref_data,
+        ref_psf,
+        ref_sigma,
+        dtype=dtype,
+        fft=fft,
+        cache_psf=cache_reference_psf,
+    )
+    ref_nanmask = ref["ref_nanmask"]
+    ref_psf_hat = ref["ref_psf_hat"]
+
+    # Set nans to the median in new and ref images
+    new_nanmask = np.isnan(new_data)
+
+    new_data[new_nanmask] = np.nanmedian(new_data)
+    ref_data[ref_nanmask] = ref["ref_fill"]
+
+    logger.debug(f"Number of nans is  {np.sum(new_nanmask)}")
+
+    logger.debug(
+        f"Max of small PSF is "
+        f"{np.unravel_index(np.argmax(new_psf, axis=None), new_psf.shape)}"
+    )
+
+    # Match the backgrounds of the new and reference images
+    _, sci_median, _ = sigma_clipped_stats(new_data, sigma=3.0, maxiters=5)
+
+    new_data = (new_data - sci_median + ref["ref_median"]).astype(dtype)
+
+    # Take all the Fourier Transforms
+    new_hat = fft.rfft2(new_data)
+    del new_data
+    new_psf_hat = get_psf_hat(new_psf, shape, dtype, fft)
+
+    # Fourier Transform of Difference Image (Equation 13)
+    diff_hat_denominator = np.sqrt(
+        new_avg_unc**2 * np.abs(ref_psf_hat) ** 2
+        + ref_avg_unc**2 * np.abs(new_psf_hat) ** 2
+    )
+    diff_hat = (
+        ref_psf_hat * new_hat - new_psf_hat * ref["ref_hat"]
+    ) / diff_hat_denominator
+    # Flux-based zero point (Equation 15)
+    flux_zero_point = 1.0 / np.sqrt(new_avg_unc**2 + ref_avg_unc**2)
+    logger.debug(f"Calculated flux_zero_point {flux_zero_point} ")
+
+    # Difference Image
+    diff = fft.irfft2(diff_hat, shape, dtype) / flux_zero_point
+    # Fourier Transform of PSF of Subtraction Image (Equation 14)
+    diff_hat_psf = ref_psf_hat * new_psf_hat / flux_zero_point / diff_hat_denominator
+
+    # PSF of Subtraction Image
+    diff_psf = np.fft.ifftshift(fft.irfft2(diff_hat_psf, shape, dtype))
+    diff_psf = diff_psf[get_psf_slices(shape, new_psf.shape)]
+    logger.debug(
+        f"Max of diff PSF is "
+        f"{np.unravel_index(np.argmax(diff_psf, axis=None), diff_psf.shape)}"
+        f"PSF data shape is {shape}"
+        f"and ref data shape {ref_data.shape}"
+    )
+
+    # Fourier Transform of Score Image (Equation 17)
+    score_hat = flux_zero_point * diff_hat * np.conj(diff_hat_psf)
+    del diff_hat, diff_hat_psf
+
+    # Score Image
+    score = fft.irfft2(score_hat, shape, dtype)
+    del score_hat
+
+    # Now start calculating Scorr matrix (including all noise terms)
+
+    # Start out with source noise
+    new_sigma[new_nanmask] = 0.0
+    ref_sigma[ref_nanmask] = 0.0
+    # Sigma to variance, and Fourier Transform of variance image
+    new_variance_hat = fft.rfft2(new_sigma.astype(dtype) ** 2)
+
+    diff_hat_variance = diff_hat_denominator**2
+    del diff_hat_denominator
+
+    # Equation 28
+    k_r_hat = np.conj(ref_psf_hat) * np.abs(new_psf_hat) ** 2 / diff_hat_variance
+    k_r = fft.irfft2(k_r_hat, shape, dtype)
+
+    # Equation 29
+    k_n_hat = np.conj(new_psf_hat) * np.abs(ref_psf_hat) ** 2 / diff_hat_variance
+    k_n = fft.irfft2(k_n_hat, shape, dtype)
+    del diff_hat_variance, new_psf_hat
+
+    # Noise in New Image: Equation 26
+    new_noise = fft.irfft2(new_variance_hat * fft.rfft2(k_n**2), shape, dtype)
+    del new_variance_hat, k_n
+    # Noise in Reference Image: Equation 27
+    ref_noise = fft.irfft2(ref["ref_variance_hat"] * fft.rfft2(k_r**2), shape, dtype)
+    del k_r
+
+    # Astrometric Noise
+    # Equation 31
+    new_sigma = fft.irfft2(k_n_hat * new_hat, shape, dtype)
+    del k_n_hat, new_hat
+    dsn_dx = new_sigma - np.roll(new_sigma, 1, axis=1)
+    dsn_dy = new_sigma - np.roll(new_sigma, 1, axis=0)
+    del new_sigma
+
+    # Equation 30
+    v_ast_s_n = dx**2 * dsn_dx**2 + dy**2 * dsn_dy**2
+    del dsn_dx, dsn_dy
+
+    # Equation 33
+    ref_sigma = fft.irfft2(k_r_hat * ref["ref_hat"], shape, dtype)
+    del k_r_hat
+    dsr_dx = ref_sigma - np.roll(ref_sigma, 1, axis=1)
+    dsr_dy = ref_sigma - np.roll(ref_sigma, 1, axis=0)
+    del ref_sigma
+
+    # Equation 32
+    v_ast_s_r = dx**2 * dsr_dx**2 + dy**2 * dsr_dy**2
+    del dsr_dx, dsr_dy
+
+    # Calculate Scorr
+    s_corr = score / np.sqrt(new_noise + ref_noise + v_ast_s_n + v_ast_s_r)
+
+    # Set back nans before returning
+    diff[new_nanmask | ref_nanmask] = np.nan
+    s_corr[new_nanmask | ref_nanmask] = np.nan
+
+    return diff, diff_psf, s_corr
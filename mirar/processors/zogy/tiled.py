@@ -0,0 +1,229 @@
+"""
+Module for running ZOGY on overlapping tiles of an image.
+
+Rather than subtracting the full frame at once, the new and reference images are
+split into overlapping tiles, and :func:`~mirar.processors.zogy.pyzogy.pyzogy` is
+run on each tile with a local PSF (e.g. evaluated from a PSFex model at the
+centre of the tile). This bounds the memory used by each subtraction, allows
+tiles to be subtracted in parallel by a pool of threads, and handles PSF
+variation across the field.
+
+The difference and Scorr images of the tiles are stitched together with
+apodized overlaps: within each overlap, the weights of the two tiles taper
+smoothly (as sin^2 and cos^2), so that pixels near the edge of a tile, which
+are affected by the periodic boundaries of the FFTs, get little weight. The PSF
+of the difference image is the weighted mean of the tile PSFs.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+
+from mirar.errors import ProcessorError
+from mirar.paths import max_n_cpu
+from mirar.processors.zogy.pyzogy import pyzogy
+
+logger = logging.getLogger(__name__)
+
+PSFProvider = np.ndarray | Callable[[float, float], np.ndarray]
+
+
+class ZOGYTilingError(ProcessorError):
+    """Error relating to tiled ZOGY"""
+
+
+def get_tile_edges(n_pixels: int, tile_size: int, overlap: int) -> list[int]:
+    """
+    Get the start of each tile along one axis. Tiles have a fixed size,
+    overlap by at least 'overlap' pixels, and the last tile ends at the
+    edge of the image.
+
+    :param n_pixels: number of pixels along the axis
+    :param tile_size: size of each tile
+    :param overlap: minimum overlap between tiles
+    :return: list of tile starts
+    """
+    if tile_size >= n_pixels:
+        return [0]
+    step = tile_size - overlap
+    starts = list(range(0, n_pixels - tile_size, step))
+    return starts + [n_pixels - tile_size]
+
+
+def get_tile_weights(starts: list[int], index: int, size: int) -> np.ndarray:
+    """
+    Get the apodization weights of a tile along one axis. Weights taper
+    across the overlap with each neighbouring tile.
+
+    :param starts: starts of all tiles along the axis
+    :param index: index of the tile
+    :param size: size of each tile (or of the image, if smaller)
+    :return: weights
+    """
+    weights = np.ones(size)
+
+    if index > 0:
+        overlap = starts[index - 1] + size - starts[index]
+        weights[:overlap] = (
+            np.sin(0.5 * np.pi * (np.arange(overlap) + 0.5) / overlap) ** 2
+        )
+
+    if index < len(starts) - 1:
+        overlap = starts[index] + size - starts[index + 1]
+        weights[-overlap:] *= (
+            np.cos(0.5 * np.pi * (np.arange(overlap) + 0.5) / overlap) ** 2
+        )
+
+    return weights
+
+
+def get_tile_psf(psf: PSFProvider, x_cent: float, y_cent: float) -> np.ndarray:
+    """
+    Get the PSF of a tile
+
+    :param psf: PSF, or function returning the PSF at an (x, y) position
+    :param x_cent: x (column) index of the tile centre
+    :param y_cent: y (row) index of the tile centre
+    :return: PSF
+    """
+    if callable(psf):
+        return psf(x_cent, y_cent)
+    return psf
+
+
+def pyzogy_tiled(
+    new_data: np.ndarray,
+    ref_data: np.ndarray,
+    new_psf: PSFProvider,
+    ref_psf: PSFProvider,
+    new_sigma: np.ndarray,
+    ref_sigma: np.ndarray,
+    new_avg_unc: float,
+    ref_avg_unc: float,
+    dx: float = 0.25,
+    dy: float = 0.25,
+    tile_size: int = 1024,
+    overlap: int = 64,
+    n_workers: int = max_n_cpu,
+    dtype: Optional[str | np.dtype] = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Run ZOGY on overlapping tiles, and stitch the outputs together
+
+    :param new_data: New image
+    :param ref_data: Reference image
+    :param new_psf: PSF of New image, or function returning it at an (x, y) position
+    :param ref_psf: PSF of Reference image, or function returning it at
+        an (x, y) position
+    :param new_sigma: 2D Uncertainty (sigma) of New image
+    :param ref_sigma: 2D Uncertainty (sigma) of Reference image
+    :param new_avg_unc: Average uncertainty (sigma) of New image
+    :param ref_avg_unc: Average uncertainty (sigma) of Reference image
+    :param dx: Astrometric uncertainty (sigma) in x coordinate
+    :param dy: Astrometric uncertainty (sigma) in y coordinate
+    :param tile_size: size of each (square) tile, which must be even
+    :param overlap: minimum overlap between tiles
+    :param n_workers: number of threads subtracting tiles
+    :param dtype: Real dtype of the Fourier transforms
+    :return: Subtracted image, PSF of subtracted image, Corrected subtracted image
+    """
+    if (tile_size % 2 != 0) or (overlap < 0) or (overlap >= tile_size):
+        err = (
+            f"Invalid tiling with tile size {tile_size} and overlap {overlap}. "
+            f"The tile size must be even, and larger than the overlap."
+        )
+        logger.error(err)
+        raise ZOGYTilingError(err)
+
+    shape = new_data.shape
+    y_starts = get_tile_edges(shape[0], tile_size, overlap)
+    x_starts = get_tile_edges(shape[1], tile_size, overlap)
+    y_size, x_size = min(tile_size, shape[0]), min(tile_size, shape[1])
+
+    logger.debug(
+        f"Running ZOGY on {len(y_starts)} x {len(x_starts)} tiles "
+        f"of {y_size} x {x_size} pixels"
+    )
+
+    diff_sum = np.zeros(shape)
+    diff_weights = np.zeros(shape)
+    scorr_sum = np.zeros(shape)
+    scorr_weights = np.zeros(shape)
+    psf_sum = None
+    psf_weight = 0.0
+    lock = threading.Lock()
+
+    def subtract_tile(tile: tuple[int, int]):
+        nonlocal psf_sum, psf_weight
+
+        y_index, x_index = tile
+        y_slice = slice(y_starts[y_index], y_starts[y_index] + y_size)
+        x_slice = slice(x_starts[x_index], x_starts[x_index] + x_size)
+
+        tile_new = new_data[y_slice, x_slice].copy()
+        tile_ref = ref_data[y_slice, x_slice].copy()
+
+        if np.all(np.isnan(tile_new)) or np.all(np.isnan(tile_ref)):
+            logger.debug(f"Skipping tile {tile}, which has no valid pixels")
+            return
+
+        x_cent = x_slice.start + 0.5 * (x_size - 1)
+        y_cent = y_slice.start + 0.5 * (y_size - 1)
+
+        diff, diff_psf, scorr = pyzogy(
+            new_data=tile_new,
+            ref_data=tile_ref,
+            new_psf=get_tile_psf(new_psf, x_cent, y_cent),
+            ref_psf=get_tile_psf(ref_psf, x_cent, y_cent),
+            new_sigma=new_sigma[y_slice, x_slice].copy(),
+            ref_sigma=ref_sigma[y_slice, x_slice].copy(),
+            new_avg_unc=new_avg_unc,
+            ref_avg_unc=ref_avg_unc,
+            dx=dx,
+            dy=dy,
+            dtype=dtype,
+            cache_reference_psf=False,
+        )
+
+        weights = np.outer(
+            get_tile_weights(y_starts, y_index, y_size),
+            get_tile_weights(x_starts, x_index, x_size),
+        )
+        diff_valid = ~np.isnan(diff)
+        scorr_valid = ~np.isnan(scorr)
+
+        with lock:
+            diff_sum[y_slice, x_slice] += np.where(diff_valid, diff * weights, 0.0)
+            diff_weights[y_slice, x_slice] += np.where(diff_valid, weights, 0.0)
+            scorr_sum[y_slice, x_slice] += np.where(scorr_valid, scorr * weights, 0.0)
+            scorr_weights[y_slice, x_slice] += np.where(scorr_valid, weights, 0.0)
+
+            tile_weight = float(np.sum(weights[diff_valid]))
+            if psf_sum is None:
+                psf_sum = np.zeros(diff_psf.shape)
+            psf_sum += diff_psf * tile_weight
+            psf_weight += tile_weight
+
+    tiles = [(y, x) for y in range(len(y_starts)) for x in range(len(x_starts))]
+
+    if (n_workers <= 1) or (len(tiles) == 1):
+        for tile in tiles:
+            subtract_tile(tile)
+    else:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # Consume the results, to raise any errors
+            list(executor.map(subtract_tile, tiles))
+
+    if psf_sum is None:
+        err = "No tiles with valid pixels to subtract"
+        logger.error(err)
+        raise ZOGYTilingError(err)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        diff = diff_sum / diff_weights
+        scorr = scorr_sum / scorr_weights
+
+    return diff, psf_sum / psf_weight, scorr
@@ -13,6 +13,7 @@ import logging
 from collections.abc import Callable
 from copy import copy
 from pathlib import Path
+from typing import Optional
 
 import astropy.table
 import astropy.units as u
@@ -31,6 +32,7 @@ from mirar.paths import (
     MAGLIM_KEY,
     NORM_PSFEX_KEY,
     OBSCLASS_KEY,
+    PSFEX_CAT_KEY,
     RAW_IMG_KEY,
     REF_IMG_KEY,
     RMS_COUNTS_KEY,
@@ -43,9 +45,12 @@ from mirar.paths import (
     UNC_IMG_KEY,
     core_fields,
     get_output_dir,
+    max_n_cpu,
 )
+from mirar.processors.astromatic.psfex.psfex import PSFexModel
 from mirar.processors.base_processor import BaseImageProcessor, PrerequisiteError
 from mirar.processors.zogy.pyzogy import pyzogy
+from mirar.processors.zogy.tiled import PSFProvider, pyzogy_tiled
 from mirar.utils.ldac_tools import get_table_from_ldac
 
 logger = logging.getLogger(__name__)
@@ -432,6 +437,11 @@ class ZOGY(ZOGYPrepare):
     :class:`mirar.processors.base_processor.BaseProcessor` class to run
     the ZOGY algorithm using the
     :func:mirar.processors.zogy.pyzogy.pyzogy` function.
+
+    If tile_size is set, images are instead subtracted in overlapping tiles
+    (see :func:`mirar.processors.zogy.tiled.pyzogy_tiled`), using n_tile_workers
+    threads. Each tile then uses the PSF from the PSFex model of each image
+    at the centre of the tile, if the model is available.
     """
 
     base_key = "ZOGY"
@@ -442,11 +452,42 @@ class ZOGY(ZOGYPrepare):
         *args,
         output_sub_dir: str = "sub",
         sci_zp_header_key: str = "ZP",
+        fft_dtype: str = "float64",
+        tile_size: Optional[int] = None,
+        tile_overlap: int = 64,
+        n_tile_workers: Optional[int] = None,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
         self.output_sub_dir = output_sub_dir
         self.sci_zp_header_key = sci_zp_header_key
+        self.fft_dtype = fft_dtype
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        # ZOGY processes one image at a time, so tiles use all the CPUs by default
+        self.n_tile_workers = (
+            n_tile_workers if n_tile_workers is not None else max_n_cpu
+        )
+
+    def get_psf_provider(self, image: Image, norm_psf: np.ndarray) -> PSFProvider:
+        """
+        Get the PSF of an image for tiled subtraction: a function returning the
+        PSF at a position if the image has a PSFex model, or else the
+        normalised PSF
+
+        :param image: image
+        :param norm_psf: normalised PSF
+        :return: PSF, or function returning the PSF at an (x, y) position
+        """
+        if PSFEX_CAT_KEY in image.keys():
+            psf_model_path = self.get_path(image[PSFEX_CAT_KEY])
+            if psf_model_path.exists():
+                psf_model = PSFexModel(psf_model_path)
+                # PSFex uses FITS pixel coordinates
+                return lambda x, y: psf_model.get_psf(x + 1.0, y + 1.0)
+
+        logger.debug(f"No PSFex model for {image[BASE_NAME_KEY]}, using a fixed PSF")
+        return norm_psf
 
     def _apply_to_images(
         self,
@@ -487,18 +528,37 @@ class ZOGY(ZOGYPrepare):
             with fits.open(ref_rms_path, memmap=False) as ref_sigma_f:
                 ref_sigma = ref_sigma_f[0].data  # pylint: disable=no-member
 
-            diff_data, diff_psf_data, scorr_data = pyzogy(
-                new_data=image.get_data(),
-                ref_data=ref_image.get_data(),
-                new_psf=new_psf,
-                ref_psf=ref_psf,
-                new_sigma=new_sigma,
-                ref_sigma=ref_sigma,
-                new_avg_unc=sci_rms,
-                ref_avg_unc=ref_rms,
-                dx=ast_unc_x,
-                dy=ast_unc_y,
-            )
+            if self.tile_size is None:
+                diff_data, diff_psf_data, scorr_data = pyzogy(
+                    new_data=image.get_data(),
+                    ref_data=ref_image.get_data(),
+                    new_psf=new_psf,
+                    ref_psf=ref_psf,
+                    new_sigma=new_sigma,
+                    ref_sigma=ref_sigma,
+                    new_avg_unc=sci_rms,
+                    ref_avg_unc=ref_rms,
+                    dx=ast_unc_x,
+                    dy=ast_unc_y,
+                    dtype=self.fft_dtype,
+                )
+            else:
+                diff_data, diff_psf_data, scorr_data = pyzogy_tiled(
+                    new_data=image.get_data(),
+                    ref_data=ref_image.get_data(),
+                    new_psf=self.get_psf_provider(image, new_psf),
+                    ref_psf=self.get_psf_provider(ref_image, ref_psf),
+                    new_sigma=new_sigma,
+                    ref_sigma=ref_sigma,
+                    new_avg_unc=sci_rms,
+                    ref_avg_unc=ref_rms,
+                    dx=ast_unc_x,
+                    dy=ast_unc_y,
+                    tile_size=self.tile_size,
+                    overlap=self.tile_overlap,
+                    n_workers=self.n_tile_workers,
+                    dtype=self.fft_dtype,
+                )
 
             sci_image_path = self.get_path(image[BASE_NAME_KEY])
             diff_image_path = Path(sci_image_path).with_suffix(".diff.fits")
@@ -0,0 +1,405 @@
+"""
+Module for running commands in a pool of long-lived Docker containers.
+
+Rather than starting a new container for every command (and copying files in and
+out as tar archives), a pool of warm containers is kept running. Each container
+bind-mounts a shared work directory. For every command, a fresh subdirectory of
+the work directory is created, the input files are hard-linked into it (or copied,
+if the work directory is on another filesystem), and any new files are moved to
+the output directory afterwards. As inputs are hard-linked, commands should write
+new files rather than modifying their inputs in place.
+
+Up to DOCKER_POOL_SIZE commands (default MAX_N_CPU) run concurrently. Containers
+are health-checked before use, and are replaced if they have stopped, if running
+a command raised an error, or after DOCKER_MAX_USES commands.
+
+The containers are created by a runner factory. The default factory uses Docker,
+while :class:`LocalContainerRunner` runs commands on the local machine instead,
+which is useful for testing without a Docker daemon.
+"""
+
+import atexit
+import errno
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+from uuid import uuid4
+
+from docker.errors import DockerException
+
+from mirar.paths import max_n_cpu
+from mirar.utils.dockerutil import docker_dir, new_container, prepare_docker_command
+
+logger = logging.getLogger(__name__)
+
+DOCKER_POOL_SIZE = int(os.getenv("DOCKER_POOL_SIZE", str(max_n_cpu)))
+DOCKER_MAX_USES = int(os.getenv("DOCKER_MAX_USES", "200"))
+DOCKER_WORK_DIR = os.getenv("DOCKER_WORK_DIR")
+
+
+def link_or_copy(source: Path, destination: Path):
+    """
+    Hard-link a file to a new path, or copy it if a link is not possible
+    (e.g. across filesystems)
+
+    :param source: existing file
+    :param destination: new path
+    :return: None
+    """
+    try:
+        os.link(source, destination)
+    except OSError as exc:
+        if exc.errno not in (errno.EXDEV, errno.EPERM):
+            raise
+        shutil.copyfile(source, destination)
+
+
+class BaseContainerRunner(ABC):
+    """
+    Base class for a long-lived container, which runs commands in a
+    bind-mounted work directory
+    """
+
+    def __init__(self, work_root: Path, container_root: Path = docker_dir):
+        self.work_root = Path(work_root)
+        self.container_root = container_root
+        self.n_uses = 0
+
+    @abstractmethod
+    def exec_run(self, cmd: str, workdir: Path) -> tuple[int, str]:
+        """
+        Run a command in the container
+
+        :param cmd: command
+        :param workdir: work directory in the container
+        :return: exit code and output
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_healthy(self) -> bool:
+        """
+        Check whether the container can run commands
+
+        :return: boolean
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stop(self):
+        """
+        Stop and remove the container
+
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class DockerContainerRunner(BaseContainerRunner):
+    """
+    A warm Docker container, with the work directory bind-mounted
+    """
+
+    def __init__(self, work_root: Path, container_root: Path = docker_dir):
+        super().__init__(work_root=work_root, container_root=container_root)
+        self.container = new_container(
+            volumes={
+                str(self.work_root): {"bind": container_root.as_posix(), "mode": "rw"}
+            }
+        )
+
+    def exec_run(self, cmd: str, workdir: Path) -> tuple[int, str]:
+        # Run as the local user, so output files can be moved and deleted
+        user = f"{os.getuid()}:{os.getgid()}" if hasattr(os, "getuid") else ""
+        log = self.container.exec_run(
+            cmd, stderr=True, stdout=True, workdir=workdir.as_posix(), user=user
+        )
+        return log.exit_code, log.output.decode()
+
+    def is_healthy(self) -> bool:
+        try:
+            self.container.reload()
+        except DockerException:
+            return False
+        return self.container.status == "running"
+
+    def stop(self):
+        try:
+            self.container.kill()
+            self.container.remove()
+        except DockerException as err:
+            logger.warning(f"Unable to remove container {self.container.id}: {err}")
+
+
+class LocalContainerRunner(BaseContainerRunner):
+    """
+    Fake container, which runs commands on the local machine
+    with container paths mapped to the work directory
+    """
+
+    def __init__(self, work_root: Path, container_root: Path = docker_dir):
+        super().__init__(work_root=work_root, container_root=container_root)
+        self.stopped = False
+
+    def to_local(self, value: str | Path) -> str:
+        """
+        Convert container paths to local paths
+
+        :param value: string or path containing container paths
+        :return: string with local paths
+        """
+        return str(value).replace(
+            self.container_root.as_posix(), self.work_root.as_posix()
+        )
+
+    def exec_run(self, cmd: str, workdir: Path) -> tuple[int, str]:
+        rval = subprocess.run(
+            self.to_local(cmd),
+            shell=True,
+            cwd=self.to_local(workdir),
+            capture_output=True,
+            check=False,
+        )
+        return rval.returncode, rval.stdout.decode() + rval.stderr.decode()
+
+    def is_healthy(self) -> bool:
+        return not self.stopped
+
+    def stop(self):
+        self.stopped = True
+
+
+class DockerWorkerPool:
+    """
+    Thread-safe pool of long-lived containers
+
+    :param size: maximum number of containers (and concurrent commands)
+    :param work_root: shared work directory (default: a new temporary directory)
+    :param runner_factory: function to create a container from the work directory
+    :param max_uses: number of commands after which a container is replaced
+    """
+
+    def __init__(
+        self,
+        size: int = DOCKER_POOL_SIZE,
+        work_root: Optional[str | Path] = DOCKER_WORK_DIR,
+        runner_factory: Callable[[Path], BaseContainerRunner] = DockerContainerRunner,
+        max_uses: int = DOCKER_MAX_USES,
+    ):
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.runner_factory = runner_factory
+
+        self._own_work_root = work_root is None
+        if work_root is None:
+            work_root = tempfile.mkdtemp(prefix="mirar_docker_")
+        self.work_root = Path(work_root)
+        self.work_root.mkdir(parents=True, exist_ok=True)
+
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle: list[BaseContainerRunner] = []
+        self._closed = False
+
+    def _discard(self, runner: BaseContainerRunner):
+        """
+        Stop a container, ignoring any errors
+
+        :param runner: container runner
+        :return: None
+        """
+        try:
+            runner.stop()
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.warning(f"Error stopping container: {err}")
+
+    def _acquire(self) -> BaseContainerRunner:
+        """
+        Get a healthy container, creating a new one if needed
+
+        :return: container runner
+        """
+        self._slots.acquire()  # pylint: disable=consider-using-with
+        try:
+            with self._lock:
+                runner = self._idle.pop() if len(self._idle) > 0 else None
+
+            if runner is not None and (
+                (runner.n_uses >= self.max_uses) or not runner.is_healthy()
+            ):
+                logger.debug("Recycling container")
+                self._discard(runner)
+                runner = None
+
+            if runner is None:
+                logger.debug("Starting new container")
+                runner = self.runner_factory(self.work_root)
+
+            return runner
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, runner: BaseContainerRunner, healthy: bool):
+        """
+        Return a container to the pool
+
+        :param runner: container runner
+        :param healthy: whether the container can be reused
+        :return: None
+        """
+        runner.n_uses += 1
+        with self._lock:
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append(runner)
+        if not keep:
+            self._discard(runner)
+        self._slots.release()
+
+    @contextmanager
+    def worker(self) -> Iterator[BaseContainerRunner]:
+        """
+        Context manager to borrow a container from the pool.
+        Containers raising errors are replaced.
+
+        :return: container runner
+        """
+        runner = self._acquire()
+        healthy = True
+        try:
+            yield runner
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            self._release(runner, healthy)
+
+    def run(self, cmd: str, output_dir: Path | str = "."):
+        """
+        Run a command in a container. Input files are linked into a new
+        subdirectory of the work directory, and any new files are moved to
+        'output_dir' afterwards.
+
+        :param cmd: command
+        :param output_dir: A local directory to save the output files to.
+        :return: None
+        """
+        call_id = uuid4().hex
+        local_dir = self.work_root.joinpath(call_id)
+        container_dir = docker_dir.joinpath(call_id)
+        local_dir.mkdir()
+
+        # Output paths are only recognised if their directory exists
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        try:
+            new_cmd, copy_list = prepare_docker_command(
+                cmd, work_dir=local_dir, container_dir=container_dir
+            )
+
+            logger.debug(f"Linking {copy_list} into work directory {local_dir}")
+            for path in copy_list:
+                link_or_copy(path, local_dir.joinpath(path.name))
+
+            ignore_files = set(os.listdir(local_dir))
+
+            with self.worker() as runner:
+                exit_code, output = runner.exec_run(new_cmd, workdir=container_dir)
+
+            if not output == "":
+                logger.info(f"Output: {output}")
+
+            if not exit_code == 0:
+                err = (
+                    f"Error running command: \n '{new_cmd}'\n "
+                    f"which resulted in returncode '{exit_code}' and"
+                    f"the following error message: \n '{output}'"
+                )
+                logger.error(err)
+                raise subprocess.CalledProcessError(
+                    returncode=exit_code, cmd=new_cmd, stderr=output
+                )
+
+            # Move out any files which did not exist before running the command
+
+            for output_file in sorted(set(os.listdir(local_dir)) - ignore_files):
+                output_path = output_dir.joinpath(output_file)
+                shutil.move(local_dir.joinpath(output_file), output_path)
+                logger.debug(f"Saved to {output_path}")
+
+        finally:
+            shutil.rmtree(local_dir, ignore_errors=True)
+
+    def close(self):
+        """
+        Stop all idle containers, and remove the work directory if it was
+        created by the pool. Busy containers are stopped when released.
+
+        :return: None
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+
+        for runner in idle:
+            self._discard(runner)
+
+        if self._own_work_root:
+            shutil.rmtree(self.work_root, ignore_errors=True)
+
+
+_pool: Optional[DockerWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_docker_pool() -> DockerWorkerPool:
+    """
+    Get the (shared) docker worker pool of this process, creating it if needed
+
+    :return: docker worker pool
+    """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None:
+            _pool = DockerWorkerPool()
+        return _pool
+
+
+def close_docker_pool():
+    """
+    Close the shared docker worker pool, if it exists
+
+    :return: None
+    """
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def _reset_pool_after_fork():
+    """
+    Forget the pool inherited from a parent process, without stopping
+    the parent's containers
+
+    :return: None
+    """
+    global _pool, _pool_lock  # pylint: disable=global-statement
+    _pool_lock = threading.Lock()
+    _pool = None
+
+
+atexit.register(close_docker_pool)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
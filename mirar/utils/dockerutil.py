@@ -2,15 +2,12 @@
 Module containing docker integration (beta-stage)
 """
 
-import io
 import logging
 import os
-import tarfile
 from pathlib import Path
 
 import docker
 from docker.errors import DockerException
-from docker.models.containers import Container
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +15,7 @@ DOCKER_IMAGE_NAME = "robertdstein/astrodocker"
 docker_dir = Path("/usr/src/astrodocker")
 
 
-def new_container():
+def new_container(volumes: dict | None = None):
     """Generate a new docker.models.containers.Container object, using the default
     docker daemon and the docker image.
     If the image is not found locally,
@@ -26,6 +23,10 @@ def new_container():
 
     This function requires a Docker daemon to first be running.
 
+    Parameters
+    ----------
+    volumes: Optional volumes to bind-mount, in the docker-py format
+
     Returns
     -------
     A docker container built with the {DOCKER_IMAGE_NAME} image
@@ -45,145 +46,111 @@ def new_container():
         logger.info(f"Pulling docker image {DOCKER_IMAGE_NAME}")
         client.images.pull(DOCKER_IMAGE_NAME)
 
-    return client.containers.run(DOCKER_IMAGE_NAME, tty=True, detach=True)
+    return client.containers.run(
+        DOCKER_IMAGE_NAME, tty=True, detach=True, volumes=volumes
+    )
 
 
-def docker_path(file_path: str | Path) -> Path:
+def docker_path(file_path: str | Path, container_dir: Path = docker_dir) -> Path:
     """
     Converts a local path to the corresponding path in the docker container
 
     :param file_path: file path
+    :param container_dir: work directory in the container
     :return:
     """
-    return docker_dir.joinpath(Path(file_path).name)
-
+    return container_dir.joinpath(Path(file_path).name)
 
-def docker_get(container: Container, local_path: str | Path):
-    """Function to cope one file from the Docker container 'container' to 'local_path'.
-    The file in the container should have
-    the same name as the base file in 'local_path'.
 
-    Parameters
-    ----------
-    container: A docker.models.container.Container object
-    local_path: Local path of file to copy to
-
-    Returns
-    -------
-    """
-
-    container_path = docker_path(local_path)
-
-    with open(local_path, "wb") as local_file:
-        bits, _ = container.get_archive(container_path.as_posix())
-        for chunk in bits:
-            local_file.write(chunk)
-
-
-def docker_put(container: Container, local_path: str | Path):
-    """Function to one file, at 'local_path' into the Docker container 'container'
-
-    Parameters
-    ----------
-    container: A docker.models.container.Container object
-    local_path: Local path of file to copy
-
-    Returns
-    -------
+def prepare_docker_command(
+    cmd: str, work_dir: Path, container_dir: Path = docker_dir
+) -> tuple[str, list[Path]]:
     """
-    stream = io.BytesIO()
-
-    with tarfile.open(fileobj=stream, mode="w|") as tar, open(
-        local_path, "rb"
-    ) as local_file:
-        info = tar.gettarinfo(fileobj=local_file)
-        info.name = os.path.basename(local_path)
-        tar.addfile(info, local_file)
-
-    return container.put_archive(docker_dir.as_posix(), stream.getvalue())
-
-
-def docker_batch_put(container: Container, local_paths: str | list):
-    """Function to copy multiple files into a Docker container
-
-    Parameters
-    ----------
-    container: A docker.models.container.Container object
-    local_paths: Local paths of each file to copy
-
-    Returns
-    -------
-    Returns a list of files in the docker container after the copying is done
+    Rewrite a command to run in a container, with every file moved to a single
+    work directory. Files listed in configuration files (-c) or files of files (@)
+    are rewritten too, into temporary copies in 'work_dir'.
+
+    :param cmd: command to run
+    :param work_dir: local work directory, for temporary files
+    :param container_dir: corresponding work directory in the container
+    :return: rewritten command, and list of local files needed in the work directory
     """
+    split = cmd.split(" -")
 
-    if isinstance(local_paths, str):
-        local_paths = [local_paths]
+    # Reorganise the commands so that each '-x' argument is grouped together
+    # Basically still work even if someone puts the filename in a weird place
 
-    for local_path in local_paths:
-        docker_put(container, local_path)
+    sorted_split = []
 
-    return (
-        container.exec_run("ls", stderr=True, stdout=True).output.decode().split("\n")
-    )
+    for arg in split:
+        sep = arg.split(" ")
+        sorted_split.append(" ".join(sep[:2]))
+        if len(sep) > 2:
+            sorted_split[0] += " " + " ".join(sep[2:])
 
+    new_split = []
 
-def docker_get_new_files(
-    container: Container, output_dir: str | Path, ignore_files: list[str | Path]
-):
-    """
-    Function to copy new files out of a container.
-    All files in the work directory of 'container'
-    will be copied out to 'output_dir',
-    unless they appear in the 'ignore_files' list.
-
-    The normal procedure is to run this in tandem with docker_batch_put(),
-    so that only new files
-    are copied out of the container. For example:
-
-        ignore_files = docker_batch_put(
-            container=container,
-            local_paths=list_of_files_to_copy_into_container
-        )
+    # Loop over the command, and
+    # copy everything that looks like a file into container
+    # Go through everything that looks like a file with paths in it after
 
-        container.exec_run(some_docker_command)
+    copy_list = []
+    files_of_files = []
 
-        docker_get_new_files(
-            container=container,
-            output_dir=output_dir,
-            ignore_files=ignore_files
-        )
-
-    Parameters
-    ----------
-    container: A docker.models.container.Container object
-    output_dir: A local directory to save the output files to.
-    ignore_files: List of files to ignore (i.e to not copy)
+    for arg in sorted_split:
+        sep = arg.split(" ")
 
-    Returns
-    -------
-    """
+        if sep[0] == "c":
+            files_of_files.append(sep[1])
 
-    new_files = [
-        x
-        for x in container.exec_run("ls", stderr=True, stdout=True)
-        .output.decode()
-        .split("\n")
-        if x not in ignore_files
-    ]
+        new = list(sep)
 
-    # Make output directory if it doesn't exist
+        for j, x in enumerate(sep):
+            if len(x) > 0:
+                if os.path.isfile(x):
+                    new[j] = str(docker_path(sep[j], container_dir))
+                    copy_list.append(Path(sep[j]))
+                elif x[0] == "@":
+                    files_of_files.append(x[1:])
+                elif os.path.isdir(os.path.dirname(x)):
+                    new[j] = str(docker_path(sep[j], container_dir))
 
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
+        new_split.append(" ".join(new))
 
-    # Collect output files
+    cmd = " -".join(new_split)
 
-    for output_file in new_files:
-        output_path = output_dir.joinpath(output_file)
+    # Be extra clever: go through files and check there too!
 
-        docker_get(container, output_path)
+    logger.debug(
+        f"Found the following files which should contain paths: {files_of_files}"
+    )
 
-        if output_path.exists():
-            logger.debug(f"Saved to {output_path}")
-        else:
-            raise FileNotFoundError(f"Unable to find {output_path}")
+    for path in files_of_files:
+        new_file = []
+
+        with open(path, "r", encoding="utf8") as local_file:
+            for line in local_file.readlines():
+                args = [x for x in line.split(" ") if x not in [""]]
+                new_args = list(args)
+                for i, arg in enumerate(args):
+                    if os.path.isfile(arg):
+                        copy_list.append(Path(arg))
+                        new_args[i] = str(docker_path(arg, container_dir))
+                    elif os.path.isfile(arg.strip("\n")):
+                        copy_list.append(Path(arg.strip("\n")))
+                        new_args[i] = (
+                            str(docker_path(arg.strip("\n"), container_dir)) + "\n"
+                        )
+                new_file.append(" ".join(new_args))
+
+        temp_file_path = Path(work_dir).joinpath(f"temp_{Path(path).name}")
+
+        with open(temp_file_path, "w", encoding="utf8") as temp_file:
+            temp_file.writelines(new_file)
+
+        # The original path may already have been converted to a container path
+        temp_path = str(docker_path(temp_file_path, container_dir))
+        for original in [path, str(docker_path(path, container_dir))]:
+            cmd = cmd.replace(original + " ", temp_path + " ")
+
+    return cmd, list(dict.fromkeys(copy_list))
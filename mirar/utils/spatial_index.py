@@ -0,0 +1,195 @@
+"""
+Module for a reusable spatial index of sky positions.
+
+Positions are converted to unit vectors on the sphere, and stored in a KD-tree.
+Angular separations are then recovered exactly from the chord length between
+vectors, so nearest-neighbour and radius queries are performed in bulk,
+returning numpy index arrays rather than per-source python objects.
+
+Building an index is cheap compared to repeated queries, but reference catalogs
+are often reused for many images in a night. :func:`get_sky_index` therefore
+keeps a small cache of indexes, keyed on the coordinates themselves.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+# Number of spatial indexes kept in memory by get_sky_index
+SKY_INDEX_CACHE_SIZE = 8
+
+_sky_index_cache = OrderedDict()
+_sky_index_lock = threading.Lock()
+
+
+def radec_to_unit_vectors(ra_deg: np.ndarray, dec_deg: np.ndarray) -> np.ndarray:
+    """
+    Convert ra/dec to unit vectors on the sphere
+
+    :param ra_deg: right ascension in degrees
+    :param dec_deg: declination in degrees
+    :return: array of unit vectors, with shape (N, 3)
+    """
+    ra_rad = np.radians(np.asarray(ra_deg, dtype=float))
+    dec_rad = np.radians(np.asarray(dec_deg, dtype=float))
+    cos_dec = np.cos(dec_rad)
+    return np.column_stack(
+        [cos_dec * np.cos(ra_rad), cos_dec * np.sin(ra_rad), np.sin(dec_rad)]
+    )
+
+
+def chord_to_arcsec(chord: np.ndarray) -> np.ndarray:
+    """
+    Convert the chord length between two unit vectors to an angular separation
+
+    :param chord: chord length
+    :return: angular separation in arcseconds
+    """
+    return np.degrees(2.0 * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))) * 3600.0
+
+
+def arcsec_to_chord(separation_arcsec: float) -> float:
+    """
+    Convert an angular separation to the chord length between two unit vectors
+
+    :param separation_arcsec: angular separation in arcseconds
+    :return: chord length
+    """
+    separation_rad = np.radians(min(float(separation_arcsec) / 3600.0, 180.0))
+    return 2.0 * np.sin(separation_rad / 2.0)
+
+
+class SkyIndex:
+    """
+    Spatial index of sky positions, supporting bulk k-nearest and radius queries
+    """
+
+    def __init__(self, ra_deg: np.ndarray, dec_deg: np.ndarray):
+        self.n_sources = len(ra_deg)
+        self.tree = cKDTree(radec_to_unit_vectors(ra_deg, dec_deg))
+
+    def __len__(self):
+        return self.n_sources
+
+    def query_nearest(
+        self,
+        ra_deg: np.ndarray,
+        dec_deg: np.ndarray,
+        k: int = 1,
+        max_separation_arcsec: float = np.inf,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest indexed sources to each query position
+
+        :param ra_deg: query right ascensions in degrees
+        :param dec_deg: query declinations in degrees
+        :param k: number of neighbours to return
+        :param max_separation_arcsec: maximum separation of neighbours
+        :return: indices of neighbours (-1 where there is no neighbour) and their
+            separations in arcseconds (NaN where there is no neighbour),
+            each with shape (N, k) and sorted by separation
+        """
+        n_queries = len(ra_deg)
+        indices = np.full((n_queries, k), -1, dtype=int)
+        separations = np.full((n_queries, k), np.nan)
+
+        if (n_queries == 0) or (self.n_sources == 0):
+            return indices, separations
+
+        distance_upper_bound = np.inf
+        if np.isfinite(max_separation_arcsec):
+            # Widen the bound slightly, and recheck the exact separations below
+            distance_upper_bound = np.nextafter(
+                arcsec_to_chord(max_separation_arcsec), np.inf
+            )
+
+        chords, neighbours = self.tree.query(
+            radec_to_unit_vectors(ra_deg, dec_deg),
+            k=k,
+            distance_upper_bound=distance_upper_bound,
+        )
+        chords = np.reshape(chords, (n_queries, k))
+        neighbours = np.reshape(neighbours, (n_queries, k))
+
+        found = np.isfinite(chords)
+        indices[found] = neighbours[found]
+        separations[found] = chord_to_arcsec(chords[found])
+
+        too_far = separations > max_separation_arcsec
+        indices[too_far] = -1
+        separations[too_far] = np.nan
+
+        return indices, separations
+
+    def query_radius(
+        self, ra_deg: np.ndarray, dec_deg: np.ndarray, radius_arcsec: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find all indexed sources within a radius of each query position
+
+        :param ra_deg: query right ascensions in degrees
+        :param dec_deg: query declinations in degrees
+        :param radius_arcsec: search radius in arcseconds
+        :return: flat arrays of query indices, indexed source indices, and
+            separations in arcseconds, sorted by query index and then separation
+        """
+        n_queries = len(ra_deg)
+        if (n_queries == 0) or (self.n_sources == 0):
+            return np.array([], dtype=int), np.array([], dtype=int), np.array([])
+
+        query_tree = cKDTree(radec_to_unit_vectors(ra_deg, dec_deg))
+        pairs = query_tree.sparse_distance_matrix(
+            self.tree,
+            max_distance=np.nextafter(arcsec_to_chord(radius_arcsec), np.inf),
+            output_type="ndarray",
+        )
+
+        query_indices = pairs["i"].astype(int)
+        source_indices = pairs["j"].astype(int)
+        separations = chord_to_arcsec(pairs["v"])
+
+        mask = separations <= radius_arcsec
+        order = np.lexsort((separations[mask], query_indices[mask]))
+
+        return (
+            query_indices[mask][order],
+            source_indices[mask][order],
+            separations[mask][order],
+        )
+
+
+def get_sky_index(ra_deg: np.ndarray, dec_deg: np.ndarray) -> SkyIndex:
+    """
+    Get a spatial index for a set of positions, reusing a cached index if the same
+    positions have been indexed before
+
+    :param ra_deg: right ascensions in degrees
+    :param dec_deg: declinations in degrees
+    :return: SkyIndex
+    """
+    ra_deg = np.ascontiguousarray(ra_deg, dtype=float)
+    dec_deg = np.ascontiguousarray(dec_deg, dtype=float)
+
+    digest = hashlib.blake2b(ra_deg.tobytes(), digest_size=16)
+    digest.update(dec_deg.tobytes())
+    key = (len(ra_deg), digest.hexdigest())
+
+    with _sky_index_lock:
+        if key in _sky_index_cache:
+            _sky_index_cache.move_to_end(key)
+            return _sky_index_cache[key]
+
+    sky_index = SkyIndex(ra_deg, dec_deg)
+
+    with _sky_index_lock:
+        _sky_index_cache[key] = sky_index
+        while len(_sky_index_cache) > SKY_INDEX_CACHE_SIZE:
+            _sky_index_cache.popitem(last=False)
+
+    return sky_index
@@ -0,0 +1,77 @@
+"""
+Tests for distance matching in
+..module::mirar.processors.astrometry.autoastrometry.crossmatch,
+using a synthetic field
+"""
+
+import logging
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from mirar.processors.astrometry.autoastrometry.crossmatch import distance_match
+from mirar.processors.astrometry.autoastrometry.sources import (
+    BaseSource,
+    SextractorSource,
+)
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class TestAutoastrometryCrossmatch(BaseTestCase):
+    """Class for testing autoastrometry distance matching"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_distance_match(self):
+        """Sources of a rotated image should be matched to their references"""
+        rng = np.random.default_rng(0)
+        ra_0, dec_0 = 150.0, 30.0
+        cosdec = np.cos(np.radians(dec_0))
+        rotation = np.radians(0.7)
+        pixscale = 0.5 / 3600.0
+
+        n_ref = 80
+        ref_x = rng.uniform(-0.15, 0.15, n_ref)
+        ref_y = rng.uniform(-0.15, 0.15, n_ref)
+        mags = rng.uniform(12.0, 20.0, n_ref)
+        ref_src_list = [
+            BaseSource(ra_0 + x / cosdec, dec_0 + y, mag)
+            for x, y, mag in zip(ref_x, ref_y, mags)
+        ]
+
+        img_index = rng.choice(n_ref, size=60, replace=False)
+        img_src_list = []
+        for i in img_index:
+            x_rot = np.cos(rotation) * ref_x[i] - np.sin(rotation) * ref_y[i]
+            y_rot = np.sin(rotation) * ref_x[i] + np.cos(rotation) * ref_y[i]
+            img_src_list.append(
+                SextractorSource(
+                    f"{1000 + x_rot / pixscale} {1000 + y_rot / pixscale} "
+                    f"{ra_0 + x_rot / cosdec} {dec_0 + y_rot} {mags[i]} "
+                    f"0.01 0.1 3.0"
+                )
+            )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            img_match, ref_match, mpa = distance_match(
+                img_src_list,
+                ref_src_list,
+                base_output_path=Path(temp_dir).joinpath("test.fits").as_posix(),
+                max_rad=600.0,
+                min_rad=10.0,
+                tolerance=0.01,
+                req_match=3,
+                pa_tolerance=1.2,
+                unc_pa=None,
+            )
+
+        self.assertGreater(len(img_match), 10)
+        self.assertEqual(len(img_match), len(ref_match))
+        for img_i, ref_i in zip(img_match, ref_match):
+            self.assertEqual(img_index[img_i], ref_i)
+        self.assertAlmostEqual(abs(np.median(mpa)), 0.7, delta=0.05)
@@ -0,0 +1,175 @@
+"""
+Tests for bulk database inserts, in ..module::mirar.database.base_model
+and ..module::mirar.processors.base_processor
+"""
+
+import logging
+from typing import ClassVar
+
+import numpy as np
+import pandas as pd
+from pydantic import ValidationError
+
+from mirar.database.base_model import BaseDB
+from mirar.pipelines.winter.constants import winter_filters_map
+from mirar.pipelines.winter.models import (
+    Candidate,
+    Diff,
+    Exposure,
+    FieldEntry,
+    Filter,
+    FiltersTable,
+)
+from mirar.processors.base_processor import BaseSourceProcessor
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class RowHookFilter(Filter):
+    """Filter model which modifies each entry on insertion"""
+
+    sql_model: ClassVar = FiltersTable
+
+    def insert_entry(self, duplicate_protocol: str, returning_key_names=None):
+        """Insert with a per-row hook"""
+        self.filtername = self.filtername.upper()
+        return super().insert_entry(duplicate_protocol, returning_key_names)
+
+
+class BulkHookFilter(RowHookFilter):
+    """Filter model which also modifies entries for bulk insertion"""
+
+    sql_model: ClassVar = FiltersTable
+
+    @classmethod
+    def prepare_bulk_insert(cls, entries: list[Filter]):
+        """Apply the per-row hook to many entries"""
+        for entry in entries:
+            entry.filtername = entry.filtername.upper()
+
+
+class TestBulkInsert(BaseTestCase):
+    """Class for testing bulk database inserts"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_super_dicts(self):
+        """Super dicts for a whole table should match those made row by row"""
+        source_table = pd.DataFrame(
+            {
+                "RA": [10.0, 10.1, 10.2],
+                "fwhm": [1.5, np.nan, 2.5],
+                "nsources": [3, 4, 5],
+                "name": ["a", "b", "c"],
+            }
+        )
+        metadata = {"FWHM": -1.0, "EXPTIME": 30.0, "NAME": "image", "ra": 0.0}
+
+        super_dicts = BaseSourceProcessor.generate_super_dicts(metadata, source_table)
+        self.assertEqual(len(super_dicts), len(source_table))
+
+        for (_, row), super_dict in zip(source_table.iterrows(), super_dicts):
+            expected = BaseSourceProcessor.generate_super_dict(metadata, row)
+            self.assertEqual(set(super_dict), set(expected))
+            for key, value in expected.items():
+                if pd.isnull(value):
+                    self.assertTrue(pd.isnull(super_dict[key]))
+                else:
+                    self.assertEqual(super_dict[key], value)
+
+            # Source columns take precedence over metadata, for both cases
+            for key in ["fwhm", "FWHM", "ra", "RA", "name", "NAME"]:
+                self.assertNotIn(super_dict[key], [-1.0, 0.0, "image"])
+            self.assertEqual(super_dict["exptime"], 30.0)
+            self.assertEqual(super_dict["EXPTIME"], 30.0)
+
+        self.assertEqual(super_dicts[1]["NAME"], "b")
+        self.assertEqual(super_dicts[2]["RA"], 10.2)
+
+    def test_supports_bulk_insert(self):
+        """Models with per-row insertion hooks must also have bulk hooks"""
+        self.assertTrue(BaseDB.supports_bulk_insert())
+        self.assertTrue(Filter.supports_bulk_insert())
+        self.assertTrue(FieldEntry.supports_bulk_insert())
+
+        # Per-row hooks, with and without a bulk equivalent
+        self.assertTrue(Candidate.supports_bulk_insert())
+        self.assertFalse(Diff.supports_bulk_insert())
+        self.assertFalse(Exposure.supports_bulk_insert())
+        self.assertFalse(RowHookFilter.supports_bulk_insert())
+        self.assertTrue(BulkHookFilter.supports_bulk_insert())
+
+        entries = BulkHookFilter.validate_entries(
+            [{"fid": winter_filters_map["J"], "filtername": "j"}]
+        )
+        BulkHookFilter.prepare_bulk_insert(entries)
+        self.assertEqual(entries[0].filtername, "J")
+
+    def test_bulk_validation(self):
+        """Bulk validation should reject the same entries as single entries"""
+        fid = winter_filters_map["J"]
+        records = [
+            {"fid": fid, "filtername": "J"},
+            {"fid": -1, "filtername": "J"},
+            {"fid": fid, "filtername": ""},
+            {"fid": fid, "filtername": "J", "extra": 1},
+            {"fid": max(winter_filters_map.values()) + 1, "filtername": "X"},
+            {"filtername": "J"},
+            {"fid": str(fid), "filtername": "J"},
+        ]
+
+        single_bad = set()
+        for i, record in enumerate(records):
+            try:
+                Filter(**record)
+            except ValidationError:
+                single_bad.add(i)
+        self.assertEqual(single_bad, {1, 2, 4, 5})
+
+        with self.assertRaises(ValidationError) as context:
+            Filter.validate_entries(records)
+        bulk_bad = {x["loc"][0] for x in context.exception.errors()}
+        self.assertEqual(bulk_bad, single_bad)
+
+        # Validation fails before any database access
+        with self.assertRaises(ValidationError):
+            Filter.insert_entries(records, duplicate_protocol="fail")
+
+        good = [x for i, x in enumerate(records) if i not in single_bad]
+        self.assertEqual(
+            [x.model_dump() for x in Filter.validate_entries(good)],
+            [Filter(**x).model_dump() for x in good],
+        )
+
+        field_records = [
+            {
+                "fieldid": 1,
+                "ra": 10.0,
+                "dec": 20.0,
+                "ebv": 1.5,
+                "gall": 1.0,
+                "galb": 2.0,
+            },
+            {
+                "fieldid": 2,
+                "ra": 400.0,
+                "dec": 20.0,
+                "ebv": 1.5,
+                "gall": 1.0,
+                "galb": 2.0,
+            },
+            {
+                "fieldid": 3,
+                "ra": 10.0,
+                "dec": 20.0,
+                "ebv": 0.5,
+                "gall": 1.0,
+                "galb": 2.0,
+            },
+        ]
+        with self.assertRaises(ValidationError) as context:
+            FieldEntry.validate_entries(field_records)
+        self.assertEqual({x["loc"][0] for x in context.exception.errors()}, {1, 2})
@@ -0,0 +1,209 @@
+"""
+Tests for the image cache in ..module::mirar.data.cache
+"""
+
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+from astropy.io.fits import Header
+
+from mirar.data import Image, cache
+from mirar.data.image_data import get_image_dtype, set_image_dtype
+from mirar.io import open_fits, open_raw_image, save_fits
+from mirar.paths import BASE_NAME_KEY, RAW_IMG_KEY, core_fields
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+def make_image(name: str, shape: tuple[int, int] = (10, 10)) -> Image:
+    """
+    Make a simple image of zeros
+
+    :param name: name of image
+    :param shape: shape of image
+    :return: image
+    """
+    header = Header()
+    header[BASE_NAME_KEY] = name
+    header[RAW_IMG_KEY] = name
+    return Image(np.zeros(shape), header)
+
+
+class TestCache(BaseTestCase):
+    """Class for testing the image cache"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        cache.set_memory_budget(0)
+        set_image_dtype("float64")
+
+    def test_disk_cache(self):
+        """Cached data should be copy-on-write, and only change on set_data"""
+        cache.set_memory_budget(0)
+        image = make_image("disk.fits")
+
+        data = image.get_data()
+        data[0, 0] = 1.0
+        self.assertEqual(image.get_data()[0, 0], 0.0)
+
+        # Writing to the copy-on-write map does not change the cached file
+        self.assertEqual(np.load(image.cache_path)[0, 0], 0.0)
+
+        image.set_data(data)
+        self.assertEqual(image.get_data()[0, 0], 1.0)
+        self.assertEqual(data[0, 0], 1.0)
+
+        data[1, 1] = np.nan
+        image.set_data(data)
+        self.assertEqual(int(np.sum(image.get_mask())), 99)
+
+    def test_memory_tier(self):
+        """Images beyond the memory budget should be evicted to disk"""
+        image_bytes = np.zeros((10, 10)).nbytes
+        cache.set_memory_budget(2 * image_bytes)
+
+        images = [make_image(f"image_{i}.fits") for i in range(3)]
+        for i, image in enumerate(images):
+            image.set_data(np.full((10, 10), float(i)))
+
+        stats = cache.get_stats()
+        self.assertEqual(stats["n_in_memory"], 2)
+        self.assertLessEqual(stats["bytes_in_memory"], 2 * image_bytes)
+        self.assertGreater(stats["evictions"], 0)
+
+        # The evicted image was written to disk, and is read back correctly
+        for i, image in enumerate(images):
+            self.assertTrue(np.all(image.get_data() == float(i)))
+
+        hits = cache.get_stats()["hits"]
+        images[2].get_data()
+        self.assertEqual(cache.get_stats()["hits"], hits + 1)
+
+        # Returned data is a copy, so the cache is unchanged
+        data = images[2].get_data()
+        data += 1.0
+        self.assertTrue(np.all(images[2].get_data() == 2.0))
+
+    def test_image_dtype(self):
+        """Floating point image data should follow the image dtype policy"""
+        self.assertEqual(get_image_dtype(), np.float64)
+
+        set_image_dtype("float32")
+        image = make_image("float32.fits")
+        self.assertEqual(image.get_data().dtype, np.float32)
+        self.assertEqual(np.load(image.cache_path, mmap_mode="r").dtype, np.float32)
+
+        image.set_data(image.get_data().astype(np.float64) + 1.0)
+        self.assertEqual(image.get_data().dtype, np.float32)
+        self.assertTrue(np.all(image.get_data() == 1.0))
+
+        with self.assertRaises(ValueError):
+            set_image_dtype("int16")
+
+    def test_image_dtype_no_upcast(self):
+        """Data narrower than the image dtype should not be widened"""
+        self.assertEqual(get_image_dtype(), np.float64)
+
+        image = make_image("narrow.fits")
+        image.set_data(np.ones((10, 10), dtype=np.float32))
+        self.assertEqual(image.get_data().dtype, np.float32)
+        self.assertEqual(np.load(image.cache_path, mmap_mode="r").dtype, np.float32)
+
+        for key in core_fields:
+            image[key] = "narrow.fits"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir).joinpath("narrow.fits")
+            save_fits(image, path)
+            data, header = open_fits(path)
+            self.assertEqual(data.dtype.name, "float32")
+            self.assertEqual(Image(data, header).get_data().dtype.name, "float32")
+
+            # Raw images are converted to the image dtype
+            self.assertEqual(open_raw_image(path).get_data().dtype, np.float64)
+
+    def test_header_reuse(self):
+        """The header of a cached file should only be parsed again if it changes"""
+        cache.set_memory_budget(0)
+        image = make_image("header.fits")
+
+        with patch(
+            "numpy.lib.format.read_magic", wraps=np.lib.format.read_magic
+        ) as read_magic:
+            for _ in range(3):
+                self.assertEqual(image.get_data().shape, (10, 10))
+            self.assertEqual(read_magic.call_count, 1)
+
+            # Rewriting the file invalidates the parsed header
+            image.set_data(np.ones((5, 4)))
+            for _ in range(3):
+                self.assertEqual(image.get_data().shape, (5, 4))
+            self.assertEqual(read_magic.call_count, 2)
+
+        self.assertTrue(np.all(image.get_data() == 1.0))
+
+    def test_flush_and_fork(self):
+        """Arrays should be flushed before a fork, and not rewritten by workers"""
+        image_bytes = np.zeros((10, 10)).nbytes
+        cache.set_memory_budget(2 * image_bytes)
+
+        image = make_image("flush.fits")
+        image.set_data(np.full((10, 10), 2.0))
+        self.assertFalse(image.cache_path.exists())
+
+        cache.flush()
+        self.assertTrue(np.all(np.load(image.cache_path) == 2.0))
+        self.assertEqual(cache.get_stats()["n_in_memory"], 1)
+
+        # A worker discards the inherited arrays, without writing them
+        image.set_data(np.full((10, 10), 3.0))
+        with patch("numpy.save") as save:
+            cache.reset_after_fork()
+            cache.set_memory_budget(0)
+        save.assert_not_called()
+        self.assertEqual(cache.get_stats()["n_in_memory"], 0)
+        self.assertTrue(np.all(image.get_data() == 2.0))
+
+    def test_io_outside_lock(self):
+        """Files should be written and read without holding the cache lock"""
+        cache.set_memory_budget(0)
+        image = make_image("lock.fits")
+        lock_free = []
+
+        def try_lock(result: list):
+            """Try to acquire the lock, from another thread"""
+            acquired = cache._lock.acquire(timeout=1.0)  # pylint: disable=W0212
+            if acquired:
+                cache._lock.release()  # pylint: disable=protected-access
+            result.append(acquired)
+
+        def check_lock(*args, **kwargs):
+            """Check that the lock is free while saving"""
+            result = []
+            thread = threading.Thread(target=try_lock, args=(result,))
+            thread.start()
+            thread.join()
+            lock_free.append(result[0])
+            return original_save(*args, **kwargs)
+
+        original_save = np.save
+        with patch("numpy.save", side_effect=check_lock):
+            image.set_data(np.ones((10, 10)))
+            cache.set_memory_budget(np.ones((10, 10)).nbytes)
+            image.get_data()
+            image.set_data(np.full((10, 10), 2.0))
+            cache.set_memory_budget(0)
+
+        self.assertEqual(lock_free, [True, True])
+        self.assertTrue(np.all(image.get_data() == 2.0))
+        self.assertEqual(
+            list(image.cache_path.parent.glob(f".{image.cache_path.name}.*.tmp")), []
+        )
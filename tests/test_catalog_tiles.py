@@ -0,0 +1,180 @@
+"""
+Tests for the catalog tile cache in ..module::mirar.catalog.tile_cache
+"""
+
+import logging
+
+import astropy.table
+import numpy as np
+from astropy.table import Table
+
+from mirar.catalog.base_catalog import BaseCatalog
+from mirar.catalog.tile_cache import angular_separation_deg, prewarm_catalog_tiles
+from mirar.catalog.vizier.base_vizier_catalog import VizierCatalog, VizierError
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+rng = np.random.default_rng(0)
+N_SKY_SOURCES = 20000
+SKY = Table(
+    {
+        "id": np.arange(N_SKY_SOURCES),
+        "ra": rng.uniform(148.0, 152.0, N_SKY_SOURCES),
+        "dec": rng.uniform(-2.0, 2.0, N_SKY_SOURCES),
+        "magnitude": rng.uniform(10.0, 20.0, N_SKY_SOURCES),
+    }
+)
+# Offset from the (Vega) magnitude used for cuts to the returned (AB) magnitude
+VEGA_AB_OFFSET = 1.85
+
+
+class FakeCatalog(BaseCatalog):
+    """Catalog which serves cones from a fixed table, counting each query"""
+
+    abbreviation = "fake"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, filter_name="g", **kwargs)
+        # Shared with copies of the catalog, which perform the tile queries
+        self.queries = []
+
+    def get_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
+        self.queries.append((ra_deg, dec_deg, self.search_radius_arcmin))
+        separation = angular_separation_deg(ra_deg, dec_deg, SKY["ra"], SKY["dec"])
+        mask = (
+            (separation < self.search_radius_arcmin / 60.0)
+            & (SKY["magnitude"] > self.min_mag)
+            & (SKY["magnitude"] < self.max_mag)
+        )
+        return SKY[mask]
+
+
+class FakeGaia2MassCatalog(FakeCatalog):
+    """
+    Catalog which cuts on a Vega magnitude, but returns an AB magnitude,
+    like :class:`~mirar.catalog.gaia.Gaia2Mass`
+    """
+
+    abbreviation = "fakegaia"
+
+    def get_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
+        self.queries.append((ra_deg, dec_deg, self.search_radius_arcmin))
+        separation = angular_separation_deg(ra_deg, dec_deg, SKY["ra"], SKY["dec"])
+        mask = (
+            (separation < self.search_radius_arcmin / 60.0)
+            & (SKY["magnitude"] > self.min_mag)
+            & (SKY["magnitude"] < self.max_mag)
+        )
+        table = SKY[mask]
+        table["magnitude"] = table["magnitude"] + VEGA_AB_OFFSET
+        return table
+
+
+class FakeVizierCatalog(FakeCatalog):
+    """
+    Catalog which only applies the maximum magnitude,
+    like :class:`~mirar.catalog.vizier.base_vizier_catalog.VizierCatalog`
+    """
+
+    abbreviation = "fakevizier"
+
+    def get_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
+        self.queries.append((ra_deg, dec_deg, self.search_radius_arcmin))
+        separation = angular_separation_deg(ra_deg, dec_deg, SKY["ra"], SKY["dec"])
+        mask = (separation < self.search_radius_arcmin / 60.0) & (
+            SKY["magnitude"] < self.max_mag
+        )
+        return SKY[mask]
+
+
+class FakeCoverageCatalog(VizierCatalog):
+    """
+    Vizier catalog which only covers fields with positive declination
+    """
+
+    abbreviation = "fakecoverage"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, filter_name="g", **kwargs)
+        self.queries = []
+
+    def get_catalog(self, ra_deg: float, dec_deg: float) -> astropy.table.Table:
+        self.queries.append((ra_deg, dec_deg, self.search_radius_arcmin))
+        return Table()
+
+    @staticmethod
+    def check_coverage(ra_deg: float, dec_deg: float):
+        if dec_deg < 0.0:
+            raise VizierError(f"Field ({ra_deg}, {dec_deg}) is not covered")
+
+
+class TestCatalogTiles(BaseTestCase):
+    """Class for testing the catalog tile cache"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_tile_cache(self):
+        """Repeated cones should be served from cached tiles"""
+        catalog = FakeCatalog(
+            min_mag=10.0,
+            max_mag=18.0,
+            search_radius_arcmin=20.0,
+            tile_cache_dir=self.temp_dir.name,
+        )
+
+        prewarm_catalog_tiles(catalog, [(150.0, 0.0)])
+        self.assertEqual(len(catalog.queries), 1)
+
+        cached = catalog.get_cached_catalog(ra_deg=150.0, dec_deg=0.0)
+        self.assertEqual(len(catalog.queries), 1)
+        direct = catalog.get_catalog(ra_deg=150.0, dec_deg=0.0)
+        self.assertEqual(sorted(cached["id"]), sorted(direct["id"]))
+
+    def test_magnitude_ranges(self):
+        """Cached catalogs should match uncached ones, for any magnitude range"""
+        for catalog_class in [FakeCatalog, FakeGaia2MassCatalog, FakeVizierCatalog]:
+            catalog = catalog_class(
+                min_mag=10.0,
+                max_mag=18.0,
+                search_radius_arcmin=20.0,
+                tile_cache_dir=self.temp_dir.name,
+            )
+            prewarm_catalog_tiles(catalog, [(150.0, 0.0)])
+
+            for min_mag, max_mag in [(12.0, 16.0), (10.0, 20.0), (10.0, 18.0)]:
+                other = catalog_class(
+                    min_mag=min_mag,
+                    max_mag=max_mag,
+                    search_radius_arcmin=10.0,
+                    tile_cache_dir=self.temp_dir.name,
+                )
+                cached = other.get_cached_catalog(ra_deg=150.05, dec_deg=0.02)
+                # Only the range used to fill the cache is served from it
+                self.assertEqual(
+                    len(other.queries), int((min_mag, max_mag) != (10.0, 18.0))
+                )
+                direct = other.get_catalog(ra_deg=150.05, dec_deg=0.02)
+                self.assertEqual(sorted(cached["id"]), sorted(direct["id"]))
+                self.assertTrue(
+                    np.allclose(
+                        np.sort(cached["magnitude"]), np.sort(direct["magnitude"])
+                    )
+                )
+
+    def test_empty_results(self):
+        """Empty results should not be cached, and coverage checked for the field"""
+        catalog = FakeCoverageCatalog(
+            min_mag=10.0,
+            max_mag=18.0,
+            search_radius_arcmin=20.0,
+            tile_cache_dir=self.temp_dir.name,
+        )
+        for _ in range(2):
+            self.assertEqual(len(catalog.get_cached_catalog(150.0, 0.5)), 0)
+        self.assertEqual(len(catalog.queries), 2)
+
+        with self.assertRaises(VizierError):
+            catalog.get_cached_catalog(150.0, -0.1)
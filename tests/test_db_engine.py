@@ -0,0 +1,50 @@
+"""
+Tests for cached database engines in ..module::mirar.database.engine
+"""
+
+import logging
+
+from mirar.database.engine import (
+    dispose_engines,
+    get_engine,
+    get_pool_metrics_text,
+    get_pool_stats,
+)
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class TestDatabaseEngine(BaseTestCase):
+    """Class for testing cached database engines"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        dispose_engines()
+
+    def test_engine_cache(self):
+        """Engines should be reused for the same database and credentials"""
+        engine = get_engine(db_name="test_db", db_user="user", db_password="pwd")
+        self.assertIs(
+            engine, get_engine(db_name="test_db", db_user="user", db_password="pwd")
+        )
+        self.assertIsNot(
+            engine, get_engine(db_name="other_db", db_user="user", db_password="pwd")
+        )
+        self.assertIsNot(
+            engine, get_engine(db_name="test_db", db_user="admin", db_password="pwd")
+        )
+
+        stats = get_pool_stats()
+        self.assertEqual(len(stats), 3)
+        for pool_stats in stats.values():
+            self.assertEqual(pool_stats["checked_out"], 0)
+            self.assertEqual(pool_stats["n_checkouts"], 0)
+
+        self.assertIn("mirar_db_pool_checked_out_connections{", get_pool_metrics_text())
+
+        dispose_engines()
+        self.assertEqual(len(get_pool_stats()), 0)
@@ -0,0 +1,172 @@
+"""
+Tests for the docker worker pool in ..module::mirar.utils.docker_pool,
+using local (fake) containers
+"""
+
+import errno
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from mirar.processors.executors import get_process_context, init_process_worker
+from mirar.testing import BaseTestCase
+from mirar.utils import docker_pool
+from mirar.utils.docker_pool import DockerWorkerPool, LocalContainerRunner, link_or_copy
+
+logger = logging.getLogger(__name__)
+
+
+class CountingRunner(LocalContainerRunner):
+    """Local runner which records the number of concurrent commands"""
+
+    lock = threading.Lock()
+    n_active = 0
+    max_active = 0
+    n_created = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        with self.lock:
+            CountingRunner.n_created += 1
+
+    def exec_run(self, cmd: str, workdir: Path) -> tuple[int, str]:
+        with self.lock:
+            CountingRunner.n_active += 1
+            CountingRunner.max_active = max(self.max_active, self.n_active)
+        try:
+            time.sleep(0.05)
+            return super().exec_run(cmd, workdir)
+        finally:
+            with self.lock:
+                CountingRunner.n_active -= 1
+
+
+class LinkCountingRunner(LocalContainerRunner):
+    """Local runner which records the number of links to each input file"""
+
+    n_links = {}
+
+    def exec_run(self, cmd: str, workdir: Path) -> tuple[int, str]:
+        for path in Path(self.to_local(workdir)).iterdir():
+            LinkCountingRunner.n_links[path.name] = os.stat(path).st_nlink
+        return super().exec_run(cmd, workdir)
+
+
+def run_in_worker(input_path: Path) -> str:
+    """
+    Run a command with the shared docker pool of a worker process
+
+    :param input_path: input file for the command
+    :return: work directory of the pool
+    """
+    with docker_pool._pool_lock:  # pylint: disable=protected-access
+        docker_pool._pool = DockerWorkerPool(  # pylint: disable=protected-access
+            size=1, runner_factory=LocalContainerRunner
+        )
+    pool = docker_pool.get_docker_pool()
+    pool.run(f"cat {input_path}")
+    assert pool.work_root.exists()
+    return pool.work_root.as_posix()
+
+
+class TestDockerPool(BaseTestCase):
+    """Class for testing the docker worker pool"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.input_path = Path(self.temp_dir.name).joinpath("input.txt")
+        self.input_path.write_text("hello", encoding="utf8")
+        CountingRunner.n_active = 0
+        CountingRunner.max_active = 0
+        CountingRunner.n_created = 0
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_run(self):
+        """Commands should run concurrently up to the pool size, reusing containers"""
+        pool = DockerWorkerPool(size=2, runner_factory=CountingRunner)
+        output_dir = Path(self.temp_dir.name).joinpath("output")
+
+        def run(i: int):
+            pool.run(
+                f"cp {self.input_path} {output_dir.joinpath(f'output_{i}.txt')}",
+                output_dir=output_dir,
+            )
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(run, range(6)))
+
+        for i in range(6):
+            self.assertEqual(
+                output_dir.joinpath(f"output_{i}.txt").read_text(encoding="utf8"),
+                "hello",
+            )
+        self.assertFalse(output_dir.joinpath("input.txt").exists())
+        self.assertEqual(CountingRunner.max_active, 2)
+        self.assertEqual(CountingRunner.n_created, 2)
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            pool.run("false", output_dir=output_dir)
+
+        work_root = pool.work_root
+        pool.close()
+        self.assertFalse(work_root.exists())
+
+    def test_recycle(self):
+        """Stopped or heavily-used containers should be replaced"""
+        pool = DockerWorkerPool(size=1, runner_factory=CountingRunner, max_uses=2)
+
+        pool.run("true")
+        with pool.worker() as runner:
+            runner.stop()
+        pool.run("true")
+        self.assertEqual(CountingRunner.n_created, 2)
+
+        for _ in range(2):
+            pool.run("true")
+        self.assertEqual(CountingRunner.n_created, 3)
+
+        pool.close()
+
+    def test_link_inputs(self):
+        """Input files should be hard-linked, or copied across filesystems"""
+        pool = DockerWorkerPool(size=1, runner_factory=LinkCountingRunner)
+        pool.run(f"cat {self.input_path}")
+        self.assertEqual(LinkCountingRunner.n_links, {"input.txt": 2})
+        self.assertEqual(os.stat(self.input_path).st_nlink, 1)
+        pool.close()
+
+        linked = Path(self.temp_dir.name).joinpath("linked.txt")
+        link_or_copy(self.input_path, linked)
+        self.assertTrue(linked.samefile(self.input_path))
+
+        copied = Path(self.temp_dir.name).joinpath("copied.txt")
+        with patch("os.link", side_effect=OSError(errno.EXDEV, "Cross-device link")):
+            link_or_copy(self.input_path, copied)
+        self.assertFalse(copied.samefile(self.input_path))
+        self.assertEqual(copied.read_text(encoding="utf8"), "hello")
+
+        with patch("os.link", side_effect=OSError(errno.ENOSPC, "No space")):
+            with self.assertRaises(OSError):
+                link_or_copy(self.input_path, Path(self.temp_dir.name) / "other.txt")
+
+    def test_worker_process_cleanup(self):
+        """Pools created in worker processes should be closed when they exit"""
+        with ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=get_process_context(),
+            initializer=init_process_worker,
+            initargs=(None,),
+        ) as executor:
+            work_root = executor.submit(run_in_worker, self.input_path).result()
+
+        self.assertFalse(Path(work_root).exists())
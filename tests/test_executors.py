@@ -0,0 +1,80 @@
+"""
+Tests for the executors in ..module::mirar.processors.executors
+"""
+
+import logging
+
+import numpy as np
+from astropy.io.fits import Header
+
+from mirar.data import Dataset, Image, ImageBatch
+from mirar.errors import ProcessorError
+from mirar.paths import BASE_NAME_KEY, PROC_HISTORY_KEY, RAW_IMG_KEY
+from mirar.processors.base_processor import BaseImageProcessor
+from mirar.processors.executors import ExecutorError
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class DoublingProcessor(BaseImageProcessor):
+    """Processor which doubles image data, and fails for negative images"""
+
+    base_key = "test_double"
+
+    def _apply_to_images(self, batch: ImageBatch) -> ImageBatch:
+        for image in batch:
+            data = image.get_data()
+            if np.any(data < 0.0):
+                raise ProcessorError(f"Negative data in {image.get_name()}")
+            image.set_data(data * 2.0)
+        return batch
+
+
+def make_dataset(values: list[float]) -> Dataset:
+    """
+    Make a dataset with one constant-valued image per batch
+
+    :param values: image values
+    :return: dataset
+    """
+    batches = []
+    for i, value in enumerate(values):
+        header = Header()
+        header[BASE_NAME_KEY] = f"image_{i}.fits"
+        header[RAW_IMG_KEY] = f"image_{i}.fits"
+        header[PROC_HISTORY_KEY] = ""
+        batches.append(ImageBatch([Image(np.full((5, 5), value), header)]))
+    return Dataset(batches)
+
+
+class TestExecutors(BaseTestCase):
+    """Class for testing the processor executors"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_executors(self):
+        """Each executor should give the same results, in the same order"""
+        values = [1.0, -1.0, 2.0, 3.0]
+
+        for executor in ["thread", "process", "inline"]:
+            self.logger.info(f"Testing {executor} executor")
+            processor = DoublingProcessor()
+            processor.set_executor(executor)
+            dataset, err_stack = processor.base_apply(make_dataset(values))
+
+            self.assertEqual(len(dataset), 3)
+            self.assertEqual(len(err_stack.reports), 1)
+            self.assertEqual(err_stack.failed_images, ["image_1.fits"])
+            self.assertIn("Negative data", err_stack.summarise_error_stack())
+
+            for batch, value in zip(dataset, [1.0, 2.0, 3.0]):
+                self.assertTrue(np.all(batch[0].get_data() == 2.0 * value))
+                self.assertEqual(batch[0][PROC_HISTORY_KEY], "test_double,")
+
+    def test_invalid_executor(self):
+        """Unknown executors should be rejected"""
+        with self.assertRaises(ExecutorError):
+            DoublingProcessor().set_executor("gpu")
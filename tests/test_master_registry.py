@@ -0,0 +1,71 @@
+"""
+Tests for the master calibration registry in ..module::mirar.processors.master_registry
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mirar.processors.master_registry import MasterRegistry
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class TestMasterRegistry(BaseTestCase):
+    """Class for testing the master calibration registry"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_coalesced_builds(self):
+        """Concurrent requests for one entry should build it only once"""
+        registry = MasterRegistry(max_size=2)
+        calls = []
+        lock = threading.Lock()
+
+        def make_master():
+            with lock:
+                calls.append(1)
+            time.sleep(0.2)
+            return object()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(
+                executor.map(
+                    lambda _: registry.get_or_create("dark", make_master), range(16)
+                )
+            )
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(x is results[0] for x in results))
+        self.assertEqual(registry.get_stats()["misses"], 1)
+
+        # The registry is bounded, and evicts the least recently used entry
+        registry.get_or_create("flat", object)
+        registry.get_or_create("dark", make_master)
+        registry.get_or_create("bias", object)
+        self.assertEqual(len(registry), 2)
+        self.assertIn("dark", registry)
+        self.assertNotIn("flat", registry)
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_build(self):
+        """Failed builds should raise for every waiting thread, and not be stored"""
+        registry = MasterRegistry()
+
+        def fail():
+            time.sleep(0.2)
+            raise ValueError("No flats found")
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(registry.get_or_create, "flat", fail) for _ in range(4)
+            ]
+        for future in futures:
+            self.assertIsInstance(future.exception(), ValueError)
+
+        self.assertNotIn("flat", registry)
+        self.assertEqual(registry.get_or_create("flat", lambda: 1), 1)
@@ -0,0 +1,156 @@
+"""
+Tests for the processing metrics in ..module::mirar.metrics
+"""
+
+import json
+import logging
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+from astropy.io.fits import Header
+
+from mirar.data import Dataset, Image, ImageBatch
+from mirar.metrics import MetricsReport, ProcessingTracker, PrometheusExporter
+from mirar.paths import (
+    BASE_NAME_KEY,
+    COADD_KEY,
+    EXPTIME_KEY,
+    GAIN_KEY,
+    OBSCLASS_KEY,
+    PROC_FAIL_KEY,
+    PROC_HISTORY_KEY,
+    RAW_IMG_KEY,
+    TARGET_KEY,
+    TIME_KEY,
+)
+from mirar.processors.base_processor import BaseImageProcessor
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class SaveAndReloadProcessor(BaseImageProcessor):
+    """Processor which saves each image to disk, and reads it back"""
+
+    base_key = "test_save"
+
+    def __init__(self, output_dir: Path):
+        super().__init__()
+        self.output_dir = output_dir
+
+    def _apply_to_images(self, batch: ImageBatch) -> ImageBatch:
+        new_batch = ImageBatch()
+        for image in batch:
+            path = self.output_dir.joinpath(image.get_name())
+            self.save_fits(image, path)
+            new_batch.append(self.open_fits(path))
+        return new_batch
+
+
+def make_dataset(n_batches: int) -> Dataset:
+    """
+    Make a dataset with one image per batch
+
+    :param n_batches: number of batches
+    :return: dataset
+    """
+    batches = []
+    for i in range(n_batches):
+        header = Header()
+        for key in [OBSCLASS_KEY, TARGET_KEY, TIME_KEY, PROC_HISTORY_KEY]:
+            header[key] = ""
+        for key in [COADD_KEY, GAIN_KEY, PROC_FAIL_KEY, EXPTIME_KEY]:
+            header[key] = 1
+        header[BASE_NAME_KEY] = f"image_{i}.fits"
+        header[RAW_IMG_KEY] = f"image_{i}.fits"
+        batches.append(ImageBatch([Image(np.zeros((50, 50)), header)]))
+    return Dataset(batches)
+
+
+class TestMetrics(BaseTestCase):
+    """Class for testing the processing metrics"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_metrics(self):
+        """Each batch should produce a record, including its I/O"""
+        processor = SaveAndReloadProcessor(output_dir=Path(self.temp_dir.name))
+        metrics = MetricsReport()
+        dataset, _ = processor.base_apply(make_dataset(3), metrics=metrics)
+        self.assertEqual(len(dataset), 3)
+
+        self.assertEqual(len(metrics.records), 3)
+        for record in metrics.records:
+            self.assertTrue(record.success)
+            self.assertGreater(record.bytes_written, 50 * 50 * 8)
+            self.assertEqual(record.bytes_read, record.bytes_written)
+            self.assertIsNotNone(record.rss_change)
+
+        summary = metrics.summarise()
+        self.assertEqual(list(summary["processor_name"]), ["SaveAndReloadProcessor"])
+        self.assertEqual(int(summary["n_batches"].iloc[0]), 3)
+
+        output_path = Path(self.temp_dir.name).joinpath("metrics.json")
+        metrics.write_json(output_path)
+        with open(output_path, encoding="utf-8") as metrics_file:
+            report = json.load(metrics_file)
+        self.assertEqual(len(report["records"]), 3)
+        self.assertIn("hits", report["cache"])
+
+    def test_max_records(self):
+        """The summary should include records beyond the maximum kept"""
+        processor = SaveAndReloadProcessor(output_dir=Path(self.temp_dir.name))
+        metrics = MetricsReport(max_records=2)
+        processor.base_apply(make_dataset(5), metrics=metrics)
+
+        self.assertEqual(len(metrics.records), 2)
+        self.assertEqual(len(metrics.get_records_table()), 2)
+        self.assertEqual(metrics.n_records, 5)
+
+        summary = metrics.summarise()
+        self.assertEqual(int(summary["n_batches"].iloc[0]), 5)
+        self.assertEqual(int(summary["n_failed"].iloc[0]), 0)
+        self.assertGreater(summary["bytes_written"].iloc[0], 5 * 50 * 50 * 8)
+        self.assertGreater(summary["batches_per_second"].iloc[0], 0)
+
+    def test_rss_change(self):
+        """Each record should measure the memory used during its batch"""
+        with ProcessingTracker("first", ["a"]) as tracker:
+            data = np.ones(int(50e6 / 8))
+        first = tracker.record
+        self.assertGreater(first.rss_change, 40e6)
+
+        # Memory which was already in use is not counted again
+        with ProcessingTracker("second", ["b"]) as tracker:
+            data += 1.0
+        self.assertLess(tracker.record.rss_change, 10e6)
+
+        del data
+        report = MetricsReport([first, tracker.record])
+        summary = report.summarise().set_index("processor_name")
+        self.assertGreater(summary.loc["first", "max_rss_change"], 40e6)
+
+    def test_prometheus(self):
+        """Metrics should be served in the Prometheus text format"""
+        metrics = MetricsReport()
+        processor = SaveAndReloadProcessor(output_dir=Path(self.temp_dir.name))
+        processor.base_apply(make_dataset(2), metrics=metrics)
+
+        exporter = PrometheusExporter(
+            get_metrics_text=metrics.to_prometheus, port=0, host="127.0.0.1"
+        )
+        exporter.start()
+        try:
+            url = f"http://127.0.0.1:{exporter.port}/metrics"
+            with urllib.request.urlopen(url, timeout=10) as response:
+                text = response.read().decode()
+        finally:
+            exporter.stop()
+
+        self.assertIn(
+            'mirar_processor_batches_total{processor="SaveAndReloadProcessor"} 2.0',
+            text,
+        )
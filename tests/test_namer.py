@@ -0,0 +1,135 @@
+"""
+Tests for source naming in ..module::mirar.processors.sources.namer
+"""
+
+import logging
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from astropy.time import Time
+
+from mirar.pipelines.winter.models import NAME_START, SOURCE_PREFIX, Source
+from mirar.processors.sources import CandidateNamer
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class FakeResult:
+    """Result of a query on a fake connection"""
+
+    def __init__(self, row: tuple):
+        self.row = row
+
+    def scalar(self):
+        """Return the first column"""
+        return self.row[0]
+
+    def one(self):
+        """Return the row"""
+        return self.row
+
+
+class FakeEngine:
+    """
+    Engine with a table of existing names, and sequences, emulating
+    the queries run by CandidateNamer.allocate_names
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.sequences = {}
+        self.n_transactions = 0
+
+    @contextmanager
+    def begin(self):
+        """Begin a transaction"""
+        self.n_transactions += 1
+        yield self
+
+    def execute(self, statement, params: dict | None = None) -> FakeResult:
+        """Execute a statement"""
+        query = str(statement)
+
+        if "pg_advisory_xact_lock" in query:
+            return FakeResult((None,))
+
+        if query.startswith("CREATE SEQUENCE"):
+            self.sequences.setdefault(query.split()[5], (0, False))
+            return FakeResult((None,))
+
+        if "last_value, is_called" in query:
+            return FakeResult(self.sequences[query.split()[-1]])
+
+        if "setval" in query:
+            self.sequences[params["seq_name"]] = (params["value"], True)
+            return FakeResult((params["value"],))
+
+        # Most recent name with the prefix
+        prefix = next(
+            x for x in statement.compile().params.values() if isinstance(x, str)
+        )
+        matching = [x for x in self.names if x.startswith(prefix)]
+        if len(matching) == 0:
+            return FakeResult((None,))
+        return FakeResult((max(matching, key=lambda x: (len(x), x)),))
+
+
+class TestCandidateNamer(BaseTestCase):
+    """Class for testing the candidate namer"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_name_index(self):
+        """Name indices should follow the order of increment_string"""
+        namer = CandidateNamer(
+            db_table=Source, base_name=SOURCE_PREFIX, name_start=NAME_START
+        )
+
+        letters = NAME_START
+        self.assertEqual(namer.letters_to_index(letters), 0)
+        for letters in ["aaaaz", "abzzz", "zzzzy", "zzzzz", "aaaaaa", "azzzzz"]:
+            index = namer.letters_to_index(letters)
+            self.assertEqual(namer.index_to_letters(index), letters)
+            self.assertEqual(
+                namer.letters_to_index(namer.increment_string(letters)), index + 1
+            )
+
+        self.assertEqual(namer.index_to_letters(26**5), "aaaaaa")
+
+    def test_allocate_names(self):
+        """Blocks of names should follow existing names, and never overlap"""
+        namer = CandidateNamer(
+            db_table=Source, base_name=SOURCE_PREFIX, name_start=NAME_START
+        )
+        detection_time = Time("2024-06-01T00:00:00")
+        prefix = f"{SOURCE_PREFIX}24"
+        engine = FakeEngine(
+            names=[f"{SOURCE_PREFIX}23zzzzz", f"{prefix}aaaab", f"{prefix}aaaac"]
+        )
+
+        with patch("mirar.processors.sources.namer.get_engine", return_value=engine):
+            self.assertEqual(namer.allocate_names(detection_time, 0), [])
+            self.assertEqual(engine.n_transactions, 0)
+
+            first = namer.allocate_names(detection_time, 3)
+            self.assertEqual(
+                first, [f"{prefix}aaaad", f"{prefix}aaaae", f"{prefix}aaaaf"]
+            )
+
+            # The first block is not yet in the table, but is not reused
+            second = namer.allocate_names(detection_time, 2)
+            self.assertEqual(second, [f"{prefix}aaaag", f"{prefix}aaaah"])
+
+            # Names added to the table by other means are skipped
+            engine.names.append(f"{prefix}aaaba")
+            third = namer.allocate_names(detection_time, 1)
+            self.assertEqual(third, [f"{prefix}aaabb"])
+
+            # A new year starts from the beginning
+            self.assertEqual(
+                namer.allocate_names(Time("2025-01-01T00:00:00"), 1),
+                [f"{SOURCE_PREFIX}25{NAME_START}"],
+            )
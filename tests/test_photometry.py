@@ -0,0 +1,149 @@
+"""
+Tests for the photometry utilities in ..module::mirar.processors.photometry.utils
+"""
+
+import logging
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+
+from mirar.paths import GAIN_KEY
+from mirar.processors.photometry.base_photometry import load_photometry_image
+from mirar.processors.photometry.utils import (
+    CutoutError,
+    aper_photometry_batch,
+    get_cutout_stack,
+    get_psf_shifted_array,
+    get_rms_data,
+    make_cutouts,
+    psf_photometry_batch,
+)
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+def reference_psf_fit(
+    image_cutout: np.ndarray, unc_cutout: np.ndarray, psfmodels: np.ndarray
+) -> tuple[float, float, float]:
+    """
+    Fit each PSF model to a single cutout in turn
+
+    :param image_cutout: image cutout
+    :param unc_cutout: uncertainty cutout
+    :param psfmodels: PSF models
+    :return: best-fit flux, flux uncertainty and chi2
+    """
+    results = []
+    for ind in range(psfmodels.shape[2]):
+        model = psfmodels[:, :, ind]
+        flux = np.nansum(model * image_cutout) / np.nansum(np.square(model))
+        flux_unc = np.sqrt(
+            np.nansum(np.square(model) * np.square(unc_cutout))
+        ) / np.nansum(np.square(model))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            chi2 = np.nansum(
+                np.square(image_cutout - model * flux) / np.square(unc_cutout)
+            ) / (np.size(image_cutout) - 1)
+        results.append((flux, flux_unc, chi2))
+    return min(results, key=lambda x: x[2])
+
+
+class TestPhotometry(BaseTestCase):
+    """Class for testing the photometry utilities"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_cutouts(self):
+        """Vectorised cutouts should match the slower path, including at edges"""
+        rng = np.random.default_rng(0)
+        data = rng.normal(size=(60, 80))
+        image_path = Path(self.temp_dir.name).joinpath("image.fits")
+        fits.writeto(image_path, data)
+
+        x_positions = np.array([40, 0, 80, 3])
+        y_positions = np.array([30, 0, 60, 58])
+        cutouts = get_cutout_stack(data, x_positions, y_positions, half_size=5)
+        self.assertEqual(cutouts.shape, (4, 11, 11))
+        self.assertTrue(np.all(cutouts[0] == data[25:36, 35:46]))
+        self.assertTrue(np.all(cutouts[1][:5, :] == 0.0))
+        self.assertTrue(np.all(cutouts[1][5:, 5:] == data[:6, :6]))
+
+        for i, (x, y) in enumerate(zip(x_positions, y_positions)):
+            cutout = make_cutouts(image_path, (x, y), half_size=5)[0]
+            self.assertTrue(np.all(cutout == cutouts[i]))
+
+        with self.assertRaises(CutoutError):
+            get_cutout_stack(data, [81], [10], half_size=5)
+
+    def test_psf_photometry(self):
+        """Batched PSF photometry should match fitting each model in turn"""
+        rng = np.random.default_rng(1)
+        data = rng.normal(100.0, 5.0, size=(120, 120))
+        data[60, 61] = np.nan
+        unc = np.abs(rng.normal(5.0, 1.0, size=(120, 120)))
+
+        y_grid, x_grid = np.mgrid[-12:13, -12:13]
+        psf_path = Path(self.temp_dir.name).joinpath("psf.fits")
+        fits.writeto(psf_path, np.exp(-(x_grid**2 + y_grid**2) / 8.0))
+        psfmodels = get_psf_shifted_array(psf_path, cutout_size_psf_phot=10)
+        self.assertIs(psfmodels, get_psf_shifted_array(psf_path, 10))
+
+        x_positions = np.array([60, 2, 119, 30])
+        y_positions = np.array([60, 50, 119, 90])
+        image_cutouts = get_cutout_stack(data, x_positions, y_positions, 10)
+        unc_cutouts = get_cutout_stack(unc, x_positions, y_positions, 10)
+
+        fluxes, flux_uncs, chi2s, _, _, _ = psf_photometry_batch(
+            image_cutouts, unc_cutouts, psfmodels
+        )
+
+        for i in range(len(x_positions)):
+            flux, flux_unc, chi2 = reference_psf_fit(
+                image_cutouts[i], unc_cutouts[i], psfmodels
+            )
+            self.assertAlmostEqual(fluxes[i], flux, delta=1e-8 * abs(flux))
+            self.assertAlmostEqual(flux_uncs[i], flux_unc, delta=1e-8 * flux_unc)
+            if np.isinf(chi2):
+                self.assertTrue(np.isinf(chi2s[i]))
+            else:
+                self.assertAlmostEqual(chi2s[i], chi2, delta=1e-8 * chi2)
+
+    def test_aperture_photometry(self):
+        """Batched aperture photometry should subtract the annulus background"""
+        image_cutouts = np.full((3, 41, 41), 10.0)
+        image_cutouts[:, 20, 20] += np.array([100.0, 200.0, 0.0])
+        image_cutouts[2, 0, :] = np.nan
+        unc_cutouts = np.ones((3, 41, 41))
+
+        fluxes, flux_uncs = aper_photometry_batch(
+            image_cutouts,
+            unc_cutouts,
+            aper_diameter=10.0,
+            bkg_in_diameter=25.0,
+            bkg_out_diameter=40.0,
+        )
+        self.assertTrue(np.allclose(fluxes, [100.0, 200.0, 0.0]))
+        # Uncertainty is summed over the pixels with centres inside the aperture
+        y_grid, x_grid = np.mgrid[-20:21, -20:21]
+        n_pixels = np.sum(np.hypot(x_grid, y_grid) < 5.0)
+        self.assertTrue(np.allclose(flux_uncs, np.sqrt(n_pixels)))
+
+    def test_photometry_image(self):
+        """Photometry images should be cached, with a lazy uncertainty image"""
+        data = np.arange(100.0).reshape(10, 10)
+        header = fits.Header()
+        header[GAIN_KEY] = 2.0
+        image_path = Path(self.temp_dir.name).joinpath("phot_image.fits")
+        fits.writeto(image_path, data, header=header)
+
+        photometry_image = load_photometry_image(image_path)
+        self.assertIs(photometry_image, load_photometry_image(image_path))
+        self.assertTrue(np.all(photometry_image.get_data() == data))
+
+        unc = photometry_image.get_uncertainty()
+        self.assertIs(unc, photometry_image.get_uncertainty())
+        self.assertTrue(np.allclose(unc, get_rms_data(data, gain=2.0)))
@@ -0,0 +1,100 @@
+"""
+Tests for the reference product cache in ..module::mirar.processors.reference_cache
+"""
+
+import logging
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+
+from mirar.data import Image
+from mirar.paths import (
+    BASE_NAME_KEY,
+    LATEST_SAVE_KEY,
+    RAW_IMG_KEY,
+    SEXTRACTOR_HEADER_KEY,
+)
+from mirar.processors.reference_cache import ReferenceProductCache
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+def make_ref_image(name: str, value: float = 1.0) -> Image:
+    """
+    Make a reference image
+
+    :param name: name of the science image
+    :param value: value of the data
+    :return: reference image
+    """
+    header = fits.Header()
+    header["GAIN"] = 1.0
+    header[BASE_NAME_KEY] = name.replace(".fits", "_ref.fits")
+    header[RAW_IMG_KEY] = header[BASE_NAME_KEY]
+    return Image(data=np.full((10, 10), value), header=header)
+
+
+class TestReferenceCache(BaseTestCase):
+    """Class for testing the reference product cache"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.cache = ReferenceProductCache(
+            cache_dir=Path(self.temp_dir.name).joinpath("cache")
+        )
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_store_restore(self):
+        """Products should be reused for the same reference on a nearby grid"""
+        first_dir = Path(self.temp_dir.name).joinpath("night_1")
+        first_dir.mkdir()
+
+        ref_image = make_ref_image("sci_1.fits")
+        key = self.cache.get_key(ref_image, 100, 100, 1.0)
+
+        image_path = first_dir.joinpath("sci_1_ref.resamp.fits")
+        image_path.write_text("image", encoding="utf8")
+        cat_path = first_dir.joinpath("sci_1_ref.resamp.cat")
+        cat_path.write_text("catalog", encoding="utf8")
+        final_image = make_ref_image("sci_1.fits", value=0.0)
+        final_image[LATEST_SAVE_KEY] = image_path.as_posix()
+        final_image[SEXTRACTOR_HEADER_KEY] = cat_path.as_posix()
+
+        self.cache.store(key, 10.0, 20.0, final_image, stem="sci_1_ref")
+
+        # A different visit of the same field, with the same reference
+        new_ref_image = make_ref_image("sci_2.fits")
+        self.assertEqual(self.cache.get_key(new_ref_image, 100, 100, 1.0), key)
+        self.assertNotEqual(
+            self.cache.get_key(make_ref_image("sci_2.fits", value=2.0), 100, 100, 1.0),
+            key,
+        )
+        self.assertNotEqual(self.cache.get_key(new_ref_image, 100, 101, 1.0), key)
+
+        second_dir = Path(self.temp_dir.name).joinpath("night_2")
+        restored = self.cache.restore(
+            key, 10.0, 20.0 + 0.5 / 3600.0, 1.0, output_dir=second_dir, stem="sci_2_ref"
+        )
+        self.assertIsNotNone(restored)
+        new_image_path, path_map = restored
+        self.assertEqual(new_image_path, second_dir.joinpath("sci_2_ref.resamp.fits"))
+        self.assertEqual(new_image_path.read_text(encoding="utf8"), "image")
+        new_cat_path = Path(path_map[cat_path.as_posix()])
+        self.assertEqual(new_cat_path, second_dir.joinpath("sci_2_ref.resamp.cat"))
+        self.assertEqual(new_cat_path.read_text(encoding="utf8"), "catalog")
+
+        # Grid centre too far away
+        self.assertIsNone(
+            self.cache.restore(
+                key, 10.0, 20.0 + 5.0 / 3600.0, 1.0, second_dir, stem="sci_3_ref"
+            )
+        )
+        self.assertEqual(self.cache.get_stats()["hits"], 1)
+        self.assertEqual(self.cache.get_stats()["misses"], 1)
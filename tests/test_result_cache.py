@@ -0,0 +1,119 @@
+"""
+Tests for the astromatic result cache in
+..module::mirar.processors.astromatic.result_cache
+"""
+
+import logging
+import tempfile
+from pathlib import Path
+
+from mirar.processors.astromatic.result_cache import (
+    AstromaticResultCache,
+    hash_list_file,
+    run_with_result_cache,
+)
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class TestResultCache(BaseTestCase):
+    """Class for testing the astromatic result cache"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.root = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_tool(self, result_cache: AstromaticResultCache, run_dir: str) -> list:
+        """
+        Run a fake tool, which writes the reversed input to a catalog
+
+        :param result_cache: result cache
+        :param run_dir: directory for the run
+        :return: list of calls to the tool
+        """
+        input_path = self.root.joinpath(run_dir, "image.fits")
+        output_path = self.root.joinpath(run_dir, "out", "image.cat")
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        calls = []
+
+        def run():
+            calls.append(1)
+            output_path.write_text(
+                input_path.read_text(encoding="utf8")[::-1], encoding="utf8"
+            )
+
+        run_with_result_cache(
+            run,
+            cmd=f"tool {input_path} -CATALOG_NAME {output_path} -DETECT_THRESH 3",
+            input_paths=[input_path],
+            output_paths=[output_path],
+            result_cache=result_cache,
+        )
+        self.assertEqual(
+            output_path.read_text(encoding="utf8"),
+            input_path.read_text(encoding="utf8")[::-1],
+        )
+        return calls
+
+    def test_result_cache(self):
+        """Identical inputs in any directory should reuse results"""
+        result_cache = AstromaticResultCache(
+            cache_dir=self.root.joinpath("cache"), max_size=10**6
+        )
+
+        for run_dir in ["night_1", "night_2", "night_3"]:
+            self.root.joinpath(run_dir).mkdir()
+        self.root.joinpath("night_1", "image.fits").write_text(
+            "abcdef", encoding="utf8"
+        )
+        self.root.joinpath("night_2", "image.fits").write_text(
+            "abcdef", encoding="utf8"
+        )
+        self.root.joinpath("night_3", "image.fits").write_text(
+            "ghijkl", encoding="utf8"
+        )
+
+        self.assertEqual(len(self.run_tool(result_cache, "night_1")), 1)
+        self.assertEqual(len(self.run_tool(result_cache, "night_1")), 0)
+        self.assertEqual(len(self.run_tool(result_cache, "night_2")), 0)
+        self.assertEqual(len(self.run_tool(result_cache, "night_3")), 1)
+        self.assertEqual(result_cache.get_stats()["hits"], 2)
+
+        # Only the most recently used result fits
+        result_cache.max_size = max(x[1] for x in result_cache.get_entries())
+        result_cache.evict()
+        self.assertEqual(len(result_cache.get_entries()), 1)
+        self.assertEqual(len(self.run_tool(result_cache, "night_3")), 0)
+        self.assertEqual(len(self.run_tool(result_cache, "night_1")), 1)
+
+    def test_list_sidecars(self):
+        """Header files next to listed images should change the key"""
+        image_path = self.root.joinpath("temp_image.fits")
+        image_path.write_text("abcdef", encoding="utf8")
+        list_path = self.root.joinpath("list.txt")
+        list_path.write_text(f"{image_path}\n", encoding="utf8")
+
+        hashes = [hash_list_file(list_path)]
+
+        head_path = self.root.joinpath("temp_image.head")
+        head_path.write_text("CRVAL1 = 10.0", encoding="utf8")
+        hashes.append(hash_list_file(list_path))
+
+        # e.g. SCAMP re-solving an image with unchanged pixels
+        head_path.write_text("CRVAL1 = 10.1", encoding="utf8")
+        hashes.append(hash_list_file(list_path))
+
+        self.root.joinpath("temp_image.ahead").write_text("", encoding="utf8")
+        hashes.append(hash_list_file(list_path))
+
+        self.assertEqual(len(set(hashes)), 4)
+
+        head_path.write_text("CRVAL1 = 10.0", encoding="utf8")
+        self.root.joinpath("temp_image.ahead").unlink()
+        self.assertEqual(hash_list_file(list_path), hashes[1])
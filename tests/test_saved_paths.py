@@ -0,0 +1,108 @@
+"""
+Tests for reusing saved copies of images, in ..module::mirar.data.image_data
+and ..module::mirar.io
+"""
+
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from astropy.io.fits import Header
+
+from mirar.data import Image
+from mirar.paths import LATEST_SAVE_KEY, core_fields
+from mirar.processors.base_processor import ImageHandler
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+def make_image(name: str) -> Image:
+    """
+    Make a simple image with all core fields
+
+    :param name: name of image
+    :return: image
+    """
+    header = Header()
+    for key in core_fields:
+        header[key] = name
+    data = np.ones((10, 10))
+    data[2, 3] = np.nan
+    return Image(data, header)
+
+
+class TestSavedPaths(BaseTestCase):
+    """Class for testing saved copies of images"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=R1732
+        self.output_dir = Path(self.temp_dir.name)
+        self.handler = ImageHandler()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_link_or_save(self):
+        """Unchanged images should be linked, and changed images saved"""
+        image = make_image("image.fits")
+        saved_path = self.output_dir.joinpath("image.fits")
+        self.handler.save_fits(image, saved_path)
+
+        temp_path = self.output_dir.joinpath("temp_image.fits")
+        self.handler.link_or_save_fits(image, temp_path)
+        self.assertTrue(temp_path.samefile(saved_path))
+        self.assertEqual(image[LATEST_SAVE_KEY], temp_path.as_posix())
+        os.remove(temp_path)
+        self.assertTrue(saved_path.exists())
+
+        # A header change requires a new file
+        image["NEWKEY"] = 1
+        self.handler.link_or_save_fits(image, temp_path)
+        self.assertFalse(temp_path.samefile(saved_path))
+
+        # The new file is now the latest saved copy
+        other_path = self.output_dir.joinpath("other_image.fits")
+        self.handler.link_or_save_fits(image, other_path)
+        self.assertTrue(other_path.samefile(temp_path))
+
+        # As does a data change
+        image.set_data(image.get_data() * 2.0)
+        self.handler.link_or_save_fits(image, saved_path)
+        self.assertFalse(saved_path.samefile(temp_path))
+        self.assertEqual(self.handler.open_fits(saved_path).get_data()[0, 0], 2.0)
+
+    def test_mask(self):
+        """Masks should only be remade when the data or weights change"""
+        image = make_image("image.fits")
+        img_path = self.output_dir.joinpath("image.fits")
+        mask_path = self.handler.save_mask_image(image, img_path)
+
+        temp_path = self.output_dir.joinpath("temp_image.fits")
+        temp_mask_path = self.handler.save_mask_image(image, temp_path)
+        self.assertTrue(temp_mask_path.samefile(mask_path))
+
+        mask = self.handler.open_fits(temp_mask_path).get_data()
+        self.assertEqual(np.sum(mask), 99.0)
+        self.assertEqual(mask[2, 3], 0.0)
+
+        # Header changes do not change the mask
+        image["NEWKEY"] = 1
+        self.assertTrue(
+            self.handler.save_mask_image(image, temp_path).samefile(mask_path)
+        )
+
+        # Changes to the file invalidate the saved copy
+        os.remove(temp_mask_path)
+        os.remove(mask_path)
+        self.handler.save_fits(make_image("other.fits"), mask_path)
+        self.assertFalse(
+            self.handler.save_mask_image(image, temp_path).samefile(mask_path)
+        )
+        self.assertEqual(
+            np.sum(self.handler.open_fits(temp_mask_path).get_data()), 99.0
+        )
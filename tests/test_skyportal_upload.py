@@ -0,0 +1,211 @@
+"""
+Tests for concurrent uploads to SkyPortal in ..module::mirar.processors.skyportal,
+using a local stub of the SkyPortal API
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from mirar.data import SourceBatch, SourceTable
+from mirar.paths import BASE_NAME_KEY, RAW_IMG_KEY, SOURCE_NAME_KEY, TIME_KEY
+from mirar.processors.skyportal.client import RateLimiter, SkyportalClient
+from mirar.processors.skyportal.skyportal_source import (
+    SNCOSMO_KEY,
+    SkyportalSourceUploader,
+)
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class StubSkyportal:
+    """
+    Local stub of the SkyPortal API, recording requests
+    """
+
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.requests = []
+        self.sources = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    def start(self) -> str:
+        """
+        Start the stub server, in a daemon thread
+
+        :return: base url of the API
+        """
+        stub = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            """Handler for the stub API"""
+
+            protocol_version = "HTTP/1.1"
+
+            def respond(self, status: int, body: dict | None = None):
+                """Send a JSON response"""
+                content = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(content)
+
+            def handle_request(self):
+                """Record a request, and respond after a delay"""
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length)) if length > 0 else None
+                path = self.path.replace("/api/", "", 1)
+
+                with stub.lock:
+                    stub.requests.append((self.command, path, data))
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+
+                time.sleep(stub.latency)
+
+                with stub.lock:
+                    stub.in_flight -= 1
+                    if self.command == "POST" and path == "sources":
+                        stub.sources.add(data["id"])
+                    exists = path.split("/")[-1] in stub.sources
+
+                if self.command == "HEAD":
+                    self.respond(200 if exists else 404)
+                else:
+                    self.respond(200, {"status": "success", "data": {}})
+
+            do_HEAD = handle_request  # pylint: disable=invalid-name
+            do_POST = handle_request  # pylint: disable=invalid-name
+            do_PUT = handle_request  # pylint: disable=invalid-name
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                """Silence the default logging to stderr"""
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/"
+
+    def stop(self):
+        """
+        Stop the stub server
+
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_requests(self, method: str, path: str) -> list:
+        """
+        Get the data of recorded requests
+
+        :param method: HTTP method
+        :param path: path, or start of path
+        :return: list of request data
+        """
+        return [x[2] for x in self.requests if x[0] == method and x[1].startswith(path)]
+
+
+def make_source_batch(names: list[str]) -> SourceBatch:
+    """
+    Make a batch with one source table, with one source per name
+
+    :param names: names of sources
+    :return: source batch
+    """
+    source_df = pd.DataFrame(
+        {
+            SOURCE_NAME_KEY: names,
+            "ra": [10.0 + 0.01 * i for i in range(len(names))],
+            "dec": [20.0] * len(names),
+            "magpsf": [18.0] * len(names),
+            "sigmapsf": [0.1] * len(names),
+            SNCOSMO_KEY: ["ztfr"] * len(names),
+        }
+    )
+    metadata = {
+        TIME_KEY: "2023-10-01T00:00:00",
+        BASE_NAME_KEY: "image.fits",
+        RAW_IMG_KEY: "image.fits",
+    }
+    return SourceBatch([SourceTable(source_df, metadata=metadata)])
+
+
+class TestSkyportalUpload(BaseTestCase):
+    """Class for testing SkyPortal uploads"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.token = os.environ.get("FRITZ_TOKEN")
+        os.environ["FRITZ_TOKEN"] = "test"
+        self.stub = StubSkyportal()
+        self.base_url = self.stub.start()
+
+    def tearDown(self):
+        self.stub.stop()
+        if self.token is None:
+            del os.environ["FRITZ_TOKEN"]
+        else:
+            os.environ["FRITZ_TOKEN"] = self.token
+
+    def test_concurrent_upload(self):
+        """Objects should be uploaded concurrently, with batched photometry"""
+        client = SkyportalClient(base_url=self.base_url, max_in_flight=3)
+        uploader = SkyportalSourceUploader(
+            origin="test",
+            group_ids=[1],
+            instrument_id=2,
+            skyportal_client=client,
+            n_upload_workers=6,
+            photometry_batch_size=4,
+        )
+
+        names = ["SRC0", "SRC1", "SRC2", "SRC0", "SRC3", "SRC4", "SRC5"]
+        uploader._apply_to_sources(  # pylint: disable=protected-access
+            make_source_batch(names)
+        )
+
+        # The second alert of SRC0 finds the source created by the first
+        self.assertEqual(len(self.stub.get_requests("HEAD", "sources/")), 7)
+        posted = [x["id"] for x in self.stub.get_requests("POST", "sources")]
+        self.assertEqual(sorted(posted), sorted(set(names)))
+
+        photometry = self.stub.get_requests("PUT", "photometry")
+        self.assertEqual(len(photometry), 2)
+        obj_ids = sum([x["obj_id"] for x in photometry], [])
+        self.assertEqual(sorted(obj_ids), sorted(names))
+        self.assertEqual(sum(len(x["instrument_id"]) for x in photometry), len(names))
+
+        self.assertGreater(self.stub.max_in_flight, 1)
+        self.assertLessEqual(self.stub.max_in_flight, 3)
+
+        stats = client.get_latency_stats().set_index("endpoint")
+        self.assertEqual(stats.loc["HEAD sources/{id}", "n_requests"], 7)
+        self.assertEqual(stats.loc["PUT photometry", "n_requests"], 2)
+        self.assertEqual(stats["n_failed"].sum(), 0)
+        self.assertGreaterEqual(stats.loc["POST sources", "mean_seconds"], 0.02)
+        self.assertIn(
+            'mirar_skyportal_requests_total{endpoint="POST sources"} 6.0',
+            client.to_prometheus(),
+        )
+
+    def test_rate_limit(self):
+        """Requests should be limited to the maximum rate"""
+        limiter = RateLimiter(rate=50.0, burst=1)
+        t_start = time.monotonic()
+        for _ in range(11):
+            limiter.acquire()
+        self.assertGreater(time.monotonic() - t_start, 0.18)
@@ -0,0 +1,291 @@
+"""
+Tests for crossmatching all sources of a table in a single query, in
+..module::mirar.processors.database.database_selector
+and ..module::mirar.database.transactions.select
+"""
+
+import logging
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+from mirar.data import SourceBatch, SourceTable
+from mirar.database.constraints import DBQueryConstraints
+from mirar.database.transactions import select_q3c_crossmatch
+from mirar.database.transactions.select import XMATCH_INDEX_COLUMN
+from mirar.paths import BASE_NAME_KEY, RAW_IMG_KEY, SOURCE_HISTORY_KEY, SOURCE_NAME_KEY
+from mirar.pipelines.winter.models import Candidate
+from mirar.processors.database.database_selector import (
+    DatabaseHistorySelector,
+    SingleSpatialCrossmatchSource,
+    SpatialCrossmatchSourceWithDatabase,
+)
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_COLUMNS = [SOURCE_NAME_KEY, "magpsf"]
+
+
+class FakeDatabase:
+    """
+    Replacement for pandas.read_sql, recording the queries and
+    returning fixed matches
+    """
+
+    def __init__(self, matches: pd.DataFrame):
+        self.matches = matches
+        self.queries = []
+
+    def read_sql(self, query, conn, params: dict) -> pd.DataFrame:
+        """Record a query, and return the matches"""
+        assert conn is not None
+        self.queries.append((" ".join(str(query).split()), params))
+        return self.matches.copy()
+
+    @property
+    def sql(self) -> str:
+        """SQL of the last query"""
+        return self.queries[-1][0]
+
+    @property
+    def params(self) -> dict:
+        """Parameters of the last query"""
+        return self.queries[-1][1]
+
+
+def make_matches(indexes: list[int]) -> pd.DataFrame:
+    """
+    Make crossmatch results, with one match per index
+
+    :param indexes: indexes of the matched sources
+    :return: dataframe of matches
+    """
+    return pd.DataFrame(
+        {
+            XMATCH_INDEX_COLUMN: indexes,
+            SOURCE_NAME_KEY: [f"name{i}" for i in range(len(indexes))],
+            "magpsf": [18.0 + i for i in range(len(indexes))],
+            "_xm_rank": list(range(len(indexes))),
+        }
+    )
+
+
+def make_source_batch() -> SourceBatch:
+    """
+    Make a batch with one source table of three sources
+
+    :return: source batch
+    """
+    source_df = pd.DataFrame(
+        {
+            "ra": [10.0, 20.0, 30.0],
+            "dec": [-5.0, 0.0, 5.0],
+            "jd": [2460100.0, 2460100.5, 2460101.0],
+            "fwhm": [1.0, 2.0, 3.0],
+        }
+    )
+    metadata = {
+        "RA": 0.0,
+        "JD": 0.0,
+        BASE_NAME_KEY: "image.fits",
+        RAW_IMG_KEY: "image.fits",
+    }
+    return SourceBatch([SourceTable(source_df, metadata=metadata)])
+
+
+class TestSpatialCrossmatch(BaseTestCase):
+    """Class for testing crossmatches of many sources in a single query"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def run_crossmatch(self, processor, matches: pd.DataFrame):
+        """
+        Run a processor on a source batch, with a fake database
+
+        :param processor: crossmatch processor
+        :param matches: matches returned by the fake database
+        :return: output source table, fake database
+        """
+        database = FakeDatabase(matches)
+        with patch(
+            "mirar.database.transactions.select.get_engine", return_value=MagicMock()
+        ), patch(
+            "mirar.database.transactions.select.pd.read_sql",
+            side_effect=database.read_sql,
+        ):
+            batch = processor._apply_to_sources(  # pylint: disable=protected-access
+                make_source_batch()
+            )
+        return batch[0].get_data(), database
+
+    def test_query(self):
+        """The query should upload all positions, and rank matches"""
+        query_values = pd.DataFrame({"ra": [10.0, 20.0], "dec": [-5, 0]})
+        database = FakeDatabase(make_matches([1, 1]))
+
+        with patch(
+            "mirar.database.transactions.select.get_engine", return_value=MagicMock()
+        ) as engine, patch(
+            "mirar.database.transactions.select.pd.read_sql",
+            side_effect=database.read_sql,
+        ):
+            empty = select_q3c_crossmatch(
+                sql_table=Candidate.sql_model,
+                query_values=query_values.iloc[:0],
+                crossmatch_radius_arcsec=3.6,
+                output_columns=OUTPUT_COLUMNS,
+            )
+            self.assertEqual(len(empty), 0)
+            self.assertEqual(
+                list(empty.columns), [XMATCH_INDEX_COLUMN] + OUTPUT_COLUMNS
+            )
+            engine.assert_not_called()
+
+            res = select_q3c_crossmatch(
+                sql_table=Candidate.sql_model,
+                query_values=query_values,
+                crossmatch_radius_arcsec=3.6,
+                output_columns=OUTPUT_COLUMNS,
+                db_constraints=DBQueryConstraints(columns="fid", accepted_values=2),
+                max_num_results=1,
+                order_field_name="jd",
+            )
+
+        self.assertEqual(list(res.columns), [XMATCH_INDEX_COLUMN] + OUTPUT_COLUMNS)
+        self.assertEqual(
+            database.params,
+            {"q_index": [0, 1], "q_0": [10.0, 20.0], "q_1": [-5.0, 0.0]},
+        )
+
+        sql = database.sql
+        self.assertIn(
+            "FROM unnest(CAST(:q_index AS bigint[]), "
+            "CAST(:q_0 AS double precision[]), CAST(:q_1 AS double precision[])) "
+            "AS q(_xm_index, _xm_ra, _xm_dec)",
+            sql,
+        )
+        self.assertIn(
+            "JOIN candidates AS t ON q3c_join(q._xm_ra, q._xm_dec, t.ra, t.dec, 0.001)",
+            sql,
+        )
+        self.assertIn("WHERE (fid = '2')", sql)
+        self.assertIn(
+            "ORDER BY t.jd DESC, q3c_dist(q._xm_ra, q._xm_dec, t.ra, t.dec)", sql
+        )
+        self.assertIn("WHERE _xm_rank <= 1", sql)
+
+    def test_single_match(self):
+        """Single matches should be added as columns, or None if unmatched"""
+        processor = SingleSpatialCrossmatchSource(
+            db_table=Candidate,
+            db_output_columns=OUTPUT_COLUMNS,
+            crossmatch_radius_arcsec=2.0,
+        )
+        new_table, database = self.run_crossmatch(processor, make_matches([0, 2]))
+
+        # Source values take precedence over metadata
+        self.assertEqual(
+            database.params,
+            {
+                "q_index": [0, 1, 2],
+                "q_0": [10.0, 20.0, 30.0],
+                "q_1": [-5.0, 0.0, 5.0],
+            },
+        )
+        self.assertIn("WHERE _xm_rank <= 1", database.sql)
+        self.assertNotIn("_xm_jd", database.sql)
+
+        self.assertEqual(len(new_table), 3)
+        self.assertEqual(new_table["fwhm"].tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(new_table[SOURCE_NAME_KEY].tolist(), ["name0", None, "name1"])
+        self.assertEqual(new_table["magpsf"][[0, 2]].tolist(), [18.0, 19.0])
+        self.assertTrue(pd.isnull(new_table["magpsf"][1]))
+
+    def test_multi_match(self):
+        """All matches should be added as a dataframe, empty if unmatched"""
+        processor = SpatialCrossmatchSourceWithDatabase(
+            db_table=Candidate,
+            db_output_columns=OUTPUT_COLUMNS,
+            crossmatch_radius_arcsec=2.0,
+        )
+        new_table, database = self.run_crossmatch(processor, make_matches([0, 0, 2]))
+        self.assertNotIn("_xm_rank <=", database.sql)
+        self.assertNotIn("_xm_jd", database.sql)
+
+        self.assertEqual(new_table["jd"].tolist(), [2460100.0, 2460100.5, 2460101.0])
+        results = new_table[SOURCE_HISTORY_KEY].tolist()
+        self.assertEqual([len(x) for x in results], [2, 0, 1])
+        for res in results:
+            self.assertEqual(list(res.columns), OUTPUT_COLUMNS)
+        self.assertEqual(results[0][SOURCE_NAME_KEY].tolist(), ["name0", "name1"])
+        self.assertEqual(results[0].index.tolist(), [0, 1])
+        self.assertEqual(results[2][SOURCE_NAME_KEY].tolist(), ["name2"])
+        self.assertEqual(results[2].index.tolist(), [0])
+
+    def test_history(self):
+        """History queries should upload times, and constrain the time window"""
+        processor = DatabaseHistorySelector(
+            db_table=Candidate,
+            db_output_columns=OUTPUT_COLUMNS,
+            crossmatch_radius_arcsec=2.0,
+            history_duration_days=500.0,
+        )
+        new_table, database = self.run_crossmatch(processor, make_matches([1]))
+
+        self.assertEqual(database.params["q_2"], [2460100.0, 2460100.5, 2460101.0])
+        self.assertIn("AS q(_xm_index, _xm_ra, _xm_dec, _xm_jd)", database.sql)
+        self.assertIn(
+            "WHERE t.jd < q._xm_jd AND t.jd >= q._xm_jd - 500.0", database.sql
+        )
+
+        results = new_table[SOURCE_HISTORY_KEY].tolist()
+        self.assertEqual([len(x) for x in results], [0, 1, 0])
+
+    def test_constraints_override(self):
+        """Overriding get_constraints should fall back to per-source queries"""
+
+        class PerSourceCrossmatch(SpatialCrossmatchSourceWithDatabase):
+            """Crossmatch with per-source constraints"""
+
+            def get_constraints(self, data: dict) -> DBQueryConstraints:
+                return self.get_source_crossmatch_constraints(data)
+
+        with self.assertLogs(
+            "mirar.processors.database.database_selector", level="WARNING"
+        ):
+            processor = PerSourceCrossmatch(
+                db_table=Candidate,
+                db_output_columns=OUTPUT_COLUMNS,
+                crossmatch_radius_arcsec=2.0,
+            )
+
+        matches = make_matches([0])[OUTPUT_COLUMNS]
+        with patch(
+            "mirar.processors.database.database_selector.select_from_table",
+            return_value=matches,
+        ) as select, patch(
+            "mirar.processors.database.database_selector.select_q3c_crossmatch"
+        ) as crossmatch, patch.object(
+            PerSourceCrossmatch,
+            "get_constraints",
+            autospec=True,
+            side_effect=PerSourceCrossmatch.get_constraints,
+        ) as get_constraints:
+            batch = processor._apply_to_sources(  # pylint: disable=protected-access
+                make_source_batch()
+            )
+
+        crossmatch.assert_not_called()
+        self.assertEqual(get_constraints.call_count, 3)
+        self.assertEqual(select.call_count, 3)
+        self.assertEqual(
+            [x.args[1]["ra"] for x in get_constraints.call_args_list],
+            [10.0, 20.0, 30.0],
+        )
+
+        results = batch[0].get_data()[SOURCE_HISTORY_KEY].tolist()
+        self.assertEqual([len(x) for x in results], [1, 1, 1])
+        self.assertEqual(results[0][SOURCE_NAME_KEY].tolist(), ["name0"])
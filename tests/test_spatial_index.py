@@ -0,0 +1,56 @@
+"""
+Tests for the sky spatial index in ..module::mirar.utils.spatial_index
+"""
+
+import logging
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+
+from mirar.testing import BaseTestCase
+from mirar.utils.spatial_index import get_sky_index
+
+logger = logging.getLogger(__name__)
+
+
+class TestSpatialIndex(BaseTestCase):
+    """Class for testing the sky spatial index"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_spatial_index(self):
+        """Index queries should match astropy cross-matching"""
+        rng = np.random.default_rng(0)
+        ras, decs = rng.uniform(359.9, 360.1, 2000) % 360.0, rng.uniform(-1, 1, 2000)
+        query_ras = rng.uniform(359.9, 360.1, 500) % 360.0
+        query_decs = rng.uniform(-1, 1, 500)
+
+        sky_index = get_sky_index(ras, decs)
+        self.assertIs(sky_index, get_sky_index(ras.copy(), decs.copy()))
+
+        catalog_crds = SkyCoord(ras, decs, unit=u.deg)
+        query_crds = SkyCoord(query_ras, query_decs, unit=u.deg)
+
+        indices, separations = sky_index.query_nearest(query_ras, query_decs)
+        idx, d2d, _ = query_crds.match_to_catalog_sky(catalog_crds)
+        self.assertTrue(np.all(indices[:, 0] == idx))
+        self.assertTrue(np.allclose(separations[:, 0], d2d.arcsec))
+
+        indices, separations = sky_index.query_nearest(
+            query_ras, query_decs, k=2, max_separation_arcsec=60.0
+        )
+        self.assertTrue(np.all((indices >= 0) == (separations <= 60.0)))
+
+        query_inds, catalog_inds, separations = sky_index.query_radius(
+            query_ras, query_decs, radius_arcsec=60.0
+        )
+        ref_query, ref_catalog, ref_sep, _ = catalog_crds.search_around_sky(
+            query_crds, 60.0 * u.arcsec
+        )
+        self.assertEqual(
+            set(zip(query_inds, catalog_inds)), set(zip(ref_query, ref_catalog))
+        )
+        self.assertAlmostEqual(np.sum(separations), np.sum(ref_sep.arcsec), places=6)
@@ -0,0 +1,78 @@
+"""
+Tests for combining frames in ..module::mirar.processors.stacking
+"""
+
+import logging
+
+import numpy as np
+from astropy.stats import sigma_clip
+
+from mirar.processors.stacking import (
+    MEDIAN_COMBINE,
+    MINMAX_COMBINE,
+    SIGMA_CLIPPED_MEAN_COMBINE,
+    StackFrame,
+    StackingError,
+    combine_frames,
+)
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class TestStacking(BaseTestCase):
+    """Class for testing tiled frame combination"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+        rng = np.random.default_rng(0)
+        self.cube = rng.normal(100.0, 5.0, (7, 53, 31))
+        self.cube[2, 10:20, 5] = 1.0e4
+        self.cube[:, 0, 0] = np.nan
+        self.cube[3, 40:, :] = np.nan
+
+    def get_frames(self, scales: np.ndarray) -> list[StackFrame]:
+        """Get read-only frames from the test cube"""
+        frames = []
+        for data, scale in zip(self.cube * scales[:, None, None], scales):
+            data.flags.writeable = False
+            frames.append(StackFrame(data, scale=scale))
+        return frames
+
+    def test_combine_frames(self):
+        """Tiled combination should match combining the full cube"""
+        frames = self.get_frames(np.linspace(1.0, 3.0, len(self.cube)))
+
+        # A tiny memory budget forces one row per tile
+        for n_workers, memory_budget in [(1, 1), (4, 1), (4, 10**9)]:
+            median = combine_frames(
+                frames,
+                method=MEDIAN_COMBINE,
+                n_workers=n_workers,
+                memory_budget=memory_budget,
+            )
+            self.assertTrue(
+                np.allclose(
+                    median, np.nanmedian(self.cube, axis=0), equal_nan=True, rtol=0
+                )
+            )
+
+        clipped = combine_frames(
+            frames, method=SIGMA_CLIPPED_MEAN_COMBINE, memory_budget=1, sigma=2.5
+        )
+        expected = np.nanmean(
+            sigma_clip(self.cube, sigma=2.5, maxiters=5, axis=0, masked=False), axis=0
+        )
+        self.assertTrue(np.allclose(clipped, expected, equal_nan=True))
+        self.assertTrue(np.all(clipped[10:20, 5] < 200.0))
+
+        minmax = combine_frames(frames, method=MINMAX_COMBINE, memory_budget=1)
+        pixel = self.cube[:, 45, 3]
+        pixel = np.sort(pixel[~np.isnan(pixel)])[1:-1]
+        self.assertAlmostEqual(minmax[45, 3], np.mean(pixel))
+        self.assertTrue(np.isnan(minmax[0, 0]))
+
+        with self.assertRaises(StackingError):
+            combine_frames(frames, method="mode")
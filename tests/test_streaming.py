@@ -0,0 +1,94 @@
+"""
+Tests for streaming execution in ..module::mirar.pipelines.streaming
+"""
+
+import logging
+
+import numpy as np
+from astropy.io.fits import Header
+
+from mirar.data import Dataset, Image, ImageBatch
+from mirar.errors import ProcessorError
+from mirar.paths import BASE_NAME_KEY, PROC_HISTORY_KEY, RAW_IMG_KEY
+from mirar.pipelines.streaming import split_into_segments, stream_dataset
+from mirar.processors.base_processor import BaseImageProcessor
+from mirar.processors.utils.image_selector import ImageBatcher, ImageSelector
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+class AddOneProcessor(BaseImageProcessor):
+    """Processor which adds one to image data, and fails for images with value 3"""
+
+    base_key = "test_add_one"
+
+    def _apply_to_images(self, batch: ImageBatch) -> ImageBatch:
+        for image in batch:
+            data = image.get_data()
+            if np.any(data == 3.0):
+                raise ProcessorError(f"Bad data in {image.get_name()}")
+            image.set_data(data + 1.0)
+        return batch
+
+
+def make_dataset(n_batches: int) -> Dataset:
+    """
+    Make a dataset with one constant-valued image per batch
+
+    :param n_batches: number of batches
+    :return: dataset
+    """
+    batches = []
+    for i in range(n_batches):
+        header = Header()
+        header[BASE_NAME_KEY] = f"image_{i}.fits"
+        header[RAW_IMG_KEY] = f"image_{i}.fits"
+        header[PROC_HISTORY_KEY] = ""
+        header["PARITY"] = ["even", "odd"][i % 2]
+        batches.append(ImageBatch([Image(np.full((5, 5), float(i)), header)]))
+    return Dataset(batches)
+
+
+class TestStreaming(BaseTestCase):
+    """Class for testing streaming execution"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def test_segments(self):
+        """Synchronization points should split the processors into segments"""
+        processors = [
+            AddOneProcessor(),
+            AddOneProcessor(),
+            ImageBatcher("PARITY"),
+            AddOneProcessor(),
+        ]
+        segments = split_into_segments(processors)
+        self.assertEqual([len(x) for x in segments], [2, 1, 1])
+        self.assertTrue(segments[1][0].is_synchronization_point)
+
+    def test_stream(self):
+        """Streaming should give the same output, in the same order, as steps"""
+        processors = [
+            AddOneProcessor(),
+            ImageSelector(("PARITY", "odd")),
+            AddOneProcessor(),
+        ]
+
+        dataset, err_stack = stream_dataset(processors, make_dataset(8), queue_size=2)
+
+        # Image 3 fails in the first step, and even images are removed
+        self.assertEqual(len(err_stack.reports), 1)
+        self.assertEqual(err_stack.failed_images, ["image_3.fits"])
+        self.assertEqual(
+            [x[0].get_name() for x in dataset],
+            ["image_1.fits", "image_5.fits", "image_7.fits"],
+        )
+        for batch in dataset:
+            self.assertEqual(
+                batch[0][PROC_HISTORY_KEY], "test_add_one,select,test_add_one,"
+            )
+            value = float(batch[0].get_name().split("_")[1].split(".")[0])
+            self.assertTrue(np.all(batch[0].get_data() == value + 2.0))
@@ -0,0 +1,180 @@
+"""
+Tests for the ZOGY implementation in ..module::mirar.processors.zogy.pyzogy
+"""
+
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from astropy.io import fits
+
+from mirar.processors.astromatic.psfex.psfex import PSFexModel
+from mirar.processors.zogy.pyzogy import ZogyFFT, pyzogy, reference_psf_registry
+from mirar.processors.zogy.tiled import get_tile_edges, pyzogy_tiled
+from mirar.testing import BaseTestCase
+
+logger = logging.getLogger(__name__)
+
+
+def make_psf(sigma: float, size: int = 15) -> np.ndarray:
+    """
+    Make a normalised Gaussian PSF
+
+    :param sigma: width of PSF
+    :param size: size of PSF
+    :return: PSF
+    """
+    y_grid, x_grid = np.mgrid[:size, :size] - size // 2
+    psf = np.exp(-(x_grid**2 + y_grid**2) / (2 * sigma**2))
+    return psf / np.sum(psf)
+
+
+class TestZogy(BaseTestCase):
+    """Class for testing ZOGY"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(100.0, 5.0, (128, 96))
+        self.data[40:45, 30] = np.nan
+        self.psf = make_psf(2.0)
+
+    def test_fft(self):
+        """Transforms should match numpy, with plans reused between threads"""
+        fft = ZogyFFT()
+        data = np.nan_to_num(self.data)
+
+        def round_trip(dtype: str) -> float:
+            data_hat = fft.rfft2(data.astype(dtype))
+            self.assertEqual(data_hat.dtype, np.result_type(dtype, np.complex64))
+            expected = np.fft.rfft2(data)
+            self.assertLess(
+                np.max(np.abs(data_hat - expected)) / np.max(np.abs(expected)), 1e-6
+            )
+            return np.max(np.abs(fft.irfft2(data_hat, data.shape, dtype) - data))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            errors = list(executor.map(round_trip, ["float64", "float32"] * 4))
+
+        self.assertLess(max(errors[0::2]), 1e-10)
+        self.assertLess(max(errors[1::2]), 1e-3)
+
+    def test_pyzogy(self):
+        """Subtracting identical images should give zero, reusing the reference PSF"""
+        reference_psf_registry.clear()
+        hits = reference_psf_registry.get_stats()["hits"]
+
+        results = []
+        for _ in range(2):
+            results.append(
+                pyzogy(
+                    new_data=self.data.copy(),
+                    ref_data=self.data.copy(),
+                    new_psf=self.psf,
+                    ref_psf=self.psf,
+                    new_sigma=np.full(self.data.shape, 5.0),
+                    ref_sigma=np.full(self.data.shape, 5.0),
+                    new_avg_unc=5.0,
+                    ref_avg_unc=5.0,
+                )
+            )
+
+        self.assertEqual(reference_psf_registry.get_stats()["hits"], hits + 1)
+
+        diff, diff_psf, scorr = results[0]
+        self.assertEqual(diff.shape, self.data.shape)
+        self.assertEqual(diff_psf.shape, self.psf.shape)
+        self.assertTrue(np.array_equal(np.isnan(diff), np.isnan(self.data)))
+        self.assertLess(np.nanmax(np.abs(diff)), 1e-8)
+        self.assertLess(np.nanmax(np.abs(scorr)), 1e-6)
+
+        for first, second in zip(results[0], results[1]):
+            self.assertTrue(np.array_equal(first, second, equal_nan=True))
+
+    def test_tiled(self):
+        """Tiled subtraction should match the full frame for a transient"""
+        rng = np.random.default_rng(1)
+        shape = (256, 192)
+        ref_psf, new_psf = make_psf(1.8, size=25), make_psf(2.0, size=25)
+
+        ref_data = rng.normal(100.0, 5.0, shape)
+        new_data = rng.normal(100.0, 5.0, shape)
+        for y_pos, x_pos in rng.integers(20, 170, (30, 2)):
+            flux = rng.uniform(1000.0, 20000.0)
+            ref_data[y_pos - 12 : y_pos + 13, x_pos - 12 : x_pos + 13] += flux * ref_psf
+            new_data[y_pos - 12 : y_pos + 13, x_pos - 12 : x_pos + 13] += flux * new_psf
+        new_data[118:143, 88:113] += 5000.0 * new_psf
+        new_data[50, 60:70] = np.nan
+
+        self.assertEqual(get_tile_edges(256, 128, 32), [0, 96, 128])
+
+        kwargs = {
+            "new_avg_unc": 5.0,
+            "ref_avg_unc": 5.0,
+        }
+        full = pyzogy(
+            new_data=new_data.copy(),
+            ref_data=ref_data.copy(),
+            new_psf=new_psf,
+            ref_psf=ref_psf,
+            new_sigma=np.full(shape, 5.0),
+            ref_sigma=np.full(shape, 5.0),
+            **kwargs,
+        )
+        stats = reference_psf_registry.get_stats()
+        tiled = pyzogy_tiled(
+            new_data=new_data.copy(),
+            ref_data=ref_data.copy(),
+            new_psf=lambda x, y: new_psf,
+            ref_psf=ref_psf,
+            new_sigma=np.full(shape, 5.0),
+            ref_sigma=np.full(shape, 5.0),
+            tile_size=128,
+            overlap=32,
+            n_workers=4,
+            **kwargs,
+        )
+        # Tiles do not use the reference PSF registry
+        self.assertEqual(reference_psf_registry.get_stats(), stats)
+
+        for full_data, tiled_data in zip(full, tiled):
+            self.assertEqual(full_data.shape, tiled_data.shape)
+        self.assertTrue(np.array_equal(np.isnan(full[0]), np.isnan(tiled[0])))
+        self.assertTrue(np.allclose(full[1], tiled[1]))
+        self.assertAlmostEqual(tiled[2][130, 100] / full[2][130, 100], 1.0, delta=0.02)
+        self.assertGreater(tiled[2][130, 100], 10.0)
+
+    def test_psfex_model(self):
+        """The PSF of a PSFex model should vary with position"""
+        components = np.stack(
+            [make_psf(2.0), make_psf(2.5) - make_psf(2.0), np.zeros((15, 15))]
+        )
+        header = fits.Header()
+        header["POLNAXIS"] = 2
+        header["POLDEG1"] = 1
+        header["POLZERO1"], header["POLSCAL1"] = 101.0, 100.0
+        header["POLZERO2"], header["POLSCAL2"] = 101.0, 100.0
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            psf_path = Path(temp_dir).joinpath("model.psf")
+            table = fits.BinTableHDU.from_columns(
+                [
+                    fits.Column(
+                        name="PSF_MASK",
+                        format=f"{components.size}E",
+                        dim=str(components.shape[::-1]),
+                        array=components[np.newaxis],
+                    )
+                ],
+                header=header,
+            )
+            fits.HDUList([fits.PrimaryHDU(), table]).writeto(psf_path)
+
+            model = PSFexModel(psf_path)
+
+        self.assertTrue(np.allclose(model.get_psf(101.0, 1.0), make_psf(2.0)))
+        self.assertTrue(np.allclose(model.get_psf(201.0, 1.0), make_psf(2.5)))
+        self.assertAlmostEqual(np.sum(model.get_psf(151.0, 1.0)), 1.0)